@@ -235,6 +235,9 @@ elk=0           ; 0xC0DE: 0=Beeb version, 1=Elk version
 antiflicker=1   ; 0xC0DE: affects Elk version only (0=off, 1=on) reduces flicker a little but slows down the game (?)
 cheat=0         ; 0xC0DE: 0=no cheat, 1=cheat (no damage to starship)
 cheat_score=0   ; key '6' gives you score, '7' kills you
+!ifndef sorted_collisions {
+sorted_collisions=1 ; 1=check collisions against the enemy ships sorted by x, 0=against every slot in turn
+}
 
 ; ----------------------------------------------------------------------------------
 ; gameplay constants
@@ -631,6 +634,10 @@ enemy_cache_a                           = $4d8
 enemy_torpedoes_table                   = enemy_cache_a + 640
 ; length 144: to 7e8
 
+; the slots of the enemy ships that can collide, in order of x, then $ff
+enemy_ships_sorted_by_x                 = enemy_torpedoes_table + 144                   ; i.e. starts at $07e8
+enemy_ships_sorted_by_x_end             = enemy_ships_sorted_by_x + maximum_number_of_enemy_ships + 1 ; i.e. end at $07f1
+
 stride_between_enemy_coordinates        = enemy_ships_previous_y_fraction - enemy_ships_previous_x_fraction
 
 squares1_low                            = $0900  ; } 512 entries of 16 bit value (i*i)/4
@@ -697,359 +704,17 @@ load_addr
 }
 }
 
-; macros for object drawing
-; A holds the current screen modification byte
-; X and Y are between 0 and 7
-!macro left {
-    dex                                                               ;
-    bpl +                                                             ;
-    jsr leftfix                                                       ;
-+
-    eor xbit_table,X                                                  ;
-}
-
-!macro right {
-    inx                                                               ;
-    cpx #8                                                            ;
-    bne +                                                             ;
-    jsr rightfix                                                      ;
-+
-    eor xbit_table,X                                                  ;
-}
-!macro up {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    dey                                                               ;
-    bpl +                                                             ;
-    jsr upfix                                                         ;
-+
-    lda xbit_table,X                                                  ;
-}
-!macro down {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    iny                                                               ;
-    cpy #8                                                            ;
-    bne +                                                             ;
-    jsr downfix                                                       ;
-+
-    lda xbit_table,X                                                  ;
-}
-!macro downleft {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    iny                                                               ;
-    dex                                                               ;
-    bmi .nope                                                         ;
-    cpy #8                                                            ;
-    bne .ok                                                           ;
-.nope
-    jsr downleftfix                                                   ;
-.ok
-    lda xbit_table,X                                                  ;
-}
-!macro downright {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    inx                                                               ;
-    iny                                                               ;
-    cpx #8                                                            ;
-    beq .nope                                                         ;
-    cpy #8                                                            ;
-    bne .ok                                                           ;
-.nope
-    jsr downrightfix                                                  ;
-.ok
-    lda xbit_table,X                                                  ;
-}
-!macro upleft {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    dex                                                               ;
-    dey                                                               ;
-    bmi .nope                                                         ;
-    cpx #$ff                                                          ;
-    bne .ok                                                           ;
-.nope
-    jsr upleftfix                                                     ;
-.ok
-    lda xbit_table,X                                                  ;
-}
-!macro upright {
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    inx                                                               ;
-    dey                                                               ;
-    bmi .nope                                                         ;
-    cpx #8                                                            ;
-    bne .ok                                                           ;
-.nope
-    jsr uprightfix                                                    ;
-.ok
-    lda xbit_table,X                                                  ;
-}
+!src "build/plot_chain.a"
 
 ; ----------------------------------------------------------------------------------
-plus_angle0
-    +right
-plus_angle1
-    +downright
-plus_angle2
-    +right
-plus_angle3
-    +downright
-plus_angle4
-    +downright
-plus_angle5
-    +down
-plus_angle6
-    +downright
-plus_angle7
-    +down
-plus_angle8
-    +down
-plus_angle9
-    +downleft
-plus_angle10
-    +down
-plus_angle11
-    +downleft
-plus_angle12
-    +downleft
-plus_angle13
-    +left
-plus_angle14
-    +downleft
-plus_angle15
-    +left
-plus_angle16
-    +left
-plus_angle17
-    +upleft
-plus_angle18
-    +left
-plus_angle19
-    +upleft
-plus_angle20
-    +upleft
-plus_angle21
-    +up
-plus_angle22
-    +upleft
-plus_angle23
-    +up
-plus_angle24
-    +up
-plus_angle25
-    +upright
-plus_angle26
-    +up
-plus_angle27
-    +upright
-plus_angle28
-    +upright
-plus_angle29
-    +right
-plus_angle30
-    +upright
-plus_angle31
-    +right
-plus_angle32
-    +right
-plus_angle33
-    +downright
-plus_angle34
-    +right
-plus_angle35
-    +downright
-plus_angle36
-    +downright
-plus_angle37
-    +down
-plus_angle38
-    +downright
-plus_angle39
-    +down
-plus_angle40
-    +down
-plus_angle41
-    +downleft
-plus_angle42
-
-; ----------------------------------------------------------------------------------
-starship_rotation_cosine_table
-    !byte 0  , $fe, $f8, $ee, $e0, $ce                                ;
-starship_rotation_sine_table
-    !byte 0  , 2  , 4  , 6  , 8  , 10                                 ;
-
-cosine_table
-    !byte $fa, $fa, $fb, $fb, $fc, $fd, $fe, $ff                      ; overlaps with sine table
-sine_table
-    !byte 0  , 1  , 2  , 3  , 4  , 5  , 5  , 6                        ; full sine table
-    !byte 6  , 6  , 5  , 5  , 4  , 3  , 2  , 1                        ;
-    !byte 0  , $ff, $fe, $fd, $fc, $fb, $fb, $fa                      ;
-    !byte $fa, $fa, $fb, $fb, $fc, $fd, $fe, $ff                      ;
+!src "build/trig_tables.a"
 
 ; ----------------------------------------------------------------------------------
 ; Align to page boundary for speed
 
-plot_table_offset
-    !byte <plus_angle0
-    !byte <plus_angle1
-    !byte <plus_angle2
-    !byte <plus_angle3
-    !byte <plus_angle4
-    !byte <plus_angle5
-    !byte <plus_angle6
-    !byte <plus_angle7
-    !byte <plus_angle8
-    !byte <plus_angle9
-    !byte <plus_angle10
-    !byte <plus_angle11
-    !byte <plus_angle12
-    !byte <plus_angle13
-    !byte <plus_angle14
-    !byte <plus_angle15
-    !byte <plus_angle16
-    !byte <plus_angle17
-    !byte <plus_angle18
-    !byte <plus_angle19
-    !byte <plus_angle20
-    !byte <plus_angle21
-    !byte <plus_angle22
-    !byte <plus_angle23
-    !byte <plus_angle24
-    !byte <plus_angle25
-    !byte <plus_angle26
-    !byte <plus_angle27
-    !byte <plus_angle28
-    !byte <plus_angle29
-    !byte <plus_angle30
-    !byte <plus_angle31
-    !byte <plus_angle32
-    !byte <plus_angle33
-    !byte <plus_angle34
-    !byte <plus_angle35
-    !byte <plus_angle36
-    !byte <plus_angle37
-    !byte <plus_angle38
-    !byte <plus_angle39
-    !byte <plus_angle40
-    !byte <plus_angle41
-    !byte <plus_angle42
-!align 255, 0
-plot_table_offset2
-    !byte >plus_angle0
-    !byte >plus_angle1
-    !byte >plus_angle2
-    !byte >plus_angle3
-    !byte >plus_angle4
-    !byte >plus_angle5
-    !byte >plus_angle6
-    !byte >plus_angle7
-    !byte >plus_angle8
-    !byte >plus_angle9
-    !byte >plus_angle10
-    !byte >plus_angle11
-    !byte >plus_angle12
-    !byte >plus_angle13
-    !byte >plus_angle14
-    !byte >plus_angle15
-    !byte >plus_angle16
-    !byte >plus_angle17
-    !byte >plus_angle18
-    !byte >plus_angle19
-    !byte >plus_angle20
-    !byte >plus_angle21
-    !byte >plus_angle22
-    !byte >plus_angle23
-    !byte >plus_angle24
-    !byte >plus_angle25
-    !byte >plus_angle26
-    !byte >plus_angle27
-    !byte >plus_angle28
-    !byte >plus_angle29
-    !byte >plus_angle30
-    !byte >plus_angle31
-    !byte >plus_angle32
-    !byte >plus_angle33
-    !byte >plus_angle34
-    !byte >plus_angle35
-    !byte >plus_angle36
-    !byte >plus_angle37
-    !byte >plus_angle38
-    !byte >plus_angle39
-    !byte >plus_angle40
-    !byte >plus_angle41
-    !byte >plus_angle42
-
-segment_angle_to_x_deltas_table
-    !byte $1     ; 0   x+ y0
-    !byte $1     ; 1   x+ y+
-    !byte $1     ; 2   x+ y0
-    !byte $1     ; 3   x+ y+
-    !byte $1     ; 4   x+ y+
-    !byte $0     ; 5   x0 y+
-    !byte $1     ; 6   x+ y+
-    !byte $0     ; 7   x0 y+
-    !byte $0     ; 8   x0 y+
-    !byte $ff    ; 9   x- y+
-    !byte $0     ; 10  x0 y+
-    !byte $ff    ; 11  x- y+
-    !byte $ff    ; 12  x- y+
-    !byte $ff    ; 13  x- y0
-    !byte $ff    ; 14  x- y+
-    !byte $ff    ; 15  x- y0
-    !byte $ff    ; 16  x- y0
-    !byte $ff    ; 17  x- y-
-    !byte $ff    ; 18  x- y0
-    !byte $ff    ; 19  x- y-
-    !byte $ff    ; 20  x- y-
-    !byte $0     ; 21  x0 y-
-    !byte $ff    ; 22  x- y-
-    !byte $0     ; 23  x0 y-
-    !byte $0     ; 24  x0 y-
-    !byte $1     ; 25  x+ y-
-    !byte $0     ; 26  x0 y-
-    !byte $1     ; 27  x+ y-
-    !byte $1     ; 28  x+ y-
-    !byte $1     ; 29  x+ y0
-    !byte $1     ; 30  x+ y-
-    !byte $1     ; 31  x+ y0
-
-segment_angle_to_y_deltas_table
-    !byte $0     ; 0   y0
-    !byte $1     ; 1   y+
-    !byte $0     ; 2   y0
-    !byte $1     ; 3   y+
-    !byte $1     ; 4   y+
-    !byte $1     ; 5   y+
-    !byte $1     ; 6   y+
-    !byte $1     ; 7   y+
-    !byte $1     ; 8   y+
-    !byte $1     ; 9   y+
-    !byte $1     ; 10  y+
-    !byte $1     ; 11  y+
-    !byte $1     ; 12  y+
-    !byte $0     ; 13  y0
-    !byte $1     ; 14  y+
-    !byte $0     ; 15  y0
-    !byte $0     ; 16  y0
-    !byte $ff    ; 17  y-
-    !byte $0     ; 18  y0
-    !byte $ff    ; 19  y-
-    !byte $ff    ; 20  y-
-    !byte $ff    ; 21  y-
-    !byte $ff    ; 22  y-
-    !byte $ff    ; 23  y-
-    !byte $ff    ; 24  y-
-    !byte $ff    ; 25  y-
-    !byte $ff    ; 26  y-
-    !byte $ff    ; 27  y-
-    !byte $ff    ; 28  y-
-    !byte $0     ; 29  y0
-    !byte $ff    ; 30  y-
-    !byte $0     ; 31  y0
+!src "build/plot_tables.a"
+
+!src "build/segment_tables.a"
 
 ; ----------------------------------------------------------------------------------
 ; Exploding starship 1
@@ -2008,6 +1673,52 @@ check_for_collision_with_enemy_ships
     ldy #4                                                            ;
     lda (temp0_low),y                                                 ; torpedo_y_pixels
     sta temp4                                                         ;
+!if sorted_collisions {
+    ldy #$ff                                                          ;
+    sty enemy_ships_still_to_consider                                 ; lowest slot hit so far, $ff for none
+    iny                                                               ;
+consider_enemy_in_x_order
+    ldx enemy_ships_sorted_by_x,y                                     ;
+    bmi finished_considering_enemies                                  ;
+    iny                                                               ;
+    lda enemy_ships_x_pixels,x                                        ;
+    sec                                                               ;
+    sbc temp3                                                         ; torpedo_x_pixels
+    bcs enemy_is_right_of_torpedo                                     ;
+    eor #$ff                                                          ;
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes             ;
+    bcs consider_enemy_in_x_order                                     ;
+    bcc consider_enemy_y                                              ;
+enemy_is_right_of_torpedo
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes             ;
+    bcs finished_considering_enemies                                  ; this enemy ship and all those after it are too far right
+consider_enemy_y
+    lda enemy_ships_y_pixels,x                                        ;
+    sec                                                               ;
+    sbc temp4                                                         ; torpedo_y_pixels
+    bcs skip_inversion_y1                                             ;
+    eor #$ff                                                          ;
+skip_inversion_y1
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes             ;
+    bcs consider_enemy_in_x_order                                     ;
+    cpx enemy_ships_still_to_consider                                 ;
+    bcs consider_enemy_in_x_order                                     ;
+    stx enemy_ships_still_to_consider                                 ; the lowest slot hit, as when checking every slot in turn
+    bcc consider_enemy_in_x_order                                     ;
+finished_considering_enemies
+    ldx enemy_ships_still_to_consider                                 ;
+    bpl enemy_ship_was_hit_by_torpedo                                 ;
+    clc                                                               ; the torpedo didn't hit anything
+    rts                                                               ;
+enemy_ship_was_hit_by_torpedo
+    txa                                                               ;
+    eor #$ff                                                          ;
+    sec                                                               ;
+    adc #maximum_number_of_enemy_ships                                ;
+    sta enemy_ships_still_to_consider                                 ; 8 - slot, as used by explode_enemy_ship
+    lda enemy_ships_energy,x                                          ;
+    beq skip_damage                                                   ; every enemy ship in the list can collide
+} else {
     lda #maximum_number_of_enemy_ships                                ;
     sta enemy_ships_still_to_consider                                 ;
     ldx #0                                                            ;
@@ -2036,6 +1747,7 @@ skip_inversion_y1
     cmp #frame_of_enemy_ship_explosion_after_which_no_collisions      ;
     bcs skip_damage                                                   ;
     bcc move_to_next_enemy                                            ;
+}
 skip_considering_explosion
     inc enemy_ship_was_hit                                            ;
     inc enemy_ships_temporary_behaviour_flags,x                       ;
@@ -2056,12 +1768,14 @@ skip_damage
     sec                                                               ; the torpedo hit something
     rts                                                               ;
 
+!if sorted_collisions=0 {
 move_to_next_enemy
     inx                                                               ;
     dec enemy_ships_still_to_consider                                 ;
     bne consider_enemy_slot                                           ;
     clc                                                               ; the torpedo didn't hit anything
     rts                                                               ;
+}
 
 ; ----------------------------------------------------------------------------------
 plot_enemy_torpedo
@@ -2385,8 +2099,67 @@ return8
 ;    rts
 
 
+; ----------------------------------------------------------------------------------
+; Lists the enemy ships that can collide in enemy_ships_sorted_by_x, in order of x, so
+; the collision checks can stop once they are past the ships close enough to collide.
+; Called before the checks between enemy ships and again after update_enemy_ships has
+; moved them, ready for the torpedoes.
+; ----------------------------------------------------------------------------------
+!if sorted_collisions {
+sort_enemy_ships_by_x
+    ldy #0                                                            ; number of enemy ships in the list so far
+    ldx #maximum_number_of_enemy_ships - 1                            ;
+sort_next_enemy_ship
+    lda enemy_ships_on_screen,x                                       ;
+    bne skip_sorting_enemy_ship                                       ;
+    lda enemy_ships_energy,x                                          ;
+    bne insert_enemy_ship                                             ;
+    lda enemy_ships_flags_or_explosion_timer,x                        ;
+    cmp #frame_of_enemy_ship_explosion_after_which_no_collisions      ;
+    bcc skip_sorting_enemy_ship                                       ; can't collide
+insert_enemy_ship
+    stx temp4                                                         ;
+    sty temp3                                                         ;
+    lda enemy_ships_x_pixels,x                                        ;
+    sta temp1_low                                                     ;
+find_place_for_enemy_ship
+    dey                                                               ;
+    bmi store_enemy_ship                                              ;
+    ldx enemy_ships_sorted_by_x,y                                     ;
+    lda temp1_low                                                     ;
+    cmp enemy_ships_x_pixels,x                                        ;
+    bcs store_enemy_ship                                              ;
+    txa                                                               ;
+    sta enemy_ships_sorted_by_x + 1,y                                 ; move the enemy ship further right up one place
+    bcc find_place_for_enemy_ship                                     ;
+store_enemy_ship
+    iny                                                               ;
+    ldx temp4                                                         ;
+    txa                                                               ;
+    sta enemy_ships_sorted_by_x,y                                     ;
+    ldy temp3                                                         ;
+    iny                                                               ;
+skip_sorting_enemy_ship
+    dex                                                               ;
+    bpl sort_next_enemy_ship                                          ;
+    txa                                                               ;
+    sta enemy_ships_sorted_by_x,y                                     ; $ff marks the end of the list
+return9
+    rts                                                               ;
+}
+
 ; ----------------------------------------------------------------------------------
 check_for_starship_collision_with_enemy_ships
+!if sorted_collisions {
+    jsr sort_enemy_ships_by_x                                         ;
+    stx temp4                                                         ; position in the list of the first enemy ship (X = $ff)
+consider_next_enemy_ship
+    inc temp4                                                         ;
+    ldy temp4                                                         ;
+    ldx enemy_ships_sorted_by_x,y                                     ;
+    bmi return9                                                       ;
+    sty temp1_high                                                    ; position in the list of the second enemy ship
+} else {
     lda #maximum_number_of_enemy_ships                                ;
     sta enemy_ships_still_to_consider                                 ;
     lda #0                                                            ;
@@ -2402,6 +2175,7 @@ check_for_starship_collision_with_enemy_ships_loop
     bcs check_for_collision                                           ;
 to_consider_next_enemy_ship
     jmp consider_next_enemy_ship                                      ;
+}
 
 ; ----------------------------------------------------------------------------------
 check_for_collision
@@ -2427,6 +2201,13 @@ starship_not_exploded
     inc starship_collided_with_enemy_ship                             ;
     lda #0                                                            ;
     sta enemy_ships_energy,x                                          ;
+!if sorted_collisions {
+    txa                                                               ;
+    eor #$ff                                                          ;
+    sec                                                               ;
+    adc #maximum_number_of_enemy_ships                                ;
+    sta enemy_ships_still_to_consider                                 ; 8 - slot, as used by explode_enemy_ship
+}
     jsr explode_enemy_ship                                            ;
     pla                                                               ;
     lsr                                                               ;
@@ -2441,6 +2222,39 @@ incur_damage_from_passing_through_explosion
 incur_damage_from_collision
     jsr incur_damage                                                  ;
 no_collision
+!if sorted_collisions {
+    stx temp3                                                         ; slot of the first enemy ship
+consider_next_second_enemy_ship
+check_for_collisions_between_enemy_ships
+    inc temp1_high                                                    ;
+    ldy temp1_high                                                    ;
+    ldx enemy_ships_sorted_by_x,y                                     ;
+    bmi consider_next_enemy_ship                                      ;
+    ldy temp3                                                         ;
+    lda enemy_ships_x_pixels,x                                        ;
+    sec                                                               ;
+    sbc enemy_ships_x_pixels,y                                        ;
+    bcc second_ship_is_near_in_x                                      ; out of order, once a collision has pushed the ships apart
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships + 1    ;
+    bcs consider_next_enemy_ship                                      ; this enemy ship and all those after it are too far right
+second_ship_is_near_in_x
+    cpx temp3                                                         ;
+    bcs second_ship_is_in_higher_slot                                 ;
+    txa                                                               ; compare with the lower slot in Y, as when checking every slot in turn
+    ldx temp3                                                         ;
+    tay                                                               ;
+second_ship_is_in_higher_slot
+    stx temp1_low                                                     ;
+    sty temp0_low                                                     ;
+    lda enemy_ships_x_pixels,x                                        ;
+    sec                                                               ;
+    sbc enemy_ships_x_pixels,y                                        ;
+    bcs skip_inversion_x2                                             ;
+    eor #$ff                                                          ;
+skip_inversion_x2
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships        ;
+    bcs consider_next_second_enemy_ship                               ;
+} else {
     stx temp1_low                                                     ;
     ldx enemy_ships_still_to_consider                                 ;
     dex                                                               ;
@@ -2464,6 +2278,7 @@ check_for_collisions_between_enemy_ships
 skip_inversion_x2
     cmp #size_of_enemy_ship_for_collisions_between_enemy_ships        ;
     bcs consider_next_second_enemy_ship                               ;
+}
     sta enemy_ships_collision_x_difference                            ;
     lda enemy_ships_y_pixels,x                                        ;
     sec                                                               ;
@@ -2489,6 +2304,14 @@ second_ship_not_exploding
 skip11
     sta enemy_ships_energy,x                                          ;
     bne enemy_ship_isnt_destroyed_by_collision                        ;
+!if sorted_collisions {
+    txa                                                               ;
+    eor #$ff                                                          ;
+    sec                                                               ;
+    adc #maximum_number_of_enemy_ships                                ;
+    sta enemy_ships_still_to_consider                                 ; 8 - slot, as used by explode_enemy_ship
+    jsr explode_enemy_ship                                            ;
+} else {
     lda enemy_ships_still_to_consider                                 ;
     pha                                                               ;
     lda torpedoes_still_to_consider                                   ;
@@ -2496,6 +2319,7 @@ skip11
     jsr explode_enemy_ship                                            ;
     pla                                                               ;
     sta enemy_ships_still_to_consider                                 ;
+}
 enemy_ship_isnt_destroyed_by_collision
     lda enemy_ships_type,x                                            ;
     cmp #4                                                            ;
@@ -2507,6 +2331,7 @@ enemy_ship_isnt_destroyed_by_collision
 to_collide_enemy_ships
     jmp collide_enemy_ships                                           ;
 
+!if sorted_collisions=0 {
 consider_next_second_enemy_ship
     dec torpedoes_still_to_consider                                   ;
     beq consider_next_enemy_ship                                      ;
@@ -2517,268 +2342,10 @@ consider_next_enemy_ship
     dec enemy_ships_still_to_consider                                 ;
     beq return9                                                       ;
     jmp check_for_starship_collision_with_enemy_ships_loop            ;
-
-; ----------------------------------------------------------------------------------
-plot_segment
-    ; check if we are close to the side of the screen.
-    ; If not we can forego the boundary checks and run faster.
-    lda temp10                                                        ;
-    cmp #16                                                           ;
-    bcc plot_segment_with_boundary_checks                             ;
-    cmp #256 - 16                                                     ;
-    bcs plot_segment_with_boundary_checks                             ;
-!if rom_writes {
-    ; fast path now includes going off the top/bottom of the screen
-} else {
-    lda temp9                                                         ;
-    cmp #16                                                           ;
-    bcc plot_segment_with_boundary_checks                             ;
-    cmp #256 - 16                                                     ;
-    bcs plot_segment_with_boundary_checks                             ;
 }
-    lda segment_angle_change_per_pixel                                ;
-    cmp #1                                                            ;
-    beq plot_segment_unrolled                                         ;
-
-    ldx x_pixels                                                      ;
-plot_segment_regular_loop
-    jsr eor_play_area_pixel                                           ;
-
-    ldy segment_angle                                                 ;
-    txa                                                               ;
-    clc                                                               ;
-    adc segment_angle_to_x_deltas_table,y                             ; update x
-    tax                                                               ;
-
-    lda segment_angle_to_y_deltas_table,y                             ;
-    clc                                                               ;
-    adc y_pixels                                                      ; update y
-    sta y_pixels                                                      ;
-
-    tya                                                               ;
-    clc                                                               ;
-    adc segment_angle_change_per_pixel                                ; update angle
-    and #$1f                                                          ;
-    sta segment_angle                                                 ;
-
-    dec segment_length                                                ;
-    bne plot_segment_regular_loop                                     ;
-    rts                                                               ;
-
-; ----------------------------------------------------------------------------------
-plot_segment_with_boundary_checks
-    ldx x_pixels                                                      ;
-
-plot_segment_loop
-    jsr eor_pixel_with_boundary_check                                 ;
-
-    ldy segment_angle                                                 ;
-    txa                                                               ;
-    clc                                                               ;
-    adc segment_angle_to_x_deltas_table,y                             ; update x
-    tax                                                               ;
-
-    lda segment_angle_to_y_deltas_table,y                             ;
-    clc                                                               ;
-    adc y_pixels                                                      ; update y
-    sta y_pixels                                                      ;
-
-    tya                                                               ;
-    clc                                                               ;
-    adc segment_angle_change_per_pixel                                ; update angle
-    and #$1f                                                          ;
-    sta segment_angle                                                 ;
-
-    dec segment_length                                                ;
-    bne plot_segment_loop                                             ;
-    rts                                                               ;
 
 ; ----------------------------------------------------------------------------------
-plot_segment_unrolled
-    ldx segment_angle                                                 ; based on start angle,
-    lda plot_table_offset,x                                           ; look up in a table
-    sta jump_address                                                  ; the address we jump to (low byte)
-    lda plot_table_offset2,x                                          ; look up in a table
-    sta jump_address+1                                                ; the address we jump to (high byte)
-    txa                                                               ;
-    clc                                                               ;
-    adc segment_length                                                ; add the segment length
-    tax                                                               ;
-    lda plot_table_offset-1,x                                         ;
-    sta codeptr_low                                                   ;
-    lda plot_table_offset2-1,x                                        ;
-    sta codeptr_high                                                  ;
-    ldy #0                                                            ;
-    lda (codeptr_low),Y                                               ;
-    sta temp_x                                                        ; save the opcode
-    lda #$60                                                          ; opcode for RTS
-    sta (codeptr_low),Y                                               ;
-    ldx x_pixels                                                      ;
-    ldy y_pixels                                                      ;
-    jsr init_object_play_area                                         ;
-jump_address = * + 1
-    jsr $0000                                                         ;
-finish_object
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-    lda temp_x                                                        ; recall opcode
-    ldy #0                                                            ;
-    sta (codeptr_low),Y                                               ;
-    rts                                                               ;
-
-init_object_play_area
-    lda row_table_low,y                                               ;
-    and #$f8                                                          ;
-    clc                                                               ;
-    adc xandf8,x                                                      ;
-    sta screen_address_low                                            ;
-    lda play_area_row_table_high,y                                    ;
-    adc #0                                                            ;
-    sta screen_address_high                                           ;
-    txa                                                               ;
-    and #7                                                            ;
-    tax                                                               ;
-    tya                                                               ;
-    and #7                                                            ;
-    tay                                                               ;
-    lda xbit_table,X                                                  ;
-    rts                                                               ;
-
-leftfix
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-leftfix2
-    lda screen_address_low                                            ;
-    sec                                                               ;
-    sbc #8                                                            ;
-    sta screen_address_low                                            ;
-    bcs +                                                             ;
-    dec screen_address_high                                           ;
-+
-    ldx #7                                                            ;
-    lda #0                                                            ;
-    rts                                                               ;
-
-rightfix
-    eor (screen_address_low),y                                        ;
-    sta (screen_address_low),y                                        ;
-rightfix2
-    lda screen_address_low                                            ;
-    clc                                                               ;
-    adc #8                                                            ;
-    sta screen_address_low                                            ;
-    bcc +                                                             ;
-    inc screen_address_high                                           ;
-+
-    ldx #0                                                            ;
-    lda #0                                                            ;
-    rts                                                               ;
-
-downfix
-    lda #$40                                                          ;
-downfix_with_offset
-    clc                                                               ;
-    adc screen_address_low                                            ;
-    sta screen_address_low                                            ;
-    inc screen_address_high                                           ;
-    bcc +                                                             ;
-    inc screen_address_high                                           ;
-+
-!if rom_writes {
-    bmi offscreen_down                                                ;
-}
-    ldy #0                                                            ;
-    rts                                                               ;
-
-downrightfix
-    cpx #8                                                            ; if (x != 8) then right doesn't need fixing,
-    bne downfix                                                       ; so it must be down that does
-                                                                      ; (we know *something* does)
-    ; right needs fixing. does down need fixing too?
-    cpy #8                                                            ;
-    bne rightfix2                                                     ; if (y != 8) then only fix right
-
-    ; fix both
-    ldx #0                                                            ; fix right
-    lda #$48                                                          ;
-    bne downfix_with_offset                                           ; fix down with offset (ALWAYS branch)
-
-downleftfix
-    cpx #$ff                                                          ;
-    bne downfix                                                       ; if (x != 255) then left doesn't need fixing (down does)
-
-    ; left needs fixing. does down need fixing too?
-    cpy #8                                                            ;
-    bne leftfix2                                                      ; if (y != 8) then down doesn't need fixing (left does)
-
-    ; fix down and left
-    ldx #7                                                            ; fix left
-    lda #$38                                                          ;
-    bne downfix_with_offset                                           ; fix down with offset (ALWAYS branch)
-
-upfix
-    lda #$100-$40                                                     ;
-upfix_with_offset
-    clc                                                               ;
-    adc screen_address_low                                            ;
-    sta screen_address_low                                            ;
-    lda screen_address_high                                           ;
-    sbc #1                                                            ;
-    sta screen_address_high                                           ;
-!if rom_writes {
-    cmp #$58                                                          ;
-}
-    ldy #7                                                            ;
-!if rom_writes {
-    bcc offscreen_up                                                  ;
-}
--
-    rts                                                               ;
-
-!if rom_writes {
-offscreen_down
-    ldy #0                                                            ;
-    ; if screen address >$8000 then we're off the bottom
-    ; we leave the address unchanged, writing to ROM (but that's OK)
-    lda screen_address_high                                           ;
-    cmp #$98                                                          ;
-    bcc -                                                             ;
-    ; we've just moved back onto the top of the screen
-    ; subtract $4000 to reinstate the screen address
-
-offscreen_up
-    ; if screen address <$5800 then we're off the top
-    ; we add $4000 to make the address <$9800, which is also in ROM.
-    eor #$c0                                                          ;
-    sta screen_address_high                                           ;
-    rts                                                               ;
-}
-
-upleftfix
-    cpx #$ff                                                          ;
-    bne upfix                                                         ; if (x != 255) then left doesn't need fixing (but up does)
-
-    ; left needs fixing. does up need fixing too?
-    cpy #$ff                                                          ;
-    bne leftfix2                                                      ; if (y != 255) then up doesn't need fixing (but left does)
-
-    ; fix both
-    ldx #7                                                            ; fix left
-    lda #$100-$40-$8                                                  ;
-    bne upfix_with_offset                                             ; fix up with offset (ALWAYS branch)
-
-uprightfix
-    cpx #8                                                            ;
-    bne upfix                                                         ; if (x != 8) then right doesn't need fixing (but up does)
-
-    ; fix right. does up need fixing too?
-    ldx #0                                                            ; fix right
-    cpy #$ff                                                          ;
-    bne rightfix2                                                     ; if (y != 255) then fix right
-
-    ; fix up.
-    lda #$100-$40+$8                                                  ;
-    bne upfix_with_offset                                             ; fix up with offset (ALWAYS branch)
+!src "build/plot_segment.a"
 
 
 ; ----------------------------------------------------------------------------------
@@ -3260,323 +2827,7 @@ enemy_ship_is_cloaked
     rts                                                               ;
 
 
-; The Circle
-;
-;                      31 00 01
-;                29 30          02 03
-;             28                      04
-;          27                            05
-;          26                            06
-;       25                                  07
-;       24                                  08
-;       23                                  09
-;          22                            10
-;          21                            11
-;             20                      12
-;                19 18          14 13
-;                      17 16 15
-;
-;
-
-
-; Enemy 1
-;
-;                         04
-;                     27      05
-;                     26      06
-;             29  25              07  03
-;         28      24      ..      08      04
-;     27          23              09          05
-;     26              22      10              06
-; 25                  21      11                  07
-; 24                  31  00  01                  08
-; 23          29  30              02  03          09
-;     22  28                              04  10
-;     21                                      11
-;
-
-; start address of the definition of each enemy
-enemy_table_low
-    !byte <enemy0
-    !byte <enemy1
-    !byte <enemy2
-    !byte <enemy3
-    !byte <enemy4
-    !byte <enemy5
-
-enemy_table_high
-    !byte >enemy0
-    !byte >enemy1
-    !byte >enemy2
-    !byte >enemy3
-    !byte >enemy4
-    !byte >enemy5
-
-; The number of arcs that define the enemy
-enemy_arc_counts
-    !byte 5     ; enemy 0
-    !byte 5     ; enemy 1
-    !byte 5     ; enemy 2
-    !byte 5     ; enemy 3
-    !byte 5     ; enemy 4
-    !byte 6     ; enemy 5
-
-; the stride of an enemy is the number of bytes to get from the definition of one angle
-; of the enemy to the next. Four times the number of arcs of the enemy.
-enemy_strides
-    !byte 4*5   ; enemy 0
-    !byte 4*5   ; enemy 1
-    !byte 4*5   ; enemy 2
-    !byte 4*5   ; enemy 3
-    !byte 4*5   ; enemy 4
-    !byte 4*6   ; enemy 5
-
-; There are 32 angles for each enemy covering the full 360 degrees.
-; We define just 5 angles for each enemy. This covers 0-45 degrees. All other angles
-; are copies of these rotated and/or reflected into a cache for the current command.
-enemy0
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  3, -1, 3, 9
-    !byte -5,  7,21, 9
-    !byte -4,  6,28, 9
-    !byte -1,  3,21, 7
-    !byte  0, -4, 4, 8
-
-    ; angle 1
-    !byte  3,  0, 4, 9
-    !byte -6,  6,22, 9
-    !byte -5,  5,29, 9
-    !byte -1,  3,22, 7
-    !byte  1, -4, 5, 8
-
-    ; angle 2
-    !byte  4,  0, 5, 9
-    !byte -7,  4,23, 9
-    !byte -6,  4,30, 9
-    !byte -2,  2,23, 7
-    !byte  2, -4, 6, 8
-
-    ; angle 3
-    !byte  3,  1, 6, 8
-    !byte -8,  3,24,10
-    !byte -7,  3,31, 9
-    !byte -2,  3,23, 8
-    !byte  3, -3, 7, 8
-
-    ; angle 4
-    !byte  3,  1, 7, 7
-    !byte -7,  1,26, 8
-    !byte -7,  2, 0, 8
-    !byte -4,  2,25, 8
-    !byte  3, -3, 8, 9
-
-enemy1
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  3,  1, 3, 9
-    !byte -5,  9,21, 9
-    !byte -4,  8,28, 9
-    !byte  0,  4,20, 8
-    !byte  0, -4, 4, 8
-
-    ; angle 1
-    !byte  2,  2, 4, 9
-    !byte -6,  8,22, 9
-    !byte -5,  7,30, 8
-    !byte -1,  3,22, 7
-    !byte  1, -4, 5, 8
-
-    ; angle 2
-    !byte  2,  2, 5, 8
-    !byte -7,  6,23, 8
-    !byte -6,  6,31, 8
-    !byte -1,  3,22, 8
-    !byte  2, -4, 6, 8
-
-    ; angle 3
-    !byte  2,  2, 6, 8
-    !byte -9,  5,24,10
-    !byte -8,  5,31, 9
-    !byte -2,  3,23, 8
-    !byte  3, -3, 7, 8
-
-    ; angle 4
-    !byte  1,  3, 7, 7
-    !byte -9,  3,26, 8
-    !byte -8,  3, 0, 8
-    !byte -4,  2,25, 8
-    !byte  3, -3, 8, 9
-
-enemy2
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  3, -1, 4, 8
-    !byte -4,  6,21, 8
-    !byte -3,  4,29, 7
-    !byte  0, -5, 4, 4
-    !byte -1, -4, 8, 3
-
-    ; angle 1
-    !byte  3, -1, 5, 8
-    !byte -4,  5,21, 8
-    !byte -3,  4,30, 6
-    !byte  1, -5, 5, 4
-    !byte  0, -5, 9, 4
-
-    ; angle 2
-    !byte  3, -1, 5, 9
-    !byte -5,  4,23, 7
-    !byte -4,  3,31, 6
-    !byte  3, -2,22, 4
-    !byte  1, -5, 9, 4
-
-    ; angle 3
-    !byte  2,  0, 6, 9
-    !byte -6,  4,23, 8
-    !byte -5,  3,31, 6
-    !byte  3, -4, 8, 4
-    !byte  2, -5,12, 4
-
-    ; angle 4
-    !byte  2,  1, 7, 8
-    !byte -7,  2,26, 8
-    !byte -6,  1, 1, 7
-    !byte  4, -4, 8, 5
-    !byte  3, -4,12, 4
-
-enemy3
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  2, -2, 3,11
-    !byte -2,  8,19,11
-    !byte -2,  6,30, 5
-    !byte -1,  3,21, 7
-    !byte  0, -4, 4, 9
-
-    ; angle 1
-    !byte  3, -1, 5,10
-    !byte -5,  6,21,11
-    !byte -4,  4,31, 6
-    !byte -1,  3,22, 7
-    !byte  1, -4, 5, 8
-
-    ; angle 2
-    !byte  4,  0, 7, 9
-    !byte -7,  3,24, 9
-    !byte -6,  2, 0, 7
-    !byte -2,  2,23, 7
-    !byte  2, -4, 6, 9
-
-    ; angle 3
-    !byte  3,  1, 7,10
-    !byte -7,  4,24, 9
-    !byte -6,  3, 0, 6
-    !byte -2,  3,23, 8
-    !byte  3, -3, 7, 8
-
-    ; angle 4
-    !byte  3,  0, 7,11
-    !byte -7,  4,23,11
-    !byte -6,  3, 2, 5
-    !byte -4,  2,25, 8
-    !byte  3, -3, 8, 9
-
-enemy4
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  1, -5, 1,11
-    !byte  4,  5,12,11
-    !byte -6,  2,23, 9
-    !byte -1,  3,21, 7
-    !byte  0, -4, 4, 9
-
-    ; angle 1
-    !byte  2, -4, 2,10
-    !byte  4,  5,12,11
-    !byte -6,  2,23,10
-    !byte -1,  3,22, 7
-    !byte  1, -4, 5, 8
-
-    ; angle 2
-    !byte  3, -4, 3, 9
-    !byte  4,  5,12,11
-    !byte -6,  2,23,11
-    !byte -2,  2,23, 7
-    !byte  2, -4, 6, 9
-
-    ; angle 3
-    !byte  4, -3, 4,10
-    !byte  2,  6,14,11
-    !byte -6,  0,25,10
-    !byte -2,  3,23, 8
-    !byte  3, -3, 7, 8
-
-    ; angle 4
-    !byte  4, -3, 4,10
-    !byte  2,  6,14,11
-    !byte -6,  0,25,10
-    !byte -4,  2,25, 8
-    !byte  3, -3, 8, 9
-
-enemy5
-    ; (x, y, start_angle, length)
-
-    ; angle 0
-    !byte  3,  3,21, 7
-    !byte -1,  0,31, 3
-    !byte  4, -4, 4, 9
-    !byte -5,  3,21, 7
-    !byte -4, -4, 4, 9
-    !byte  0, -3, 7, 3
-
-    ; angle 1
-    !byte  3,  4,22, 7
-    !byte -1, -1, 1, 3
-    !byte  5, -3, 5, 8
-    !byte -5,  3,22, 7
-    !byte -3, -4, 5, 8
-    !byte  1, -3, 9, 3
-
-    ; angle 2
-    !byte  1,  4,23, 7
-    !byte -1, -1, 1, 3
-    !byte  5, -2, 6, 9
-    !byte -6,  1,23, 7
-    !byte -2, -5, 6, 9
-    !byte  1, -3, 8, 3
-
-    ; angle 3
-    !byte  1,  4,23, 8
-    !byte  0,  0, 1, 2
-    !byte  6, -2, 7, 8
-    !byte -5,  1,23, 8
-    !byte  0, -5, 7, 8
-    !byte  2, -3,11, 3
-
-    ; angle 4
-    !byte -1,  5,25, 8
-    !byte  0,  0, 1, 2
-    !byte  6,  0, 8, 9
-    !byte -6,  0,25, 8
-    !byte  1, -5, 8, 9
-    !byte  3, -3,11, 3
-
-; Enemy definitions for the current command
-
-; The centre_array holds (dx,dy) from the centre of the circle to each pixel on the
-; perimeter of the circle. 32 entries, with the tables overlapping.
-centre_array_dy
-    !byte -6,-6,-5,-5,-4,-3,-2,-1
-
-centre_array_dx
-    !byte  0, 1, 2, 3, 4, 5, 5, 6, 6, 6, 5, 5, 4, 3, 2, 1
-    !byte  0,-1,-2,-3,-4,-5,-5,-6,-6,-6,-5,-5,-4,-3,-2,-1
+!src "build/enemies.a"
 
 ; ----------------------------------------------------------------------------------
 read_enemy_arc
@@ -5129,16 +4380,7 @@ skip27
     rts                                                               ;
 
 ; tables of rotations for each of the eight combinations of x-flip, y-flip and xy-swap
-angle_result_table_8
-    !byte $00,$18,$00,$08,$10,$18,$10,$08
-angle_result_table_9
-    !byte $1f,$19,$01,$07,$11,$17,$0f,$09
-angle_result_table_10
-    !byte $1e,$1a,$02,$06,$12,$16,$0e,$0a
-angle_result_table_11
-    !byte $1d,$1b,$03,$05,$13,$15,$0d,$0b
-angle_result_table_12
-    !byte $1c,$1c,$04,$04,$14,$14,$0c,$0c
+!src "build/angle_tables.a"
 
 ; ----------------------------------------------------------------------------------
 ; On Entry:
@@ -5227,12 +4469,12 @@ skip_swap
     bcs return_angle_8                                                ;
 angle_8_or_greater
 !if accurate_atan2 {
-    lda squares1_low + 25,y                                           ;
+    lda squares1_low + atan_boundary_8,y                              ;
     ;sec                                                               ;
-    sbc squares2_low + 255-25,y                                       ;
+    sbc squares2_low + 255-atan_boundary_8,y                          ;
 }
-    lda squares1_high + 25,y                                          ;
-    sbc squares2_high + 255-25,y                                      ;
+    lda squares1_high + atan_boundary_8,y                             ;
+    sbc squares2_high + 255-atan_boundary_8,y                         ;
     cmp y_pixels                                                      ;
     bcc return_angle_9                                                ; if (x*25/256 >= y) then angle=8
 return_angle_8
@@ -5245,12 +4487,12 @@ return_angle_9
     rts                                                               ;
 angle_9_or_greater
 !if accurate_atan2 {
-    lda squares1_low + 78,y                                           ;
+    lda squares1_low + atan_boundary_9,y                              ;
     sec                                                               ;
-    sbc squares2_low + 255-78,y                                       ;
+    sbc squares2_low + 255-atan_boundary_9,y                          ;
 }
-    lda squares1_high + 78,y                                          ;
-    sbc squares2_high + 255-78,y                                      ;
+    lda squares1_high + atan_boundary_9,y                             ;
+    sbc squares2_high + 255-atan_boundary_9,y                         ;
     cmp y_pixels                                                      ;
     bcs return_angle_9                                                ; if (x*78/256 >= y) then angle=9
 return_angle_10
@@ -5264,12 +4506,12 @@ angle_10_or_greater
     cmp y_pixels                                                      ; 192
     bcc angle_11_or_greater                                           ;
 !if accurate_atan2 {
-    lda squares1_low + 137,y                                          ;
+    lda squares1_low + atan_boundary_10,y                             ;
     ;sec                                                               ;
-    sbc squares2_low + 255-137,y                                      ;
+    sbc squares2_low + 255-atan_boundary_10,y                         ;
 }
-    lda squares1_high + 137,y                                         ;
-    sbc squares2_high + 255-137,y                                     ;
+    lda squares1_high + atan_boundary_10,y                            ;
+    sbc squares2_high + 255-atan_boundary_10,y                        ;
     cmp y_pixels                                                      ;
     bcs return_angle_10                                               ; if (x*137/256 >= y) then angle=10
 return_angle_11
@@ -5284,12 +4526,12 @@ angle_11_or_greater
 ;    cmp y_pixels ; 224
 ;    bcc return_angle_12
 !if accurate_atan2 {
-    lda squares1_low + 210,y                                          ;
+    lda squares1_low + atan_boundary_11,y                             ;
     sec                                                               ;
-    sbc squares2_low + 255-210,y                                      ;
+    sbc squares2_low + 255-atan_boundary_11,y                         ;
 }
-    lda squares1_high + 210,y                                         ;
-    sbc squares2_high + 255-210,y                                     ;
+    lda squares1_high + atan_boundary_11,y                            ;
+    sbc squares2_high + 255-atan_boundary_11,y                        ;
     cmp y_pixels                                                      ;
     bcs return_angle_11                                               ; if (x*210/256 >= y) then angle=11
 return_angle_12
@@ -5309,6 +4551,13 @@ collide_enemy_ships
 skip_floor
     sta enemy_ships_energy,x                                          ;
     bne first_ship_survives_collision                                 ;
+!if sorted_collisions {
+    txa                                                               ;
+    eor #$ff                                                          ;
+    sec                                                               ;
+    adc #maximum_number_of_enemy_ships                                ;
+    sta enemy_ships_still_to_consider                                 ; 8 - slot, as used by explode_enemy_ship
+}
     jsr explode_enemy_ship                                            ;
 first_ship_survives_collision
     lda enemy_ships_type,x                                            ;
@@ -5938,411 +5187,7 @@ compare_velocity
 return24
     rts                                                               ;
 
-; ----------------------------------------------------------------------------------
-starship_addresses_low
-    !byte <starship_sprite_1
-    !byte <starship_sprite_2
-    !byte <starship_sprite_3
-    !byte <starship_sprite_4
-    !byte <starship_sprite_5
-    !byte <starship_sprite_6
-    !byte <starship_sprite_7
-    !byte <starship_sprite_8
-    !byte <starship_sprite_9
-    !byte <starship_sprite_10
-    !byte <starship_sprite_11
-starship_addresses_high
-    !byte >starship_sprite_1
-    !byte >starship_sprite_2
-    !byte >starship_sprite_3
-    !byte >starship_sprite_4
-    !byte >starship_sprite_5
-    !byte >starship_sprite_6
-    !byte >starship_sprite_7
-    !byte >starship_sprite_8
-    !byte >starship_sprite_9
-    !byte >starship_sprite_10
-    !byte >starship_sprite_11
-num_starships = * - starship_addresses_high
-
-; ----------------------------------------------------------------------------------
-starship_sprite_1
-    !byte %.#.....#                                                   ; .#.....#.....#..
-    !byte %.#.....#                                                   ; .#.....#.....#..
-    !byte %.#.....#                                                   ; .#.....#.....#..
-    !byte %.#....##                                                   ; .#....###....#..
-    !byte %###..###                                                   ; ###..#####..###.
-    !byte %#.#..###                                                   ; #.#..#####..#.#.
-    !byte %#.#..#.#                                                   ; #.#..#.#.#..#.#.
-    !byte %#.#...##                                                   ; #.#...###...#.#.
-    !byte %.....#..                                                   ; #####.###.#####.
-    !byte %.....#..                                                   ; .#..#######..#..
-    !byte %.....#..                                                   ; .#....###....#..
-    !byte %#....#..                                                   ; .....#.#.#......
-    !byte %##..###.                                                   ; ....##.#.##.....
-    !byte %##..#.#.                                                   ; ....##.#.##.....
-    !byte %.#..#.#.                                                   ; ....##.#.##.....
-    !byte %#...#.#.                                                   ; .....#####......
-    !byte %#####.##                                                   ;
-    !byte %.#..####                                                   ;
-    !byte %.#....##                                                   ;
-    !byte %.....#.#                                                   ;
-    !byte %....##.#                                                   ;
-    !byte %....##.#                                                   ;
-    !byte %....##.#                                                   ;
-    !byte %.....###                                                   ;
-    !byte %#.#####.                                                   ;
-    !byte %###..#..                                                   ;
-    !byte %#....#..                                                   ;
-    !byte %.#......                                                   ;
-    !byte %.##.....                                                   ;
-    !byte %.##.....                                                   ;
-    !byte %.##.....                                                   ;
-    !byte %##......                                                   ;
-
-starship_sprite_2
-    !byte %......##                                                   ; ......###.......
-    !byte %....##..                                                   ; ....##...##.....
-    !byte %...#....                                                   ; ...#.......#....
-    !byte %...#..##                                                   ; ...#..###..#....
-    !byte %..#..#..                                                   ; ..#..#...#..#...
-    !byte %..#..#.#                                                   ; ..#..#.#.#..#...
-    !byte %..#..#..                                                   ; ..#..#...#..#...
-    !byte %...#..##                                                   ; ...#..###..#....
-    !byte %#.......                                                   ; ...#.......#....
-    !byte %.##.....                                                   ; .#..##...##..#..
-    !byte %...#....                                                   ; ###...###...###.
-    !byte %#..#....                                                   ; ###..##.##..###.
-    !byte %.#..#...                                                   ; ######...######.
-    !byte %.#..#...                                                   ; ###..##.##..###.
-    !byte %.#..#...                                                   ; ###...###...###.
-    !byte %#..#....                                                   ; .#...........#..
-    !byte %...#....                                                   ;
-    !byte %.#..##..                                                   ;
-    !byte %###...##                                                   ;
-    !byte %###..##.                                                   ;
-    !byte %######..                                                   ;
-    !byte %###..##.                                                   ;
-    !byte %###...##                                                   ;
-    !byte %.#......                                                   ;
-    !byte %...#....                                                   ;
-    !byte %.##..#..                                                   ;
-    !byte %#...###.                                                   ;
-    !byte %##..###.                                                   ;
-    !byte %.######.                                                   ;
-    !byte %##..###.                                                   ;
-    !byte %#...###.                                                   ;
-    !byte %.....#..                                                   ;
-
-; TOBY:
-starship_sprite_3
-    !byte %.......#                                                   ; .......#........
-    !byte %......#.                                                   ; ......#.#.......
-    !byte %......#.                                                   ; ......#.#.......
-    !byte %.....#..                                                   ; .....#...#......
-    !byte %.....#.#                                                   ; .....#.#.#......
-    !byte %....#.#.                                                   ; ....#.#.#.#.....
-    !byte %#..#.###                                                   ; #..#.#####.#..#.
-    !byte %##.#....                                                   ; ##.#.......#.##.
-    !byte %........                                                   ; #.##...#...##.#.
-    !byte %#.......                                                   ; #..#..#.#..#..#.
-    !byte %#.......                                                   ; #...##...##...#.
-    !byte %.#......                                                   ; #...#.....#...#.
-    !byte %.#......                                                   ; #..#.......#..#.
-    !byte %#.#.....                                                   ; #.#.........#.#.
-    !byte %##.#..#.                                                   ; .#...........#..
-    !byte %...#.##.                                                   ; ..###########...
-    !byte %#.##...#
-    !byte %#..#..#.
-    !byte %#...##..
-    !byte %#...#...
-    !byte %#..#....
-    !byte %#.#.....
-    !byte %.#......
-    !byte %..######
-    !byte %...##.#.
-    !byte %#..#..#.
-    !byte %.##...#.
-    !byte %..#...#.
-    !byte %...#..#.
-    !byte %....#.#.
-    !byte %.....#..
-    !byte %#####...
-
-starship_sprite_4
-    !byte %.......#                                                   ; .......#........
-    !byte %.....###                                                   ; .....#####......
-    !byte %.#..##..                                                   ; .#..##...##..#..
-    !byte %.#..##..                                                   ; .#..##...##..#..
-    !byte %.#...###                                                   ; .#...#####...#..
-    !byte %.#.....#                                                   ; .#.....#.....#..
-    !byte %###...#.                                                   ; ###...#.#...###.
-    !byte %#.#....#                                                   ; #.#....#....#.#.
-    !byte %........                                                   ; #.#...#.#...#.#.
-    !byte %##......                                                   ; #.#....#....#.#.
-    !byte %.##..#..                                                   ; #..#..###..#..#.
-    !byte %.##..#..                                                   ; #..###...###..#.
-    !byte %##...#..                                                   ; #.#.#.....#.#.#.
-    !byte %.....#..                                                   ; .#...#...#...#..
-    !byte %#...###.                                                   ; ......#.#.......
-    !byte %....#.#.                                                   ; .......#........
-    !byte %#.#...#.                                                   ;
-    !byte %#.#....#                                                   ;
-    !byte %#..#..##                                                   ;
-    !byte %#..###..                                                   ;
-    !byte %#.#.#...                                                   ;
-    !byte %.#...#..                                                   ;
-    !byte %......#.                                                   ;
-    !byte %.......#                                                   ;
-    !byte %#...#.#.                                                   ;
-    !byte %....#.#.                                                   ;
-    !byte %#..#..#.                                                   ;
-    !byte %.###..#.                                                   ;
-    !byte %..#.#.#.                                                   ;
-    !byte %.#...#..                                                   ;
-    !byte %#.......                                                   ;
-    !byte %........                                                   ;
-
-; ADE:
-starship_sprite_5
-    !byte %..#.....                                                   ; ..#.........#...
-    !byte %.##....#                                                   ; .##....#....##..
-    !byte %.#.#...#                                                   ; .#.#...#...#.#..
-    !byte %.#.#..##                                                   ; .#.#..###..#.#..
-    !byte %#...#.##                                                   ; #...#.###.#...#.
-    !byte %#...#.##                                                   ; #...#.###.#...#.
-    !byte %#....###                                                   ; #....#####....#.
-    !byte %#..#..##                                                   ; #..#..###..#..#.
-    !byte %....#...                                                   ; #.###.###.###.#.
-    !byte %....##..                                                   ; .#.#..###..#.#..
-    !byte %...#.#..                                                   ; .#....###....#..
-    !byte %#..#.#..                                                   ; ..#..#####..#...
-    !byte %#.#...#.                                                   ; ...##..#..##....
-    !byte %#.#...#.                                                   ; ....##...##.....
-    !byte %##....#.                                                   ; ....##...##.....
-    !byte %#..#..#.                                                   ; .....#####......
-    !byte %#.###.##
-    !byte %.#.#..##
-    !byte %.#....##
-    !byte %..#..###
-    !byte %...##..#
-    !byte %....##..
-    !byte %....##..
-    !byte %.....###
-    !byte %#.###.#.
-    !byte %#..#.#..
-    !byte %#....#..
-    !byte %##..#...
-    !byte %..##....
-    !byte %.##.....
-    !byte %.##.....
-    !byte %##......
-
-starship_sprite_6
-    !byte %.......#                                                   ; .......#........
-    !byte %.......#                                                   ; .......#........
-    !byte %......##                                                   ; ......###.......
-    !byte %##....##                                                   ; ##....###....##.
-    !byte %##...##.                                                   ; ##...##.##...##.
-    !byte %##...##.                                                   ; ##...##.##...##.
-    !byte %##..##..                                                   ; ##..##...##..##.
-    !byte %##..##.#                                                   ; ##..##.#.##..##.
-    !byte %........                                                   ; #####..#..#####.
-    !byte %........                                                   ; ##....###....##.
-    !byte %#.......                                                   ; ######...######.
-    !byte %#....##.                                                   ; ##...##.##...##.
-    !byte %##...##.                                                   ; ####..###..####.
-    !byte %##...##.                                                   ; ##.##..#..##.##.
-    !byte %.##..##.                                                   ; ##..##.#.##..##.
-    !byte %.##..##.                                                   ; .....#####......
-    !byte %#####..#                                                   ;
-    !byte %##....##                                                   ;
-    !byte %######..                                                   ;
-    !byte %##...##.                                                   ;
-    !byte %####..##                                                   ;
-    !byte %##.##..#                                                   ;
-    !byte %##..##.#                                                   ;
-    !byte %.....###                                                   ;
-    !byte %..#####.                                                   ;
-    !byte %#....##.                                                   ;
-    !byte %.######.                                                   ;
-    !byte %##...##.                                                   ;
-    !byte %#..####.                                                   ;
-    !byte %..##.##.                                                   ;
-    !byte %.##..##.                                                   ;
-    !byte %##......                                                   ;
-
-; TOBY
-starship_sprite_7
-    !byte %.......#                                                   ; .......#........
-    !byte %......#.                                                   ; ......#.#.......
-    !byte %......#.                                                   ; ......#.#.......
-    !byte %.....#..                                                   ; .....#...#......
-    !byte %....#..#                                                   ; ....#..#..#.....
-    !byte %..##..#.                                                   ; ..##..#.#..##...
-    !byte %.#..#..#                                                   ; .#..#..#..#..#..
-    !byte %#....#.#                                                   ; #....#.#.#....#.
-    !byte %........                                                   ; #..#..#.#..#..#.
-    !byte %#.......                                                   ; #.#.#..#..#.#.#.
-    !byte %#.......                                                   ; #..#.#.#.#.#..#.
-    !byte %.#......                                                   ; .#....#.#....#..
-    !byte %..#.....                                                   ; ..#..#...#..#...
-    !byte %#..##...                                                   ; .#.##..#..##.#..
-    !byte %..#..#..                                                   ; #....#####....#.
-    !byte %.#....#.                                                   ; #.............#.
-    !byte %#..#..#.
-    !byte %#.#.#..#
-    !byte %#..#.#.#
-    !byte %.#....#.
-    !byte %..#..#..
-    !byte %.#.##..#
-    !byte %#....###
-    !byte %#.......
-    !byte %#..#..#.
-    !byte %..#.#.#.
-    !byte %.#.#..#.
-    !byte %#....#..
-    !byte %.#..#...
-    !byte %..##.#..
-    !byte %##....#.
-    !byte %......#.
-
-starship_sprite_8
-    !byte %........                                                   ; ................
-    !byte %......##                                                   ; ......###.......
-    !byte %.....#..                                                   ; .....#...#......
-    !byte %....#...                                                   ; ....#.....#.....
-    !byte %...#...#                                                   ; ...#...#...#....
-    !byte %...#..#.                                                   ; ...#..#.#..#....
-    !byte %...#...#                                                   ; ...#...#...#....
-    !byte %.#..#...                                                   ; .#..#.....#..#..
-    !byte %........                                                   ; ###..#...#..###.
-    !byte %#.......                                                   ; ###...###...###.
-    !byte %.#......                                                   ; ##.#..#.#..#.##.
-    !byte %..#.....                                                   ; ##.##.#.#.##.##.
-    !byte %...#....                                                   ; ###.###.###.###.
-    !byte %#..#....                                                   ; ###..#...#..###.
-    !byte %...#....                                                   ; .#....#.#....#..
-    !byte %..#..#..                                                   ; .#.....#.....#..
-    !byte %###..#..                                                   ;
-    !byte %###...##                                                   ;
-    !byte %##.#..#.                                                   ;
-    !byte %##.##.#.                                                   ;
-    !byte %###.###.                                                   ;
-    !byte %###..#..                                                   ;
-    !byte %.#....#.                                                   ;
-    !byte %.#.....#                                                   ;
-    !byte %.#..###.                                                   ;
-    !byte %#...###.                                                   ;
-    !byte %#..#.##.                                                   ;
-    !byte %#.##.##.                                                   ;
-    !byte %###.###.                                                   ;
-    !byte %.#..###.                                                   ;
-    !byte %#....#..                                                   ;
-    !byte %.....#..                                                   ;
-
-starship_sprite_9
-    !byte %......##                                                   ; ......###.......
-    !byte %.....##.                                                   ; .....##.##......
-    !byte %.#..##..                                                   ; .#..##...##..#..
-    !byte %.#...###                                                   ; .#...#####...#..
-    !byte %.#....#.                                                   ; .#....#.#....#..
-    !byte %###...#.                                                   ; ###...#.#...###.
-    !byte %#.#...#.                                                   ; #.#...#.#...#.#.
-    !byte %#.#...#.                                                   ; #.#...#.#...#.#.
-    !byte %#.......                                                   ; #..#..#.#..#..#.
-    !byte %##......                                                   ; #...#.#.#.#...#.
-    !byte %.##..#..                                                   ; #....#.#.#....#.
-    !byte %##...#..                                                   ; #..#...#...#..#.
-    !byte %#....#..                                                   ; #.#.#..#..#.#.#.
-    !byte %#...###.                                                   ; .#...#.#.#...#..
-    !byte %#...#.#.                                                   ; .#....###....#..
-    !byte %#...#.#.                                                   ; .......#........
-    !byte %#..#..#.                                                   ;
-    !byte %#...#.#.                                                   ;
-    !byte %#....#.#                                                   ;
-    !byte %#..#...#                                                   ;
-    !byte %#.#.#..#                                                   ;
-    !byte %.#...#.#                                                   ;
-    !byte %.#....##                                                   ;
-    !byte %.......#                                                   ;
-    !byte %#..#..#.                                                   ;
-    !byte %#.#...#.                                                   ;
-    !byte %.#....#.                                                   ;
-    !byte %...#..#.                                                   ;
-    !byte %..#.#.#.                                                   ;
-    !byte %.#...#..                                                   ;
-    !byte %#....#..                                                   ;
-    !byte %........                                                   ;
-
-starship_sprite_10
-    !byte %.......#                                                   ; .......#........
-    !byte %.......#                                                   ; .......#........
-    !byte %.#....##                                                   ; .#....###....#..
-    !byte %.#....##                                                   ; .#....###....#..
-    !byte %.#...##.                                                   ; .#...##.##...#..
-    !byte %###..##.                                                   ; ###..##.##..###.
-    !byte %###.##.#                                                   ; ###.##.#.##.###.
-    !byte %###.##.#                                                   ; ###.##.#.##.###.
-    !byte %........                                                   ; #####..#..#####.
-    !byte %........                                                   ; ##.....#.....##.
-    !byte %#....#..                                                   ; ######.#.######.
-    !byte %#....#..                                                   ; ##....###....##.
-    !byte %##...#..                                                   ; #####..#..#####.
-    !byte %##..###.                                                   ; ###.##.#.##.###.
-    !byte %.##.###.                                                   ; ###..##.##..###.
-    !byte %.##.###.                                                   ; .#....###....#..
-    !byte %#####..#                                                   ;
-    !byte %##.....#                                                   ;
-    !byte %######.#                                                   ;
-    !byte %##....##                                                   ;
-    !byte %#####..#                                                   ;
-    !byte %###.##.#                                                   ;
-    !byte %###..##.                                                   ;
-    !byte %.#....##                                                   ;
-    !byte %..#####.                                                   ;
-    !byte %.....##.                                                   ;
-    !byte %.######.                                                   ;
-    !byte %#....##.                                                   ;
-    !byte %..#####.                                                   ;
-    !byte %.##.###.                                                   ;
-    !byte %##..###.                                                   ;
-    !byte %#....#..                                                   ;
-
-starship_sprite_11
-    !byte %.....###                                                   ;.....#####......
-    !byte %....##..                                                   ;....##...##.....
-    !byte %...##..#                                                   ;...##..#..##....
-    !byte %...##.##                                                   ;...##.###.##....
-    !byte %...##.##                                                   ;...##.###.##....
-    !byte %...##..#                                                   ;...##..#..##....
-    !byte %....##..                                                   ;....##...##.....
-    !byte %##...###                                                   ;##...#####...##.
-    !byte %##......                                                   ;##.....#.....##.
-    !byte %.##.....                                                   ;###...###...###.
-    !byte %..##....                                                   ;####..###..####.
-    !byte %#.##....                                                   ;##.##.###.##.##.
-    !byte %#.##....                                                   ;##..#######..##.
-    !byte %..##....                                                   ;##....###....##.
-    !byte %.##.....                                                   ;##....###....##.
-    !byte %##...##.                                                   ;##.....#.....##.
-    !byte %##.....#                                                   ;
-    !byte %###...##                                                   ;
-    !byte %####..##                                                   ;
-    !byte %##.##.##                                                   ;
-    !byte %##..####                                                   ;
-    !byte %##....##                                                   ;
-    !byte %##....##                                                   ;
-    !byte %##.....#                                                   ;
-    !byte %.....##.                                                   ;
-    !byte %#...###.                                                   ;
-    !byte %#..####.                                                   ;
-    !byte %#.##.##.                                                   ;
-    !byte %###..##.                                                   ;
-    !byte %#....##.                                                   ;
-    !byte %#....##.                                                   ;
-    !byte %.....##.                                                   ;
-
+!src "build/starships.a"
 
 ; ----------------------------------------------------------------------------------
 scores_for_destroying_enemy_ships
@@ -7794,6 +6639,9 @@ post_wait_for_timer
     jsr update_stars                                                  ;
     jsr handle_enemy_ships_cloaking                                   ;
     inc how_enemy_ship_was_damaged                                    ; # 0 = collision with starship torpedoes
+!if sorted_collisions {
+    jsr sort_enemy_ships_by_x                                         ; ready for the torpedoes
+}
     jsr plot_starship_torpedoes                                       ;
     jsr update_enemy_torpedoes                                        ;
     inc how_enemy_ship_was_damaged                                    ; # 2 = collision with escape pod
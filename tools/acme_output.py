@@ -0,0 +1,71 @@
+import re
+
+# Readers for the files acme writes alongside each binary (see go_acme).
+
+symbol_pattern = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(\$[0-9a-fA-F]+|-?[0-9]+)')
+
+def read_symbols(filename):
+    # Read an acme --symbollist file into a dictionary of name -> value
+    symbols = {}
+    with open(filename) as f:
+        for line in f:
+            match = symbol_pattern.search(line)
+            if match:
+                value = match.group(2)
+                if value[0] == '$':
+                    symbols[match.group(1)] = int(value[1:], 16)
+                else:
+                    symbols[match.group(1)] = int(value)
+    return symbols
+
+def symbols_filename(variant, build_dir="build"):
+    return build_dir + "/" + variant + ".symbols.txt"
+
+# An acme -r report lists each source line with its line number, and for lines that
+# assemble to something, the address and (the first few of) the bytes assembled:
+#
+#    2565  2df3 d0e1                   bne plot_segment_regular_loop       ;
+#
+# Included files start with a '; ******** Source: <filename>' line. Lines inside a macro
+# are listed at each use, with the line numbers of the macro definition.
+
+report_pattern = re.compile(r'^\s*([0-9]+)  ([0-9a-fA-F]{4}) ([0-9a-fA-F]*)(\.*) ?(.*)$')
+report_source_pattern = re.compile(r'^\s*([0-9]+) (.*)$')
+report_file_pattern = re.compile(r'^; \*+ Source: (.*)$')
+
+class ReportLine:
+    def __init__(self, filename, number, address, data, truncated, source):
+        self.filename = filename
+        self.number = number
+        self.address = address          # None if the line assembles to nothing
+        self.data = data                # bytes assembled (only the first few if truncated)
+        self.truncated = truncated
+        self.source = source
+
+    def code(self):
+        # the source without its comment
+        return self.source.split(";", 1)[0].strip()
+
+def read_report(filename):
+    # Read an acme -r report file into a list of ReportLines
+    lines = []
+    source_filename = None
+    with open(filename, encoding="latin-1") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            match = report_file_pattern.match(line)
+            if match:
+                source_filename = match.group(1).strip()
+                continue
+            match = report_pattern.match(line)
+            if match:
+                data = bytes.fromhex(match.group(3)) if len(match.group(3)) % 2 == 0 else b""
+                lines.append(ReportLine(source_filename, int(match.group(1)), int(match.group(2), 16), data, match.group(4) != "", match.group(5).strip(" ")))
+                continue
+            match = report_source_pattern.match(line)
+            if match:
+                lines.append(ReportLine(source_filename, int(match.group(1)), None, b"", False, match.group(2).strip(" ")))
+    return lines
+
+def report_filename(variant, build_dir="build"):
+    return build_dir + "/" + variant + ".report.txt"
@@ -0,0 +1,365 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import maths_tables
+import mos6502
+import png
+
+# Models calculate_enemy_ship_angle_to_starship with NumPy, for every enemy position
+# (temp10, temp9) = (x, y) from 0 to 255 at once, and compares the angle it returns with
+# the nearest of the 32 angles to the exact direction from the starship.
+#
+# The routine finds the magnitudes of dx and dy, swaps them so that x >= y, and then
+# narrows down the angle within the octant (8-12) with a binary search on shifts of x and
+# at most one multiply of x by an atan_boundary constant. The angle is then looked up in
+# angle_result_table_8 to _12 by octant (see maths_tables.py). The schemes modelled are:
+#
+#   fast        accurate_atan2=0, as built: only the high bytes of each multiply are
+#               calculated, so the result can be one too low
+#   accurate    accurate_atan2=1: the full 16 bit multiply
+#   shifts      the binary search only, with no multiply: the boundaries are at x/8, x/4,
+#               x/2 and 3x/4 instead of x*atan_boundary/256
+#
+# plus any --boundaries given: the four boundaries (in 256ths of x) with an exact
+# multiply, to try out other constants.
+#
+# The table lists how many positions get the right angle, or one or more angles out, for
+# each scheme. --images writes, for each scheme, the angles as in documents/atan2-fast.png
+# (so the original images can be reproduced) and a heatmap of the error.
+#
+# The cycles of each scheme are counted statically: the instructions each position runs
+# through (code below) are added up from mos6502's table, a taken branch and a squares
+# table lookup that crosses a page each costing one more. 'shifts' replaces the multiply
+# with shifts of x, and each --boundaries scheme uses the 'accurate' 16 bit multiply.
+#
+# With --variant STAR the routine in the assembled binary is also run on the 6502 core for
+# every position. It checks the 'fast' model returns the same angle each time, and lists
+# the cycles it took on each path next to the static count.
+
+angles = 32
+size = 256
+
+# the paths through the routine: how the angle was decided, and the angle in the octant
+paths = [
+    ("x/16 >= y", 8),
+    ("x*atan_boundary_8", 8),
+    ("x*atan_boundary_8", 9),
+    ("x/8 < y", 9),
+    ("x*atan_boundary_9", 9),
+    ("x*atan_boundary_9", 10),
+    ("x*atan_boundary_10", 10),
+    ("x*atan_boundary_10", 11),
+    ("x*atan_boundary_11", 11),
+    ("x*atan_boundary_11", 12),
+]
+
+# The routine's instructions, for the static cycle counts, as 'mnemonic mode' with a '+'
+# after a branch that is taken, from the jsr that calls it. The squares tables start on a
+# page (squares1_low = $0900 and so on), so a lookup at table + k,Y crosses a page when
+# k + Y passes 255. Branches and the angle_result_table lookups are taken not to cross a
+# page: where the routine is assembled decides that, so --variant can show a cycle or two
+# more on some paths.
+start_code = "jsr abs, lda zp, ldy imm, sty zp"
+
+# each magnitude, as (sign bit clear, sign bit set), then the swap as (no swap, swap)
+fast_y_code = ("sec imp, sbc imm, bpl rel+, rol zp, sta zp", "sec imp, sbc imm, bpl rel, eor imm, rol zp, sta zp")
+fast_x_code = ("lda zp, sbc imm, bpl rel+, rol zp", "lda zp, sbc imm, bpl rel, eor imm, rol zp")
+accurate_y_code = ("sec imp, bmi rel, eor imm, sbc imm, clc imp, rol zp, sbc imm, sta zp", "sec imp, bmi rel+, rol zp, sbc imm, sta zp")
+accurate_x_code = ("lda zp, bmi rel, eor imm, sbc imm, clc imp, rol zp, sbc imm", "lda zp, bmi rel+, rol zp, sbc imm")
+swap_code = ("sta zp, cmp zp, bcs rel+, rol zp, ldy zp, tya imp", "sta zp, cmp zp, bcs rel, ldy zp, sty zp, sta zp, rol zp, ldy zp, tya imp")
+
+# the binary search for each path, up to the multiply and after it (to the rts)
+step = "lsr acc, cmp zp, bcc rel"
+step_taken = "lsr acc, cmp zp, bcc rel+"
+result_code = "ldy zp, lda absy, rts imp"
+path_code = [
+    (", ".join([step, step, step, "lsr acc, cmp zp, bcs rel+", result_code]), None),
+    (", ".join([step, step, step, "lsr acc, cmp zp, bcs rel"]), "cmp zp, bcc rel, " + result_code),
+    (", ".join([step, step, step, "lsr acc, cmp zp, bcs rel"]), "cmp zp, bcc rel+, " + result_code),
+    (", ".join([step, step, step_taken, result_code]), None),
+    (", ".join([step, step_taken]), "cmp zp, bcs rel+, " + result_code),
+    (", ".join([step, step_taken]), "cmp zp, bcs rel, " + result_code),
+    (", ".join([step_taken, "adc zp, ror acc, cmp zp, bcc rel"]), "cmp zp, bcs rel+, " + result_code),
+    (", ".join([step_taken, "adc zp, ror acc, cmp zp, bcc rel"]), "cmp zp, bcs rel, " + result_code),
+    (", ".join([step_taken, "adc zp, ror acc, cmp zp, bcc rel+"]), "cmp zp, bcs rel+, " + result_code),
+    (", ".join([step_taken, "adc zp, ror acc, cmp zp, bcc rel+"]), "cmp zp, bcs rel, " + result_code),
+]
+path_boundary = [None, 0, 0, None, 1, 1, 2, 2, 3, 3]
+
+# the multiply for each boundary: the code, and the squares table lookups (offset of k)
+fast_multiply = "lda absy, sbc absy"
+accurate_multiply = ["lda absy, sbc absy, lda absy, sbc absy", "lda absy, sec imp, sbc absy, lda absy, sbc absy", "lda absy, sbc absy, lda absy, sbc absy", "lda absy, sec imp, sbc absy, lda absy, sbc absy"]
+exact_multiply = "lda absy, sec imp, sbc absy, lda absy, sbc absy"
+shifts_multiply = ["tya imp, lsr acc, lsr acc, lsr acc", "tya imp, lsr acc, lsr acc", "tya imp, lsr acc", "tya imp, lsr acc, sta zp, lsr acc, clc imp, adc zp"]
+
+def code_cycles(code):
+    # the cycles of a list of instructions, as above
+    cycles = 0
+    for text in code.split(","):
+        (mnemonic, mode) = text.split()
+        taken = mode.endswith("+")
+        cycles += mos6502.lookup(mnemonic, mode.rstrip("+")).cycles + taken
+    return cycles
+
+def static_cycles(scheme, x, y, path, boundaries):
+    # The cycles for each position, counted along the instructions of its path
+    if scheme == "accurate":
+        (mx, my, bits) = octant_accurate(x, y)
+        (y_code, x_code) = (accurate_y_code, accurate_x_code)
+        (y_sign, x_sign) = (y >= 0x80, x >= 0x80)
+    else:
+        (mx, my, bits) = octant_fast(x, y)
+        (y_code, x_code) = (fast_y_code, fast_x_code)
+        (y_sign, x_sign) = (((y - 0x7f) & 0x80) != 0, ((x - 0x7f) & 0x80) != 0)
+    swap = mx < my
+    larger = np.where(swap, my, mx)
+    cycles = code_cycles(start_code) + np.where(y_sign, code_cycles(y_code[1]), code_cycles(y_code[0]))
+    cycles += np.where(x_sign, code_cycles(x_code[1]), code_cycles(x_code[0]))
+    cycles += np.where(swap, code_cycles(swap_code[1]), code_cycles(swap_code[0]))
+
+    for (number, (before, after)) in enumerate(path_code):
+        chosen = path == number
+        boundary = path_boundary[number]
+        taken = code_cycles(before)
+        if boundary is not None:
+            if scheme == "fast":
+                (multiply, lookups) = (fast_multiply, 1)
+            elif scheme == "accurate":
+                (multiply, lookups) = (accurate_multiply[boundary], 2)
+            elif scheme == "shifts":
+                (multiply, lookups) = (shifts_multiply[boundary], 0)
+            else:
+                (multiply, lookups) = (exact_multiply, 2)
+            taken += code_cycles(multiply) + code_cycles(after)
+            if lookups:
+                k = boundaries[boundary] if scheme in ("fast", "accurate") else [int(value) for value in scheme.split(",")][boundary]
+                crossings = (k + larger > 255).astype(int) + (255 - k + larger > 255).astype(int)
+                taken = taken + lookups * crossings
+        cycles = np.where(chosen, cycles + taken, cycles)
+    return cycles
+
+# colours for the angles, as the images in documents/, and for the error heatmaps
+sector_palette = [(0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0)]
+error_shades = 8
+error_palette = [(0, 0, int(40 + 160 * shade / (error_shades - 1))) for shade in range(error_shades)] + [(255, 0, 0), (255, 255, 255), (90, 90, 90)]
+one_out = error_shades
+more_out = error_shades + 1
+centre_colour = error_shades + 2
+
+def read_angle_tables():
+    # Returns angle_result_table_8 to _12 as an array (5, 8) and the atan_boundary constants
+    groups = maths_tables.make_groups(maths_tables.all_args.parse_args([]))
+    angle_group = [group for group in groups if group.filename == "angle_tables.a"][0]
+    tables = np.array([table.values for table in angle_group.tables])
+    boundaries = [constant.value for constant in angle_group.constants]
+    return (tables, boundaries)
+
+# squares1 and squares2 as made by create_square_tables: (n*n)/4 and ((n-255)^2)/4
+n = np.arange(512)
+squares1 = n * n // 4
+squares2 = (n - 255) ** 2 // 4
+
+def positions():
+    y, x = np.mgrid[0:size, 0:size]
+    return (x, y)
+
+def octant_fast(x, y):
+    # (magnitude of dx, magnitude of dy, octant bits) as the accurate_atan2=0 code: the
+    # difference from $7f, inverted with 'eor #$ff' when negative
+    def magnitude(value):
+        difference = (value - 0x7f) & 0xff
+        return (np.where(difference & 0x80, difference ^ 0xff, difference), value >= 0x7f)
+    (mx, x_positive) = magnitude(x)
+    (my, y_positive) = magnitude(y)
+    return (mx, my, y_positive.astype(int) * 4 + x_positive.astype(int) * 2)
+
+def octant_accurate(x, y):
+    # the accurate_atan2=1 code: |value - 127|, with the sign from bit 7 of the value
+    def magnitude(value):
+        return (np.where(value >= 0x80, value - 0x7f, 0x7f - value), value >= 0x80)
+    (mx, x_positive) = magnitude(x)
+    (my, y_positive) = magnitude(y)
+    return (mx, my, y_positive.astype(int) * 4 + x_positive.astype(int) * 2)
+
+def angle_in_octant(larger, smaller, multiply):
+    # The binary search of the routine. 'multiply(k, carry)' is the value compared
+    # against the smaller magnitude for x*k/256, where 'carry' is the carry flag
+    # when the multiply starts. Returns the angle (8-12) and the path taken.
+    half = larger >> 1
+    three_quarters = (half + larger) >> 1          # adc x_pixels / ror
+    search = [
+        (half >= smaller) & ((larger >> 2) >= smaller) & ((larger >> 3) >= smaller) & ((larger >> 4) >= smaller),
+        (half >= smaller) & ((larger >> 2) >= smaller) & ((larger >> 3) >= smaller) & ((larger >> 4) < smaller),
+        (half >= smaller) & ((larger >> 2) >= smaller) & ((larger >> 3) < smaller),
+        (half >= smaller) & ((larger >> 2) < smaller),
+        (half < smaller) & (three_quarters >= smaller),
+        (half < smaller) & (three_quarters < smaller),
+    ]
+    above_8 = multiply(0, 0) < smaller
+    above_9 = multiply(1, 0) < smaller
+    above_10 = multiply(2, 1) < smaller
+    above_11 = multiply(3, 0) < smaller
+    path = np.select(search, [0, np.where(above_8, 2, 1), 3, np.where(above_9, 5, 4), np.where(above_10, 7, 6), np.where(above_11, 9, 8)])
+    octant_angles = np.array([angle for (name, angle) in paths])
+    return (octant_angles[path], path)
+
+def evaluate(scheme, x, y, tables, boundaries):
+    # Returns the angle (0-31) for each position, and the path taken
+    if scheme == "accurate":
+        (mx, my, bits) = octant_accurate(x, y)
+    else:
+        (mx, my, bits) = octant_fast(x, y)
+    swap = mx < my
+    larger = np.where(swap, my, mx)
+    smaller = np.where(swap, mx, my)
+    bits = bits + (~swap).astype(int)
+
+    if scheme == "fast":
+        def multiply(boundary, carry):
+            k = boundaries[boundary]
+            return ((squares1[larger + k] >> 8) - (squares2[larger + 255 - k] >> 8) - (1 - carry)) & 0xff
+    elif scheme == "accurate":
+        def multiply(boundary, carry):
+            # the low bytes are subtracted first, with the carry as it is for
+            # atan_boundary_8 and atan_boundary_10 and set for the others
+            k = boundaries[boundary]
+            carry = carry if boundary in (0, 2) else 1
+            return ((squares1[larger + k] - squares2[larger + 255 - k] - (1 - carry)) >> 8) & 0xff
+    elif scheme == "shifts":
+        def multiply(boundary, carry):
+            return [larger >> 3, larger >> 2, larger >> 1, (larger >> 1) + (larger >> 2)][boundary]
+    else:
+        scheme_boundaries = [int(value) for value in scheme.split(",")]
+        def multiply(boundary, carry):
+            return (larger * scheme_boundaries[boundary]) >> 8
+
+    (octant_angle, path) = angle_in_octant(larger, smaller, multiply)
+    angle = tables[octant_angle - 8, bits]
+    return (angle, path)
+
+def exact_angles(x, y, centre):
+    # the exact angle (in 32nds of a turn, 0 = up, clockwise) from the centre, with y
+    # increasing down the screen
+    return (np.arctan2(x - centre, centre - y) * angles / (2 * np.pi)) % angles
+
+def angle_errors(angle, exact):
+    # how far the angle returned is from the exact angle, in 32nds of a turn (-16 to 16)
+    return (angle - exact + angles / 2) % angles - angles / 2
+
+def sector_image(filename, angle):
+    # as documents/atan2-*.png: twice the size, y up, coloured by angle
+    colours = (angle % 4)[::-1]
+    png.write(filename, np.kron(colours, np.ones((2, 2), dtype=np.uint8)).tolist(), sector_palette)
+
+def error_image(filename, error, at_centre):
+    # dark to light blue for the error within the right angle (up to half an angle), red
+    # for one angle out, white for more
+    magnitude = np.abs(error)
+    colours = np.minimum((magnitude * 2 * error_shades).astype(int), error_shades - 1)
+    colours = np.where(magnitude > 0.5, one_out, colours)
+    colours = np.where(magnitude > 1.5, more_out, colours)
+    colours = np.where(at_centre, centre_colour, colours)[::-1]
+    png.write(filename, np.kron(colours, np.ones((2, 2), dtype=np.uint8)).tolist(), error_palette)
+
+def summarise(name, angle, exact, mask):
+    error = angle_errors(angle, exact)[mask]
+    # which angle is 'right' is the nearest to the exact angle
+    out = np.rint(error).astype(int)
+    counts = dict((k, int((out == k).sum())) for k in (-2, -1, 0, 1, 2))
+    further = int((np.abs(out) > 2).sum())
+    total = int(mask.sum())
+    rms = float(np.sqrt((error ** 2).mean())) * 360.0 / angles
+    worst = float(np.abs(error).max()) * 360.0 / angles
+    print("%-20s  %6.2f%%  %7d  %7d  %7d  %7d  %7d  %7d  %8.2f  %8.2f" % (name, 100.0 * counts[0] / total, counts[-2], counts[-1], counts[0], counts[1], counts[2], further, rms, worst))
+
+def run_variant(variant, build_dir, fast_angle, fast_path):
+    # Runs the routine in the assembled binary for every position. Returns the cycles for
+    # each position, and the number of positions where the model is different.
+    import benchmark
+    machine = benchmark.Machine(variant, build_dir)
+    cycles = np.zeros((size, size), dtype=int)
+    different = 0
+    for y in range(size):
+        for x in range(size):
+            machine.set("temp10", x)
+            machine.set("temp9", y)
+            cycles[y, x] = machine.call("calculate_enemy_ship_angle_to_starship")
+            if machine.cpu.a != fast_angle[y, x]:
+                if different < 5:
+                    print("error: (" + str(x) + ", " + str(y) + ") gives angle " + str(machine.cpu.a) + " on the 6502, " + str(fast_angle[y, x]) + " in the model")
+                different += 1
+    return (cycles, different)
+
+def print_paths(scheme, path, static, measured, mask):
+    # the static cycles on each path of a scheme, and those measured on the 6502 if given
+    print("%-28s  angle  positions       %%    min   mean    max" % scheme + ("    6502: min   mean    max" if measured is not None else ""))
+    for (number, (name, octant_angle)) in enumerate(paths):
+        chosen = (path == number) & mask
+        count = int(chosen.sum())
+        if count == 0:
+            continue
+        line = "  %-26s  %5d  %9d  %6.2f  %5d  %5.1f  %5d" % (name, octant_angle, count, 100.0 * count / mask.sum(), static[chosen].min(), static[chosen].mean(), static[chosen].max())
+        if measured is not None:
+            line += "        %5d  %5.1f  %5d" % (measured[chosen].min(), measured[chosen].mean(), measured[chosen].max())
+        print(line)
+    line = "  %-26s  %5s  %9d  %6.2f  %5d  %5.1f  %5d" % ("all", "", int(mask.sum()), 100.0, static[mask].min(), static[mask].mean(), static[mask].max())
+    if measured is not None:
+        line += "        %5d  %5.1f  %5d" % (measured[mask].min(), measured[mask].mean(), measured[mask].max())
+    print(line)
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Model calculate_enemy_ship_angle_to_starship for every position and compare it with the exact angle")
+all_args.add_argument("--boundaries", action="append", default=[], metavar="K8,K9,K10,K11", help="also try these four boundaries (in 256ths of x) with an exact multiply")
+all_args.add_argument("--centre", type=float, default=127, help="the position of the starship (x and y) for the exact angle")
+all_args.add_argument("--radius", type=float, help="only count positions within this distance of the starship")
+all_args.add_argument("--images", metavar="DIR", help="write the angles and errors of each scheme as PNGs to this directory")
+all_args.add_argument("--variant", help="run the routine in this build (e.g. STAR) for every position, check the model and time each path")
+all_args.add_argument("--build", default="build", help="build directory")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    (tables, boundaries) = read_angle_tables()
+    (x, y) = positions()
+    exact = exact_angles(x, y, args.centre)
+    at_centre = (x == args.centre) & (y == args.centre)
+    mask = ~at_centre
+    if args.radius:
+        mask &= (x - args.centre) ** 2 + (y - args.centre) ** 2 <= args.radius ** 2
+
+    schemes = ["fast", "accurate", "shifts"] + args.boundaries
+    results = {}
+    for scheme in schemes:
+        results[scheme] = evaluate(scheme, x, y, tables, boundaries)
+
+    print("angles out from the nearest to the exact angle, for " + str(int(mask.sum())) + " positions")
+    print("scheme                 right       -2       -1        0       +1       +2   further  rms deg  max deg")
+    for scheme in schemes:
+        summarise(scheme, results[scheme][0], exact, mask)
+    print("")
+
+    cycles = None
+    failed = False
+    if args.variant:
+        (cycles, different) = run_variant(args.variant, args.build, results["fast"][0], results["fast"][1])
+        if different:
+            print(str(different) + " positions differ between " + args.variant + " and the 'fast' model")
+            failed = True
+        else:
+            print(args.variant + " matches the 'fast' model for all " + str(size * size) + " positions")
+        print("")
+    print("cycles on each path (counted along the instructions)")
+    for scheme in schemes:
+        static = static_cycles(scheme, x, y, results[scheme][1], boundaries)
+        print_paths(scheme, results[scheme][1], static, cycles if scheme == "fast" else None, mask)
+
+    if args.images:
+        os.makedirs(args.images, exist_ok=True)
+        for scheme in schemes:
+            name = "atan2-" + scheme.replace(",", "-")
+            sector_image(os.path.join(args.images, name + ".png"), results[scheme][0])
+            error_image(os.path.join(args.images, name + "-error.png"), angle_errors(results[scheme][0], exact), at_centre)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import random
+import sys
+
+import acme_output
+import cpu6502
+
+# Times game routines by running them on a 6502 core (cpu6502.py), without an emulator.
+#
+# Each variant's binary is loaded at load_addr and the tables the game builds at start up
+# (squares, xandf8, xbit_table and the row tables) are made by running the game's own
+# create_square_tables code. Each benchmark then calls one routine many times, each time
+# from the same starting memory, with its inputs set up from a seeded random number
+# generator, so the cycle counts are exactly the same from one run to the next.
+#
+# Calls to the OS (OSWRCH, OSBYTE, OSWORD) return at once and their time is not counted.
+# Characters written are collected, so that a benchmark can check what was printed.
+
+variants = ["STAR", "STAR.tape", "STARELK", "STARELK.tape"]
+
+os_routines = {
+    0xffee: "oswrch",
+    0xffcb: "nvwrch",
+    0xffe7: "osnewl",
+    0xfff1: "osword",
+    0xfff4: "osbyte",
+    0xc433: "oswrch",       # the Electron's VDU code, called by fastwrch
+}
+
+class Machine:
+    def __init__(self, variant, build_dir="build"):
+        self.variant = variant
+        self.symbols = acme_output.read_symbols(acme_output.symbols_filename(variant, build_dir))
+        self.cpu = cpu6502.CPU()
+        self.output = bytearray()
+        for address in os_routines:
+            self.cpu.traps[address] = self.os_call
+
+        with open(os.path.join(build_dir, "disk", variant), 'rb') as f:
+            self.cpu.load(self.symbols["load_addr"], f.read())
+
+        # build the tables, stopping before the sound envelopes are set up
+        self.cpu.s = 0xff
+        self.cpu.pc = self.symbols["create_square_tables"]
+        self.cpu.run(until=self.symbols["initialise_envelopes"], max_cycles=1000000)
+        self.initial_memory = bytes(self.cpu.memory)
+
+    def os_call(self, cpu):
+        if os_routines[cpu.pc] == "oswrch" or os_routines[cpu.pc] == "nvwrch":
+            self.output.append(cpu.a)
+        elif os_routines[cpu.pc] == "osnewl":
+            self.output += b"\n\r"
+        cpu.rts()
+
+    def reset(self):
+        self.cpu.memory[:] = self.initial_memory
+        self.cpu.s = 0xff
+        self.cpu.p = cpu6502.FLAG_U | cpu6502.FLAG_I
+        self.output = bytearray()
+
+    def has(self, name):
+        return name in self.symbols
+
+    def set(self, name, value):
+        self.cpu.memory[self.symbols[name]] = value & 0xff
+
+    def get(self, name):
+        return self.cpu.memory[self.symbols[name]]
+
+    def call(self, name, a=None, x=None, y=None):
+        return self.cpu.call(self.symbols[name], a, x, y)
+
+class Benchmark:
+    # 'setup' is called with the machine and a random.Random before each call of
+    # 'routine', and returns the registers (a, x, y) to call it with. 'check' (if given)
+    # is called afterwards and returns an error message, or None.
+    def __init__(self, name, routine, setup, check=None):
+        self.name = name
+        self.routine = routine
+        self.setup = setup
+        self.check = check
+
+class Result:
+    def __init__(self, name, cycles, errors):
+        self.name = name
+        self.calls = len(cycles)
+        self.minimum = min(cycles)
+        self.maximum = max(cycles)
+        self.mean = sum(cycles) / float(len(cycles))
+        self.errors = errors
+
+# ----------------------------------------------------------------------------------
+# mul24x8: (input_screens, input_pixels, input_fraction) x t, the top 24 bits of the
+# 32 bit result in (multiplier, output_fraction, output_pixels)
+def setup_mul24x8(machine, rng):
+    for name in ("t", "input_fraction", "input_pixels", "input_screens"):
+        machine.set(name, rng.randrange(256))
+    machine.expected = ((machine.get("input_screens") << 16) | (machine.get("input_pixels") << 8) | machine.get("input_fraction")) * machine.get("t") >> 8
+    return (None, None, None)
+
+def check_mul24x8(machine):
+    result = (machine.get("multiplier") << 16) | (machine.get("output_fraction") << 8) | machine.get("output_pixels")
+    if result != machine.expected:
+        return "got &" + format(result, "06x") + ", expected &" + format(machine.expected, "06x")
+    return None
+
+def setup_multiply_by_cosine(machine, rng):
+    machine.set("starship_rotation_cosine", rng.randrange(256))
+    machine.set("starship_rotation_sine_magnitude", rng.randrange(16))
+    machine.call("init_self_modifying_bytes_for_starship_rotation")
+    x = rng.randrange(8)
+    for name in ("enemy_ships_x_fraction", "enemy_ships_x_pixels", "enemy_ships_x_screens"):
+        machine.cpu.memory[machine.symbols[name] + x] = rng.randrange(256)
+    return (None, x, None)
+
+# plot_segment draws part of an enemy ship or explosion, centred on (temp10, temp9).
+# The fast paths are only used away from the edges of the screen.
+def segment_setup(change, near_edge):
+    def setup(machine, rng):
+        if near_edge:
+            (x, y) = (rng.choice([rng.randrange(16), rng.randrange(240, 256)]), rng.randrange(256))
+        else:
+            (x, y) = (rng.randrange(16, 240), rng.randrange(16, 240))
+        machine.set("temp10", x)
+        machine.set("temp9", y)
+        machine.set("x_pixels", x)
+        machine.set("y_pixels", y)
+        machine.set("segment_angle", rng.randrange(32))
+        machine.set("segment_length", rng.randrange(1, 11))
+        machine.set("segment_angle_change_per_pixel", change)
+        return (None, None, None)
+    return setup
+
+def setup_print_string(machine, rng):
+    # the string numbers are named '..._string' in build/sc_text.a
+    strings = sorted(value for (name, value) in machine.symbols.items() if name.endswith("_string") and not name.startswith("regular_") and value < 0x100)
+    return (None, rng.choice(strings), None)
+
+def check_print_string(machine):
+    if not machine.output:
+        return "nothing printed"
+    return None
+
+benchmarks = [
+    Benchmark("mul24x8", "mul24x8", setup_mul24x8, check_mul24x8),
+    Benchmark("multiply by cosine", "multiply_enemy_position_by_starship_rotation_cosine", setup_multiply_by_cosine),
+    Benchmark("plot_segment (unrolled)", "plot_segment", segment_setup(1, False)),
+    Benchmark("plot_segment (regular)", "plot_segment", segment_setup(2, False)),
+    Benchmark("plot_segment (edge)", "plot_segment", segment_setup(0xff, True)),
+    Benchmark("print_compressed_string", "print_compressed_string", setup_print_string, check_print_string),
+]
+
+def run_benchmark(machine, benchmark, calls, seed):
+    rng = random.Random(seed)
+    cycles = []
+    errors = []
+    for i in range(calls):
+        machine.reset()
+        (a, x, y) = benchmark.setup(machine, rng)
+        cycles.append(machine.call(benchmark.routine, a, x, y))
+        if benchmark.check:
+            error = benchmark.check(machine)
+            if error:
+                errors.append(error)
+    return Result(benchmark.name, cycles, errors)
+
+def print_results(variant, results, previous):
+    print(variant)
+    print("    benchmark                    calls      min     mean      max   change")
+    for result in results:
+        change = ""
+        old = previous.get(variant, {}).get(result.name)
+        if old:
+            change = "%+.1f%%" % (100.0 * (result.mean - old["mean"]) / old["mean"])
+        print("    %-26s %7d %8d %8.1f %8d   %s" % (result.name, result.calls, result.minimum, result.mean, result.maximum, change))
+        for error in result.errors[0:3]:
+            print("        error: " + error)
+    print("")
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Count the cycles taken by game routines, running them on a 6502 core")
+all_args.add_argument("variants", nargs="*", default=variants, help="variants to benchmark (default: all four)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--calls", type=int, default=200, help="number of calls of each routine")
+all_args.add_argument("--seed", type=int, default=1, help="random number seed for the routine inputs")
+all_args.add_argument("--only", help="only run benchmarks whose name contains this")
+all_args.add_argument("--save", help="write the results to this JSON file")
+all_args.add_argument("--compare", help="JSON file of earlier results to compare against")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    saved = {}
+    failed = False
+    for variant in args.variants:
+        machine = Machine(variant, args.build)
+        results = []
+        for benchmark in benchmarks:
+            if args.only and args.only not in benchmark.name:
+                continue
+            if not machine.has(benchmark.routine):
+                print(variant + ": no '" + benchmark.routine + "', skipping")
+                continue
+            results.append(run_benchmark(machine, benchmark, args.calls, args.seed))
+        print_results(variant, results, previous)
+        saved[variant] = dict((result.name, {"calls": result.calls, "min": result.minimum, "mean": result.mean, "max": result.maximum}) for result in results)
+        failed = failed or any(result.errors for result in results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(saved, f, indent=4, sort_keys=True)
+            f.write("\n")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,442 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+import post_process
+
+# Builds a call graph and a cross-reference of the labels in the acme source, for all
+# four variants at once.
+#
+# The source is walked with post_process.py's SourceWalker, once for each variant (the
+# -D definitions go_acme gives acme), so only the lines acme would assemble for that
+# variant are seen, with macros expanded and the generated files in build/ included. The
+# lines are taken one at a time as they are walked, and only the graph is kept.
+#
+# Each global label starts a node of the graph. Its edges are:
+#
+#   call        jsr label
+#   jump        jmp label
+#   branch      a branch to another global label
+#   falls into  the code runs on into the next label without a jmp, rts or rti
+#   address     the label's address is taken: '#<label' in code, or '!byte <label' or
+#               '!word label' in a table. These are the routines that may be reached
+#               indirectly, by 'jmp (vector)' or by pushing an address and using rts.
+#
+# Each edge and each reference lists the variants it is assembled in, and the sites list
+# the '!if' conditions around them in the source, so code only in the Electron or tape
+# builds is easy to see.
+#
+# The cross-reference lists for every label and constant each line that uses it, and
+# how: read, write, modify (inc, dec, shifts), address (an immediate '#<' or '#>'), data
+# (named in a table), or as an edge above.
+#
+# Self-modifying code is found as a write or modify of a label that marks an instruction
+# (or of 'name = * + 1' and the like, set just before one), usually at label+1 or label+2
+# to change the operand.
+#
+# Queries: --from LABEL lists everything reachable from a routine, such as the frame loop,
+# with the depth and the edge it was first reached by (--depth N stops N edges away, as a
+# jump out of a loop soon reaches most of the game). --indirect also follows the address
+# tables a routine reads, for 'jmp (vector)' dispatch. --callers LABEL walks the graph
+# backwards. --xref NAME and --smc list the references and the self-modifying code. The
+# whole index can be written with --json and read back in place of the source, and
+# --dot writes the graph (or the part reached by --from or --callers) for Graphviz.
+
+variants = {
+    "STAR": {"elk": 0, "tape": 0},
+    "STAR.tape": {"elk": 0, "tape": 1},
+    "STARELK": {"elk": 1, "tape": 0},
+    "STARELK.tape": {"elk": 1, "tape": 1},
+}
+
+default_source = os.path.join("source", "starcommand_acme.asm")
+
+name_pattern = re.compile(r'(?<![\w$%.])[A-Za-z_][A-Za-z0-9_]*')
+quote_pattern = re.compile(r'"[^"]*"|\'[^\']*\'')
+here_pattern = re.compile(r'^\*\s*([-+].*)?$')
+
+branches = ("bcc", "bcs", "beq", "bmi", "bne", "bpl", "bvc", "bvs")
+stores = ("sta", "stx", "sty")
+modifies = ("inc", "dec", "asl", "lsr", "rol", "ror")
+ends = ("jmp", "rts", "rti")
+control_kinds = ("call", "jump", "branch", "falls into")
+
+def names_in(text):
+    # Symbol names used in an operand or list of data
+    return name_pattern.findall(quote_pattern.sub("", text))
+
+def block_conditions(items, stack, result):
+    # The '!if' headers around each line: 'else' parts are given as 'not <header>'
+    for item in items:
+        if isinstance(item, post_process.SourceLine):
+            if stack:
+                result[item.number] = stack
+            continue
+        header = item.header
+        if header.startswith("!if"):
+            block_conditions(item.body, stack + [header], result)
+            if item.else_body is not None:
+                block_conditions(item.else_body, stack + ["not " + header], result)
+        elif not header.startswith("!macro"):
+            block_conditions(item.body, stack, result)
+
+class Builder:
+    # Gathers the graph from the lines of each variant as they are walked
+    def __init__(self, filename):
+        self.filename = filename
+        self.nodes = {}             # name -> [filename, line number, set of variants]
+        self.symbols = {}           # name -> [kind, filename, line number, set of variants]
+        self.owner = {}             # label or '* + n' name -> global label it is in
+        self.code_labels = set()
+        self.edges = {}             # (from, to, kind) -> {site: set of variants}
+        self.references = {}        # name -> {(from, kind, site): set of variants}
+        self.indirect = {}          # (from, vector, site) -> set of variants
+        self.conditions = {}        # filename -> {line number: conditions}
+        self.missing_includes = set()
+
+    def site(self, line):
+        return (os.path.normpath(line.filename), line.number)
+
+    def add_edge(self, source, target, kind, site, variant):
+        self.edges.setdefault((source, target, kind), {}).setdefault(site, set()).add(variant)
+
+    def add_reference(self, name, source, kind, site, variant):
+        self.references.setdefault(name, {}).setdefault((source, kind, site), set()).add(variant)
+
+    def define(self, name, kind, line, variant):
+        entry = self.symbols.setdefault(name, [kind, line.filename, line.number, set()])
+        entry[3].add(variant)
+
+    def walk(self, variant, defines):
+        walker = post_process.SourceWalker(defines)
+        routine = None
+        pending = []                # labels waiting to see if code or data follows
+        previous = None             # 'code', 'end' or 'data': the last thing assembled
+        for visit in walker.walk(self.filename):
+            line = visit.line
+            if not visit.active or visit.macro is not None:
+                continue
+            site = self.site(visit.call or line)
+            if site[0] not in self.conditions:
+                self.conditions[site[0]] = {}
+                block_conditions(post_process.read_source(site[0]), [], self.conditions[site[0]])
+
+            if visit.call is None and line.is_global_label():
+                name = line.label
+                if routine is not None and previous == "code":
+                    self.add_edge(routine, name, "falls into", site, variant)
+                routine = name
+                node = self.nodes.setdefault(name, [line.filename, line.number, set()])
+                node[2].add(variant)
+                self.define(name, "label", line, variant)
+                self.owner[name] = name
+                pending.append(name)
+
+            if line.assignment is not None:
+                (name, expression) = line.assignment
+                if name != "*" and not name.startswith("."):
+                    if here_pattern.match(expression):
+                        self.define(name, "label", line, variant)
+                        self.owner[name] = routine
+                        pending.append(name)
+                    else:
+                        self.define(name, "constant", line, variant)
+                continue
+
+            if line.mnemonic is not None:
+                self.code_labels.update(pending)
+                pending = []
+                self.instruction(line, routine, site, variant)
+                previous = "end" if line.mnemonic in ends else "code"
+            elif post_process.data_size(line, walker.evaluator) is not None:
+                pending = []
+                previous = "data"
+                for name in names_in(line.arguments):
+                    self.add_reference(name, routine, "data", site, variant)
+                    if routine is not None:
+                        self.add_edge(routine, name, "address", site, variant)
+        self.missing_includes.update(walker.missing_includes)
+
+    def instruction(self, line, routine, site, variant):
+        mnemonic = line.mnemonic
+        operand = line.operand
+        names = names_in(operand)
+        if mnemonic in ("jsr", "jmp") and operand.startswith("("):
+            for name in names:
+                self.add_reference(name, routine, "indirect jump", site, variant)
+                self.indirect.setdefault((routine, name, site), set()).add(variant)
+            return
+        if mnemonic in ("jsr", "jmp") or mnemonic in branches:
+            kind = "call" if mnemonic == "jsr" else "jump" if mnemonic == "jmp" else "branch"
+            for name in names[0:1]:
+                self.add_reference(name, routine, kind, site, variant)
+                if routine is not None:
+                    self.add_edge(routine, name, kind, site, variant)
+            return
+        if operand.startswith("#"):
+            kind = "address"
+        elif mnemonic in stores:
+            kind = "write"
+        elif mnemonic in modifies and operand.lower() not in ("", "a"):
+            kind = "modify"
+        else:
+            kind = "read"
+        for name in names:
+            self.add_reference(name, routine, kind, site, variant)
+            if kind == "address" and routine is not None:
+                self.add_edge(routine, name, "address", site, variant)
+
+    def site_entry(self, site, found):
+        (filename, number) = site
+        entry = {"file": filename, "line": number, "variants": [variant for variant in variants if variant in found]}
+        conditions = self.conditions.get(filename, {}).get(number)
+        if conditions:
+            entry["conditions"] = conditions
+        return entry
+
+    def index(self):
+        # The graph as plain dictionaries and lists, as written to JSON
+        def listed(found):
+            return [variant for variant in variants if variant in found]
+
+        edges = []
+        for ((source, target, kind), sites) in sorted(self.edges.items()):
+            if target not in self.nodes:
+                continue
+            if kind == "address" and target not in self.code_labels:
+                continue
+            found = set().union(*sites.values())
+            edges.append({"from": source, "to": target, "kind": kind, "variants": listed(found), "sites": [self.site_entry(site, sites[site]) for site in sorted(sites)]})
+
+        routines = {}
+        for (name, (filename, number, found)) in self.nodes.items():
+            routines[name] = {"file": filename, "line": number, "code": name in self.code_labels, "variants": listed(found)}
+
+        references = {}
+        for (name, uses) in sorted(self.references.items()):
+            if name not in self.symbols:
+                continue
+            references[name] = [dict([("from", source), ("kind", kind)] + list(self.site_entry(site, found).items())) for ((source, kind, site), found) in sorted(uses.items(), key=lambda use: (use[0][2], use[0][1], use[0][0] or ""))]
+
+        symbols = {}
+        for (name, (kind, filename, number, found)) in sorted(self.symbols.items()):
+            symbols[name] = {"kind": kind, "file": filename, "line": number, "variants": listed(found)}
+            if kind == "label":
+                symbols[name]["code"] = name in self.code_labels
+                symbols[name]["routine"] = self.owner.get(name)
+
+        self_modifying = []
+        for (name, uses) in references.items():
+            if name not in self.code_labels:
+                continue
+            for use in uses:
+                if use["kind"] in ("write", "modify"):
+                    self_modifying.append(dict([("target", name), ("in", self.owner.get(name))] + list(use.items())))
+
+        indirect = []
+        for ((source, vector, site), found) in sorted(self.indirect.items(), key=lambda item: item[0][2]):
+            indirect.append(dict([("from", source), ("vector", vector)] + list(self.site_entry(site, found).items())))
+
+        return {
+            "source": self.filename,
+            "variants": list(variants),
+            "routines": routines,
+            "edges": edges,
+            "symbols": symbols,
+            "references": references,
+            "self_modifying": self_modifying,
+            "indirect_jumps": indirect,
+        }
+
+def build_index(filename, wanted):
+    builder = Builder(filename)
+    for variant in wanted:
+        builder.walk(variant, variants[variant])
+    for name in sorted(builder.missing_includes):
+        print("warning: " + name + " not found (run go_acme first to generate it)", file=sys.stderr)
+    return builder.index()
+
+def read_index(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def write_index(filename, index):
+    with open(filename, "w") as f:
+        json.dump(index, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+# ----------------------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------------------
+def edges_by(index, variant, backwards=False):
+    # name -> list of (edge, name at the other end)
+    result = {}
+    for edge in index["edges"]:
+        if variant and variant not in edge["variants"]:
+            continue
+        if backwards:
+            result.setdefault(edge["to"], []).append((edge, edge["from"]))
+        else:
+            result.setdefault(edge["from"], []).append((edge, edge["to"]))
+    return result
+
+def reachable(index, start, variant=None, indirect=False, backwards=False, limit=None):
+    # Breadth first from 'start', to at most 'limit' edges away: name -> (depth, edge first
+    # reached by). Follows calls, jumps, branches and fall throughs, and with 'indirect',
+    # the routines whose addresses are in a table the code reads (or whose address it
+    # takes itself).
+    graph = edges_by(index, variant, backwards)
+    tables = {}
+    if indirect and not backwards:
+        for (name, uses) in index["references"].items():
+            for use in uses:
+                if use["kind"] == "read" and (variant is None or variant in use["variants"]):
+                    tables.setdefault(use["from"], set()).add(name)
+    found = {start: (0, None)}
+    queue = [start]
+    while queue:
+        name = queue.pop(0)
+        (depth, _) = found[name]
+        if limit is not None and depth >= limit:
+            continue
+        followed = []
+        for (edge, other) in graph.get(name, []):
+            if edge["kind"] in control_kinds or (indirect and edge["kind"] == "address"):
+                followed.append((edge, other))
+        for table in sorted(tables.get(name, [])):
+            for (edge, other) in graph.get(table, []):
+                if edge["kind"] == "address":
+                    followed.append((edge, other))
+        for (edge, other) in followed:
+            if other not in found and other in index["routines"]:
+                found[other] = (depth + 1, edge)
+                queue.append(other)
+    return found
+
+def print_reachable(index, start, found, backwards=False):
+    if start not in index["routines"]:
+        print("error: no label '" + start + "' in " + index["source"])
+        sys.exit(1)
+    code = [name for name in found if index["routines"][name]["code"]]
+    print(("%d routines reach " if backwards else "%d routines reachable from ") % (len(code) - 1) + start)
+    print("depth  routine" + " " * 43 + "reached by")
+    for name in sorted(found, key=lambda name: (found[name][0], name)):
+        (depth, edge) = found[name]
+        if edge is None:
+            continue
+        other = edge["from"] if not backwards else edge["to"]
+        via = edge["kind"] + (" from " if not backwards else " to ") + other
+        if len(edge["variants"]) < len(index["variants"]):
+            via += "  [" + ", ".join(edge["variants"]) + "]"
+        print("%5d  %-50s %s" % (depth, name, via))
+
+def print_references(index, name):
+    symbol = index["symbols"].get(name)
+    if symbol is None:
+        print("error: no label or constant '" + name + "' in " + index["source"])
+        sys.exit(1)
+    kind = symbol["kind"] + (" (code)" if symbol.get("code") else "")
+    print("%s  %s defined at %s:%d" % (name, kind, symbol["file"], symbol["line"]))
+    for use in index["references"].get(name, []):
+        text = "    %s:%-6d %-14s %s" % (use["file"], use["line"], use["kind"], use["from"] or "-")
+        if len(use["variants"]) < len(index["variants"]):
+            text += "  [" + ", ".join(use["variants"]) + "]"
+        print(text)
+
+def print_self_modifying(index):
+    print("target".ljust(36) + "in".ljust(40) + "written by")
+    for use in sorted(index["self_modifying"], key=lambda use: (use["target"], use["file"], use["line"])):
+        print("%-35s %-39s %s (%s:%d)" % (use["target"], use["in"] or "-", use["from"] or "-", use["file"], use["line"]))
+
+def print_summary(index):
+    routines = [name for (name, routine) in index["routines"].items() if routine["code"]]
+    print("%d code labels, %d data labels, %d symbols in all" % (len(routines), len(index["routines"]) - len(routines), len(index["symbols"])))
+    kinds = {}
+    partial = 0
+    for edge in index["edges"]:
+        kinds[edge["kind"]] = kinds.get(edge["kind"], 0) + 1
+        if len(edge["variants"]) < len(index["variants"]):
+            partial += 1
+    print("edges: " + ", ".join("%d %s" % (kinds[kind], kind) for kind in sorted(kinds)) + " (%d only in some variants)" % partial)
+    print("%d self-modifying code writes to %d targets, %d indirect jumps" % (len(index["self_modifying"]), len(set(use["target"] for use in index["self_modifying"])), len(index["indirect_jumps"])))
+    called = set(edge["to"] for edge in index["edges"] if edge["kind"] in control_kinds)
+    roots = sorted(name for name in routines if name not in called)
+    print("code labels not called, jumped, branched or fallen into (entry points, and those reached indirectly):")
+    for name in roots:
+        print("    " + name)
+
+dot_styles = {
+    "call": "",
+    "jump": "style=bold",
+    "branch": "style=dashed",
+    "falls into": "style=dotted",
+    "address": "style=dotted, color=grey",
+}
+
+def write_dot(filename, index, names=None, variant=None):
+    # The graph (or the edges between 'names') in Graphviz format. Data tables are boxes
+    # and edges not in every variant are labelled with the variants they are in.
+    with open(filename, "w") as f:
+        f.write("digraph calls {\n")
+        f.write("    node [fontname=\"Helvetica\", fontsize=10];\n")
+        f.write("    edge [fontname=\"Helvetica\", fontsize=8];\n")
+        used = set()
+        lines = []
+        for edge in index["edges"]:
+            if variant and variant not in edge["variants"]:
+                continue
+            if names is not None and (edge["from"] not in names or edge["to"] not in names):
+                continue
+            attributes = [dot_styles[edge["kind"]]] if dot_styles[edge["kind"]] else []
+            if len(edge["variants"]) < len(index["variants"]):
+                attributes.append("label=\"" + ", ".join(edge["variants"]) + "\"")
+            lines.append("    \"%s\" -> \"%s\"%s;\n" % (edge["from"], edge["to"], " [" + ", ".join(attributes) + "]" if attributes else ""))
+            used.update((edge["from"], edge["to"]))
+        for name in sorted(used | set(names or [])):
+            shape = "ellipse" if index["routines"][name]["code"] else "box"
+            f.write("    \"%s\" [shape=%s];\n" % (name, shape))
+        f.writelines(lines)
+        f.write("}\n")
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Build a call graph and cross-reference of the game source, for all four variants, and query it")
+all_args.add_argument("input", nargs="?", default=default_source, help="acme source, or an index written by --json (default: " + default_source + ")")
+all_args.add_argument("--variant", choices=list(variants), help="only follow the code assembled for this variant")
+all_args.add_argument("--from", dest="start", metavar="LABEL", help="list every routine reachable from LABEL (e.g. every_vsync)")
+all_args.add_argument("--callers", metavar="LABEL", help="list every routine that can reach LABEL")
+all_args.add_argument("--depth", type=int, metavar="N", help="with --from or --callers, stop N edges away")
+all_args.add_argument("--indirect", action="store_true", help="with --from, also follow the tables of routine addresses that code reads (for 'jmp (vector)')")
+all_args.add_argument("--xref", action="append", metavar="NAME", help="list the lines that use a label or constant (comma separated)")
+all_args.add_argument("--smc", action="store_true", help="list the self-modifying code")
+all_args.add_argument("--json", metavar="FILE", help="write the whole index as JSON")
+all_args.add_argument("--dot", metavar="FILE", help="write the graph (or the part found by --from or --callers) for Graphviz")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    if args.input.endswith(".json"):
+        index = read_index(args.input)
+    else:
+        index = build_index(args.input, list(variants))
+    if args.json:
+        write_index(args.json, index)
+
+    names = None
+    queried = args.start or args.callers or args.xref or args.smc
+    if args.start:
+        found = reachable(index, args.start, args.variant, args.indirect, limit=args.depth)
+        print_reachable(index, args.start, found)
+        names = set(found)
+    if args.callers:
+        found = reachable(index, args.callers, args.variant, backwards=True, limit=args.depth)
+        print_reachable(index, args.callers, found, backwards=True)
+        names = set(found) | (names or set())
+    for name in [name.strip() for names_given in args.xref or [] for name in names_given.split(",")]:
+        print_references(index, name)
+    if args.smc:
+        print_self_modifying(index)
+    if not queried:
+        print_summary(index)
+    if args.dot:
+        write_dot(args.dot, index, names, args.variant)
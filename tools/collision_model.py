@@ -0,0 +1,758 @@
+import argparse
+import json
+import random
+
+import acme_output
+import cpu6502
+import plot_routines
+
+# Models the broad phase the game uses for its collision checks (with sorted_collisions=1,
+# the default): keeping the enemy ships that can collide in a list sorted by x, and
+# sweeping along it, instead of comparing every pair.
+#
+# Two checks are modelled. Built with sorted_collisions=0, the game does them as before:
+#
+#   pairs     check_for_starship_collision_with_enemy_ships takes each enemy ship that
+#             can collide (on screen, and not exploding or only just exploding) and, in
+#             check_for_collisions_between_enemy_ships, compares it with every later slot
+#             (consider_next_second_enemy_ship), x first then y.
+#   torpedoes check_for_collision_with_enemy_ships compares one torpedo (the head and tail
+#             of each starship torpedo, each enemy torpedo near the starship, and the
+#             escape capsule) with every slot, and stops at the first ship it hits.
+#
+# The sweep sorts the ships that can collide by x (an insertion sort, which is quick as
+# the order changes little from one update to the next), then for pairs compares each ship
+# only with the ships after it in the list until one is 9 or more pixels further on, and
+# for a torpedo skips along the list to the torpedo's x and stops once past it. It finds
+# exactly the same collisions: the differences are measured as the game measures them
+# (which is one pixel short when the second ship is to the left), and a torpedo that
+# touches two ships hits the lower slot, as before.
+#
+# For each layout the model counts the x and y comparisons each way (and the comparisons
+# the sort makes), checks both find the same collisions, and assembles both on the 6502
+# core to measure the cycles and bytes: the old loops copied from the game (without the
+# responses to a collision, the same either way) against the sort and sweeps. With
+# --variant the game's own check_for_collision_with_enemy_ships in the assembled binary is
+# also checked against the model, and the game's own routines are timed for an update:
+# the pairs (with the sort before them), the sort again before the torpedoes and the
+# torpedoes, each with its responses to a collision. Give --build a build made with
+# -Dsorted_collisions=0 to time the old loops in the game.
+#
+# Layouts come from --layouts (a JSON list, as written by --save), --memory (memory dumps
+# taken from an emulator, read at the addresses in the variant's symbol list), or are
+# made at random (--random N, seeded). Random layouts can have more slots than the game's
+# maximum_number_of_enemy_ships (--ships 4,8,12,16) to see where the sweep starts to pay.
+#
+# The game sorts the list in check_for_starship_collision_with_enemy_ships and again
+# after update_enemy_ships has moved the ships, before the torpedoes are checked. A
+# collision between two ships pushes them apart in x, which can leave the list a little
+# out of order for the rest of that sweep, so the game compares a ship it finds to the
+# left of the first rather than stopping there. The ships are taken in order of x rather
+# than of slot, so where a ship is in more than one collision in an update (with the
+# starship or other ships) the pushes, and which ship is already exploding, can come out
+# differently from before. Each extra slot also costs 12 bytes of zero page.
+
+size_for_ships = 8              # size_of_enemy_ship_for_collisions_between_enemy_ships
+size_for_torpedoes = 5          # size_of_enemy_ship_for_collisions_with_torpedoes
+last_colliding_frame = 27       # frame_of_enemy_ship_explosion_after_which_no_collisions
+
+code_address = 0x1000
+sorted_slots = 0x0400
+pairs_found = 0x0500
+
+model_symbols = {
+    "first": 0x02,
+    "second": 0x03,
+    "enemy_ships_still_to_consider": 0x04,
+    "torpedoes_still_to_consider": 0x05,
+    "torpedo_x": 0x06,
+    "torpedo_y": 0x07,
+    "first_x": 0x08,
+    "sweep_position": 0x09,
+    "best": 0x0a,
+    "sorted_count": 0x0b,
+    "pair_count": 0x0c,
+    "sort_key": 0x0d,
+    "sort_slot": 0x0e,
+    "window_low": 0x0f,
+    "sweep_next": 0x10,
+    "sorted_slots": sorted_slots,
+    "pairs_found": pairs_found,
+    "size_of_enemy_ship_for_collisions_between_enemy_ships": size_for_ships,
+    "size_of_enemy_ship_for_collisions_with_torpedoes": size_for_torpedoes,
+    "frame_of_enemy_ship_explosion_after_which_no_collisions": last_colliding_frame,
+}
+
+# The game's loops, with each collision recorded instead of acted on
+existing_loops = """
+existing_pairs
+    lda #0
+    sta pair_count
+    lda #maximum_number_of_enemy_ships
+    sta enemy_ships_still_to_consider
+    lda #0
+    sta first
+existing_pairs_loop
+    ldx first
+    lda enemy_ships_on_screen,x
+    bne to_existing_next_first
+    lda enemy_ships_energy,x
+    bne existing_first_can_collide
+    lda enemy_ships_flags_or_explosion_timer,x
+    cmp #frame_of_enemy_ship_explosion_after_which_no_collisions
+    bcs existing_first_can_collide
+to_existing_next_first
+    jmp existing_next_first
+
+existing_first_can_collide
+    stx second
+    ldx enemy_ships_still_to_consider
+    dex
+    stx torpedoes_still_to_consider
+    bne existing_second
+    rts
+
+existing_second
+    inc second
+    ldx second
+    lda enemy_ships_on_screen,x
+    bne existing_next_second
+    ldy first
+    lda enemy_ships_x_pixels,x
+    sec
+    sbc enemy_ships_x_pixels,y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships
+    bcs existing_next_second
+    lda enemy_ships_y_pixels,x
+    sec
+    sbc enemy_ships_y_pixels,y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships
+    bcs existing_next_second
+    lda enemy_ships_energy,x
+    bne +
+    lda enemy_ships_flags_or_explosion_timer,x
+    cmp #frame_of_enemy_ship_explosion_after_which_no_collisions
+    bcc existing_next_second
++
+    jsr record_pair
+existing_next_second
+    dec torpedoes_still_to_consider
+    beq existing_next_first
+    jmp existing_second
+
+existing_next_first
+    inc first
+    dec enemy_ships_still_to_consider
+    beq +
+    jmp existing_pairs_loop
++
+    rts
+
+existing_torpedo
+    lda #maximum_number_of_enemy_ships
+    sta enemy_ships_still_to_consider
+    ldx #0
+existing_torpedo_slot
+    lda enemy_ships_on_screen,x
+    bne existing_torpedo_next
+    lda enemy_ships_x_pixels,x
+    sec
+    sbc torpedo_x
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes
+    bcs existing_torpedo_next
+    lda enemy_ships_y_pixels,x
+    sec
+    sbc torpedo_y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes
+    bcs existing_torpedo_next
+    lda enemy_ships_energy,x
+    bne existing_torpedo_hit
+    lda enemy_ships_flags_or_explosion_timer,x
+    cmp #frame_of_enemy_ship_explosion_after_which_no_collisions
+    bcs existing_torpedo_hit
+    bcc existing_torpedo_next
+existing_torpedo_hit
+    stx best
+    sec
+    rts
+
+existing_torpedo_next
+    inx
+    dec enemy_ships_still_to_consider
+    bne existing_torpedo_slot
+    lda #$ff
+    sta best
+    clc
+    rts
+"""
+
+# The broad phase: sort_by_x, then sweep_pairs and sweep_torpedo use the sorted list
+sweep_loops = """
+sort_by_x
+    ldy #0
+    ldx #0
+sort_next_slot
+    lda enemy_ships_on_screen,x
+    bne sort_skip_slot
+    lda enemy_ships_energy,x
+    bne +
+    lda enemy_ships_flags_or_explosion_timer,x
+    cmp #frame_of_enemy_ship_explosion_after_which_no_collisions
+    bcc sort_skip_slot
++
+    ; insert slot X, moving up the entries further right
+    lda enemy_ships_x_pixels,x
+    sta sort_key
+    stx sort_slot
+    sty sorted_count
+sort_insert
+    dey
+    bmi sort_store
+    ldx sorted_slots,y
+    lda enemy_ships_x_pixels,x
+    cmp sort_key
+    bcc sort_store
+    beq sort_store
+    txa
+    sta sorted_slots+1,y
+    bcs sort_insert
+sort_store
+    iny
+    lda sort_slot
+    sta sorted_slots,y
+    ldy sorted_count
+    iny
+    ldx sort_slot
+sort_skip_slot
+    inx
+    cpx #maximum_number_of_enemy_ships
+    bne sort_next_slot
+    sty sorted_count
+    rts
+
+sweep_pairs
+    lda #0
+    sta pair_count
+    tay
+sweep_first
+    cpy sorted_count
+    bcs sweep_done
+    ldx sorted_slots,y
+    stx first
+    lda enemy_ships_x_pixels,x
+    sta first_x
+    iny
+    sty sweep_position
+sweep_second
+    cpy sorted_count
+    bcs sweep_next_first
+    ldx sorted_slots,y
+    lda enemy_ships_x_pixels,x
+    sec
+    sbc first_x
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships + 1
+    bcs sweep_next_first
+
+    ; near in x: compare as the game does, with the lower slot in Y and the higher in X
+    sty sweep_next
+    ldy first
+    cpx first
+    bcs +
+    txa
+    ldx first
+    tay
++
+    lda enemy_ships_x_pixels,x
+    sec
+    sbc enemy_ships_x_pixels,y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships
+    bcs sweep_next_second
+    lda enemy_ships_y_pixels,x
+    sec
+    sbc enemy_ships_y_pixels,y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_between_enemy_ships
+    bcs sweep_next_second
+    jsr record_pair
+sweep_next_second
+    ldy sweep_next
+    iny
+    bne sweep_second
+
+sweep_next_first
+    ldy sweep_position
+    jmp sweep_first
+
+sweep_done
+    rts
+
+sweep_torpedo
+    lda #$ff
+    sta best
+    lda torpedo_x
+    sec
+    sbc #size_of_enemy_ship_for_collisions_with_torpedoes
+    bcs +
+    lda #0
++
+    sta window_low
+    ldy #0
+sweep_torpedo_loop
+    cpy sorted_count
+    bcs sweep_torpedo_done
+    ldx sorted_slots,y
+    iny
+    lda enemy_ships_x_pixels,x
+    cmp window_low
+    bcc sweep_torpedo_loop
+    sec
+    sbc torpedo_x
+    bcc +
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes
+    bcs sweep_torpedo_done
++
+    lda enemy_ships_y_pixels,x
+    sec
+    sbc torpedo_y
+    bcs +
+    eor #$ff
++
+    cmp #size_of_enemy_ship_for_collisions_with_torpedoes
+    bcs sweep_torpedo_loop
+    cpx best
+    bcs sweep_torpedo_loop
+    stx best
+    bcc sweep_torpedo_loop
+sweep_torpedo_done
+    rts
+"""
+
+# Records the pair of slots Y (first) and X (second), as both loops do
+record_pair = """
+record_pair
+    tya
+    ldy pair_count
+    sta pairs_found,y
+    txa
+    sta pairs_found+1,y
+    iny
+    iny
+    sty pair_count
+    rts
+"""
+
+# ----------------------------------------------------------------------------------
+# Layouts
+# ----------------------------------------------------------------------------------
+# A layout is the enemy ships in their slots, each {"x", "y", "on_screen", "energy",
+# "timer"} (on_screen is zero when the ship is on screen, as in enemy_ships_on_screen),
+# and the positions [x, y] checked against them by check_for_collision_with_enemy_ships
+# in one update.
+
+centre = 128                    # where the starship is
+
+def near_starship(x, y):
+    # enemy torpedoes are only checked against the enemy ships once they have missed
+    # the starship, which is only looked at within $40 pixels of it
+    return distance(x, centre) < 0x40 and distance(y, centre) < 0x40
+
+def random_layout(rng, slots):
+    ships = []
+    for slot in range(slots):
+        ship = {"x": rng.randrange(256), "y": rng.randrange(256), "on_screen": 0 if rng.random() < 0.6 else 1, "energy": rng.randrange(1, 256), "timer": 0}
+        if rng.random() < 0.1:
+            ship["energy"] = 0
+            ship["timer"] = rng.randrange(37)
+        ships.append(ship)
+    torpedoes = []
+    for torpedo in range(12):
+        if rng.random() < 0.5:
+            x = centre + rng.randrange(-96, 96)
+            y = centre + rng.randrange(-96, 96)
+            torpedoes.append([x, y])
+            torpedoes.append([(x + rng.randrange(-3, 4)) & 0xff, (y + rng.randrange(-3, 4)) & 0xff])
+    for torpedo in range(24):
+        (x, y) = (rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.3 and near_starship(x, y):
+            torpedoes.append([x, y])
+    return {"ships": ships, "torpedoes": torpedoes}
+
+def layout_from_memory(memory, symbols):
+    # The ships and torpedoes in a memory dump taken from an emulator (from &0000)
+    slots = symbols["maximum_number_of_enemy_ships"]
+    def array(name, slot):
+        return memory[symbols[name] + slot]
+    ships = []
+    for slot in range(slots):
+        ships.append({
+            "x": array("enemy_ships_x_pixels", slot),
+            "y": array("enemy_ships_y_pixels", slot),
+            "on_screen": array("enemy_ships_on_screen", slot),
+            "energy": array("enemy_ships_energy", slot),
+            "timer": array("enemy_ships_flags_or_explosion_timer", slot),
+        })
+    torpedoes = []
+    table = symbols["starship_torpedoes_table"]
+    for torpedo in range(symbols["maximum_number_of_starship_torpedoes"]):
+        entry = memory[table + 9 * torpedo:table + 9 * torpedo + 9]
+        if entry[0]:
+            torpedoes += [[entry[2], entry[4]], [entry[6], entry[8]]]
+    table = symbols["enemy_torpedoes_table"]
+    for torpedo in range(symbols["maximum_number_of_enemy_torpedoes"]):
+        entry = memory[table + 6 * torpedo:table + 6 * torpedo + 6]
+        if entry[0] and near_starship(entry[2], entry[4]):
+            torpedoes.append([entry[2], entry[4]])
+    return {"ships": ships, "torpedoes": torpedoes}
+
+def read_layouts(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def write_layouts(filename, layouts):
+    with open(filename, "w") as f:
+        json.dump(layouts, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+# ----------------------------------------------------------------------------------
+# Counting comparisons
+# ----------------------------------------------------------------------------------
+def distance(a, b):
+    # as the game works it out: 'lda a : sec : sbc b : bcs + : eor #$ff'
+    return a - b if a >= b else b - a - 1
+
+def can_collide(ship):
+    return ship["on_screen"] == 0 and (ship["energy"] != 0 or ship["timer"] >= last_colliding_frame)
+
+class Counts:
+    def __init__(self):
+        self.x = 0              # pairs of objects compared in x
+        self.y = 0              # ... and in y
+        self.sort = 0           # comparisons made sorting
+
+    def add(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.sort += other.sort
+
+def existing_pairs(ships):
+    # Returns (pairs that collide, Counts) for the game's loop over every later slot
+    counts = Counts()
+    pairs = []
+    for (first, ship) in enumerate(ships):
+        if not can_collide(ship):
+            continue
+        for second in range(first + 1, len(ships)):
+            other = ships[second]
+            if other["on_screen"]:
+                continue
+            counts.x += 1
+            if distance(other["x"], ship["x"]) >= size_for_ships:
+                continue
+            counts.y += 1
+            if distance(other["y"], ship["y"]) >= size_for_ships:
+                continue
+            if can_collide(other):
+                pairs.append((first, second))
+    return (pairs, counts)
+
+def existing_torpedo(ships, x, y):
+    # Returns (slot hit or None, Counts) for the game's loop over every slot
+    counts = Counts()
+    for (slot, ship) in enumerate(ships):
+        if ship["on_screen"]:
+            continue
+        counts.x += 1
+        if distance(ship["x"], x) >= size_for_torpedoes:
+            continue
+        counts.y += 1
+        if distance(ship["y"], y) >= size_for_torpedoes:
+            continue
+        if ship["energy"] != 0 or ship["timer"] >= last_colliding_frame:
+            return (slot, counts)
+    return (None, counts)
+
+def sort_by_x(ships):
+    # Returns (slots of the ships that can collide in order of x, Counts), sorting as
+    # sort_by_x does: each slot in turn is inserted after the entries no further right
+    counts = Counts()
+    order = []
+    for (slot, ship) in enumerate(ships):
+        if not can_collide(ship):
+            continue
+        position = len(order)
+        while position > 0:
+            counts.sort += 1
+            if ships[order[position - 1]]["x"] <= ship["x"]:
+                break
+            position -= 1
+        order.insert(position, slot)
+    return (order, counts)
+
+def sweep_pairs(ships, order):
+    counts = Counts()
+    pairs = []
+    for (position, slot) in enumerate(order):
+        for other in order[position + 1:]:
+            counts.x += 1
+            if ships[other]["x"] - ships[slot]["x"] > size_for_ships:
+                break
+            (first, second) = (min(slot, other), max(slot, other))
+            if distance(ships[second]["x"], ships[first]["x"]) >= size_for_ships:
+                continue
+            counts.y += 1
+            if distance(ships[second]["y"], ships[first]["y"]) < size_for_ships:
+                pairs.append((first, second))
+    return (sorted(pairs), counts)
+
+def sweep_torpedo(ships, order, x, y):
+    counts = Counts()
+    best = None
+    for slot in order:
+        counts.x += 1
+        if ships[slot]["x"] < x - size_for_torpedoes:
+            continue
+        if ships[slot]["x"] - x >= size_for_torpedoes:
+            break
+        counts.y += 1
+        if distance(ships[slot]["y"], y) < size_for_torpedoes and (best is None or slot < best):
+            best = slot
+    return (best, counts)
+
+def count_layout(layout):
+    # Returns (existing Counts, sweep Counts, number of sorts) for one update, checking
+    # that both ways find the same collisions
+    ships = layout["ships"]
+    (pairs, existing) = existing_pairs(ships)
+    (order, sweep) = sort_by_x(ships)
+    sorts = 1
+    (swept, counts) = sweep_pairs(ships, order)
+    sweep.add(counts)
+    if swept != pairs:
+        raise AssertionError("the sweep found the pairs " + str(swept) + " not " + str(pairs))
+    if pairs:
+        # the collisions move the ships, so they are sorted again for the torpedoes
+        sweep.sort *= 2
+        sorts = 2
+    for (x, y) in layout["torpedoes"]:
+        (hit, counts) = existing_torpedo(ships, x, y)
+        existing.add(counts)
+        (swept, counts) = sweep_torpedo(ships, order, x, y)
+        sweep.add(counts)
+        if swept != hit:
+            raise AssertionError("the sweep hit slot " + str(swept) + " not " + str(hit) + " for a torpedo at " + str((x, y)))
+    return (existing, sweep, sorts)
+
+# ----------------------------------------------------------------------------------
+# Timing on the 6502 core
+# ----------------------------------------------------------------------------------
+def ship_symbols(slots):
+    # the enemy ship arrays, at the same zero page addresses as in the game
+    symbols = dict(model_symbols)
+    symbols["maximum_number_of_enemy_ships"] = slots
+    for (name, index) in (("enemy_ships_flags_or_explosion_timer", 0), ("enemy_ships_on_screen", 1), ("enemy_ships_x_pixels", 3), ("enemy_ships_y_pixels", 6), ("enemy_ships_energy", 11)):
+        symbols[name] = 0x38 + index * slots
+    return symbols
+
+def place_ships(memory, symbols, ships):
+    for (slot, ship) in enumerate(ships):
+        memory[symbols["enemy_ships_x_pixels"] + slot] = ship["x"]
+        memory[symbols["enemy_ships_y_pixels"] + slot] = ship["y"]
+        memory[symbols["enemy_ships_on_screen"] + slot] = ship["on_screen"]
+        memory[symbols["enemy_ships_energy"] + slot] = ship["energy"]
+        memory[symbols["enemy_ships_flags_or_explosion_timer"] + slot] = ship["timer"]
+
+class Timer:
+    # Both ways assembled for a number of slots
+    def __init__(self, slots):
+        self.symbols = ship_symbols(slots)
+        (recorder, _, _) = plot_routines.assemble(record_pair.strip("\n").split("\n"), code_address, self.symbols)
+        self.bytes = {}
+        self.labels = {}
+        self.cpu = cpu6502.CPU()
+        address = code_address
+        for (name, source) in (("existing", existing_loops), ("sweep", sweep_loops)):
+            (code, labels, _) = plot_routines.assemble((source + record_pair).strip("\n").split("\n"), address, self.symbols)
+            self.cpu.load(address, code)
+            self.bytes[name] = len(code) - len(recorder)
+            self.labels.update(labels)
+            address += 0x400
+
+    def pairs_found(self):
+        memory = self.cpu.memory
+        count = memory[self.symbols["pair_count"]]
+        return sorted((memory[pairs_found + i], memory[pairs_found + i + 1]) for i in range(0, count, 2))
+
+    def time_layout(self, layout):
+        # Returns (existing cycles, sweep cycles) for one update
+        memory = self.cpu.memory
+        symbols = self.symbols
+        place_ships(memory, symbols, layout["ships"])
+        (pairs, _) = existing_pairs(layout["ships"])
+
+        existing = self.cpu.call(self.labels["existing_pairs"])
+        if self.pairs_found() != pairs:
+            raise AssertionError("existing_pairs found " + str(self.pairs_found()) + " not " + str(pairs))
+        sweep = self.cpu.call(self.labels["sort_by_x"])
+        sweep += self.cpu.call(self.labels["sweep_pairs"])
+        if self.pairs_found() != pairs:
+            raise AssertionError("sweep_pairs found " + str(self.pairs_found()) + " not " + str(pairs))
+        if pairs:
+            sweep += self.cpu.call(self.labels["sort_by_x"])
+
+        for (x, y) in layout["torpedoes"]:
+            (hit, _) = existing_torpedo(layout["ships"], x, y)
+            expected = 0xff if hit is None else hit
+            memory[symbols["torpedo_x"]] = x
+            memory[symbols["torpedo_y"]] = y
+            existing += self.cpu.call(self.labels["existing_torpedo"])
+            if memory[symbols["best"]] != expected:
+                raise AssertionError("existing_torpedo hit " + str(memory[symbols["best"]]) + " not " + str(expected))
+            sweep += self.cpu.call(self.labels["sweep_torpedo"])
+            if memory[symbols["best"]] != expected:
+                raise AssertionError("sweep_torpedo hit " + str(memory[symbols["best"]]) + " not " + str(expected))
+        return (existing, sweep)
+
+def check_against_game(layouts, variant, build_dir):
+    # Run the game's own check_for_collision_with_enemy_ships for each torpedo and check
+    # it hits the slot the model does, sorting first if the build has sort_enemy_ships_by_x
+    # (sorted_collisions=1). Also times check_for_starship_collision_with_enemy_ships once
+    # per layout. Returns (torpedoes checked, mean cycles per update for the pairs, the sort
+    # before the torpedoes and the torpedoes).
+    import benchmark
+
+    machine = benchmark.Machine(variant, build_dir)
+    symbols = machine.symbols
+    table = symbols["starship_torpedoes_table"]
+    checked = 0
+    updates = 0
+    cycles = {"pairs": 0, "sort": 0, "torpedoes": 0}
+    for layout in layouts:
+        if len(layout["ships"]) != symbols["maximum_number_of_enemy_ships"]:
+            continue
+        machine.reset()
+        place_ships(machine.cpu.memory, symbols, layout["ships"])
+        cycles["pairs"] += machine.call("check_for_starship_collision_with_enemy_ships")
+        updates += 1
+        for (x, y) in layout["torpedoes"]:
+            machine.reset()
+            place_ships(machine.cpu.memory, symbols, layout["ships"])
+            if machine.has("sort_enemy_ships_by_x"):
+                sort_cycles = machine.call("sort_enemy_ships_by_x")
+            machine.cpu.memory[table:table + 5] = bytes([2, 0, x, 0, y])
+            machine.set("temp0_low", table & 0xff)
+            machine.set("temp0_high", table >> 8)
+            cycles["torpedoes"] += machine.call("check_for_collision_with_enemy_ships")
+            (hit, _) = existing_torpedo(layout["ships"], x, y)
+            if machine.cpu.p & cpu6502.FLAG_C:
+                slot = symbols["maximum_number_of_enemy_ships"] - machine.get("enemy_ships_still_to_consider")
+            else:
+                slot = None
+            if slot != hit:
+                raise AssertionError(variant + "'s check_for_collision_with_enemy_ships disagrees with the model for a torpedo at " + str((x, y)) + " in " + json.dumps(layout["ships"]))
+            checked += 1
+        if machine.has("sort_enemy_ships_by_x"):
+            cycles["sort"] += sort_cycles if layout["torpedoes"] else machine.call("sort_enemy_ships_by_x")
+    for name in cycles:
+        cycles[name] /= float(max(1, updates))
+    return (checked, cycles)
+
+def print_results(layouts):
+    by_slots = {}
+    for layout in layouts:
+        by_slots.setdefault(len(layout["ships"]), []).append(layout)
+
+    print("comparisons per update (mean)           every later slot       sorted by x")
+    print("slots  layouts  ships  torpedoes      x tests   y tests     x tests   y tests  sorting   x tests avoided")
+    for (slots, group) in sorted(by_slots.items()):
+        existing = Counts()
+        sweep = Counts()
+        for layout in group:
+            (before, after, _) = count_layout(layout)
+            existing.add(before)
+            sweep.add(after)
+        n = float(len(group))
+        ships = sum(len([ship for ship in layout["ships"] if can_collide(ship)]) for layout in group) / n
+        torpedoes = sum(len(layout["torpedoes"]) for layout in group) / n
+        avoided = existing.x - sweep.x - sweep.sort
+        print("%5d  %7d  %5.1f  %9.1f  %11.1f %9.1f  %10.1f %9.1f %8.1f  %8.1f (%.0f%%)" % (slots, len(group), ships, torpedoes, existing.x / n, existing.y / n, sweep.x / n, sweep.y / n, sweep.sort / n, avoided / n, 100.0 * avoided / max(1, existing.x)))
+    print("")
+    print("cycles per update on the 6502 core (mean)")
+    print("slots      every later slot   sorted by x   saving    code bytes (every later slot / sorted by x)")
+    for (slots, group) in sorted(by_slots.items()):
+        timer = Timer(slots)
+        existing = 0
+        sweep = 0
+        for layout in group:
+            (before, after) = timer.time_layout(layout)
+            existing += before
+            sweep += after
+        n = float(len(group))
+        print("%5d  %20.1f  %12.1f  %7.1f    %d / %d (and %d bytes for the sorted list)" % (slots, existing / n, sweep / n, (existing - sweep) / n, timer.bytes["existing"], timer.bytes["sweep"], slots + 1))
+
+def print_budget(variant, build_dir):
+    # How much the variant's resident code can still grow
+    import memory_map
+
+    config = memory_map.read_config(memory_map.default_budget)
+    for name in memory_map.variants:
+        layout = memory_map.Layout(name, build_dir, config)
+        reserve = config["reserve"].get(name)
+        if reserve is not None:
+            print("%-13s can grow by %d bytes before reaching its budget" % (name, layout.budget(reserve) - layout.resident()))
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Count the collision comparisons a broad phase sorted by x would avoid, and time both ways on the 6502 core")
+all_args.add_argument("--layouts", action="append", metavar="FILE", help="JSON list of recorded layouts (as written by --save)")
+all_args.add_argument("--memory", nargs="+", metavar="DUMP", help="emulator memory dumps (from &0000) to read layouts from, at the addresses in --variant's symbol list")
+all_args.add_argument("--variant", help="build whose symbols to use for --memory, and whose own check_for_collision_with_enemy_ships to check the model against (e.g. STAR)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--random", type=int, metavar="N", help="make N random layouts for each number of slots (default 1000 if no layouts are given)")
+all_args.add_argument("--ships", default="8", metavar="SLOTS", help="numbers of enemy ship slots for random layouts, comma separated (default 8, as in the game)")
+all_args.add_argument("--seed", type=int, default=1, help="seed for the random layouts")
+all_args.add_argument("--save", metavar="FILE", help="write the layouts used as JSON")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    layouts = []
+    for filename in args.layouts or []:
+        layouts += read_layouts(filename)
+    if args.memory:
+        if not args.variant:
+            all_args.error("--memory needs --variant for the addresses of the enemy ships")
+        symbols = acme_output.read_symbols(acme_output.symbols_filename(args.variant, args.build))
+        for filename in args.memory:
+            with open(filename, "rb") as f:
+                layouts.append(layout_from_memory(bytearray(f.read()), symbols))
+    count = args.random if args.random is not None else (0 if layouts else 1000)
+    rng = random.Random(args.seed)
+    for slots in [int(slots) for slots in args.ships.split(",")]:
+        layouts += [random_layout(rng, slots) for layout in range(count)]
+    if not layouts:
+        all_args.error("no layouts")
+    if args.save:
+        write_layouts(args.save, layouts)
+
+    print_results(layouts)
+    if args.variant:
+        (checked, cycles) = check_against_game(layouts, args.variant, args.build)
+        print("")
+        print("%s's check_for_collision_with_enemy_ships agrees with the model for %d torpedoes" % (args.variant, checked))
+        print("%s's cycles per update (mean, with the responses to a collision): pairs %.1f, sort before the torpedoes %.1f, torpedoes %.1f, total %.1f" % (args.variant, cycles["pairs"], cycles["sort"], cycles["torpedoes"], sum(cycles.values())))
+        print_budget(args.variant, args.build)
@@ -0,0 +1,437 @@
+import mos6502
+
+# A small cycle counting NMOS 6502 core, for running game routines outside an emulator.
+#
+# Only the documented instructions are implemented. Cycle counts include the extra
+# cycles for page crossings and taken branches. Memory is a flat 64K bytearray;
+# 'read_hooks' and 'write_hooks' map addresses to functions for memory mapped I/O, and
+# 'traps' map addresses to Python functions that run instead of the code there (used to
+# stand in for OS routines). A trap function is called with the CPU and should finish
+# by calling cpu.rts() (or otherwise set the PC).
+
+class CPUError(Exception):
+    pass
+
+FLAG_C = 0x01
+FLAG_Z = 0x02
+FLAG_I = 0x04
+FLAG_D = 0x08
+FLAG_B = 0x10
+FLAG_U = 0x20
+FLAG_V = 0x40
+FLAG_N = 0x80
+
+class CPU:
+    def __init__(self, memory=None):
+        if memory is None:
+            memory = bytearray(65536)
+        self.memory = memory
+        self.a = 0
+        self.x = 0
+        self.y = 0
+        self.s = 0xff
+        self.p = FLAG_U | FLAG_I
+        self.pc = 0
+        self.cycles = 0
+        self.instructions = 0
+        self.read_hooks = {}
+        self.write_hooks = {}
+        self.traps = {}
+        self.trace = None       # optional function(cpu) called before each instruction
+
+        self.handlers = {}
+        for opcode, instruction in mos6502.by_opcode.items():
+            self.handlers[opcode] = (getattr(self, "op_" + instruction.mnemonic), instruction)
+
+    # ------------------------------------------------------------------------------
+    # memory
+    def read(self, address):
+        hook = self.read_hooks.get(address)
+        if hook:
+            return hook(self, address) & 0xff
+        return self.memory[address]
+
+    def write(self, address, value):
+        hook = self.write_hooks.get(address)
+        if hook:
+            hook(self, address, value & 0xff)
+        else:
+            self.memory[address] = value & 0xff
+
+    def read_word(self, address):
+        return self.read(address) | (self.read((address + 1) & 0xffff) << 8)
+
+    def load(self, address, data):
+        self.memory[address:address + len(data)] = data
+
+    def push(self, value):
+        self.memory[0x100 + self.s] = value & 0xff
+        self.s = (self.s - 1) & 0xff
+
+    def pull(self):
+        self.s = (self.s + 1) & 0xff
+        return self.memory[0x100 + self.s]
+
+    def rts(self):
+        # Return from a subroutine (for use by traps)
+        low = self.pull()
+        self.pc = ((self.pull() << 8) | low) + 1
+        self.pc &= 0xffff
+
+    # ------------------------------------------------------------------------------
+    # flags
+    def flag(self, mask):
+        return (self.p & mask) != 0
+
+    def set_flag(self, mask, value):
+        if value:
+            self.p |= mask
+        else:
+            self.p &= ~mask
+
+    def set_nz(self, value):
+        self.p &= ~(FLAG_N | FLAG_Z)
+        if value == 0:
+            self.p |= FLAG_Z
+        self.p |= value & FLAG_N
+        return value
+
+    # ------------------------------------------------------------------------------
+    # execution
+    def step(self):
+        trap = self.traps.get(self.pc)
+        if trap:
+            trap(self)
+            return
+        if self.trace:
+            self.trace(self)
+        opcode = self.memory[self.pc]
+        handler = self.handlers.get(opcode)
+        if handler is None:
+            raise CPUError("unknown opcode &" + format(opcode, "02x") + " at &" + format(self.pc, "04x"))
+        (function, instruction) = handler
+        self.cycles += instruction.cycles
+        self.instructions += 1
+        self.instruction = instruction
+        address = self.operand_address(instruction)
+        self.pc = (self.pc + instruction.size) & 0xffff
+        function(address)
+
+    def operand_address(self, instruction):
+        mode = instruction.mode
+        pc = self.pc
+        m = self.memory
+        if mode == mos6502.IMM or mode == mos6502.REL:
+            return (pc + 1) & 0xffff
+        if mode == mos6502.ZP:
+            return m[(pc + 1) & 0xffff]
+        if mode == mos6502.ABS:
+            return m[(pc + 1) & 0xffff] | (m[(pc + 2) & 0xffff] << 8)
+        if mode == mos6502.ZPX:
+            return (m[(pc + 1) & 0xffff] + self.x) & 0xff
+        if mode == mos6502.ZPY:
+            return (m[(pc + 1) & 0xffff] + self.y) & 0xff
+        if mode == mos6502.ABSX or mode == mos6502.ABSY:
+            base = m[(pc + 1) & 0xffff] | (m[(pc + 2) & 0xffff] << 8)
+            address = (base + (self.x if mode == mos6502.ABSX else self.y)) & 0xffff
+            if instruction.page_penalty and (address ^ base) & 0xff00:
+                self.cycles += 1
+            return address
+        if mode == mos6502.INDY:
+            zp = m[(pc + 1) & 0xffff]
+            base = m[zp] | (m[(zp + 1) & 0xff] << 8)
+            address = (base + self.y) & 0xffff
+            if instruction.page_penalty and (address ^ base) & 0xff00:
+                self.cycles += 1
+            return address
+        if mode == mos6502.INDX:
+            zp = (m[(pc + 1) & 0xffff] + self.x) & 0xff
+            return m[zp] | (m[(zp + 1) & 0xff] << 8)
+        if mode == mos6502.IND:
+            pointer = m[(pc + 1) & 0xffff] | (m[(pc + 2) & 0xffff] << 8)
+            # the NMOS 6502 doesn't carry into the high byte of the pointer
+            return self.read(pointer) | (self.read((pointer & 0xff00) | ((pointer + 1) & 0xff)) << 8)
+        return None
+
+    def run(self, until=None, max_cycles=None):
+        # Run until the PC reaches 'until' (if given) or 'max_cycles' have elapsed
+        limit = None if max_cycles is None else self.cycles + max_cycles
+        while self.pc != until:
+            if limit is not None and self.cycles >= limit:
+                raise CPUError("still running after " + str(max_cycles) + " cycles, PC=&" + format(self.pc, "04x"))
+            self.step()
+
+    def call(self, address, a=None, x=None, y=None, max_cycles=10000000):
+        # JSR to a routine and run until it returns. Returns the number of cycles taken,
+        # including the JSR and RTS.
+        return_address = 0xfffe                     # an address the game never runs
+        if a is not None:
+            self.a = a & 0xff
+        if x is not None:
+            self.x = x & 0xff
+        if y is not None:
+            self.y = y & 0xff
+        self.push((return_address - 1) >> 8)
+        self.push((return_address - 1) & 0xff)
+        self.pc = address
+        start = self.cycles
+        self.run(until=return_address, max_cycles=max_cycles)
+        return self.cycles - start + 6             # the JSR
+
+    # ------------------------------------------------------------------------------
+    # value of the operand, for instructions with an accumulator form
+    def fetch(self, address):
+        if self.instruction.mode == mos6502.ACC:
+            return self.a
+        return self.read(address)
+
+    def store(self, address, value):
+        if self.instruction.mode == mos6502.ACC:
+            self.a = value & 0xff
+        else:
+            self.write(address, value)
+
+    def branch(self, address, condition):
+        if condition:
+            offset = self.memory[address]
+            if offset & 0x80:
+                offset -= 256
+            target = (self.pc + offset) & 0xffff
+            self.cycles += 1
+            if (target ^ self.pc) & 0xff00:
+                self.cycles += 1
+            self.pc = target
+
+    def compare(self, register, value):
+        result = register - value
+        self.set_flag(FLAG_C, result >= 0)
+        self.set_nz(result & 0xff)
+
+    # ------------------------------------------------------------------------------
+    # instructions
+    def op_adc(self, address):
+        value = self.read(address)
+        carry = self.p & FLAG_C
+        if self.p & FLAG_D:
+            low = (self.a & 0x0f) + (value & 0x0f) + carry
+            if low > 9:
+                low += 6
+            high = (self.a >> 4) + (value >> 4) + (1 if low > 0x0f else 0)
+            binary = (self.a + value + carry) & 0xff
+            self.set_flag(FLAG_Z, binary == 0)
+            self.set_flag(FLAG_N, high & 8)
+            self.set_flag(FLAG_V, (~(self.a ^ value) & (self.a ^ (high << 4)) & 0x80))
+            if high > 9:
+                high += 6
+            self.set_flag(FLAG_C, high > 0x0f)
+            self.a = ((high << 4) | (low & 0x0f)) & 0xff
+        else:
+            result = self.a + value + carry
+            self.set_flag(FLAG_V, (~(self.a ^ value) & (self.a ^ result) & 0x80))
+            self.set_flag(FLAG_C, result > 0xff)
+            self.a = self.set_nz(result & 0xff)
+
+    def op_sbc(self, address):
+        value = self.read(address)
+        borrow = 1 - (self.p & FLAG_C)
+        result = self.a - value - borrow
+        self.set_flag(FLAG_V, ((self.a ^ value) & (self.a ^ result) & 0x80))
+        if self.p & FLAG_D:
+            low = (self.a & 0x0f) - (value & 0x0f) - borrow
+            high = (self.a >> 4) - (value >> 4)
+            if low < 0:
+                low -= 6
+                high -= 1
+            if high < 0:
+                high -= 6
+            self.set_nz(result & 0xff)
+            self.set_flag(FLAG_C, result >= 0)
+            self.a = ((high << 4) | (low & 0x0f)) & 0xff
+        else:
+            self.set_flag(FLAG_C, result >= 0)
+            self.a = self.set_nz(result & 0xff)
+
+    def op_and(self, address):
+        self.a = self.set_nz(self.a & self.read(address))
+
+    def op_ora(self, address):
+        self.a = self.set_nz(self.a | self.read(address))
+
+    def op_eor(self, address):
+        self.a = self.set_nz(self.a ^ self.read(address))
+
+    def op_asl(self, address):
+        value = self.fetch(address)
+        self.set_flag(FLAG_C, value & 0x80)
+        self.store(address, self.set_nz((value << 1) & 0xff))
+
+    def op_lsr(self, address):
+        value = self.fetch(address)
+        self.set_flag(FLAG_C, value & 1)
+        self.store(address, self.set_nz(value >> 1))
+
+    def op_rol(self, address):
+        value = self.fetch(address)
+        result = ((value << 1) | (self.p & FLAG_C)) & 0xff
+        self.set_flag(FLAG_C, value & 0x80)
+        self.store(address, self.set_nz(result))
+
+    def op_ror(self, address):
+        value = self.fetch(address)
+        result = (value >> 1) | ((self.p & FLAG_C) << 7)
+        self.set_flag(FLAG_C, value & 1)
+        self.store(address, self.set_nz(result))
+
+    def op_bit(self, address):
+        value = self.read(address)
+        self.set_flag(FLAG_Z, (value & self.a) == 0)
+        self.set_flag(FLAG_N, value & 0x80)
+        self.set_flag(FLAG_V, value & 0x40)
+
+    def op_bcc(self, address):
+        self.branch(address, not self.p & FLAG_C)
+
+    def op_bcs(self, address):
+        self.branch(address, self.p & FLAG_C)
+
+    def op_bne(self, address):
+        self.branch(address, not self.p & FLAG_Z)
+
+    def op_beq(self, address):
+        self.branch(address, self.p & FLAG_Z)
+
+    def op_bpl(self, address):
+        self.branch(address, not self.p & FLAG_N)
+
+    def op_bmi(self, address):
+        self.branch(address, self.p & FLAG_N)
+
+    def op_bvc(self, address):
+        self.branch(address, not self.p & FLAG_V)
+
+    def op_bvs(self, address):
+        self.branch(address, self.p & FLAG_V)
+
+    def op_brk(self, address):
+        self.pc = (self.pc + 1) & 0xffff
+        self.push(self.pc >> 8)
+        self.push(self.pc & 0xff)
+        self.push(self.p | FLAG_B | FLAG_U)
+        self.p |= FLAG_I
+        self.pc = self.read_word(0xfffe)
+
+    def op_clc(self, address):
+        self.p &= ~FLAG_C
+
+    def op_cld(self, address):
+        self.p &= ~FLAG_D
+
+    def op_cli(self, address):
+        self.p &= ~FLAG_I
+
+    def op_clv(self, address):
+        self.p &= ~FLAG_V
+
+    def op_sec(self, address):
+        self.p |= FLAG_C
+
+    def op_sed(self, address):
+        self.p |= FLAG_D
+
+    def op_sei(self, address):
+        self.p |= FLAG_I
+
+    def op_cmp(self, address):
+        self.compare(self.a, self.read(address))
+
+    def op_cpx(self, address):
+        self.compare(self.x, self.read(address))
+
+    def op_cpy(self, address):
+        self.compare(self.y, self.read(address))
+
+    def op_dec(self, address):
+        self.write(address, self.set_nz((self.read(address) - 1) & 0xff))
+
+    def op_inc(self, address):
+        self.write(address, self.set_nz((self.read(address) + 1) & 0xff))
+
+    def op_dex(self, address):
+        self.x = self.set_nz((self.x - 1) & 0xff)
+
+    def op_dey(self, address):
+        self.y = self.set_nz((self.y - 1) & 0xff)
+
+    def op_inx(self, address):
+        self.x = self.set_nz((self.x + 1) & 0xff)
+
+    def op_iny(self, address):
+        self.y = self.set_nz((self.y + 1) & 0xff)
+
+    def op_jmp(self, address):
+        self.pc = address
+
+    def op_jsr(self, address):
+        return_address = (self.pc - 1) & 0xffff
+        self.push(return_address >> 8)
+        self.push(return_address & 0xff)
+        self.pc = address
+
+    def op_rts(self, address):
+        self.rts()
+
+    def op_rti(self, address):
+        self.p = (self.pull() | FLAG_U) & ~FLAG_B
+        low = self.pull()
+        self.pc = (self.pull() << 8) | low
+
+    def op_lda(self, address):
+        self.a = self.set_nz(self.read(address))
+
+    def op_ldx(self, address):
+        self.x = self.set_nz(self.read(address))
+
+    def op_ldy(self, address):
+        self.y = self.set_nz(self.read(address))
+
+    def op_sta(self, address):
+        self.write(address, self.a)
+
+    def op_stx(self, address):
+        self.write(address, self.x)
+
+    def op_sty(self, address):
+        self.write(address, self.y)
+
+    def op_nop(self, address):
+        pass
+
+    def op_pha(self, address):
+        self.push(self.a)
+
+    def op_php(self, address):
+        self.push(self.p | FLAG_B | FLAG_U)
+
+    def op_pla(self, address):
+        self.a = self.set_nz(self.pull())
+
+    def op_plp(self, address):
+        self.p = (self.pull() | FLAG_U) & ~FLAG_B
+
+    def op_tax(self, address):
+        self.x = self.set_nz(self.a)
+
+    def op_tay(self, address):
+        self.y = self.set_nz(self.a)
+
+    def op_tsx(self, address):
+        self.x = self.set_nz(self.s)
+
+    def op_txa(self, address):
+        self.a = self.set_nz(self.x)
+
+    def op_txs(self, address):
+        self.s = self.x
+
+    def op_tya(self, address):
+        self.a = self.set_nz(self.y)
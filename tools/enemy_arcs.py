@@ -0,0 +1,375 @@
+import argparse
+import re
+import sys
+
+# Compiles the enemy ship designs in source/enemies.txt into the tables used by
+# fill_enemy_cache and plot_enemy_loop (enemy_table_low/high, enemy_arc_counts,
+# enemy_strides, enemy0... and centre_array_dx/dy), written as build/enemies.a for
+# starcommand_acme.asm to include. The tables are the same for all four builds.
+#
+# Each enemy is drawn as arcs of a 32 point circle. An arc is plotted one pixel at a time
+# from its start point, stepping by the difference between successive points of the
+# circle. Pixels are EOR'd onto the screen, so a pixel plotted twice disappears.
+#
+# With --report it lists the arcs (moves) and points plotted for each angle, and the
+# bytes each enemy needs in the cache. With --optimise it searches for the fewest arcs
+# that draw exactly the same pixels, and writes the result as a new description.
+
+number_of_points = 32
+defined_angles = 5          # angles 0-4 are defined, the rest are made by fill_enemy_cache
+cached_angles = 32
+bytes_per_arc = 4
+cache_sizes = [("enemy_cache_a", 640), ("enemy_cache_b", 768)]
+
+# the unrolled plotting code (plus_angle0 onwards, written by plot_routines.py) holds 42
+# moves, so an arc starting at point 31 can be at most 12 points long. Arcs are rotated to
+# start at every point by fill_enemy_cache, so this limits all arcs.
+max_arc_length = 12
+
+# rough costs, from benchmark.py's plot_segment (unrolled) figures
+cycles_per_arc = 230
+cycles_per_point = 28
+
+class DescriptionError(Exception):
+    pass
+
+class Arc:
+    def __init__(self, x, y, start, length):
+        self.x = x
+        self.y = y
+        self.start = start
+        self.length = length
+
+    def last(self):
+        return self.start + self.length - 1
+
+    def pixels(self, circle):
+        # the pixels plotted, in order
+        (x, y) = (self.x, self.y)
+        result = [(x, y)]
+        for i in range(self.start, self.start + self.length - 1):
+            (dx, dy) = circle.step(i)
+            x += dx
+            y += dy
+            result.append((x, y))
+        return result
+
+    def description(self):
+        return "arc %2d-%-2d at %2d,%2d" % (self.start, self.last(), self.x, self.y)
+
+class Circle:
+    def __init__(self, points):
+        if len(points) != number_of_points:
+            raise DescriptionError("the circle needs " + str(number_of_points) + " points, not " + str(len(points)))
+        self.points = points
+
+    def step(self, i):
+        (x0, y0) = self.points[i % number_of_points]
+        (x1, y1) = self.points[(i + 1) % number_of_points]
+        return (x1 - x0, y1 - y0)
+
+class Enemy:
+    def __init__(self, number):
+        self.number = number
+        self.comments = []
+        self.angles = []                # a list of arcs for each angle
+
+    def arc_count(self):
+        return len(self.angles[0])
+
+    def stride(self):
+        return bytes_per_arc * self.arc_count()
+
+    def cache_bytes(self):
+        return cached_angles * self.stride()
+
+arc_pattern = re.compile(r'^arc\s+([0-9]+)\s*-\s*([0-9]+)\s+at\s+(-?[0-9]+)\s*,\s*(-?[0-9]+)$')
+point_pattern = re.compile(r'(-?[0-9]+)\s*,\s*(-?[0-9]+)')
+
+def read_description(filename):
+    # Returns the circle, the list of enemies and the comment lines at the start of the file
+    circle_points = None
+    enemies = []
+    header = []
+    comments = []
+    in_circle = False
+    with open(filename) as f:
+        for (number, line) in enumerate(f, 1):
+            where = filename + ":" + str(number) + ": "
+            text = line.strip()
+            if text.startswith(";") or text == "":
+                comments.append(line.rstrip())
+                continue
+            words = text.split()
+            if words[0] == "circle":
+                in_circle = True
+                circle_points = []
+                header = comments
+                comments = []
+                continue
+            if words[0] == "enemy":
+                in_circle = False
+                enemy = Enemy(int(words[1]))
+                if enemy.number != len(enemies):
+                    raise DescriptionError(where + "expected enemy " + str(len(enemies)))
+                enemy.comments = comments
+                comments = []
+                enemies.append(enemy)
+                continue
+            if in_circle:
+                circle_points += [(int(x), int(y)) for (x, y) in point_pattern.findall(text)]
+                continue
+            if not enemies:
+                raise DescriptionError(where + "expected 'circle' or 'enemy'")
+            comments = []
+            if words[0] == "angle":
+                if int(words[1]) != len(enemies[-1].angles):
+                    raise DescriptionError(where + "expected angle " + str(len(enemies[-1].angles)))
+                enemies[-1].angles.append([])
+                continue
+            match = arc_pattern.match(text)
+            if not match or not enemies[-1].angles:
+                raise DescriptionError(where + "can't read '" + text + "'")
+            (first, last, x, y) = [int(value) for value in match.groups()]
+            if first >= number_of_points or last < first or last - first + 1 > max_arc_length:
+                raise DescriptionError(where + "arc must start at a point 0-31 and be 1-" + str(max_arc_length) + " points long")
+            enemies[-1].angles[-1].append(Arc(x, y, first, last - first + 1))
+
+    if circle_points is None:
+        raise DescriptionError(filename + ": no circle")
+    for enemy in enemies:
+        if len(enemy.angles) != defined_angles:
+            raise DescriptionError(filename + ": enemy " + str(enemy.number) + " has " + str(len(enemy.angles)) + " angles, not " + str(defined_angles))
+        counts = set(len(arcs) for arcs in enemy.angles)
+        if len(counts) != 1:
+            raise DescriptionError(filename + ": enemy " + str(enemy.number) + " needs the same number of arcs at each angle")
+    return (Circle(circle_points), enemies, header)
+
+def visible_pixels(arcs, circle):
+    # pixels left on screen after EOR plotting all the arcs
+    pixels = set()
+    for arc in arcs:
+        for pixel in arc.pixels(circle):
+            pixels ^= set([pixel])
+    return pixels
+
+def signed_byte(value):
+    return str(value).rjust(2)
+
+def write_tables(filename, circle, enemies):
+    with open(filename, 'w') as f:
+        f.write("; Written by tools/enemy_arcs.py from source/enemies.txt. Do not edit.\n\n")
+        f.write("; start address of the definition of each enemy\n")
+        f.write("enemy_table_low\n")
+        for enemy in enemies:
+            f.write("    !byte <enemy" + str(enemy.number) + "\n")
+        f.write("\nenemy_table_high\n")
+        for enemy in enemies:
+            f.write("    !byte >enemy" + str(enemy.number) + "\n")
+
+        f.write("\n; The number of arcs that define the enemy\n")
+        f.write("enemy_arc_counts\n")
+        for enemy in enemies:
+            f.write("    !byte " + str(enemy.arc_count()) + "     ; enemy " + str(enemy.number) + "\n")
+
+        f.write("\n; the stride of an enemy is the number of bytes to get from the definition of one angle\n")
+        f.write("; of the enemy to the next. Four times the number of arcs of the enemy.\n")
+        f.write("enemy_strides\n")
+        for enemy in enemies:
+            f.write("    !byte 4*" + str(enemy.arc_count()) + "   ; enemy " + str(enemy.number) + "\n")
+
+        f.write("\n; There are 32 angles for each enemy covering the full 360 degrees.\n")
+        f.write("; We define just 5 angles for each enemy. This covers 0-45 degrees. All other angles\n")
+        f.write("; are copies of these rotated and/or reflected into a cache for the current command.\n")
+        for enemy in enemies:
+            f.write("enemy" + str(enemy.number) + "\n")
+            f.write("    ; (x, y, start_angle, length)\n")
+            for (angle, arcs) in enumerate(enemy.angles):
+                f.write("\n    ; angle " + str(angle) + "\n")
+                for arc in arcs:
+                    f.write("    !byte " + signed_byte(arc.x) + ", " + signed_byte(arc.y) + "," + signed_byte(arc.start) + "," + signed_byte(arc.length) + "\n")
+            f.write("\n")
+
+        f.write("; The centre_array holds (dx,dy) from the centre of the circle to each pixel on the\n")
+        f.write("; perimeter of the circle.")
+        xs = [x for (x, y) in circle.points]
+        ys = [y for (x, y) in circle.points]
+        quarter = number_of_points // 4
+        if ys[quarter:] == xs[:number_of_points - quarter]:
+            # a quarter turn of the circle is the same circle, so the y table is the x
+            # table shifted by a quarter, and they can overlap
+            f.write(" 32 entries, with the tables overlapping.\n")
+            f.write("centre_array_dy\n")
+            f.write("    !byte " + ",".join(signed_byte(y) for y in ys[0:quarter]) + "\n\n")
+            f.write("centre_array_dx\n")
+        else:
+            f.write("\ncentre_array_dy\n")
+            for i in range(0, number_of_points, 16):
+                f.write("    !byte " + ",".join(signed_byte(y) for y in ys[i:i + 16]) + "\n")
+            f.write("\ncentre_array_dx\n")
+        for i in range(0, number_of_points, 16):
+            f.write("    !byte " + ",".join(signed_byte(x) for x in xs[i:i + 16]) + "\n")
+
+def write_description(filename, circle, enemies, header):
+    out = open(filename, 'w') if filename != "-" else sys.stdout
+    for line in header:
+        out.write(line + "\n")
+    out.write("circle\n")
+    for i in range(0, number_of_points, 8):
+        out.write("    " + "  ".join(("%d,%d" % point).rjust(5) for point in circle.points[i:i + 8]) + "\n")
+    for enemy in enemies:
+        for line in enemy.comments:
+            out.write(line + "\n")
+        out.write("enemy " + str(enemy.number) + "\n")
+        for (angle, arcs) in enumerate(enemy.angles):
+            out.write("    angle " + str(angle) + "\n")
+            for arc in arcs:
+                out.write("        " + arc.description() + "\n")
+    if out is not sys.stdout:
+        out.close()
+
+def picture(pixels):
+    # ASCII picture of a set of pixels
+    if not pixels:
+        return []
+    xs = [x for (x, y) in pixels]
+    ys = [y for (x, y) in pixels]
+    lines = []
+    for y in range(min(ys), max(ys) + 1):
+        line = ""
+        for x in range(min(xs), max(xs) + 1):
+            if (x, y) in pixels:
+                line += "#"
+            elif (x, y) == (0, 0):
+                line += "+"
+            else:
+                line += "."
+        lines.append(line)
+    return lines
+
+def angle_cost(arcs):
+    points = sum(arc.length for arc in arcs)
+    return (len(arcs), points, len(arcs) * cycles_per_arc + points * cycles_per_point)
+
+def report(circle, enemies, show):
+    print("enemy  angle  arcs  points  visible  ~cycles")
+    for enemy in enemies:
+        for (angle, arcs) in enumerate(enemy.angles):
+            (moves, points, cycles) = angle_cost(arcs)
+            visible = visible_pixels(arcs, circle)
+            print("%5d  %5d  %4d  %6d  %7d  %7d" % (enemy.number, angle, moves, points, len(visible), cycles))
+            if show:
+                for line in picture(visible):
+                    print("        " + line)
+    print("")
+    print("enemy  stride  cache bytes")
+    for enemy in enemies:
+        fits = [name for (name, size) in cache_sizes if enemy.cache_bytes() <= size]
+        print("%5d  %6d  %11d  %s" % (enemy.number, enemy.stride(), enemy.cache_bytes(), ("fits " + ", ".join(fits)) if fits else "too big for either cache"))
+
+# ----------------------------------------------------------------------------------
+# Searching for fewer arcs
+#
+# The pixels of an angle are covered exactly (each once) by a set of arcs taken from
+# every arc that lies entirely on the pixels, using Knuth's Algorithm X: always branch
+# on the uncovered pixel with the fewest arcs through it.
+# ----------------------------------------------------------------------------------
+
+def candidate_arcs(pixels, circle):
+    # every arc that plots only pixels in 'pixels', each pixel once
+    found = {}
+    for (x, y) in pixels:
+        for start in range(number_of_points):
+            for length in range(1, max_arc_length + 1):
+                arc = Arc(x, y, start, length)
+                plotted = arc.pixels(circle)
+                if plotted[-1] not in pixels or plotted[-1] in plotted[:-1]:
+                    break
+                key = frozenset(plotted)
+                if key not in found or (start, length) < (found[key].start, found[key].length):
+                    found[key] = arc
+    return found
+
+def fewest_arcs(pixels, circle, limit):
+    # Returns the smallest list of arcs covering 'pixels' exactly, with at most 'limit'
+    # arcs, or None
+    candidates = candidate_arcs(pixels, circle)
+    through = dict((pixel, []) for pixel in pixels)
+    for key in candidates:
+        for pixel in key:
+            through[pixel].append(key)
+    longest = max(len(key) for key in candidates) if candidates else 1
+    best = [None]
+
+    def search(uncovered, chosen):
+        if not uncovered:
+            if best[0] is None or len(chosen) < len(best[0]):
+                best[0] = list(chosen)
+            return
+        bound = best[0] and len(best[0]) - 1 or limit
+        if len(chosen) + (len(uncovered) + longest - 1) // longest > bound:
+            return
+        pixel = min(uncovered, key=lambda p: len([key for key in through[p] if key <= uncovered]))
+        for key in sorted(through[pixel], key=len, reverse=True):
+            if key <= uncovered:
+                chosen.append(candidates[key])
+                search(uncovered - key, chosen)
+                chosen.pop()
+
+    search(frozenset(pixels), [])
+    return best[0]
+
+def split_arc(arc, circle):
+    # split an arc into two, to pad an angle out to the enemy's number of arcs
+    first = arc.length // 2
+    (x, y) = arc.pixels(circle)[first]
+    return [Arc(arc.x, arc.y, arc.start, first), Arc(x, y, (arc.start + first) % number_of_points, arc.length - first)]
+
+def optimise(circle, enemies):
+    for enemy in enemies:
+        found = []
+        for arcs in enemy.angles:
+            pixels = visible_pixels(arcs, circle)
+            better = fewest_arcs(pixels, circle, len(arcs))
+            found.append(better if better else list(arcs))
+
+        # every angle of an enemy must have the same number of arcs
+        count = max(len(arcs) for arcs in found)
+        for arcs in found:
+            while len(arcs) < count:
+                arcs.sort(key=lambda arc: arc.length)
+                arcs += split_arc(arcs.pop(), circle)
+            arcs.sort(key=lambda arc: (arc.start, arc.y, arc.x))
+
+        before = [angle_cost(arcs) for arcs in enemy.angles]
+        after = [angle_cost(arcs) for arcs in found]
+        print("enemy %d: %d arcs, %d points -> %d arcs, %d points (~%d -> ~%d cycles per draw, cache %d -> %d bytes)" % (
+            enemy.number, sum(c[0] for c in before), sum(c[1] for c in before), sum(c[0] for c in after), sum(c[1] for c in after),
+            sum(c[2] for c in before) // defined_angles, sum(c[2] for c in after) // defined_angles,
+            enemy.cache_bytes(), cached_angles * bytes_per_arc * count))
+        for (old, new) in zip(enemy.angles, found):
+            assert visible_pixels(old, circle) == visible_pixels(new, circle)
+        enemy.angles = found
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Compile the enemy ship designs into tables for the game")
+all_args.add_argument("--input", default="source/enemies.txt", help="enemy design description")
+all_args.add_argument("--output", help="acme source file to write the tables to (e.g. build/enemies.a)")
+all_args.add_argument("--report", action="store_true", help="list the arcs, points and cache bytes of each enemy")
+all_args.add_argument("--show", action="store_true", help="with --report, draw each angle")
+all_args.add_argument("--optimise", metavar="FILE", help="search for fewer arcs drawing the same pixels, and write the description to FILE ('-' for stdout)")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    try:
+        (circle, enemies, header) = read_description(args.input)
+    except DescriptionError as e:
+        print(e)
+        sys.exit(1)
+    if args.output:
+        write_tables(args.output, circle, enemies)
+    if args.report:
+        report(circle, enemies, args.show)
+    if args.optimise:
+        optimise(circle, enemies)
+        write_description(args.optimise, circle, enemies, header)
@@ -0,0 +1,184 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import enemy_arcs
+import png
+
+# Draws every enemy design at all 32 angles at once with NumPy, to find pixels that are
+# plotted more than once. Enemies are EOR plotted, so a pixel plotted twice disappears
+# and a pixel plotted three times is two wasted plots.
+#
+# The arcs for all 32 angles come either from an assembled binary, by running the game's
+# own fill_one_enemy_cache on the 6502 core (see benchmark.py), or from
+# source/enemies.txt, by doing the same reflections and rotations here.
+#
+# For each enemy a contact sheet PNG shows the 32 angles: pixels plotted once are white,
+# an odd number of times more than once yellow, and an even number of times (so not
+# visible) red.
+
+angles = enemy_arcs.cached_angles
+points = enemy_arcs.number_of_points
+
+# contact sheet colours
+palette = [(0, 0, 0), (255, 255, 255), (255, 200, 0), (255, 0, 0), (40, 40, 40), (0, 90, 160)]
+background = 0
+plotted_once = 1
+plotted_odd = 2
+cancelled = 3
+grid = 4
+centre = 5
+
+def signed(values):
+    values = np.asarray(values, dtype=np.int32)
+    return np.where(values >= 0x80, values - 0x100, values)
+
+def expand_angles(arcs, circle_x, circle_y):
+    # Make all 32 angles from the first five (shape (5, arcs, 4) of x, y, start, length),
+    # as fill_one_enemy_cache does: angles 5-7 reflect angles 3-1, and each angle from 8
+    # on is the angle eight before it turned by 90 degrees.
+    result = np.zeros((angles,) + arcs.shape[1:], dtype=np.int32)
+    result[0:5] = arcs
+    source = arcs[[3, 2, 1]]
+    (x, y, start, length) = (source[..., 0], source[..., 1], source[..., 2], source[..., 3])
+    end = (start + length - 1) & 31
+    result[5:8, :, 0] = circle_y[start] - circle_y[end] - y
+    result[5:8, :, 1] = circle_x[start] - circle_x[end] - x
+    result[5:8, :, 2] = (40 - end) & 31
+    result[5:8, :, 3] = length
+    for angle in range(8, angles):
+        previous = result[angle - 8]
+        result[angle, :, 0] = -previous[:, 1]
+        result[angle, :, 1] = previous[:, 0]
+        result[angle, :, 2] = (previous[:, 2] + 8) & 31
+        result[angle, :, 3] = previous[:, 3]
+    # the cache holds bytes
+    result[..., 0:2] = signed(result[..., 0:2] & 0xff)
+    return result
+
+def arcs_from_source(filename):
+    (circle, enemies, header) = enemy_arcs.read_description(filename)
+    circle_x = np.array([x for (x, y) in circle.points])
+    circle_y = np.array([y for (x, y) in circle.points])
+    most = max(enemy.arc_count() for enemy in enemies)
+    result = np.zeros((len(enemies), angles, most, 4), dtype=np.int32)
+    for (number, enemy) in enumerate(enemies):
+        defined = np.array([[(arc.x, arc.y, arc.start, arc.length) for arc in arcs] for arcs in enemy.angles])
+        result[number, :, 0:enemy.arc_count()] = expand_angles(defined, circle_x, circle_y)
+    steps_x = np.roll(circle_x, -1) - circle_x
+    steps_y = np.roll(circle_y, -1) - circle_y
+    return (result, steps_x, steps_y)
+
+def arcs_from_binary(variant, build_dir):
+    # run fill_one_enemy_cache for each enemy and read back the cache
+    import benchmark
+    machine = benchmark.Machine(variant, build_dir)
+    symbols = machine.symbols
+    memory = machine.cpu.memory
+    count = symbols["enemy_table_high"] - symbols["enemy_table_low"]
+    counts = [memory[symbols["enemy_arc_counts"] + i] for i in range(count)]
+    result = np.zeros((count, angles, max(counts), 4), dtype=np.int32)
+    cache = symbols["enemy_cache_b"]
+    for number in range(count):
+        machine.reset()
+        machine.set("enemy_number", number)
+        for (name, value) in (("end_low", cache & 0xff), ("end_high", cache >> 8), ("cache_start_low", cache & 0xff), ("cache_start_high", cache >> 8)):
+            machine.set(name, value)
+        machine.call("fill_one_enemy_cache")
+        size = angles * counts[number] * 4
+        data = np.frombuffer(bytes(memory[cache:cache + size]), dtype=np.uint8).reshape(angles, counts[number], 4)
+        result[number, :, 0:counts[number]] = data
+    result[..., 0:2] = signed(result[..., 0:2])
+    steps_x = signed([memory[symbols["segment_angle_to_x_deltas_table"] + i] for i in range(points)])
+    steps_y = signed([memory[symbols["segment_angle_to_y_deltas_table"] + i] for i in range(points)])
+    return (result, steps_x, steps_y)
+
+def rasterise(arcs, steps_x, steps_y):
+    # Returns the number of times each pixel is plotted, shape (enemies, angles, size, size)
+    # centred on the middle of each square, and the size of the square
+    longest = max(1, int(arcs[..., 3].max()))
+    k = np.arange(longest)
+    (x, y, start, length) = (arcs[..., 0:1], arcs[..., 1:2], arcs[..., 2:3], arcs[..., 3:4])
+    step = (start + k) & 31
+    # each pixel is the start plus the steps before it
+    dx = np.concatenate([np.zeros(step.shape[:-1] + (1,), dtype=np.int32), np.cumsum(steps_x[step], axis=-1)[..., :-1]], axis=-1)
+    dy = np.concatenate([np.zeros(step.shape[:-1] + (1,), dtype=np.int32), np.cumsum(steps_y[step], axis=-1)[..., :-1]], axis=-1)
+    px = x + dx
+    py = y + dy
+    plotted = k < length
+
+    half = int(max(np.abs(px[plotted]).max(), np.abs(py[plotted]).max())) + 1
+    size = 2 * half + 1
+    (enemies, count) = arcs.shape[0:2]
+    e = np.broadcast_to(np.arange(enemies)[:, None, None, None], px.shape)
+    a = np.broadcast_to(np.arange(count)[None, :, None, None], px.shape)
+    index = ((e * count + a) * size + (py + half)) * size + (px + half)
+    hits = np.bincount(index[plotted], minlength=enemies * count * size * size)
+    return (hits.reshape(enemies, count, size, size), size)
+
+def summarise(arcs, hits):
+    # per enemy and angle: arcs, points plotted, pixels visible, pixels plotted more than
+    # once, and pixels cancelled out
+    arc_counts = (arcs[..., 3] > 0).sum(axis=-1)
+    plots = arcs[..., 3].sum(axis=-1)
+    visible = (hits % 2 == 1).sum(axis=(-1, -2))
+    duplicated = (hits >= 2).sum(axis=(-1, -2))
+    cancelled_pixels = ((hits >= 2) & (hits % 2 == 0)).sum(axis=(-1, -2))
+    return (arc_counts, plots, visible, duplicated, cancelled_pixels)
+
+def contact_sheet(filename, hits, size, scale, columns=8):
+    colours = np.full(hits.shape, background, dtype=np.uint8)
+    colours[hits == 1] = plotted_once
+    colours[(hits > 1) & (hits % 2 == 1)] = plotted_odd
+    colours[(hits > 1) & (hits % 2 == 0)] = cancelled
+    half = size // 2
+    colours[:, half, half] = np.where(colours[:, half, half] == background, centre, colours[:, half, half])
+
+    rows = (len(hits) + columns - 1) // columns
+    cell = size * scale + 1
+    sheet = np.full((rows * cell + 1, columns * cell + 1), grid, dtype=np.uint8)
+    for (angle, image) in enumerate(colours):
+        (row, column) = divmod(angle, columns)
+        big = np.kron(image, np.ones((scale, scale), dtype=np.uint8))
+        sheet[row * cell + 1:row * cell + 1 + size * scale, column * cell + 1:column * cell + 1 + size * scale] = big
+    png.write(filename, sheet.tolist(), palette)
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Draw every enemy at all 32 angles and look for pixels plotted more than once")
+all_args.add_argument("--variant", help="read the enemies from this build (e.g. STAR) rather than source/enemies.txt")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--input", default="source/enemies.txt", help="enemy design description")
+all_args.add_argument("--sheets", metavar="DIR", help="write a contact sheet PNG for each enemy to this directory")
+all_args.add_argument("--scale", type=int, default=4, help="contact sheet pixel size")
+all_args.add_argument("--angles", action="store_true", help="list every angle, not just the totals for each enemy")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    if args.variant:
+        (arcs, steps_x, steps_y) = arcs_from_binary(args.variant, args.build)
+    else:
+        (arcs, steps_x, steps_y) = arcs_from_source(args.input)
+    (hits, size) = rasterise(arcs, steps_x, steps_y)
+    (arc_counts, plots, visible, duplicated, cancelled_pixels) = summarise(arcs, hits)
+
+    print("enemy  angle  arcs  plots  visible  duplicated  cancelled  wasted plots")
+    problems = 0
+    for enemy in range(len(arcs)):
+        for angle in range(angles):
+            wasted = plots[enemy, angle] - visible[enemy, angle]
+            if args.angles or wasted:
+                print("%5d  %5d  %4d  %5d  %7d  %10d  %9d  %12d" % (enemy, angle, arc_counts[enemy, angle], plots[enemy, angle], visible[enemy, angle], duplicated[enemy, angle], cancelled_pixels[enemy, angle], wasted))
+        wasted = int(plots[enemy].sum() - visible[enemy].sum())
+        problems += wasted
+        print("%5d    all  %4.1f  %5.1f  %7.1f  %10d  %9d  %12d   (mean per angle, totals)" % (enemy, arc_counts[enemy].mean(), plots[enemy].mean(), visible[enemy].mean(), duplicated[enemy].sum(), cancelled_pixels[enemy].sum(), wasted))
+
+    if args.sheets:
+        os.makedirs(args.sheets, exist_ok=True)
+        for enemy in range(len(arcs)):
+            contact_sheet(os.path.join(args.sheets, "enemy" + str(enemy) + ".png"), hits[enemy], size, args.scale)
+    if problems:
+        print("")
+        print(str(problems) + " wasted plots")
+        sys.exit(1)
@@ -0,0 +1,601 @@
+import argparse
+import bisect
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import acme_output
+
+# The Exomizer 3 crunched format, as decoded by source/exo.asm (and so as written by
+# 'exomizer302 level'). Data is read forwards and written backwards.
+#
+# A crunched stream holds:
+#   the end address of the data (high byte, then low byte)
+#   the first byte of the bit buffer
+#   52 four bit codes giving the number of bits for each entry of the decrunch table:
+#       entries  0-15   sequence lengths
+#       entries 16-31   offsets for sequences with other lengths
+#       entries 32-47   offsets for sequences with a length of 2 (mod 256)
+#       entries 48-51   offsets for sequences with a length of 1 (mod 256)
+#   the last byte of the data
+#   then repeatedly: a count of 0 bits ended by a 1 bit, and
+#       no 0 bits       a literal byte
+#       1-16 0 bits     a sequence, with the length from table entry (count-1) then its
+#                       offset (two or four bits choosing an entry, then the value)
+#       17 0 bits       the end of the data
+#       18 0 bits       a run of literal bytes (length high byte, low byte, then the bytes)
+#
+# Bits come most significant first. Each byte of the bit buffer supplies eight bits,
+# except the first which holds seven and a marker bit. Values of more than eight bits
+# take their top bits from the bit buffer and their low eight bits as a whole byte.
+#
+# Table values are one more than the base of the entry plus the bits read, and as in
+# exo.asm a sequence length with a zero low byte copies an extra 256 bytes.
+#
+# crunch() writes the same format without Exomizer. The data is reversed (so the stream
+# runs forwards through it) and each byte from the end back is given its cheapest
+# encoding, in bits, as a literal, a run of literals or any sequence found by a hash
+# chain search, given the current tables. The tables are then refitted to the lengths
+# and offsets chosen and the data parsed again. crunch_best() tries several settings for
+# the search in parallel processes and keeps the smallest result.
+
+class ExoError(Exception):
+    pass
+
+table_size = 52
+table_groups = [0, 16, 32, 48]
+end_of_data = 17
+literal_run = 18
+
+def bits_for_code(code):
+    # number of bits given by a four bit table code
+    if code & 1:
+        return 8 + (code >> 1)
+    return code >> 1
+
+def table_bases(bits):
+    # the base value for each table entry, restarting at each group
+    bases = []
+    base = 0
+    for (i, b) in enumerate(bits):
+        if i in table_groups:
+            base = 0
+        bases.append(base)
+        base = (base + (1 << b)) & 0xffff
+    return bases
+
+def copy_length(value):
+    # the number of bytes copied for a 16 bit length, as the copy loop in exo.asm does it
+    if value & 0xff:
+        return value
+    return value + 0x100
+
+class BitReader:
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos
+        self.bitbuf = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise ExoError("unexpected end of crunched data at offset " + str(self.pos))
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def bit(self):
+        result = self.bitbuf >> 7
+        self.bitbuf = (self.bitbuf << 1) & 0xff
+        if self.bitbuf == 0:
+            value = self.byte()
+            result = value >> 7
+            self.bitbuf = ((value << 1) | 1) & 0xff
+        return result
+
+    def bits(self, count):
+        value = 0
+        for i in range(count):
+            value = (value << 1) | self.bit()
+        return value
+
+    def value(self, bits):
+        if bits >= 8:
+            high = self.bits(bits - 8)
+            return (high << 8) | self.byte()
+        return self.bits(bits)
+
+class Decrunched:
+    # The result of decrunching one stream
+    def __init__(self, start, end, data, crunched_start, crunched_end):
+        self.start = start                  # address of the first byte written
+        self.end = end                      # address just after the last byte written
+        self.data = data
+        self.crunched_start = crunched_start
+        self.crunched_end = crunched_end    # offset just after the stream in the input
+
+def decrunch(data, pos=0):
+    # Decrunch the stream starting at offset 'pos' of 'data'
+    reader = BitReader(data, pos)
+    end = reader.byte() << 8
+    end |= reader.byte()
+    reader.bitbuf = reader.byte()
+    bits = [bits_for_code(reader.bits(4)) for i in range(table_size)]
+    bases = table_bases(bits)
+
+    # output is built up in reverse, since it is written backwards from 'end'
+    output = bytearray()
+    output.append(reader.byte())
+    while True:
+        zeros = 0
+        while reader.bit() == 0:
+            zeros += 1
+
+        if zeros == 0:
+            output.append(reader.byte())
+            continue
+        if zeros == end_of_data:
+            break
+        if zeros >= literal_run:
+            length = reader.byte() << 8
+            length |= reader.byte()
+            for i in range(copy_length(length)):
+                output.append(reader.byte())
+            continue
+
+        entry = zeros - 1
+        length = (bases[entry] + reader.value(bits[entry]) + 1) & 0xffff
+        if (length & 0xff) == 1:
+            entry = 48 + reader.bits(2)
+        elif (length & 0xff) == 2:
+            entry = 32 + reader.bits(4)
+        else:
+            entry = 16 + reader.bits(4)
+        offset = (bases[entry] + reader.value(bits[entry]) + 1) & 0xffff
+        source = len(output) - offset
+        if source < 0:
+            raise ExoError("sequence offset " + str(offset) + " reaches past the end of the data")
+        for i in range(copy_length(length)):
+            output.append(output[source + i])
+
+    output.reverse()
+    if len(output) > end:
+        raise ExoError("data written below address 0")
+    return Decrunched(end - len(output), end, bytes(output), pos, reader.pos)
+
+# ----------------------------------------------------------------------------------
+# Crunching
+infinite = 1 << 60
+
+# bit costs of the other encodings
+literal_bits = 9                                # a 1 bit and the byte
+literal_run_bits = literal_run + 1 + 16         # the 0 bits, the 1 bit and the length
+
+default_table = [0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 6, 7, 8, 9, 10, 15] + list(range(16)) + list(range(16)) + [0, 1, 2, 3]
+
+def code_for_bits(bits):
+    # the four bit table code for a number of bits
+    if bits >= 8:
+        return ((bits - 8) << 1) | 1
+    return bits << 1
+
+def offset_entries(length):
+    # the first table entry, number of entries and bits choosing between them for the
+    # offset of a sequence of 'length'
+    if (length & 0xff) == 1:
+        return (48, 4, 2)
+    if (length & 0xff) == 2:
+        return (32, 16, 4)
+    return (16, 16, 4)
+
+class BitWriter:
+    def __init__(self, end):
+        self.output = bytearray([end >> 8, end & 0xff, 0])
+        self.slot = 2               # offset of the bit buffer byte being filled
+        self.free = 7               # (the first holds seven bits and a marker bit)
+        self.current = 0
+
+    def flush(self):
+        if self.slot == 2:
+            value = (self.current << (self.free + 1)) | (1 << self.free)
+        else:
+            value = self.current << self.free
+        self.output[self.slot] = value & 0xff
+
+    def bit(self, value):
+        if self.free == 0:
+            self.flush()
+            self.slot = len(self.output)
+            self.output.append(0)
+            self.free = 8
+            self.current = 0
+        self.current = (self.current << 1) | value
+        self.free -= 1
+
+    def bits(self, count, value):
+        for i in range(count - 1, -1, -1):
+            self.bit((value >> i) & 1)
+
+    def byte(self, value):
+        self.output.append(value)
+
+    def value(self, bits, value):
+        if bits >= 8:
+            self.bits(bits - 8, value >> 8)
+            self.byte(value & 0xff)
+        else:
+            self.bits(bits, value)
+
+    def finish(self):
+        self.flush()
+        return bytes(self.output)
+
+class Table:
+    # The 52 entry decrunch table
+    def __init__(self, bits):
+        self.bits = list(bits)
+        self.bases = table_bases(bits)
+        self.tops = [base + (1 << b) for (base, b) in zip(self.bases, self.bits)]
+
+    def entry(self, first, count, value):
+        # the entry in [first, first + count) holding 'value', or None
+        for i in range(first, first + count):
+            if self.bases[i] < value <= self.tops[i] <= 0x10000:
+                return i
+        return None
+
+class Settings:
+    # How hard to search for sequences
+    def __init__(self, max_chain, max_offset, literal_runs, passes):
+        self.max_chain = max_chain          # most earlier positions tried for each byte
+        self.max_offset = max_offset        # furthest back a sequence can come from
+        self.literal_runs = literal_runs    # whether to use runs of literal bytes
+        self.passes = passes                # times the table is refitted
+
+    def name(self):
+        return "chain %d, offset %d, %s, %d passes" % (self.max_chain, self.max_offset, "runs" if self.literal_runs else "no runs", self.passes)
+
+default_settings = Settings(64, 0xffff, True, 4)
+
+search_settings = [Settings(max_chain, max_offset, literal_runs, 4)
+    for max_chain in (16, 64, 256)
+    for max_offset in (0xffff, 4096)
+    for literal_runs in (True, False)]
+
+def find_sequences(data, settings):
+    # For each position, the (offset, length) of earlier matches of two or more bytes,
+    # each longer than the last, found through a hash chain of the byte pairs
+    count = len(data)
+    latest = {}
+    previous = [-1] * count
+    found = [()] * count
+    for i in range(count - 1):
+        key = data[i] | (data[i + 1] << 8)
+        j = latest.get(key, -1)
+        matches = []
+        best = 1
+        tried = 0
+        while j >= 0 and tried < settings.max_chain:
+            offset = i - j
+            if offset > settings.max_offset:
+                break
+            if best < 2 or (i + best < count and data[j + best] == data[i + best]):
+                length = 2
+                while i + length + 32 <= count and data[j + length:j + length + 32] == data[i + length:i + length + 32]:
+                    length += 32
+                while i + length < count and data[j + length] == data[i + length]:
+                    length += 1
+                if length > best:
+                    best = length
+                    matches.append((offset, length))
+            j = previous[j]
+            tried += 1
+        previous[i] = latest.get(key, -1)
+        latest[key] = i
+        found[i] = matches
+    return found
+
+def parse(data, sequences, table, literal_runs):
+    # The cheapest encoding of the (reversed) data after its first byte, as a list of
+    # ("literal", position), ("run", position, length) and ("sequence", position, length,
+    # offset), and its cost in bits
+    count = len(data)
+    cost = [0] * (count + 1)
+    choice = [None] * (count + 1)
+    # the cheapest way to carry on with literals from each position, as part of a run
+    run_cost = [infinite] * (count + 2)
+    run_length = [0] * (count + 2)
+    length_costs = {}
+    offset_costs = {}
+
+    def length_cost(length):
+        result = length_costs.get(length)
+        if result is None:
+            entry = table.entry(0, 16, length)
+            if entry is None or (length & 0xff) == 0:
+                result = infinite
+            else:
+                result = entry + 2 + table.bits[entry]
+            length_costs[length] = result
+        return result
+
+    def offset_cost(length, offset):
+        (first, entries, selector) = offset_entries(length)
+        result = offset_costs.get((first, offset))
+        if result is None:
+            entry = table.entry(first, entries, offset)
+            result = infinite if entry is None else selector + table.bits[entry]
+            offset_costs[(first, offset)] = result
+        return result
+
+    # lengths worth trying: the longest each table entry holds
+    limits = sorted(set(min(top, 0xffff) for top in table.tops[0:16]))
+    for i in range(count - 1, 0, -1):
+        best = literal_bits + cost[i + 1]
+        chosen = None
+        if literal_runs:
+            if 8 + cost[i + 1] <= 8 + run_cost[i + 1]:
+                (run_cost[i], run_length[i]) = (8 + cost[i + 1], 1)
+            else:
+                (run_cost[i], run_length[i]) = (8 + run_cost[i + 1], run_length[i + 1] + 1)
+            if run_length[i] > 1 and literal_run_bits + run_cost[i] < best:
+                best = literal_run_bits + run_cost[i]
+                chosen = ("run", run_length[i])
+        for offset in range(1, min(i, 16) + 1):
+            if data[i - offset] == data[i]:
+                bits = length_cost(1) + offset_cost(1, offset) + cost[i + 1]
+                if bits < best:
+                    (best, chosen) = (bits, ("sequence", 1, offset))
+        for (offset, longest) in sequences[i]:
+            if offset > i:
+                continue
+            longest = min(longest, count - i)
+            for length in set([2, 3, longest] + [limit for limit in limits if limit < longest]):
+                if length > longest:
+                    continue
+                if (length & 0xff) == 0:
+                    length -= 1
+                if length < 2:
+                    continue
+                bits = length_cost(length)
+                if bits < infinite:
+                    bits += offset_cost(length, offset)
+                if bits < infinite and bits + cost[i + length] < best:
+                    (best, chosen) = (bits + cost[i + length], ("sequence", length, offset))
+        cost[i] = best
+        choice[i] = chosen
+
+    result = []
+    i = 1
+    while i < count:
+        chosen = choice[i]
+        if chosen is None:
+            result.append(("literal", i))
+            i += 1
+        elif chosen[0] == "run":
+            length = chosen[1]
+            if (length & 0xff) == 0:
+                # (a run with a zero low byte would copy an extra 256 bytes)
+                result.append(("run", i, length - 1))
+                result.append(("literal", i + length - 1))
+            else:
+                result.append(("run", i, length))
+            i += length
+        else:
+            result.append(("sequence", i, chosen[1], chosen[2]))
+            i += chosen[1]
+    return (result, cost[1])
+
+def fit_group(counts, entries, prefix_bits, beam=96):
+    # The bits for each of 'entries' table entries that cover the values counted in
+    # 'counts' (value -> uses) in the fewest bits, where entry i costs prefix_bits(i)
+    # bits to choose. A beam search over the value each entry reaches.
+    if not counts:
+        return [0] * entries
+    values = sorted(counts)
+    totals = [0]
+    for value in values:
+        totals.append(totals[-1] + counts[value])
+
+    def uses(low, high):
+        # the uses of values in (low, high]
+        return totals[bisect.bisect_right(values, high)] - totals[bisect.bisect_right(values, low)]
+
+    largest = values[-1]
+    states = {0: (0, [])}
+    finished = []
+    for i in range(entries):
+        reached = {}
+        for (covered, (bits_so_far, chosen)) in states.items():
+            for bits in range(16):
+                top = covered + (1 << bits)
+                total = bits_so_far + uses(covered, top) * (prefix_bits(i) + bits)
+                if top >= largest:
+                    finished.append((total, chosen + [bits]))
+                    break
+                if top not in reached or reached[top][0] > total:
+                    reached[top] = (total, chosen + [bits])
+        if not reached:
+            break
+        # keep the best states, counting the values not yet covered at the next entry's cost
+        ranked = sorted(reached.items(), key=lambda state: state[1][0] + uses(state[0], 1 << 20) * prefix_bits(i + 1))
+        states = dict(ranked[0:beam])
+    (total, chosen) = min(finished)
+    return chosen + [0] * (entries - len(chosen))
+
+def fit_table(encoding):
+    # a table fitted to the lengths and offsets of the sequences in 'encoding'
+    lengths = {}
+    offsets = {16: {}, 32: {}, 48: {}}
+    for item in encoding:
+        if item[0] == "sequence":
+            (kind, position, length, offset) = item
+            lengths[length] = lengths.get(length, 0) + 1
+            group = offsets[offset_entries(length)[0]]
+            group[offset] = group.get(offset, 0) + 1
+    bits = fit_group(lengths, 16, lambda i: i + 2)
+    bits += fit_group(offsets[16], 16, lambda i: 0)
+    bits += fit_group(offsets[32], 16, lambda i: 0)
+    bits += fit_group(offsets[48], 4, lambda i: 0)
+    return Table(bits)
+
+def encode(data, end, encoding, table):
+    writer = BitWriter(end)
+    for bits in table.bits:
+        writer.bits(4, code_for_bits(bits))
+    writer.byte(data[0])
+    for item in encoding:
+        if item[0] == "literal":
+            writer.bit(1)
+            writer.byte(data[item[1]])
+        elif item[0] == "run":
+            (kind, position, length) = item
+            writer.bits(literal_run + 1, 1)
+            writer.byte(length >> 8)
+            writer.byte(length & 0xff)
+            for i in range(position, position + length):
+                writer.byte(data[i])
+        else:
+            (kind, position, length, offset) = item
+            entry = table.entry(0, 16, length)
+            writer.bits(entry + 2, 1)
+            writer.value(table.bits[entry], length - table.bases[entry] - 1)
+            (first, entries, selector) = offset_entries(length)
+            entry = table.entry(first, entries, offset)
+            writer.bits(selector, entry - first)
+            writer.value(table.bits[entry], offset - table.bases[entry] - 1)
+    writer.bits(end_of_data + 1, 1)
+    return writer.finish()
+
+def crunch(data, end, settings=default_settings):
+    # Crunch 'data', which ends just before address 'end'
+    if not data:
+        raise ExoError("no data to crunch")
+    if len(data) > end:
+        raise ExoError("data would be written below address 0")
+    reversed_data = bytes(reversed(data))
+    sequences = find_sequences(reversed_data, settings)
+    table = Table(default_table)
+    best = None
+    for i in range(settings.passes):
+        (encoding, bits) = parse(reversed_data, sequences, table, settings.literal_runs)
+        crunched = encode(reversed_data, end, encoding, table)
+        if best is None or len(crunched) < len(best):
+            best = crunched
+        table = fit_table(encoding)
+    return best
+
+def crunch_best(data, end, jobs=None, settings=search_settings):
+    # Crunch with each of 'settings' in parallel processes, returning the smallest result
+    # and the settings that made it
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(crunch, [data] * len(settings), [end] * len(settings), settings))
+    return min(zip(results, settings), key=lambda result: len(result[0]))
+
+def exomizer_crunch(exomizer, data, start):
+    # Crunch with Exomizer itself (as exo_region in go_acme), or None if it isn't installed
+    if shutil.which(exomizer) is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        raw = os.path.join(directory, "region")
+        crunched = os.path.join(directory, "region.exo")
+        with open(raw, 'wb') as f:
+            f.write(data)
+        subprocess.run([exomizer, "level", "-q", raw + "@0x" + format(start, "04x"), "-o", crunched], check=True)
+        with open(crunched, 'rb') as f:
+            return f.read()
+
+def read_region(build, variant, start_label, end_label):
+    # (start address, end address, bytes) of part of a build, between two labels
+    symbols = acme_output.read_symbols(acme_output.symbols_filename(variant, build))
+    with open(os.path.join(build, "disk", variant), 'rb') as f:
+        binary = f.read()
+    (start, end) = (symbols[start_label], symbols[end_label])
+    offset = start - symbols["load_addr"]
+    return (start, end, binary[offset:offset + end - start])
+
+benchmark_regions = [
+    ("1", "loader_copy_start", "eof"),
+    ("2", "post_reloc", "loader_copy_start"),
+    ("3", "load_addr", "post_reloc"),
+]
+
+def benchmark(args):
+    print("variant       region  bytes   exomizer  python  time    settings")
+    totals = [0, 0]
+    for variant in args.variants:
+        for (name, start_label, end_label) in benchmark_regions:
+            (start, end, data) = read_region(args.build, variant, start_label, end_label)
+            reference = exomizer_crunch(args.exomizer, data, start)
+            began = time.time()
+            (crunched, settings) = crunch_best(data, end, args.jobs)
+            taken = time.time() - began
+            result = decrunch(crunched)
+            if result.data != data or result.start != start:
+                raise ExoError(variant + " region " + name + " doesn't decrunch to the original data")
+            totals[1] += len(crunched)
+            if reference is not None:
+                totals[0] += len(reference)
+            print("%-13s %-6s  %5d   %8s  %6d  %5.1fs  %s" % (variant, name, len(data), len(reference) if reference is not None else "-", len(crunched), taken, settings.name()))
+    print("%-13s %-6s  %5s   %8s  %6d" % ("total", "", "", totals[0] if totals[0] else "-", totals[1]))
+    if not totals[0]:
+        print("")
+        print("(" + args.exomizer + " not found, so there are no reference sizes)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Exomizer 3 (level mode) crunched data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    decrunch_args = commands.add_parser("decrunch", help="decrunch a .exo file")
+    decrunch_args.add_argument("input", help="crunched file")
+    decrunch_args.add_argument("-o", "--output", help="file to write the decrunched data to")
+
+    crunch_args = commands.add_parser("crunch", help="crunch a file, as 'exomizer302 level' does")
+    crunch_args.add_argument("input", help="file to crunch, with the address it loads at (e.g. region@0x1c04)")
+    crunch_args.add_argument("-o", "--output", required=True, help="crunched file to write")
+    crunch_args.add_argument("--fast", action="store_true", help="crunch once with the default settings rather than searching")
+    crunch_args.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of settings to try at once")
+
+    benchmark_args = commands.add_parser("benchmark", help="crunch the regions of the tape builds, against Exomizer")
+    benchmark_args.add_argument("variants", nargs="*", default=["STAR.tape", "STARELK.tape"], help="tape builds (default: both)")
+    benchmark_args.add_argument("--build", default="build", help="build directory")
+    benchmark_args.add_argument("--exomizer", default="exomizer302", help="Exomizer 3.0.2 executable")
+    benchmark_args.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of settings to try at once")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "crunch":
+            (filename, address) = args.input.rsplit("@", 1) if "@" in args.input else (args.input, "0")
+            start = int(address, 0)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            if args.fast:
+                crunched = crunch(data, start + len(data))
+            else:
+                (crunched, settings) = crunch_best(data, start + len(data), args.jobs)
+            if decrunch(crunched).data != data:
+                raise ExoError("the crunched data doesn't decrunch to the original")
+            with open(args.output, 'wb') as f:
+                f.write(crunched)
+        elif args.command == "benchmark":
+            benchmark(args)
+        elif args.command == "decrunch":
+            with open(args.input, 'rb') as f:
+                data = f.read()
+            result = decrunch(data)
+            print(args.input + ": &" + format(result.start, "04X") + "-&" + format(result.end, "04X") + ", " + str(len(data)) + " -> " + str(len(result.data)) + " bytes")
+            if result.crunched_end != len(data):
+                print("warning: " + str(len(data) - result.crunched_end) + " bytes after the end of the crunched data")
+            if args.output:
+                with open(args.output, 'wb') as f:
+                    f.write(result.data)
+    except ExoError as e:
+        print("ERROR: " + str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,13 @@
 # insert:    image.py -d <disk> [-t <type> -s <side>] -i <file>
 # delete:    image.py -d <disk> [-t <type> -s <side>] -del <file>
 # compact:   image.py -d <disk> [-t <type> -s <side>] -compact
+# time:      image.py -d <disk> [-t <type> -s <side> -skew <n> -boot <files>] -time
+# place:     image.py -d <disk> [-t <type> -s <side> -skew <n> -boot <files>] -place
+# convert:   image.py -d <disk> [-t <type> -s <side> -pair <disk>] -convert <disk>
+# merge:     image.py -d <disk> [-t <type> -s <side>] -merge <disk>
+# ingest:    image.py -store <directory> [-jobs <n>] -ingest <images>
+# rebuild:   image.py -store <directory> -rebuild <image>
+# batch:     image.py [-jobs <n>] -batch <json file>
 
 # Parameters in [square brackets] are optional.
 
@@ -57,6 +64,8 @@
 # -insert*  -i*
 # -delete   -del
 # -compact  -com
+# -boot     -b
+# -place    -p
 
 # Commands can be combined:
 
@@ -66,20 +75,161 @@
 # e.g. to catalogue disk side 2 after compacting and inserting a tokenised BASIC file:
 # image.py -d mydisk.dsd -s 2 -compact -i* basprog -cat
 
+# -time estimates how long DFS takes to load each file, and each boot sequence: the files
+# given by -boot (comma separated, and -boot can be given more than once), or !BOOT alone.
+# It models the catalogue read before each file, the head stepping between tracks and the
+# wait for each track's first sector to come round. -skew gives the sectors each track is
+# rotated by against the one before, for a disc formatted that way (0 for a written image).
+
+# -place moves the boot files to the start of the disk in the order they are loaded, each
+# placed (often at the start of a track) to give the fastest boot, then the other files.
+
+# e.g. image.py -d mydisk.ssd -boot !BOOT,GAME -place -time
+
+# -convert writes the disk in the layout given by the new file's extension: a dsd as a dss or
+# the other way round, one side (-s) of either as an ssd, or an ssd with its -pair (the ssd for
+# side 2) as a dsd or dss. -merge replaces the selected side of a double-sided disk with the
+# first side of another image. Both work a track at a time on the image mapped into memory,
+# so large batches run as fast as the files can be read and written.
+
+# e.g. image.py -d side0.ssd -pair side2.ssd -convert both.dsd
+#      image.py -d both.dsd -s 2 -convert side2.ssd
+
+# -ingest adds every .ssd, .dsd and .dss image in a directory (or a single image) to the
+# content store given by -store, hashing each file on each side in a pool of -jobs processes.
+# Each unique file is stored once, so the store grows with the number of unique files, and
+# images unchanged since they were ingested are skipped. -rebuild writes an image back out
+# exactly as it was, found by its path, name or the start of its hash.
+
+# e.g. image.py -store archive -ingest images
+#      image.py -store archive -rebuild images/game.ssd
+
 # Specify the disk/type/side FIRST when combining commands:
 # e.g. image.py -d foo.dsd -s 2 -cat -e file1 -e* file2
 #               ^^^^^^^^^^
 
+# -batch builds the disk images listed in a JSON file at once, in a pool of -jobs processes
+# (one per core by default). Each is a dict giving the "disk", the "template" to make it from,
+# the "side", the "directory" holding the files to "insert", and the "boot" sequences to
+# "place". Several can write to the same double-sided image, one side each: a job holds an
+# advisory lock on the image (<image>.lock) while it changes it, and writes only its side.
+
+# e.g. [{"disk": "games.dsd", "template": "blank.dsd", "side": "0", "insert": ["!BOOT", "GAME"],
+#        "boot": ["!BOOT,GAME"], "place": true},
+#       {"disk": "games.dsd", "template": "blank.dsd", "side": "2", "insert": ["DEMO"]}]
+
+# -overwrite sets what -insert does with a file already on the disk: ask (the default, when run
+# from a terminal), replace, skip or error. Without a terminal nothing is asked: a file with no
+# .inf, or one already on the disk under "ask", is an error, and -delete doesn't ask to confirm.
+
+# LIBRARY
+# The script can also be imported, so a build can make its disk images without starting python
+# for each one. Each command is a method of DiskImage, which returns its results (catalogue()
+# the disk title and files, extract() the file data, timing() the load times, and so on) and
+# prints nothing unless made with quiet = False. Errors raise an ImageError subclass rather than
+# exiting, and nothing is asked unless made with interactive = True. Used in a with block, all
+# the changes are written to the disk image once, when the block ends without an exception.
+# The image stays locked against other writers (and readers) until then.
+
+# e.g. import image
+#      with image.DiskImage("mydisk.ssd", overwrite = "replace") as disk:
+#          disk.insert("GAME", load = 0x1900)
+#          disk.add_boot("!BOOT,GAME")
+#          disk.place()
+#          print(disk.timing()["boot"])
+
 
 
 import sys
 import os.path
+import argparse
 import subprocess
 import shutil
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # (Windows: images are not locked)
+
+
+# errors (ImageError catches them all)
+
+class ImageError(Exception):
+    pass
+
+class ImageNotFoundError(ImageError):
+    pass                # a disk image (or host file) doesn't exist
+
+class DiskFileNotFoundError(ImageError):
+    pass                # a file isn't on the disk
+
+class DiskFileExistsError(ImageError):
+    pass                # a file is already on the disk (overwrite = "error")
+
+class DiskFullError(ImageError):
+    pass
+
+class InvalidOptionError(ImageError):
+    pass
+
+class UnsupportedDiskError(ImageError):
+    pass                # not a DFS disk
+
+class AbortedError(ImageError):
+    pass                # the user answered no
+
+
+# locking
+#
+# Writers hold an exclusive lock on an image from reading it to writing it back, so jobs
+# changing the same image (e.g. one per side of a dsd) take turns rather than losing each
+# other's changes, and only the sides changed are written. Readers take a shared lock so
+# they don't see an image half written. The locks are advisory, held with flock on a file
+# beside the image (<image>.lock) rather than the image itself, which convert and merge
+# replace. flock locks exclude each other between threads as well as processes.
+
+def _lock_image(disk, shared = False):
+
+    # lock an image until the file returned is closed (None if there is nothing to lock)
+    if fcntl is None:
+        return None
+
+    if shared:
+        # (no lock file: nothing has ever written the image this way)
+        if not os.path.exists(disk + ".lock"):
+            return None
+        f = open(disk + ".lock", "rb")
+        fcntl.flock(f, fcntl.LOCK_SH)
+    else:
+        f = open(disk + ".lock", "ab")
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    return f
+
+
+def _writes(method):
+
+    # a DiskImage method that changes the image: it runs holding the image's lock, which
+    # is kept until the changes are written if they are held back (see flush)
+    def locked(self, *args, **kwargs):
+        self._lock()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            if not self._dirty:
+                self._unlock()
+
+    return locked
+
 
 class DiskImage:
 
-    def __init__(self):
+    def __init__(self, disk = None, type = None, side = None, overwrite = "error", quiet = True, interactive = False):
 
         # constants
         self.DISKTYPES = ['DFS/WDFS<256K', 'WDFS>256K', 'HDFS(SS)', 'HDFS(DS)']
@@ -215,11 +365,58 @@ class DiskImage:
                          (254,"WIDTH"),     \
                          (255,"OSCLI")]
 
+        # drive timing, in seconds (see _read_sectors)
+        self.SECTORS_PER_TRACK = 10
+        self.REVOLUTION_TIME   = 0.2            # 300rpm
+        self.SECTOR_TIME       = self.REVOLUTION_TIME / self.SECTORS_PER_TRACK
+        self.STEP_TIME         = 0.006          # per track stepped
+        self.SETTLE_TIME       = 0.016          # after stepping, before reading
+
         # attributes
         self.disk  = ""
         self.type  = "ssd" # "ssd" single-sided, "dsd" double-sided interleaved, "dss" double-sided sequential
         self.side  = "0"   # "0" or "2"
         self.verbose_level = 0
+        self.track_skew    = 0     # sectors each track is rotated by against the last
+        self.boot_sequences = []   # lists of files loaded one after another when booting
+        self.store = ""            # content store directory (see _ingest_image)
+        self.pair  = ""            # side 2 image for -convert from a single-sided disk
+        self.jobs  = os.cpu_count()
+        self.quiet = quiet         # print nothing (as a library)
+        self.interactive = interactive # ask before overwriting or deleting, and for missing .inf details
+        self.overwrite = "error"   # what insert does with a file already on the disk
+        self._deferred = False     # inside a with block: write changes when it ends
+        self._dirty    = False     # changes not yet written (see flush)
+        self._changed  = set()     # the sides changed ("0", "2")
+        self._lock_file = None     # held while changing the image (see _lock_image)
+
+        self.set_overwrite(overwrite)
+        if disk is not None:
+            self.set_disk(disk)
+        if type is not None:
+            self.set_type(type)
+        if side is not None:
+            self.set_side(side)
+
+
+    def __enter__(self):
+
+        self._deferred = True
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # write the changes, unless the block failed part way through
+        self._deferred = False
+        if exc_type is None:
+            self.flush()
+        else:
+            self._dirty = False
+            self._changed = set()
+            self._unlock()
+
+        return False
 
 
     def help(self):
@@ -231,6 +428,13 @@ class DiskImage:
         print("insert:    image.py -d <disk> [-t <type> -s <side>] -i <file>")
         print("delete:    image.py -d <disk> [-t <type> -s <side>] -del <file>")
         print("compact:   image.py -d <disk> [-t <type> -s <side>] -compact")
+        print("time:      image.py -d <disk> [-t <type> -s <side> -boot <files>] -time")
+        print("place:     image.py -d <disk> [-t <type> -s <side> -boot <files>] -place")
+        print("convert:   image.py -d <disk> [-t <type> -s <side> -pair <disk>] -convert <disk>")
+        print("merge:     image.py -d <disk> [-t <type> -s <side>] -merge <disk>")
+        print("ingest:    image.py -store <directory> [-jobs <n>] -ingest <images>")
+        print("rebuild:   image.py -store <directory> -rebuild <image>")
+        print("batch:     image.py [-jobs <n>] -batch <json file>")
         print("")
         print("type = ssd (single-sided), dsd (interleaved), dss (sequential)")
         print("")
@@ -244,17 +448,61 @@ class DiskImage:
         print("")
         print("Commands:")
         print("-help -?, -disk -d, -type -t, -side -s, -cat -c, -extract -e")
-        print("-extract* -e*, -insert -i, -insert* -i*, -delete -del, -compact -com\n")
+        print("-extract* -e*, -insert -i, -insert* -i*, -delete -del, -compact -com")
+        print("-boot -b, -place -p, -time, -skew, -pair, -convert -conv, -merge")
+        print("-store, -jobs, -ingest, -rebuild, -overwrite, -batch\n")
 
-    def verbose(i):
+    def verbose(self, i):
         self.verbose_level = i
 
+
+    def _say(self, *text):
+
+        # report progress (only when not quiet)
+        if not self.quiet:
+            print(*text)
+
+
+    def set_overwrite(self, overwrite):
+
+        # error checks
+        if overwrite not in ("ask", "replace", "skip", "error"):
+            raise InvalidOptionError("invalid overwrite (use ask, replace, skip or error)")
+
+        self.overwrite = overwrite
+
+
+    def flush(self):
+
+        # write any changes kept back inside a with block
+        if self._dirty:
+            self._write_to_disk()
+            self._dirty = False
+            self._unlock()
+
+
+    def _lock(self):
+
+        # lock the image for writing (the changes are made to the image as it is once locked)
+        if self._lock_file is None and self.disk != "":
+            self._lock_file = _lock_image(self.disk)
+
+
+    def _unlock(self):
+
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
     def set_disk(self, disk):
 
+        # finish with the last disk
+        self.flush()
+
         # error checks
         if not(os.path.exists(disk)):
-            print("ERROR: disk image not found")
-            sys.exit()
+            raise ImageNotFoundError("disk image not found")
 
         self.disk = disk
 
@@ -279,10 +527,12 @@ class DiskImage:
 
     def set_type(self, type):
 
+        # (the sides are held in the layout of the old type)
+        self.flush()
+
         # error checks
         if type !="ssd" and type != "dsd" and type != "dss":
-            print("ERROR: invalid type (valid = ssd, dsd, dss")
-            sys.exit()
+            raise InvalidOptionError("invalid type (valid = ssd, dsd, dss")
 
         self.type = type
 
@@ -291,53 +541,214 @@ class DiskImage:
 
         # error checks
         if self.type == "ssd" and side != "0":
-            print("ERROR: invalid side (disk is single-sided)")
-            sys.exit()
+            raise InvalidOptionError("invalid side (disk is single-sided)")
 
         if side != "0" and side != "2":
-            print("ERROR: invalid side (use 0 or 2)")
-            sys.exit()
+            raise InvalidOptionError("invalid side (use 0 or 2)")
 
         self.side = side
 
 
-    def _scan(self):
+    def set_pair(self, pair):
+
+        # error checks
+        if not(os.path.exists(pair)):
+            raise ImageNotFoundError("pair image not found")
+
+        self.pair = pair
+
+
+    def _image_type(self, filename):
+
+        # type from the file extension, as set_disk
+        i = filename.rfind(".")
+        if filename[i:].lower() in (".ssd", ".dsd", ".dss"):
+            return filename[i + 1:].lower()
+
+        raise InvalidOptionError(filename + " needs an .ssd, .dsd or .dss extension")
+
+
+    def _side_tracks(self, view, type):
+
+        # The tracks of each side of an image, as slices of 'view' (nothing is copied).
+        # The last track of a side may be short if the image was clipped.
+        track = self.SECTORS_PER_TRACK * 256
+
+        if type == "ssd":
+            return [[view[i : i + track] for i in range(0, len(view), track)]]
+
+        if type == "dsd":
+            side0 = [view[i : i + track] for i in range(0, len(view), 2 * track)]
+            side2 = [view[i + track : i + 2 * track] for i in range(0, len(view), 2 * track) if i + track < len(view)]
+            return [side0, side2]
+
+        # dss: each side is the length given by the side 0 catalogue (as _scan reads it)
+        size = ((view[0x106] & 0b00000011) * 0x100 + view[0x107]) * 256
+        side0 = [view[i : min(i + track, size)] for i in range(0, min(size, len(view)), track)]
+        side2 = [view[i : min(i + track, 2 * size)] for i in range(size, min(2 * size, len(view)), track)]
+        return [side0, side2]
+
+
+    def _write_tracks(self, filename, type, sides):
+
+        # Write the sides (lists of tracks) in the layout 'type', a track at a time. Short
+        # tracks are padded with zeros where the layout needs the next track in place.
+        track = self.SECTORS_PER_TRACK * 256
+        temp = filename + ".tmp"
+
+        with open(temp, 'wb') as f:
+
+            if type == "ssd":
+
+                # single-sided
+                for t in sides[0]:
+                    f.write(t)
+
+            elif type == "dsd":
+
+                # double-sided interleaved
+                for i in range(max(len(sides[0]), len(sides[1]))):
+                    t0 = sides[0][i] if i < len(sides[0]) else b""
+                    t2 = sides[1][i] if i < len(sides[1]) else b""
+                    f.write(t0)
+                    if len(t2) > 0:
+                        f.write(bytes(track - len(t0)))
+                        f.write(t2)
+
+            elif type == "dss":
+
+                # double-sided sequential: side 2 starts where the side 0 catalogue says side 0 ends
+                size = (sides[0][0][0x106] & 0b00000011) * 0x100 + sides[0][0][0x107]
+                size *= 256
+                written = 0
+                for t in sides[0]:
+                    t = t[0 : max(0, size - written)]
+                    f.write(t)
+                    written += len(t)
+                if len(sides[1]) > 0:
+                    f.write(bytes(size - written))
+                    written = 0
+                    for t in sides[1]:
+                        t = t[0 : max(0, size - written)]
+                        f.write(t)
+                        written += len(t)
+
+        return temp
+
+
+    def _open_view(self, filename):
+
+        # the contents of an image, mapped into memory rather than read
+        if os.path.getsize(filename) == 0:
+            raise ImageError(filename + " is empty")
+
+        with open(filename, 'rb') as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+
+    def _close_view(self, view):
+
+        # unmap an image (once no tracks of it are left), so it can be replaced
+        m = view.obj
+        view.release()
+        m.close()
+
+
+    def convert(self, output):
+
+        # error checks
+        if self.disk == "":
+            raise InvalidOptionError("no disk image specified")
+
+        type = self._image_type(output)
+        self.flush()
+        self._say("converting " + self.disk + " to " + output + "...")
+
+        view = self._open_view(self.disk)
+        sides = self._side_tracks(view, self.type)
+
+        if type == "ssd":
+
+            # one side of the disk
+            sides = [sides[0] if self.side == "0" else sides[1]]
+
+        elif self.type == "ssd":
+
+            # side 2 comes from a second single-sided image
+            if self.pair == "":
+                raise InvalidOptionError("a single-sided disk needs -pair <side 2 image> to make a double-sided one")
+
+            pair_view = self._open_view(self.pair)
+            sides.append(self._side_tracks(pair_view, "ssd")[0])
+
+        if len(sides[0]) == 0:
+            raise ImageError("side " + self.side + " is empty")
+
+        lock = _lock_image(output)
+        temp = self._write_tracks(output, type, sides)
+
+        # (the output may be the input)
+        del sides
+        self._close_view(view)
+        if self.type == "ssd" and type != "ssd":
+            self._close_view(pair_view)
+        os.replace(temp, output)
+        if lock is not None:
+            lock.close()
+
+
+    def merge(self, image):
+
+        # error checks
+        if self.type == "ssd":
+            raise InvalidOptionError("can only merge a side into a double-sided disk")
+
+        self.flush()
+        self._say("merging " + image + " into " + self.disk + " (side " + self.side + ")...")
+
+        lock = _lock_image(self.disk)
+        view = self._open_view(self.disk)
+        sides = self._side_tracks(view, self.type)
+
+        # replace the selected side
+        new_view = self._open_view(image)
+        sides[0 if self.side == "0" else 1] = self._side_tracks(new_view, self._image_type(image))[0]
+
+        temp = self._write_tracks(self.disk, self.type, sides)
+
+        del sides
+        self._close_view(view)
+        self._close_view(new_view)
+        os.replace(temp, self.disk)
+        if lock is not None:
+            lock.close()
+
+
+    def _read(self):
 
         # disk arrays
         self._side0     = bytearray()
         self._side2     = bytearray()
         self._disk_data = bytearray() # acts as a pointer to selected side data
 
-        # disk data
-        self.disk_sectors = 0
-        self.disk_title   = ""
-        self.disk_cycle   = 0
-        self.disk_files   = 0
-        self.disk_boot    = 0
-        self.disk_type    = 0
-
-        # file data (for all files on disk)
-        self.file_name    = []
-        self.file_lock    = []
-        self.file_load    = []
-        self.file_exec    = []
-        self.file_length  = []
-        self.file_sector  = []
-        self.sectors_used = []
-
         # error checks
         if self.disk == "":
-            print("ERROR: no disk image specified")
-            sys.exit()
+            raise InvalidOptionError("no disk image specified")
 
         if not(os.path.exists(self.disk)):
-            print("ERROR: disk image not found")
-            sys.exit()
+            raise ImageNotFoundError("disk image not found")
+
+        # wait for any writer to finish
+        lock = None
+        if self._lock_file is None:
+            lock = _lock_image(self.disk, shared = True)
 
         # need to know number of sectors to read disk
         with open(self.disk, 'rb') as f:
             data = f.read(512)
-            self.disk_sectors = (data[0x106] & 0b00000011) * 0x100 + data[0x107]
+            if len(data) < 512:
+                raise UnsupportedDiskError(self.disk + " is too short to hold a catalogue")
+            disk_sectors = (data[0x106] & 0b00000011) * 0x100 + data[0x107]
 
         # read disk data
         with open(self.disk, 'rb') as f:
@@ -345,13 +756,13 @@ class DiskImage:
             if self.type == "ssd":
 
                 # single-sided
-                self._side0 += f.read(self.disk_sectors * 256)
+                self._side0 += f.read(disk_sectors * 256)
 
             elif self.type == "dsd":
 
                 # double-sided interleaved
                 i = 0
-                while i < self.disk_sectors:
+                while i < disk_sectors:
                     self._side0 += f.read(10 * 256)
                     self._side2 += f.read(10 * 256)
                     i += 10
@@ -359,12 +770,39 @@ class DiskImage:
             elif self.type == "dss":
 
                 # double-sided sequential
-                self._side0 += f.read(self.disk_sectors * 256)
-                self._side2 += f.read(self.disk_sectors * 256)
+                self._side0 += f.read(disk_sectors * 256)
+                self._side2 += f.read(disk_sectors * 256)
+
+        if lock is not None:
+            lock.close()
 
         # expand if clipped
-        self._side0.extend([0] * (self.disk_sectors * 256 - len(self._side0)))
-        self._side2.extend([0] * (self.disk_sectors * 256 - len(self._side2)))
+        self._side0.extend([0] * (disk_sectors * 256 - len(self._side0)))
+        self._side2.extend([0] * (disk_sectors * 256 - len(self._side2)))
+
+
+    def _scan(self):
+
+        # read the disk image, unless there are changes not yet written (see flush)
+        if not self._dirty:
+            self._read()
+
+        # disk data
+        self.disk_sectors = 0
+        self.disk_title   = ""
+        self.disk_cycle   = 0
+        self.disk_files   = 0
+        self.disk_boot    = 0
+        self.disk_type    = 0
+
+        # file data (for all files on disk)
+        self.file_name    = []
+        self.file_lock    = []
+        self.file_load    = []
+        self.file_exec    = []
+        self.file_length  = []
+        self.file_sector  = []
+        self.sectors_used = []
 
         # select side and catalogue
         if self.side == "0":
@@ -372,6 +810,9 @@ class DiskImage:
         else:
             self._disk_data = self._side2 # as above
 
+        # sectors per side, as the side 0 catalogue gives them
+        self.disk_sectors = (self._side0[0x106] & 0b00000011) * 0x100 + self._side0[0x107]
+
         # catalogue data
         data = self._disk_data[0:512]
 
@@ -385,8 +826,7 @@ class DiskImage:
 
         # abort if not DFS disk
         if self.disk_type > 0:
-            print("ERROR: cannot process this disk type")
-            sys.exit()
+            raise UnsupportedDiskError("cannot process this disk type")
 
         # parse file data
         for i in range(0, self.disk_files):
@@ -446,6 +886,18 @@ class DiskImage:
         # scan disk-image
         self._scan()
 
+        # summary
+        files = []
+        for i in range(self.disk_files):
+            files.append({"name": self.file_name[i], "locked": self.file_lock[i] == "L", "load": self.file_load[i], \
+                          "exec": self.file_exec[i], "length": self.file_length[i], "sector": self.file_sector[i]})
+
+        result = {"title": self.disk_title, "cycle": self.disk_cycle, "boot": self.disk_boot, \
+                  "sectors": self.disk_sectors, "files": files, "used": "".join(self.sectors_used)}
+
+        if self.quiet:
+            return result
+
         # print summary
         if self.type != "ssd":
             s = " (side " + self.side + ")"
@@ -474,16 +926,19 @@ class DiskImage:
         for r in matrix:
             print(",".join(r).replace(",", ""))
 
+        return result
+
 
-    def extract(self, file, detokenise = False):
+    def extract(self, file, detokenise = False, write = True):
+
+        # returns the file data, and unless 'write' is False writes it and its .inf on the host
 
         # scan disk-image
         self._scan()
 
         # error checks
         if file == "":
-            print("ERROR: file not specified")
-            sys.exit()
+            raise InvalidOptionError("file not specified")
 
         # assume dir $ if none specified
         if file[1] != ".":
@@ -494,10 +949,9 @@ class DiskImage:
             # Beeb does not distinguish case
             file_name_ucase = [item.upper() for item in self.file_name]
             file_index = file_name_ucase.index(file.upper())
-            print("extracting " + file + " from " + self.disk + "...")
+            self._say("extracting " + file + " from " + self.disk + "...")
         except:
-            print("ERROR: file not found")
-            sys.exit()
+            raise DiskFileNotFoundError("file not found")
 
         # get the file data
         start = self.file_sector[file_index] * 256
@@ -507,8 +961,8 @@ class DiskImage:
         bas_file = (self.file_exec[file_index] & 0xFFFF > 0x8000 and self.file_exec[file_index] & 0xFFFF < 0x80FF)
         if detokenise:
             if not bas_file:
-                print("WARNING: " + file + " does not have a typical exec address for a BASIC file...")
-            print("de-tokenising file...")
+                self._say("WARNING: " + file + " does not have a typical exec address for a BASIC file...")
+            self._say("de-tokenising file...")
 
         # container for file
         file_data = bytearray()
@@ -574,33 +1028,49 @@ class DiskImage:
             # loop until eof
             i += 1
 
+        if not write:
+            return bytes(file_data)
+
         # write file on host
         filename = self.file_name[file_index]
-        print("writing " + filename + " on host...")
+        self._say("writing " + filename + " on host...")
         with open(filename, "wb") as f:
             f.write(file_data)
 
         # write .inf file on host
-        print("writing " + filename + ".inf on host...")
-        t = (self.file_name[file_index]).ljust(12) \
+        self._say("writing " + filename + ".inf on host...")
+        t = self._inf_text(file_index)
+
+        with open(filename + ".inf", "wb") as f:
+            f.write(t.encode('Latin-1'))
+
+        return bytes(file_data)
+
+
+    def _inf_text(self, file_index):
+
+        # the .inf file written alongside an extracted file
+        return (self.file_name[file_index]).ljust(12) \
                 + '{:08X}'.format(self.file_load[file_index]) + "  " \
                 + '{:08X}'.format(self.file_exec[file_index]) + "  " \
                 + self.file_lock[file_index].ljust(3) \
                 + '{:08X}'.format(self.file_length[file_index])
 
-        with open(filename + ".inf", "wb") as f:
-            f.write(t.encode('Latin-1'))
 
+    @_writes
+    def insert(self, file, tokenise = False, load = None, execute = None, locked = False, overwrite = None):
 
-    def insert(self, file, tokenise = False):
+        # Returns the name of the file on the disk, or None if skipped. Without a .inf file,
+        # the addresses are 'load' and 'execute' (the load address if not given), or asked for.
+        # 'overwrite' overrides the policy set for a file already on the disk.
+        overwrite = overwrite or self.overwrite
 
         # scan disk-image
         self._scan()
 
         # error checks
         if not(os.path.exists(file)):
-            print("ERROR: file not found")
-            sys.exit()
+            raise ImageNotFoundError(file + " not found")
 
         # assume dir $ if none specified
         if file[1] != ".":
@@ -610,13 +1080,11 @@ class DiskImage:
 
         # tokenise BASIC file
         if tokenise:
-            print("tokenising file...")
+            self._say("tokenising file...")
 
             # files are tokenised using separate utility written by Richard Russell - thanks RR!
             if not (os.path.exists("tokenise.exe") or os.path.exists("tokenise")):
-                print("ERROR: 'tokenise' utility required to tokenise BASIC programs")
-                print("This can be downloaded from stardot.org.uk")
-                sys.exit()
+                raise ImageError("'tokenise' utility required to tokenise BASIC programs\nThis can be downloaded from stardot.org.uk")
 
             # tokenise will produce file called "abb"
             f = file[0:2] + "abb"
@@ -632,21 +1100,20 @@ class DiskImage:
                 info.wShowWindow = subprocess.SW_HIDE
                 cmd = ['tokenise', file]
                 with subprocess.Popen(cmd, stdout=subprocess.PIPE, startupinfo=info) as proc:
-                    print(proc.stdout.read().strip(b'').decode('ascii'))
+                    self._say(proc.stdout.read().strip(b'').decode('ascii'))
             else:
 
                 # linux ("linux" or "linux2") or OS X ("darwin")
                 cmd = ['./tokenise', file]
                 with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
-                    print(proc.stdout.read().strip(b'').decode('ascii'))
+                    self._say(proc.stdout.read().strip(b'').decode('ascii'))
 
             if not os.path.exists(f):
-                print("ERROR: failed to tokenise file")
-                sys.exit()
+                raise ImageError("failed to tokenise file")
 
             # copy .inf file matching original filename
             if os.path.exists(file + ".inf"):
-                print("using " + file + ".inf as " + f + ".inf")
+                self._say("using " + file + ".inf as " + f + ".inf")
                 shutil.copyfile(file + ".inf", f + ".inf")
 
             # insert tokenised file
@@ -661,11 +1128,18 @@ class DiskImage:
             file_index = -1
 
         if file_index != -1:
-            print("WARNING: file already exists in disk image")
-            s = input("are you sure? ")
-            if s.find("Y") == -1 and s.find("y") == -1:
-                print("aborted")
-                sys.exit()
+            if overwrite == "skip":
+                self._say("skipping " + target + " (already in disk image)")
+                return None
+
+            elif overwrite == "ask" and self.interactive:
+                print("WARNING: file already exists in disk image")
+                s = input("are you sure? ")
+                if s.find("Y") == -1 and s.find("y") == -1:
+                    raise AbortedError("aborted")
+
+            elif overwrite != "replace":
+                raise DiskFileExistsError(target + " already exists in disk image")
 
         # check sufficient space on disk
         size = os.path.getsize(file)
@@ -679,19 +1153,17 @@ class DiskImage:
                 self.sectors_used[i] = "-"
 
         if self.sectors_used.count("-") < sectors:
-            print("ERROR: insufficient space")
-            sys.exit()
+            raise DiskFullError("insufficient space")
 
         # find the first space big enough
         start_sector = (''.join(self.sectors_used)).find("-" * sectors)
         if start_sector == -1:
-            print("ERROR: disk needs compacting first")
-            sys.exit()
+            raise DiskFullError("disk needs compacting first")
 
         # get file attributes
         if (os.path.exists(file + ".inf")):
             if (self.verbose_level > 0):
-                print("found " + file + ".inf...")
+                self._say("found " + file + ".inf...")
 
             with open(file + ".inf", "r") as f:
                 s = f.read()
@@ -703,8 +1175,7 @@ class DiskImage:
                     f = "$." + f
 
                 if f.upper() != target.upper():
-                    print("ERROR: .inf does not refer to the same file")
-                    sys.exit()
+                    raise ImageError(".inf does not refer to the same file")
                 else:
                     target = f # match case
 
@@ -729,6 +1200,15 @@ class DiskImage:
                 else:
                     lock = " "
 
+        elif load is not None:
+
+            s1 = '{:X}'.format(load)
+            s2 = '{:X}'.format(load if execute is None else execute)
+            lock = "L" if locked else " "
+
+        elif not self.interactive:
+            raise ImageError("no " + file + ".inf file (give the load address)")
+
         else:
 
             s1 = input("Enter load address (hex): 0x")
@@ -743,23 +1223,21 @@ class DiskImage:
         try:
             load_addr = int(s1, 16)
         except:
-            print("ERROR: invalid load address")
-            sys.exit()
+            raise ImageError("invalid load address")
 
         try:
             exec_addr = int(s2, 16)
         except:
-            print("ERROR: invalid exec address")
-            sys.exit()
+            raise ImageError("invalid exec address")
 
         if (self.verbose_level > 0):
-            print("load: " + hex(load_addr), "exec: " + hex(exec_addr),
+            self._say("load: " + hex(load_addr), "exec: " + hex(exec_addr),
                   "length: " + hex(size), "sector: " + hex(start_sector))
 
         # check for BASIC file
         bas_file = (exec_addr & 0xFFFF > 0x8000 and exec_addr & 0xFFFF < 0x80FF)
         if bas_file and not tokenise:
-            print("NOTE: BASIC program not tokenised (*exec and save)")
+            self._say("NOTE: BASIC program not tokenised (*exec and save)")
 
         # get file from host
         with open(file, 'rb') as f:
@@ -810,12 +1288,15 @@ class DiskImage:
         self._update_catalogue()
 
         # write changes to disk image
-        self._write_to_disk()
+        self._commit()
 
         # refresh
         self._scan()
 
+        return target
+
 
+    @_writes
     def delete(self, file):
 
         # scan disk-image
@@ -836,13 +1317,11 @@ class DiskImage:
             file_index = -1
 
         if file_index == -1:
-            print("ERROR: file not found")
-            sys.exit()
-        else:
+            raise DiskFileNotFoundError("file not found")
+        elif self.interactive:
             s = input("WARNING: Delete " + file + " from " + self.disk + " - are you sure (y/n)?")
             if s.find("Y") == -1 and s.find("y") == -1:
-                print("aborted")
-                sys.exit()
+                raise AbortedError("aborted")
 
         # delete file from file data
         del self.file_name[file_index]
@@ -862,21 +1341,22 @@ class DiskImage:
         self._update_catalogue()
 
         # write changes to disk image
-        self._write_to_disk()
+        self._commit()
 
         # refresh
         self._scan()
 
 
+    @_writes
     def compact(self):
 
         # scan disk-image
         self._scan()
 
         if self.type == "ssd":
-            print("compacting " + self.disk + "...")
+            self._say("compacting " + self.disk + "...")
         else:
-            print("compacting " + self.disk + " (side " + str(self.side) + ")...")
+            self._say("compacting " + self.disk + " (side " + str(self.side) + ")...")
 
         # calculate relocation sectors
         new_file_sector = []
@@ -920,12 +1400,390 @@ class DiskImage:
         self._disk_data[0x104] = self.disk_cycle
 
         # write changes to disk image
-        self._write_to_disk()
+        self._commit()
+
+        # refresh
+        self._scan()
+
+
+    def set_skew(self, skew):
+
+        # error checks
+        if not skew.isdigit() or int(skew) >= self.SECTORS_PER_TRACK:
+            raise InvalidOptionError("invalid skew (use 0 to " + str(self.SECTORS_PER_TRACK - 1) + ")")
+
+        self.track_skew = int(skew)
+
+
+    def add_boot(self, files):
+
+        # files loaded one after another, e.g. "!BOOT,STAR"
+        sequence = []
+        for file in files.split(","):
+            if file[1:2] != ".":
+                file = "$." + file
+            sequence.append(file)
+
+        self.boot_sequences.append(sequence)
+
+
+    def _file_index(self, file):
+
+        # index of a file in the catalogue, or -1 (Beeb does not distinguish case)
+        file_name_ucase = [item.upper() for item in self.file_name]
+        if file.upper() in file_name_ucase:
+            return file_name_ucase.index(file.upper())
+        return -1
+
+
+    def _read_sectors(self, state, sector, count):
+
+        # Time reading 'count' sectors from 'sector'. state is [track, time] and is updated.
+        # Moving the head costs the settle time plus the step time for each track, then the
+        # drive waits for the first sector to come round before reading the rest of the track.
+        # Sector 0 of each track passes the head 'track_skew' sectors later than on the track
+        # before (0 for a disc image written track by track).
+        while count > 0:
+
+            track = sector // self.SECTORS_PER_TRACK
+            if track != state[0]:
+                state[1] += self.SETTLE_TIME + abs(track - state[0]) * self.STEP_TIME
+                state[0] = track
+
+            # wait for the sector
+            slot = (sector + track * self.track_skew) % self.SECTORS_PER_TRACK
+            state[1] += (slot * self.SECTOR_TIME - state[1]) % self.REVOLUTION_TIME
+
+            # read to the end of the file or track
+            n = min(count, self.SECTORS_PER_TRACK - sector % self.SECTORS_PER_TRACK)
+            state[1] += n * self.SECTOR_TIME
+            sector += n
+            count -= n
+
+
+    def _load_time(self, state, sector, length):
+
+        # DFS reads the catalogue (sectors 0 and 1) before loading each file
+        self._read_sectors(state, 0, 2)
+        self._read_sectors(state, sector, -(-length // 256)) # round up
+
+
+    def _sequence_time(self, sequence, sectors):
+
+        # time to load the files of a boot sequence, with sectors[i] the start sector of
+        # file i, from the head on track 0 as sector 0 comes round
+        state = [0, 0.0]
+        for i in sequence:
+            self._load_time(state, sectors[i], self.file_length[i])
+
+        return state[1]
+
+
+    def _boot_indexes(self):
+
+        # the boot sequences as lists of file indexes ("!BOOT" alone if none are given)
+        sequences = self.boot_sequences
+        if not sequences:
+            sequences = [["$.!BOOT"]]
+
+        result = []
+        for sequence in sequences:
+            indexes = []
+            for file in sequence:
+                i = self._file_index(file)
+                if i == -1:
+                    raise DiskFileNotFoundError("boot file " + file + " not found")
+                indexes.append(i)
+            result.append(indexes)
+
+        return result
+
+
+    def timing(self):
+
+        # Returns the load time of each file, {name: seconds}, and of each boot sequence,
+        # [(names, seconds)], as {"files": ..., "boot": ...}
+
+        # scan disk-image
+        self._scan()
+
+        result = {"files": {}, "boot": []}
+
+        self._say("\nEstimated load times (skew " + str(self.track_skew) + "):\n")
+        self._say("FILENAME     SEC  TRACKS    TIME")
+        for i in range(self.disk_files - 1, -1, -1):
+            first = self.file_sector[i] // self.SECTORS_PER_TRACK
+            last = (self.file_sector[i] + max(1, -(-self.file_length[i] // 256)) - 1) // self.SECTORS_PER_TRACK
+            t = self._sequence_time([i], self.file_sector)
+            result["files"][self.file_name[i]] = t
+            self._say(self.file_name[i].ljust(10) + "   " + '{:03X}'.format(self.file_sector[i]) \
+                + "  " + (str(first) + "-" + str(last)).ljust(6) + "  " + '{:6.2f}'.format(t) + "s")
+
+        self._say("")
+        for sequence in self._boot_indexes():
+            t = self._sequence_time(sequence, self.file_sector)
+            result["boot"].append(([self.file_name[i] for i in sequence], t))
+            self._say("boot " + ", ".join(self.file_name[i] for i in sequence) + ": " + '{:.2f}'.format(t) + "s")
+
+        return result
+
+
+    @_writes
+    def place(self):
+
+        # scan disk-image
+        self._scan()
+
+        sequences = self._boot_indexes()
+        self._say("placing boot files on " + self.disk + "...")
+
+        # boot files go first in the order they are loaded, each at whichever of the next
+        # SECTORS_PER_TRACK sectors gives the fastest boot (so often at the start of a track)
+        order = []
+        for sequence in sequences:
+            for i in sequence:
+                if i not in order:
+                    order.append(i)
+
+        new_file_sector = [None] * self.disk_files
+        s = 2
+        for i in order:
+
+            best = None
+            for gap in range(self.SECTORS_PER_TRACK):
+                new_file_sector[i] = s + gap
+                t = 0.0
+                for sequence in sequences:
+                    placed = [j for j in sequence if new_file_sector[j] is not None]
+                    t += self._sequence_time(placed, new_file_sector)
+
+                # (only a clear saving is worth the gap)
+                if best is None or t < best[0] - 0.001:
+                    best = (t, s + gap)
+
+            new_file_sector[i] = best[1]
+            s = best[1] + -(-self.file_length[i] // 256) # round up
+
+        # then the other files, in their catalogue order
+        for i in range(self.disk_files - 1, -1, -1):
+            if new_file_sector[i] is None:
+                new_file_sector[i] = s
+                s += -(-self.file_length[i] // 256) # round up
+
+        if s > self.disk_sectors:
+            raise DiskFullError("insufficient space")
+
+        # move the files
+        disk_copy = bytearray(self._disk_data)
+        for i in range(self.disk_files):
+
+            source = self.file_sector[i] * 256
+            target = new_file_sector[i] * 256
+            self._disk_data[target : target + self.file_length[i]] = disk_copy[source : source + self.file_length[i]]
+
+        # clear the gaps left between files
+        used = set()
+        for i in range(self.disk_files):
+            used.update(range(new_file_sector[i], new_file_sector[i] + -(-self.file_length[i] // 256)))
+        for sector in range(2, self.disk_sectors):
+            if sector not in used:
+                self._disk_data[sector * 256 : (sector + 1) * 256] = bytes(256)
+
+        # catalogue must be in descending sector order
+        entries = sorted(range(self.disk_files), key = lambda i: -new_file_sector[i])
+        self.file_name   = [self.file_name[i] for i in entries]
+        self.file_lock   = [self.file_lock[i] for i in entries]
+        self.file_load   = [self.file_load[i] for i in entries]
+        self.file_exec   = [self.file_exec[i] for i in entries]
+        self.file_length = [self.file_length[i] for i in entries]
+        self.file_sector = [new_file_sector[i] for i in entries]
+
+        # update disk data
+        self.disk_cycle += 1
+        self._disk_data[0x104] = self.disk_cycle
+
+        # update _disk_data from file data
+        self._update_catalogue()
+
+        # write changes to disk image
+        self._commit()
 
         # refresh
         self._scan()
 
 
+    def set_store(self, store):
+
+        self.store = store
+
+
+    def set_jobs(self, jobs):
+
+        # error checks
+        if not jobs.isdigit() or int(jobs) < 1:
+            raise InvalidOptionError("invalid number of jobs")
+
+        self.jobs = int(jobs)
+
+
+    def ingest(self, path):
+
+        # returns counts of the images ingested and the store's contents (as printed)
+
+        # error checks
+        if self.store == "":
+            raise InvalidOptionError("no store specified (use -store <directory>)")
+
+        if not(os.path.exists(path)):
+            raise ImageNotFoundError(path + " not found")
+
+        # find the disk images
+        if os.path.isdir(path):
+            paths = []
+            for directory, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f[-4:].lower() in (".ssd", ".dsd", ".dss"):
+                        paths.append(os.path.normpath(os.path.join(directory, f)))
+        else:
+            paths = [os.path.normpath(path)]
+
+        # images not changed since they were last ingested are skipped without reading them
+        index = _read_index(self.store)
+        todo = []
+        for p in paths:
+            stat = os.stat(p)
+            known = index["paths"].get(p)
+            if known is None or known["size"] != stat.st_size or known["mtime"] != stat.st_mtime:
+                todo.append(p)
+
+        self._say("ingesting " + str(len(todo)) + " of " + str(len(paths)) + " disk images into " + self.store + "...")
+
+        # each image is hashed in a separate process, which stores any new file contents
+        new_images = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers = self.jobs) as pool:
+            for p, (manifest, new) in zip(todo, pool.map(_ingest_image, todo, [self.store] * len(todo), chunksize = 8)):
+                if new:
+                    new_images += 1
+                if "raw" in manifest and new:
+                    self._say("WARNING: " + p + " stored whole (its catalogue could not be read)")
+                stat = os.stat(p)
+                index["paths"][p] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": manifest["hash"]}
+
+        _write_index(self.store, index)
+
+        # summary
+        hashes = set(known["hash"] for known in index["paths"].values())
+        image_bytes = sum(known["size"] for known in index["paths"].values())
+        objects = 0
+        stored_bytes = 0
+        for directory, dirs, files in os.walk(os.path.join(self.store, "objects")):
+            for f in files:
+                objects += 1
+                stored_bytes += os.path.getsize(os.path.join(directory, f))
+
+        self._say(str(new_images) + " new image contents, " + str(len(hashes)) + " unique of " + str(len(index["paths"])) + " images")
+        self._say(str(objects) + " objects, " + str(stored_bytes) + " bytes stored for " + str(image_bytes) + " bytes of images")
+
+        return {"found": len(paths), "ingested": len(todo), "new": new_images, "unique": len(hashes), "images": len(index["paths"]), \
+                "objects": objects, "stored_bytes": stored_bytes, "image_bytes": image_bytes}
+
+
+    def rebuild(self, image, write = True):
+
+        # returns the image data, and unless 'write' is False writes it on the host
+
+        # error checks
+        if self.store == "":
+            raise InvalidOptionError("no store specified (use -store <directory>)")
+
+        # find the image by its path, its name or the start of its hash
+        index = _read_index(self.store)
+        path = os.path.normpath(image)
+        if path in index["paths"]:
+            found = [path]
+        else:
+            found = sorted(p for p, known in index["paths"].items() \
+                if os.path.basename(p) == image or known["hash"].startswith(image.lower()))
+
+        if len(found) == 0:
+            raise ImageNotFoundError("image not found in store")
+
+        if len(set(index["paths"][p]["hash"] for p in found)) > 1:
+            raise ImageError(image + " matches more than one image: " + ", ".join(found))
+
+        # rebuild the image from its manifest and check it
+        h = index["paths"][found[0]]["hash"]
+        with open(os.path.join(self.store, "images", h + ".json"), "r") as f:
+            manifest = json.load(f)
+
+        data = _image_bytes(self.store, manifest)
+        if hashlib.sha256(data).hexdigest() != h:
+            raise ImageError("rebuilt image does not match its hash (store damaged?)")
+
+        if not write:
+            return data
+
+        # write image on host
+        filename = os.path.basename(found[0])
+        self._say("writing " + filename + " on host...")
+        with open(filename, "wb") as f:
+            f.write(data)
+
+        return data
+
+
+    def batch(self, specs):
+
+        # Build several images at once, each in one of a pool of -jobs processes. specs is a
+        # list of the images to build, or a JSON file holding one, each a dict of:
+        #   disk       the image, made from 'template' if it doesn't exist
+        #   template   the empty image to start from
+        #   side       the side to write ("0" or "2", default "0")
+        #   directory  where the files to insert and their .inf files are (default here)
+        #   insert     the files to insert, in order
+        #   boot       boot sequences ("!BOOT,GAME") to place and time
+        #   place      true to place the boot files (see place)
+        #   overwrite  what to do with a file already on the disk (default "replace")
+        # Jobs for different sides of the same image write just their own side, taking turns
+        # holding its lock. Returns the boot times of each image, [(disk, side, timing)].
+        if isinstance(specs, str):
+            with open(specs, "r") as f:
+                specs = json.load(f)
+
+        # (the workers change directory, so paths are made absolute first)
+        jobs = []
+        for spec in specs:
+            spec = dict(spec)
+            for key in ("disk", "template", "directory"):
+                if key in spec:
+                    spec[key] = os.path.abspath(spec[key])
+            spec.setdefault("directory", os.getcwd())
+            jobs.append(spec)
+
+        self._say("building " + str(len(jobs)) + " disk images in " + str(min(self.jobs, max(1, len(jobs)))) + " processes...")
+
+        results = []
+        failed = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers = self.jobs) as pool:
+            for spec, (timing, error) in zip(jobs, pool.map(_build_image, jobs)):
+                name = os.path.relpath(spec["disk"]) + " (side " + str(spec.get("side", "0")) + ")"
+                if error is not None:
+                    self._say("ERROR: " + name + ": " + error)
+                    failed += 1
+                    continue
+
+                self._say("built " + name)
+                for files, t in timing:
+                    self._say("    boot " + ", ".join(files) + ": " + '{:.2f}'.format(t) + "s")
+                results.append((spec["disk"], str(spec.get("side", "0")), timing))
+
+        if failed > 0:
+            raise ImageError(str(failed) + " of " + str(len(jobs)) + " disk images failed")
+
+        return results
+
+
     def _update_catalogue(self):
 
         # update catalogue entries in _disk_data before writing to disk
@@ -1000,85 +1858,325 @@ class DiskImage:
             self._disk_data[p + 0x107] = lb
 
 
+    def _commit(self):
+
+        # write the changes, or inside a with block keep them until it ends
+        self._changed.add(self.side)
+        if self._deferred:
+            self._dirty = True
+        else:
+            self._write_to_disk()
+
+
     def _write_to_disk(self):
 
+        # Write the sides changed into the image in place (holding its lock), leaving the
+        # other side of a double-sided image as it is: another job may be changing it.
         if (self.verbose_level > 0):
-            print("\nwriting changes to " + self.disk + "...\n")
-        with open(self.disk, 'wb') as f:
+            self._say("\nwriting changes to " + self.disk + "...\n")
+        with open(self.disk, 'r+b') as f:
 
             if self.type == "ssd":
 
                 # single-sided
                 f.write(self._side0)
+                f.truncate()
 
             elif self.type == "dsd":
 
                 # double-sided interleaved
-                i = 0
-                while i < self.disk_sectors:
+                for side in sorted(self._changed):
+                    data = self._side0 if side == "0" else self._side2
+                    i = 0
+                    while i < self.disk_sectors:
 
-                    f.write(self._side0[i*256 : (i+10)*256])
-                    f.write(self._side2[i*256 : (i+10)*256])
-                    i += 10
+                        f.seek((2 * i + (0 if side == "0" else 10)) * 256)
+                        f.write(data[i*256 : (i+10)*256])
+                        i += 10
 
             elif self.type == "dss":
 
                 # double-sided sequential
-                f.write(self._side0)
-                f.write(self._side2)
+                for side in sorted(self._changed):
+                    f.seek(0 if side == "0" else self.disk_sectors * 256)
+                    f.write(self._side0 if side == "0" else self._side2)
 
+        self._changed = set()
 
-def main(args):
 
-    # disk image object
-    disk_image = DiskImage()
+# content store
+#
+# The store holds each unique file once, under objects/<first two hex digits>/<SHA-256 of
+# its contents>. For each unique image there is a manifest, images/<SHA-256 of the image>.json,
+# giving its type and size and for each side the .inf line, start sector and hash of every
+# file, plus the hash of the rest of the side (the catalogue, unused sectors and the ends of
+# partly used sectors) compressed with zlib. index.json maps each path ingested to the hash
+# of its image, with its size and modification time so unchanged images aren't read again.
+# An image whose catalogue can't be read is stored whole, compressed.
 
-    # parse command line
-    if len(args) == 0:
-        disk_image.help()
+def _object_path(store, h):
+
+    return os.path.join(store, "objects", h[0:2], h)
+
+
+def _store_object(store, data):
+
+    # write data to the store (unless it is there already), returning its hash
+    h = hashlib.sha256(data).hexdigest()
+    path = _object_path(store, h)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
 
-    i=0
-    while i < len(args):
+        # write then rename, so other processes never see part of an object
+        temp = path + "." + str(os.getpid()) + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
 
-        if args[i] == "-help" or args[i] == "-?":
-            disk_image.help()
+    return h
 
-        elif args[i] == "-disk" or args[i] == "-d":
-            disk_image.set_disk(args[i + 1])
 
-        elif args[i] == "-type" or args[i] == "-t":
-            disk_image.set_type(args[i + 1])
+def _load_object(store, h):
 
-        elif args[i] == "-side" or args[i] == "-s":
-            disk_image.set_side(args[i + 1])
+    with open(_object_path(store, h), "rb") as f:
+        return f.read()
 
-        elif args[i] == "-cat" or args[i] == "-c":
-            disk_image.catalogue()
 
-        elif args[i] == "-extract" or args[i] == "-e":
-            disk_image.extract(args[i + 1])
+def _read_index(store):
 
-        elif args[i] == "-extract*" or args[i] == "-e*": # de-tokenises BASIC programs
-            disk_image.extract(args[i + 1], True)
+    path = os.path.join(store, "index.json")
+    if not os.path.exists(path):
+        return {"paths": {}}
 
-        elif args[i] == "-insert" or args[i] == "-i":
-            disk_image.insert(args[i + 1])
+    with open(path, "r") as f:
+        return json.load(f)
 
-        elif args[i] == "-insert*" or args[i] == "-i*": # re-tokenises BASIC programs
-            disk_image.insert(args[i + 1], True)
 
-        elif args[i] == "-delete" or args[i] == "-del":
-            disk_image.delete(args[i + 1])
+def _write_index(store, index):
+
+    os.makedirs(store, exist_ok = True)
+    temp = os.path.join(store, "index.json.tmp")
+    with open(temp, "w") as f:
+        json.dump(index, f, indent = 1, sort_keys = True)
+    os.replace(temp, os.path.join(store, "index.json"))
+
+
+def _image_bytes(store, manifest):
+
+    # the bytes of an image rebuilt from its manifest
+    if "raw" in manifest:
+        return zlib.decompress(_load_object(store, manifest["raw"]))
+
+    sides = []
+    for side in manifest["sides"]:
+        data = bytearray(zlib.decompress(_load_object(store, side["residue"])))
+        for file in side["files"]:
+            content = _load_object(store, file["hash"])
+            start = file["sector"] * 256
+            data[start : start + len(content)] = content
+        sides.append(data)
+
+    # lay out the sides as _write_to_disk does
+    if manifest["type"] == "ssd":
+        image = sides[0]
+    elif manifest["type"] == "dsd":
+        image = bytearray()
+        for i in range(0, len(sides[0]), 10 * 256):
+            image += sides[0][i : i + 10 * 256]
+            image += sides[1][i : i + 10 * 256]
+    else:
+        image = sides[0] + sides[1]
+
+    # clip or pad to the original size
+    image = image[0 : manifest["size"]]
+    image.extend([0] * (manifest["size"] - len(image)))
+    return bytes(image)
+
+
+def _ingest_image(path, store):
+
+    # Store the files of one image and write its manifest (run in a separate process).
+    # Returns the manifest and whether the image was new to the store.
+    with open(path, "rb") as f:
+        image = f.read()
+
+    h = hashlib.sha256(image).hexdigest()
+    manifest_path = os.path.join(store, "images", h + ".json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            return (json.load(f), False)
+
+    disk_image = DiskImage()
+
+    # (an ImageError, or any other error from a damaged image)
+    try:
+        disk_image.set_disk(path)
+        manifest = {"name": os.path.basename(path), "type": disk_image.type, "size": len(image), "hash": h, "sides": []}
+
+        for side in (["0"] if disk_image.type == "ssd" else ["0", "2"]):
+            disk_image.set_side(side)
+            files = []
+            try:
+                disk_image._scan()
+                residue = bytearray(disk_image._disk_data)
+                for i in range(disk_image.disk_files):
+                    start = disk_image.file_sector[i] * 256
+                    data = bytes(disk_image._disk_data[start : start + disk_image.file_length[i]])
+                    residue[start : start + len(data)] = bytes(len(data))
+                    files.append({"inf": disk_image._inf_text(i), "sector": disk_image.file_sector[i], "hash": _store_object(store, data)})
+
+            except Exception:
+                # an unreadable catalogue (e.g. an unformatted side): keep the side as it is
+                residue = bytearray(disk_image._disk_data)
+                files = []
+
+            manifest["sides"].append({"side": side, "files": files, "residue": _store_object(store, zlib.compress(bytes(residue), 9))})
+
+        if _image_bytes(store, manifest) != image:
+            raise ValueError("image does not rebuild")
+
+    except Exception:
+        manifest = {"name": os.path.basename(path), "type": "raw", "size": len(image), "hash": h, "raw": _store_object(store, zlib.compress(image, 9))}
+
+    # write the manifest
+    os.makedirs(os.path.dirname(manifest_path), exist_ok = True)
+    temp = manifest_path + "." + str(os.getpid()) + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(temp, manifest_path)
+
+    return (manifest, True)
+
+
+class _Command(argparse.Action):
+
+    # keep every command, in the order given (they run one after another)
+    def __call__(self, parser, namespace, values, option_string = None):
+        namespace.commands.append((self.dest, values))
+
+
+# (options, command, number of values)
+COMMANDS = [(["-help", "-?"],           "help",      0),
+            (["-disk", "-d"],           "disk",      1),
+            (["-type", "-t"],           "type",      1),
+            (["-side", "-s"],           "side",      1),
+            (["-cat", "-c"],            "cat",       0),
+            (["-extract", "-e"],        "extract",   1),
+            (["-extract*", "-e*"],      "extract*",  1),    # de-tokenises BASIC programs
+            (["-insert", "-i"],         "insert",    1),
+            (["-insert*", "-i*"],       "insert*",   1),    # re-tokenises BASIC programs
+            (["-delete", "-del"],       "delete",    1),
+            (["-compact", "-com"],      "compact",   0),
+            (["-skew"],                 "skew",      1),
+            (["-boot", "-b"],           "boot",      1),
+            (["-time"],                 "time",      0),
+            (["-place", "-p"],          "place",     0),
+            (["-pair"],                 "pair",      1),
+            (["-convert", "-conv"],     "convert",   1),
+            (["-merge"],                "merge",     1),
+            (["-store"],                "store",     1),
+            (["-jobs"],                 "jobs",      1),
+            (["-ingest"],               "ingest",    1),
+            (["-rebuild"],              "rebuild",   1),
+            (["-batch"],                "batch",     1),
+            (["-overwrite"],            "overwrite", 1),
+            (["-verbose", "-v"],        "verbose",   0)]
+
+
+def _build_image(spec):
+
+    # Build one image for batch (run in a separate process). Returns the boot times and an
+    # error message (None if it was built).
+    try:
+        disk = spec["disk"]
+
+        # make the image (once, if several jobs write to it)
+        if not os.path.exists(disk):
+            if "template" not in spec:
+                raise ImageNotFoundError(disk + " not found (and no template given)")
+            lock = _lock_image(disk)
+            if not os.path.exists(disk):
+                temp = disk + "." + str(os.getpid()) + ".tmp"
+                shutil.copyfile(spec["template"], temp)
+                os.replace(temp, disk)
+            if lock is not None:
+                lock.close()
+
+        os.chdir(spec["directory"])
+
+        with DiskImage(disk, side = str(spec.get("side", "0")), overwrite = spec.get("overwrite", "replace")) as disk_image:
+            for file in spec.get("insert", []):
+                disk_image.insert(file)
+            for files in spec.get("boot", []):
+                disk_image.add_boot(files)
+            if spec.get("place", False):
+                disk_image.place()
+
+            timing = []
+            if len(spec.get("boot", [])) > 0:
+                timing = disk_image.timing()["boot"]
+
+        return (timing, None)
+
+    except (ImageError, OSError) as e:
+        return (None, str(e))
+
+
+def main(args):
+
+    # parse command line
+    parser = argparse.ArgumentParser(prog = "image.py", add_help = False, allow_abbrev = False)
+    for options, command, count in COMMANDS:
+        parser.add_argument(*options, dest = command, nargs = count, action = _Command)
+
+    commands = parser.parse_args(args, argparse.Namespace(commands = [])).commands
+
+    # disk image object (asking questions only if someone can answer them)
+    disk_image = DiskImage(overwrite = "ask", quiet = False, interactive = sys.stdin.isatty())
+
+    run = {"help":      disk_image.help,
+           "disk":      disk_image.set_disk,
+           "type":      disk_image.set_type,
+           "side":      disk_image.set_side,
+           "cat":       disk_image.catalogue,
+           "extract":   disk_image.extract,
+           "extract*":  lambda file: disk_image.extract(file, True),
+           "insert":    disk_image.insert,
+           "insert*":   lambda file: disk_image.insert(file, True),
+           "delete":    disk_image.delete,
+           "compact":   disk_image.compact,
+           "skew":      disk_image.set_skew,
+           "boot":      disk_image.add_boot,
+           "time":      disk_image.timing,
+           "place":     disk_image.place,
+           "pair":      disk_image.set_pair,
+           "convert":   disk_image.convert,
+           "merge":     disk_image.merge,
+           "store":     disk_image.set_store,
+           "jobs":      disk_image.set_jobs,
+           "ingest":    disk_image.ingest,
+           "rebuild":   disk_image.rebuild,
+           "batch":     disk_image.batch,
+           "overwrite": disk_image.set_overwrite,
+           "verbose":   lambda: disk_image.verbose(1)}
+
+    if len(commands) == 0:
+        disk_image.help()
 
-        elif args[i] == "-compact" or args[i] == "-com":
-            disk_image.compact()
+    try:
+        for command, values in commands:
+            run[command](*values)
 
-        elif args[i] == "-verbose" or args[i] == "-v":
-            disk_image.verbose(1)
+    except AbortedError:
+        print("aborted")
+        sys.exit(1)
 
-        i += 1
+    except ImageError as e:
+        print("ERROR: " + str(e))
+        sys.exit(1)
 
 
-# do it!
-main(sys.argv[1:])
+# do it! (only when run, as -ingest starts more processes that import this file)
+if __name__ == "__main__":
+    main(sys.argv[1:])
 
@@ -0,0 +1,296 @@
+import argparse
+import itertools
+import math
+import os
+import sys
+
+import enemy_arcs
+
+# Makes the maths tables from their formulas, as build/trig_tables.a, build/segment_tables.a
+# and build/angle_tables.a for starcommand_acme.asm to include. The tables are the same for
+# all four builds.
+#
+#   trig_tables.a       starship_rotation_cosine_table and starship_rotation_sine_table,
+#                       the small rotation made each frame while the starship turns, and
+#                       cosine_table and sine_table, 32 angles around a circle
+#   segment_tables.a    segment_angle_to_x_deltas_table and segment_angle_to_y_deltas_table,
+#                       the step from each point of that circle to the next (see plot_segment)
+#   angle_tables.a      angle_result_table_8 to _12, the angle for each octant, and the
+#                       atan_boundary_N constants that calculate_enemy_ship_angle_to_starship
+#                       compares against
+#
+# Each table is a list of ideal values and a rule for rounding them to bytes. --report
+# lists the maximum and RMS error of each table against the ideal values.
+#
+# Tables within a file can share bytes where the end of one is the start of the next. By
+# default the tables are in the order listed here, and only cosine_table shares bytes with
+# the table after it (24 bytes of sine_table), as in the original game. With
+# --pack each file's tables are put in the order that shares the most bytes. --report also
+# lists the bytes saved by the best order of each file, and of all the tables together.
+#
+# The results depend only on the options, so a change of precision (e.g. --sine-amplitude)
+# can be reproduced, and --report gives the bytes used against the baseline of the default
+# options.
+
+angles = 32
+rotation_steps = 6
+octant_steps = 5            # angle_result_table_8 to _12
+
+class Table:
+    def __init__(self, name, formula, ideal, values, runs_on=False):
+        self.name = name
+        self.formula = formula
+        self.ideal = ideal              # the exact values
+        self.values = values            # the rounded values (only the low byte is stored)
+        self.runs_on = runs_on          # shares bytes with the next table in the listed order
+
+    def bytes(self):
+        return bytes(value & 0xff for value in self.values)
+
+    def errors(self):
+        return [value - ideal for (value, ideal) in zip(self.values, self.ideal)]
+
+    def max_error(self):
+        return max(abs(error) for error in self.errors())
+
+    def rms_error(self):
+        errors = self.errors()
+        return math.sqrt(sum(error * error for error in errors) / len(errors))
+
+class Constant:
+    def __init__(self, name, formula, ideal, value):
+        self.name = name
+        self.formula = formula
+        self.ideal = ideal
+        self.value = value
+
+class Group:
+    def __init__(self, filename, tables, constants=None):
+        self.filename = filename
+        self.tables = tables
+        self.constants = constants or []
+
+def round_half_up(value):
+    return int(math.floor(value + 0.5))
+
+def sine_values(amplitude):
+    ideal = [amplitude * math.sin(2 * math.pi * i / angles) for i in range(angles)]
+    return (ideal, [round_half_up(value) for value in ideal])
+
+def make_groups(options):
+    # ----------------------------------------------------------------------------------
+    # trig tables
+    step = options.rotation_step
+    rotation_cosine_ideal = [65536 * math.cos(i * step) for i in range(rotation_steps)]
+    rotation_sine_ideal = [256 * math.sin(i * step) for i in range(rotation_steps)]
+    (sine_ideal, sine) = sine_values(options.sine_amplitude)
+    quarter = angles // 4
+    cosine_ideal = [-value for value in sine_ideal[quarter:] + sine_ideal[:quarter]]
+    cosine = sine[-quarter:] + sine[:-quarter]
+    amplitude = "%g" % options.sine_amplitude
+    trig = Group("trig_tables.a", [
+        Table("starship_rotation_cosine_table", "low byte of 65536*cos(i*" + "%g" % step + "), i = 0-" + str(rotation_steps - 1), rotation_cosine_ideal, [round_half_up(value) for value in rotation_cosine_ideal]),
+        Table("starship_rotation_sine_table", "256*sin(i*" + "%g" % step + "), i = 0-" + str(rotation_steps - 1), rotation_sine_ideal, [round_half_up(value) for value in rotation_sine_ideal]),
+        Table("cosine_table", "-" + amplitude + "*cos(i*2*pi/32), i = 0-31", cosine_ideal, cosine, runs_on=True),
+        Table("sine_table", amplitude + "*sin(i*2*pi/32), i = 0-31", sine_ideal, sine),
+    ])
+
+    # ----------------------------------------------------------------------------------
+    # segment tables: the points of the circle are (sine_table, cosine_table)
+    x_ideal = [sine_ideal[(i + 1) % angles] - sine_ideal[i] for i in range(angles)]
+    x_deltas = [sine[(i + 1) % angles] - sine[i] for i in range(angles)]
+    y_ideal = [cosine_ideal[(i + 1) % angles] - cosine_ideal[i] for i in range(angles)]
+    y_deltas = [cosine[(i + 1) % angles] - cosine[i] for i in range(angles)]
+    segment = Group("segment_tables.a", [
+        Table("segment_angle_to_x_deltas_table", "sine_table(i+1) - sine_table(i), i = 0-31", x_ideal, x_deltas),
+        Table("segment_angle_to_y_deltas_table", "cosine_table(i+1) - cosine_table(i), i = 0-31", y_ideal, y_deltas),
+    ])
+
+    # ----------------------------------------------------------------------------------
+    # angle tables
+    #
+    # calculate_enemy_ship_angle_to_starship finds the angle (0-4) from the larger of |dx|
+    # and |dy| towards the smaller, then looks up the full angle from the octant: bit 2 of
+    # the index is set if dy >= 0, bit 1 if dx >= 0 and bit 0 if |dx| >= |dy|. Angle 0 is
+    # up, and angles increase clockwise.
+    tables = []
+    for step_in_octant in range(octant_steps):
+        ideal = []
+        for index in range(8):
+            minor = math.tan(step_in_octant * 2 * math.pi / angles)
+            (dx, dy) = (1.0, minor) if index & 1 else (minor, 1.0)
+            dx = dx if index & 2 else -dx
+            dy = dy if index & 4 else -dy
+            ideal.append((math.atan2(dx, -dy) * angles / (2 * math.pi)) % angles)
+        values = [round_half_up(value) % angles for value in ideal]
+        ideal = [value if abs(value - rounded) < angles / 2 else value - angles for (value, rounded) in zip(ideal, values)]
+        tables.append(Table("angle_result_table_" + str(8 + step_in_octant), "atan2(dx, -dy)*32/(2*pi) for octant angle " + str(step_in_octant), ideal, values))
+
+    constants = []
+    for boundary in range(octant_steps - 1):
+        ideal = 256 * math.tan((boundary + 0.5) * 2 * math.pi / angles)
+        constants.append(Constant("atan_boundary_" + str(8 + boundary), "256*tan(" + str(boundary) + ".5*2*pi/32): the angle is " + str(9 + boundary) + " or more when y > x*" + "atan_boundary_" + str(8 + boundary) + "/256", ideal, round_half_up(ideal)))
+    angle = Group("angle_tables.a", tables, constants)
+
+    return [trig, segment, angle]
+
+# ----------------------------------------------------------------------------------
+# Layout. A layout is a list of (table, offset) and the total length in bytes.
+def overlap(first, second):
+    # the number of bytes at the end of 'first' that are the start of 'second'
+    for length in range(min(len(first), len(second)) - 1, 0, -1):
+        if first[-length:] == second[:length]:
+            return length
+    return 0
+
+def layout_in_order(tables, share_all=False):
+    # Each table follows the one before, sharing as many bytes as it can if 'share_all' or
+    # the table before runs on into it. A table already in the data is placed there.
+    data = b""
+    placed = []
+    previous = None
+    for table in tables:
+        values = table.bytes()
+        position = data.find(values) if share_all else -1
+        if position < 0:
+            shared = overlap(data, values) if data and (share_all or previous.runs_on) else 0
+            position = len(data) - shared
+            data = data + values[shared:]
+        placed.append((table, position))
+        previous = table
+    return (placed, data)
+
+def best_order(tables):
+    # Held-Karp search over orders of the tables for the most bytes shared between
+    # neighbours. Tables found inside another are placed there for free. Ties keep the
+    # listed order, so the result is always the same.
+    contained = set()
+    for (i, table) in enumerate(tables):
+        for (j, other) in enumerate(tables):
+            if i != j and table.bytes() in other.bytes() and (len(table.bytes()) < len(other.bytes()) or i > j):
+                contained.add(i)
+                break
+    main = [i for i in range(len(tables)) if i not in contained]
+    if not main:
+        return layout_in_order(tables, True)
+    shared = dict(((i, j), overlap(tables[i].bytes(), tables[j].bytes())) for i in main for j in main if i != j)
+
+    best = {}
+    for i in main:
+        best[(1 << i, i)] = (0, (i,))
+    for count in range(2, len(main) + 1):
+        for subset in itertools.combinations(main, count):
+            mask = sum(1 << i for i in subset)
+            for last in subset:
+                previous_mask = mask & ~(1 << last)
+                choices = []
+                for before in subset:
+                    if before != last and (previous_mask, before) in best:
+                        (total, order) = best[(previous_mask, before)]
+                        choices.append((-(total + shared[(before, last)]), order + (last,)))
+                if choices:
+                    (total, order) = min(choices)
+                    best[(mask, last)] = (-total, order)
+    full = sum(1 << i for i in main)
+    (total, order) = min((-best[(full, last)][0], best[(full, last)][1]) for last in main)
+    return layout_in_order([tables[i] for i in order] + [tables[i] for i in sorted(contained)], True)
+
+def layout(group, pack):
+    return best_order(group.tables) if pack else layout_in_order(group.tables)
+
+# ----------------------------------------------------------------------------------
+def hex_bytes(values):
+    return ", ".join("$" + format(value, "02x") for value in values)
+
+def write_group(filename, group, pack):
+    (placed, data) = layout(group, pack)
+    with open(filename, 'w') as f:
+        f.write("; Written by tools/maths_tables.py. Do not edit.\n")
+        for constant in group.constants:
+            f.write("\n; " + constant.formula + "\n")
+            f.write(constant.name + " = " + str(constant.value) + "\n")
+
+        starts = sorted(set(offset for (table, offset) in placed))
+        for (index, start) in enumerate(starts):
+            end = starts[index + 1] if index + 1 < len(starts) else len(data)
+            f.write("\n")
+            for (table, offset) in placed:
+                if offset == start:
+                    note = ""
+                    if offset + len(table.bytes()) > end:
+                        note = " (runs on into the following bytes)"
+                    f.write("; " + table.formula + note + "\n")
+            for (table, offset) in placed:
+                if offset == start:
+                    f.write(table.name + "\n")
+            for line in range(start, end, 8):
+                f.write("    !byte " + hex_bytes(data[line:min(line + 8, end)]) + "\n")
+
+def report(groups, baseline_groups, pack):
+    print("table                               entries  max error  rms error")
+    for group in groups:
+        for table in group.tables:
+            print("%-34s  %7d  %9.3f  %9.3f" % (table.name, len(table.values), table.max_error(), table.rms_error()))
+        for constant in group.constants:
+            print("%-34s  %7d  %9.3f  %9.3f" % (constant.name, 1, abs(constant.value - constant.ideal), abs(constant.value - constant.ideal)))
+    print("")
+
+    print("file                 tables  listed order  best order  baseline")
+    total = [0, 0, 0]
+    for (group, baseline) in zip(groups, baseline_groups):
+        listed = len(layout_in_order(group.tables)[1])
+        (placed, data) = best_order(group.tables)
+        baseline_size = len(layout_in_order(baseline.tables)[1])
+        print("%-19s  %6d  %12d  %10d  %8d   best: %s" % (group.filename, len(group.tables), listed, len(data), baseline_size, ", ".join(table.name for (table, offset) in placed)))
+        total = [total[0] + listed, total[1] + len(data), total[2] + baseline_size]
+    everything = [table for group in groups for table in group.tables]
+    together = len(best_order(everything)[1])
+    print("%-19s  %6d  %12d  %10d  %8d" % ("total", len(everything), total[0], total[1], total[2]))
+    print("")
+    used = total[1] if pack else total[0]
+    print("bytes used: " + str(used) + " (" + ("best" if pack else "listed") + " order), " + "%+d" % (used - total[2]) + " against the baseline")
+    print("all tables in one place, best order: " + str(together) + " bytes (" + str(total[2] - together) + " fewer than the baseline)")
+
+def circle_mismatch(filename, groups):
+    # the enemy designs are drawn on the circle of sine_table and cosine_table. Returns
+    # the points the circle should have, or None if it has them.
+    (circle, enemies, header) = enemy_arcs.read_description(filename)
+    trig = dict((table.name, table.values) for table in groups[0].tables)
+    expected = list(zip(trig["sine_table"], trig["cosine_table"]))
+    if [tuple(point) for point in circle.points] != expected:
+        return expected
+    return None
+
+def print_circle(points):
+    # in the form of the 'circle' section of an enemy description
+    print("circle")
+    for row in range(0, len(points), 8):
+        print("".join(("%d,%d" % point).rjust(7) for point in points[row:row + 8]))
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Make the maths tables from their formulas, and report their errors and the bytes they share")
+all_args.add_argument("--output", metavar="DIR", help="write trig_tables.a, segment_tables.a and angle_tables.a to this directory (e.g. build)")
+all_args.add_argument("--pack", action="store_true", help="order each file's tables to share the most bytes")
+all_args.add_argument("--report", action="store_true", help="list the errors of each table and the bytes each order uses")
+all_args.add_argument("--sine-amplitude", type=float, default=5.75, help="radius of the sine_table circle, in pixels")
+all_args.add_argument("--rotation-step", type=float, default=1.0 / 128, help="starship rotation per step, in radians")
+all_args.add_argument("--circle", default="source/enemies.txt", help="check the circle in this enemy description matches sine_table and cosine_table, and don't write the tables if not (\"\" to skip the check)")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    groups = make_groups(args)
+    expected = circle_mismatch(args.circle, groups) if args.circle and os.path.exists(args.circle) else None
+    if expected is not None:
+        if args.output:
+            print("error: the circle in " + args.circle + " is not (sine_table, cosine_table), so the enemy designs would be drawn with a different circle.")
+            print("Replace its 'circle' section with the one below (and check the designs with 'python3 tools/enemy_arcs.py --report --show'), or give --circle \"\" to write the tables anyway:")
+            print_circle(expected)
+            sys.exit(1)
+        print("note: the circle in " + args.circle + " is not (sine_table, cosine_table) for these options, so --output would stop")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        for group in groups:
+            write_group(os.path.join(args.output, group.filename), group, args.pack)
+    if args.report:
+        report(groups, make_groups(all_args.parse_args([])), args.pack)
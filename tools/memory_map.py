@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import acme_output
+import mos6502
+import page_check
+
+# Maps the memory used by each variant, from the symbol and report files acme writes for
+# it (see build_exe in go_acme), and checks each against a size budget.
+#
+# All four builds load at load_addr and run up to the screen at &5800. Everything up to
+# the label 'resident_end' (in memory_budget.json) must fit below the screen; the
+# one-off initialisation code after it is overwritten when the screen is cleared. Each
+# variant has a budget: the most bytes allowed from load_addr to resident_end. It is
+# worked out from the variant's own load_addr and the screen start, less the bytes that
+# variant must keep free below the screen ('reserve' in memory_budget.json). A variant
+# over its budget fails the build.
+#
+# The variants share the source, so STAR.tape, the largest, reaches the screen first.
+# Nothing is kept between resident_end and the screen once the game is running, so its
+# reserve is 0: its budget is all the memory up to the screen, the same limit as acme's
+# own "code overflowed" error. Each of the others reserves the bytes by which it is
+# smaller than STAR.tape: a change that grows every variant alike hits all four budgets
+# together, and code that grows only one variant (Electron or disc only, say) fails that
+# variant as soon as it uses more than STAR.tape has left, rather than only once it
+# reaches the screen itself. When a change alters the difference between the variants on
+# purpose, update the reserves.
+#
+# The memory map lists, in address order:
+#
+#   zero page   each address an instruction reads or writes, and the free bytes
+#   workspace   the tables at fixed addresses below load_addr that instructions use
+#   resident    each routine or table (from one global label to the next) and its size
+#   init        the initialisation code after resident_end
+#   screen      the fixed screen addresses used
+#
+# Zero page, workspace and screen are found from the addresses in the instructions: a
+# table indexed by X or Y is taken to run to the next address named (up to 256 bytes),
+# or outside zero page, the next symbol.
+#
+# Each run adds the sizes to a JSON history (build/memory_history.json by default),
+# if they have changed since the last entry, and lists what grew or shrank.
+
+variants = ["STAR", "STAR.tape", "STARELK", "STARELK.tape"]
+
+default_budget = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_budget.json")
+
+indexed_modes = (mos6502.ZPX, mos6502.ZPY, mos6502.ABSX, mos6502.ABSY)
+name_pattern = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+class Block:
+    # A range of memory with the names it is known by
+    def __init__(self, start, end, names, kind):
+        self.start = start
+        self.end = end
+        self.names = names
+        self.kind = kind
+
+    def size(self):
+        return self.end - self.start
+
+    def name(self):
+        return " / ".join(self.names)
+
+class Layout:
+    # The memory used by one variant
+    def __init__(self, variant, build_dir, config):
+        self.variant = variant
+        self.symbols = acme_output.read_symbols(acme_output.symbols_filename(variant, build_dir))
+        report = acme_output.read_report(acme_output.report_filename(variant, build_dir))
+        (self.items, self.labels) = page_check.read_items(report)
+        self.screen_start = int(config["screen_start"], 16)
+        self.load_addr = self.symbols["load_addr"]
+        self.eof = self.symbols["eof"]
+        self.resident_end = self.symbols[config["resident_end"]]
+        self.references = self.find_references()
+
+    def find_references(self):
+        # address -> (names used for it, whether it is indexed, whether it is a pointer)
+        references = {}
+        for item in self.items:
+            instruction = item.instruction
+            if instruction is None or instruction.size < 2 or instruction.mode in (mos6502.IMM, mos6502.REL):
+                continue
+            address = item.operand()
+            names = [name for name in name_pattern.findall(item.line.code().split(None, 1)[-1]) if self.symbols.get(name) == address]
+            (known, indexed, pointer) = references.get(address, (set(), False, False))
+            references[address] = (known | set(names), indexed or instruction.mode in indexed_modes, pointer or instruction.mode in (mos6502.INDX, mos6502.INDY, mos6502.IND))
+        return references
+
+    def size(self):
+        return self.eof - self.load_addr
+
+    def resident(self):
+        return self.resident_end - self.load_addr
+
+    def free(self):
+        return self.screen_start - self.resident_end
+
+    def budget(self, reserve):
+        return self.screen_start - self.load_addr - reserve
+
+    def referenced_blocks(self, start, end, kind, bounded=True):
+        # Blocks for the addresses used in [start, end). A block starts at each address an
+        # instruction names, and takes in the unnamed addresses after it (table + 1, ...).
+        # It runs to the last address used, or up to 256 bytes on if indexed, but stops at
+        # the next address named (or with 'bounded', the next symbol of any kind).
+        addresses = sorted(address for address in self.references if start <= address < end)
+        named = [address for address in addresses if self.references[address][0]]
+        boundaries = set(named)
+        if bounded:
+            boundaries.update(value for value in self.symbols.values() if start <= value < end)
+        boundaries = sorted(boundaries) + [end]
+        blocks = []
+        for address in addresses:
+            (names, indexed, pointer) = self.references[address]
+            reach = address + (256 if indexed else 2 if pointer else 1)
+            if blocks and not names and address < blocks[-1].limit:
+                blocks[-1].end = min(blocks[-1].limit, max(blocks[-1].end, reach))
+                continue
+            limit = min(boundary for boundary in boundaries if boundary > address)
+            if names:
+                label = sorted(names)
+            elif blocks and blocks[-1].names[0][0] != "&":
+                label = [blocks[-1].names[0] + "+" + str(address - blocks[-1].start)]
+            else:
+                label = ["&" + format(address, "04X")]
+            block = Block(address, min(limit, reach), label, kind)
+            block.limit = limit
+            blocks.append(block)
+        return blocks
+
+    def zero_page(self):
+        # (so many constants are below &100 that only named addresses bound the blocks)
+        return self.referenced_blocks(0, 0x100, "zero page", bounded=False)
+
+    def zero_page_used(self):
+        used = set()
+        for block in self.zero_page():
+            used.update(range(block.start, block.end))
+        return len(used)
+
+    def workspace(self):
+        return self.referenced_blocks(0x100, self.load_addr, "workspace")
+
+    def screen(self):
+        return self.referenced_blocks(self.screen_start, 0x8000, "screen")
+
+    def routines(self):
+        # Each global label from load_addr to eof, up to the next, as code or data
+        starts = sorted(set((address, name) for (name, address) in self.labels.items() if name[0] not in ".+-" and self.load_addr <= address < self.eof))
+        blocks = []
+        for (index, (address, name)) in enumerate(starts):
+            if blocks and blocks[-1].start == address:
+                blocks[-1].names.append(name)
+                continue
+            end = starts[index + 1][0] if index + 1 < len(starts) else self.eof
+            while index + 1 < len(starts) and starts[index + 1][0] == address:
+                index += 1
+                end = starts[index + 1][0] if index + 1 < len(starts) else self.eof
+            kind = "init" if address >= self.resident_end else "resident"
+            blocks.append(Block(address, end, [name], kind))
+        for block in blocks:
+            inside = [item for item in self.items if block.start <= item.address < block.end]
+            block.code = any(item.instruction is not None for item in inside)
+        return blocks
+
+def read_config(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def read_history(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return json.load(f)
+
+def write_history(filename, history):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(history, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def record(layouts):
+    entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": git_commit(), "variants": {}}
+    for layout in layouts:
+        entry["variants"][layout.variant] = {
+            "size": layout.size(),
+            "resident": layout.resident(),
+            "free": layout.free(),
+            "zero_page": layout.zero_page_used(),
+            "routines": dict((block.name(), block.size()) for block in layout.routines()),
+        }
+    return entry
+
+def hexes(address):
+    return "&" + format(address, "04X")
+
+def print_summary(layouts, budgets):
+    print("variant        load    resident end  eof     size   resident  budget  free below screen  zero page")
+    for layout in layouts:
+        budget = budgets[layout.variant]
+        print("%-13s  %s  %-12s  %s  %5d  %8d  %6s  %17d  %5d/256" % (layout.variant, hexes(layout.load_addr), hexes(layout.resident_end), hexes(layout.eof), layout.size(), layout.resident(), budget if budget is not None else "-", layout.free(), layout.zero_page_used()))
+
+def print_map(layout):
+    print("Memory map of " + layout.variant)
+    print("")
+    sections = [
+        ("zero page", layout.zero_page()),
+        ("workspace", layout.workspace()),
+        ("resident code and data", [block for block in layout.routines() if block.kind == "resident"]),
+        ("init (overwritten by the screen)", [block for block in layout.routines() if block.kind == "init"]),
+        ("screen", layout.screen()),
+    ]
+    for (title, blocks) in sections:
+        if not blocks:
+            continue
+        total = sum(block.size() for block in blocks)
+        print("%s: %s-%s, %d bytes" % (title, hexes(blocks[0].start), hexes(blocks[-1].end - 1), total))
+        previous = blocks[0].start
+        for block in blocks:
+            if block.start > previous:
+                print("    %s  %5d  (unused)" % (hexes(previous), block.start - previous))
+            kind = ("code" if block.code else "data") if hasattr(block, "code") else ""
+            print("    %s  %5d  %-4s  %s" % (hexes(block.start), block.size(), kind, block.name()))
+            previous = max(previous, block.end)
+        print("")
+
+def print_routines(layouts, limit):
+    sizes = [dict((block.name(), block) for block in layout.routines()) for layout in layouts]
+    names = set()
+    for table in sizes:
+        names.update(table)
+    def largest(name):
+        return max(table[name].size() for table in sizes if name in table)
+    print("%-50s" % "routine or table" + "".join("%14s" % layout.variant for layout in layouts))
+    for name in sorted(names, key=lambda name: (-largest(name), name))[0:limit]:
+        print("%-50s" % name + "".join("%14s" % (table[name].size() if name in table else "-") for table in sizes))
+
+def print_changes(previous, current):
+    for (variant, now) in sorted(current["variants"].items()):
+        before = previous["variants"].get(variant)
+        if before is None:
+            continue
+        change = now["size"] - before["size"]
+        resident_change = now["resident"] - before["resident"]
+        if change == 0 and resident_change == 0:
+            continue
+        print("%s: %+d bytes (resident %+d) since %s%s" % (variant, change, resident_change, previous["time"], " (" + previous["commit"] + ")" if previous.get("commit") else ""))
+        routines = set(now["routines"]) | set(before["routines"])
+        changed = [(now["routines"].get(name, 0) - before["routines"].get(name, 0), name) for name in routines]
+        for (difference, name) in sorted(changed, key=lambda change: (-abs(change[0]), change[1]))[0:8]:
+            if difference:
+                print("    %+6d  %s" % (difference, name))
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Map the memory used by each variant, track its size and check it against a budget")
+all_args.add_argument("variants", nargs="*", default=variants, help="variants to map (default: all four)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--budget", default=default_budget, help="file giving the screen start, the end of the resident code and the bytes each variant keeps free below the screen")
+all_args.add_argument("--history", default=None, help="JSON history of sizes (default: <build>/memory_history.json)")
+all_args.add_argument("--no-history", action="store_true", help="don't add to the history")
+all_args.add_argument("--map", action="store_true", help="print the memory map of each variant")
+all_args.add_argument("--routines", type=int, metavar="N", help="list the N largest routines and tables in each variant")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    config = read_config(args.budget)
+    layouts = [Layout(variant, args.build, config) for variant in args.variants]
+    missing = [layout.variant for layout in layouts if layout.variant not in config["reserve"]]
+    if missing:
+        for variant in missing:
+            print("error: no reserve for " + variant + " in " + args.budget)
+        sys.exit(1)
+    budgets = dict((layout.variant, layout.budget(config["reserve"][layout.variant])) for layout in layouts)
+
+    print_summary(layouts, budgets)
+    print("")
+    if args.map:
+        for layout in layouts:
+            print_map(layout)
+    if args.routines:
+        print_routines(layouts, args.routines)
+        print("")
+
+    if not args.no_history:
+        history_filename = args.history or os.path.join(args.build, "memory_history.json")
+        history = read_history(history_filename)
+        entry = record(layouts)
+        if history:
+            print_changes(history[-1], entry)
+        if not history or history[-1]["variants"] != entry["variants"]:
+            history.append(entry)
+            write_history(history_filename, history)
+
+    failures = []
+    for layout in layouts:
+        budget = budgets[layout.variant]
+        if layout.free() < 0:
+            failures.append(layout.variant + " overlaps the screen at " + hexes(layout.screen_start) + " by " + str(-layout.free()) + " bytes")
+        elif layout.resident() > budget:
+            failures.append(layout.variant + " is " + str(layout.resident() - budget) + " bytes over its budget of " + str(budget) + " bytes (" + str(layout.resident()) + " bytes from load_addr to " + config["resident_end"] + ", keeping " + str(config["reserve"][layout.variant]) + " bytes free below the screen)")
+    if failures:
+        for failure in failures:
+            print("error: " + failure)
+        print("Make room, or lower the variant's reserve in " + args.budget + ".")
+        sys.exit(1)
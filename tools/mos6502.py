@@ -0,0 +1,120 @@
+# Instruction set data for the (NMOS) 6502, as used by the BBC Micro and Electron.
+#
+# Each entry gives the opcode, the size in bytes and the base number of cycles for a
+# mnemonic and addressing mode. 'page_penalty' marks the instructions that take one
+# extra cycle when the indexed address crosses a 256 byte page. Branches take one extra
+# cycle when taken, and another if the destination is in a different page.
+
+# addressing modes
+IMP  = "imp"     # implied                   rts
+ACC  = "acc"     # accumulator               asl
+IMM  = "imm"     # immediate                 lda #1
+ZP   = "zp"      # zero page                 lda $70
+ZPX  = "zpx"     # zero page,X               lda $70,X
+ZPY  = "zpy"     # zero page,Y               ldx $70,Y
+ABS  = "abs"     # absolute                  lda $1234
+ABSX = "absx"    # absolute,X                lda $1234,X
+ABSY = "absy"    # absolute,Y                lda $1234,Y
+IND  = "ind"     # indirect                  jmp ($1234)
+INDX = "indx"    # (indirect,X)              lda ($70,X)
+INDY = "indy"    # (indirect),Y              lda ($70),Y
+REL  = "rel"     # relative                  bne label
+
+mode_sizes = {
+    IMP: 1, ACC: 1, IMM: 2, ZP: 2, ZPX: 2, ZPY: 2, ABS: 3, ABSX: 3, ABSY: 3, IND: 3, INDX: 2, INDY: 2, REL: 2,
+}
+
+class Instruction:
+    def __init__(self, opcode, mnemonic, mode, cycles, page_penalty):
+        self.opcode = opcode
+        self.mnemonic = mnemonic
+        self.mode = mode
+        self.size = mode_sizes[mode]
+        self.cycles = cycles
+        self.page_penalty = page_penalty
+
+# mnemonic: list of (mode, opcode, cycles), with a '*' after the cycles if a page
+# crossing adds a cycle
+instruction_data = """
+adc imm 69 2  zp 65 3  zpx 75 4  abs 6d 4  absx 7d 4*  absy 79 4*  indx 61 6  indy 71 5*
+and imm 29 2  zp 25 3  zpx 35 4  abs 2d 4  absx 3d 4*  absy 39 4*  indx 21 6  indy 31 5*
+asl acc 0a 2  zp 06 5  zpx 16 6  abs 0e 6  absx 1e 7
+bcc rel 90 2
+bcs rel b0 2
+beq rel f0 2
+bit zp 24 3  abs 2c 4
+bmi rel 30 2
+bne rel d0 2
+bpl rel 10 2
+brk imp 00 7
+bvc rel 50 2
+bvs rel 70 2
+clc imp 18 2
+cld imp d8 2
+cli imp 58 2
+clv imp b8 2
+cmp imm c9 2  zp c5 3  zpx d5 4  abs cd 4  absx dd 4*  absy d9 4*  indx c1 6  indy d1 5*
+cpx imm e0 2  zp e4 3  abs ec 4
+cpy imm c0 2  zp c4 3  abs cc 4
+dec zp c6 5  zpx d6 6  abs ce 6  absx de 7
+dex imp ca 2
+dey imp 88 2
+eor imm 49 2  zp 45 3  zpx 55 4  abs 4d 4  absx 5d 4*  absy 59 4*  indx 41 6  indy 51 5*
+inc zp e6 5  zpx f6 6  abs ee 6  absx fe 7
+inx imp e8 2
+iny imp c8 2
+jmp abs 4c 3  ind 6c 5
+jsr abs 20 6
+lda imm a9 2  zp a5 3  zpx b5 4  abs ad 4  absx bd 4*  absy b9 4*  indx a1 6  indy b1 5*
+ldx imm a2 2  zp a6 3  zpy b6 4  abs ae 4  absy be 4*
+ldy imm a0 2  zp a4 3  zpx b4 4  abs ac 4  absx bc 4*
+lsr acc 4a 2  zp 46 5  zpx 56 6  abs 4e 6  absx 5e 7
+nop imp ea 2
+ora imm 09 2  zp 05 3  zpx 15 4  abs 0d 4  absx 1d 4*  absy 19 4*  indx 01 6  indy 11 5*
+pha imp 48 3
+php imp 08 3
+pla imp 68 4
+plp imp 28 4
+rol acc 2a 2  zp 26 5  zpx 36 6  abs 2e 6  absx 3e 7
+ror acc 6a 2  zp 66 5  zpx 76 6  abs 6e 6  absx 7e 7
+rti imp 40 6
+rts imp 60 6
+sbc imm e9 2  zp e5 3  zpx f5 4  abs ed 4  absx fd 4*  absy f9 4*  indx e1 6  indy f1 5*
+sec imp 38 2
+sed imp f8 2
+sei imp 78 2
+sta zp 85 3  zpx 95 4  abs 8d 4  absx 9d 5  absy 99 5  indx 81 6  indy 91 6
+stx zp 86 3  zpy 96 4  abs 8e 4
+sty zp 84 3  zpx 94 4  abs 8c 4
+tax imp aa 2
+tay imp a8 2
+tsx imp ba 2
+txa imp 8a 2
+txs imp 9a 2
+tya imp 98 2
+"""
+
+# instructions indexed by opcode, and by (mnemonic, mode)
+by_opcode = {}
+by_mnemonic_mode = {}
+
+for line in instruction_data.strip().splitlines():
+    fields = line.split()
+    mnemonic = fields[0]
+    for i in range(1, len(fields), 3):
+        cycles = fields[i + 2]
+        instruction = Instruction(int(fields[i + 1], 16), mnemonic, fields[i], int(cycles.rstrip("*")), cycles.endswith("*"))
+        by_opcode[instruction.opcode] = instruction
+        by_mnemonic_mode[(mnemonic, instruction.mode)] = instruction
+
+mnemonics = set(mnemonic for (mnemonic, mode) in by_mnemonic_mode)
+branches = set(["bcc", "bcs", "beq", "bmi", "bne", "bpl", "bvc", "bvs"])
+
+def lookup(mnemonic, mode):
+    # Returns the Instruction for a mnemonic and addressing mode, or None if there isn't one
+    return by_mnemonic_mode.get((mnemonic.lower(), mode))
+
+def has_zero_page_form(mnemonic, mode):
+    # Would an absolute mode be assembled as zero page for an operand below $100?
+    zp_mode = { ABS: ZP, ABSX: ZPX, ABSY: ZPY }.get(mode)
+    return zp_mode is not None and lookup(mnemonic, zp_mode) is not None
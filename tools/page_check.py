@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+import acme_output
+import mos6502
+
+# Finds the places where a page boundary costs an extra cycle, from the report files acme
+# writes for each variant (see build_exe in go_acme):
+#
+#   branches    a taken branch whose target is in a different page to the next instruction
+#   tables      an abs,X / abs,Y read (lda, adc, cmp, ...) of a table that spans a page
+#               boundary, so that some index values cross it. A table runs from the
+#               address read to the next label (or the end of the data).
+#
+# Each crossing is weighted by the loops around it: every backward branch or jump makes a
+# loop, and each loop an instruction is inside multiplies its weight by --loop-weight.
+#
+# Hot routines (and the crossings already known in them, per variant) are listed in
+# page_check.json. A crossing in a hot routine that isn't already known fails the build.
+# Run with --update to accept the current crossings; the file is only written then. A
+# variant that is not in the file is an error (run --update to add it).
+
+variants = ["STAR", "STAR.tape", "STARELK", "STARELK.tape"]
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "page_check.json")
+
+label_pattern = re.compile(r'^(\.?[A-Za-z_][A-Za-z0-9_]*|[-+]+)$')
+data_directives = ("!byte", "!by", "!08", "!word", "!wo", "!16", "!32", "!text", "!tx", "!raw", "!fill", "!fi", "!bin", "!binary")
+
+class Item:
+    # An instruction or piece of data at an address
+    def __init__(self, line, address, size, instruction=None):
+        self.line = line
+        self.address = address
+        self.size = size
+        self.instruction = instruction
+        self.routine = None             # the global label the item is under
+        self.depth = 0                  # number of loops the item is inside
+
+    def operand(self):
+        if self.size == 3:
+            return self.line.data[1] | (self.line.data[2] << 8)
+        return self.line.data[1]
+
+    def branch_target(self):
+        offset = self.line.data[1]
+        if offset >= 0x80:
+            offset -= 0x100
+        return (self.address + 2 + offset) & 0xffff
+
+    def text(self):
+        return " ".join(self.line.code().split())
+
+class Crossing:
+    def __init__(self, variant, item, kind, detail, weight):
+        self.variant = variant
+        self.item = item
+        self.kind = kind
+        self.detail = detail
+        self.weight = weight
+
+    def key(self):
+        # identifies the crossing from one build to the next, as addresses move about
+        return self.item.routine + ": " + self.item.text()
+
+def read_items(report):
+    # Returns the instructions and data of a report in address order, with a dictionary
+    # of the labels found (name -> address)
+    items = []
+    labels = {}
+    pending = []
+    for (index, line) in enumerate(report):
+        code = line.code()
+        if line.address is None:
+            if label_pattern.match(code) and code.lower() not in mos6502.mnemonics:
+                pending.append(code)
+            continue
+
+        words = code.split(None, 1)
+        if not words:
+            continue
+        if label_pattern.match(words[0]) and words[0].lower() not in mos6502.mnemonics and len(words) > 1:
+            pending.append(words[0])
+            words = words[1].split(None, 1)
+        first = words[0].lower()
+        if first in mos6502.mnemonics and line.data:
+            instruction = mos6502.by_opcode.get(line.data[0])
+            if instruction is None:
+                continue
+            item = Item(line, line.address, instruction.size, instruction)
+        elif first in data_directives:
+            size = len(line.data)
+            if line.truncated:
+                # the size is up to the next line with an address
+                for following in report[index + 1:]:
+                    if following.address is not None:
+                        size = following.address - line.address
+                        break
+            item = Item(line, line.address, size)
+        else:
+            continue
+        for name in pending:
+            labels[name] = item.address
+        pending = []
+        items.append(item)
+    items.sort(key=lambda item: item.address)
+    return (items, labels)
+
+def data_runs(items):
+    # Returns a list of (start, end) of each run of consecutive data
+    runs = []
+    for item in items:
+        if item.instruction is not None:
+            continue
+        if runs and runs[-1][1] == item.address:
+            runs[-1][1] = item.address + item.size
+        else:
+            runs.append([item.address, item.address + item.size])
+    return runs
+
+def find_loops(items):
+    # Returns (start, end) of each loop: from the target of a backward branch or jump
+    # to the end of the branch or jump. A branch back to an rts or jmp is just a way out.
+    by_address = dict((item.address, item) for item in items)
+    loops = []
+    for item in items:
+        instruction = item.instruction
+        if instruction is None:
+            continue
+        if instruction.mode == mos6502.REL:
+            target = item.branch_target()
+        elif instruction.mnemonic == "jmp" and instruction.mode == mos6502.ABS:
+            target = item.operand()
+        else:
+            continue
+        exit = by_address.get(target)
+        if exit is not None and exit.instruction is not None and exit.instruction.mnemonic in ("rts", "rti", "jmp"):
+            continue
+        if target <= item.address and item.address - target < 0x400:
+            loops.append((target, item.address + item.size))
+    return loops
+
+def analyse(variant, report, loop_weight):
+    (items, labels) = read_items(report)
+    global_labels = sorted((address, name) for (name, address) in labels.items() if name[0] not in ".+-")
+    label_index = 0
+    routine = "?"
+    for item in items:
+        while label_index < len(global_labels) and global_labels[label_index][0] <= item.address:
+            routine = global_labels[label_index][1]
+            label_index += 1
+        item.routine = routine
+
+    loops = find_loops(items)
+    for item in items:
+        item.depth = sum(1 for (start, end) in loops if start <= item.address < end)
+
+    runs = data_runs(items)
+    label_addresses = sorted(set(labels.values()))
+    crossings = []
+    for item in items:
+        instruction = item.instruction
+        if instruction is None:
+            continue
+        weight = loop_weight ** item.depth
+        if instruction.mode == mos6502.REL:
+            target = item.branch_target()
+            following = item.address + 2
+            if (target >> 8) != (following >> 8):
+                crossings.append(Crossing(variant, item, "branch", "taken branch to &" + format(target, "04X") + " crosses from page &" + format(following >> 8, "02X"), weight))
+        elif instruction.page_penalty and instruction.mode in (mos6502.ABSX, mos6502.ABSY):
+            base = item.operand()
+            for (start, end) in runs:
+                if start <= base < end:
+                    # the table ends at the next label, or the end of the data
+                    following = [address for address in label_addresses if address > base]
+                    if following:
+                        end = min(end, following[0])
+                    last = min(end, base + 0x100) - 1
+                    if (base >> 8) != (last >> 8):
+                        crossings.append(Crossing(variant, item, "table", "table &" + format(base, "04X") + "-&" + format(last, "04X") + " crosses &" + format(last & 0xff00, "04X"), weight))
+                    break
+    return (crossings, items, labels)
+
+def hot_extent(name, labels, items):
+    # A hot routine runs from its label to the end of the last branch or jump back to the
+    # label (so a named loop is just the loop) or else to the next global label
+    start = labels[name]
+    end = None
+    for item in items:
+        instruction = item.instruction
+        if instruction is None or item.address < start:
+            continue
+        if instruction.mode == mos6502.REL and item.branch_target() == start:
+            end = item.address + item.size
+        elif instruction.mnemonic == "jmp" and instruction.mode == mos6502.ABS and item.operand() == start:
+            end = item.address + item.size
+    if end is None:
+        later = [address for (label, address) in labels.items() if address > start and label[0] not in ".+-"]
+        end = min(later) if later else 0x10000
+    return (start, end)
+
+def read_baseline(filename):
+    if not os.path.exists(filename):
+        return {"hot": [], "known": {}}
+    with open(filename) as f:
+        return json.load(f)
+
+def write_baseline(filename, baseline):
+    with open(filename, "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+def print_crossings(crossings, hot_keys):
+    print("    variant        address  weight  kind    routine / instruction")
+    for crossing in sorted(crossings, key=lambda c: (-c.weight, c.variant, c.item.address)):
+        item = crossing.item
+        mark = "*" if (crossing.variant, crossing.key()) in hot_keys else " "
+        print("  %s %-14s &%04X  %7d  %-6s  %s: %s   (%s)" % (mark, crossing.variant, item.address, crossing.weight, crossing.kind, item.routine, item.text(), crossing.detail))
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="List the branches and indexed table reads that cross a page boundary, and check hot routines for new ones")
+all_args.add_argument("variants", nargs="*", default=variants, help="variants to check (default: all four)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--baseline", default=default_baseline, help="file listing the hot routines and their known crossings")
+all_args.add_argument("--loop-weight", type=int, default=8, help="weight multiplier for each loop around a crossing")
+all_args.add_argument("--hot-only", action="store_true", help="only list crossings in hot routines")
+all_args.add_argument("--update", action="store_true", help="accept the current crossings in hot routines as known")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    baseline = read_baseline(args.baseline)
+    known = baseline.setdefault("known", {})
+    changed = False
+    failures = []
+    missing = []
+    all_crossings = []
+    hot_keys = set()
+    for variant in args.variants:
+        report = acme_output.read_report(acme_output.report_filename(variant, args.build))
+        (crossings, items, labels) = analyse(variant, report, args.loop_weight)
+
+        extents = []
+        for name in baseline.get("hot", []):
+            if name not in labels:
+                print("warning: hot routine '" + name + "' not found in " + variant)
+                continue
+            extents.append((name, hot_extent(name, labels, items)))
+
+        hot = []
+        for crossing in crossings:
+            for (name, (start, end)) in extents:
+                if start <= crossing.item.address < end:
+                    hot.append(crossing)
+                    hot_keys.add((variant, crossing.key()))
+                    break
+
+        keys = sorted(set(crossing.key() for crossing in hot))
+        if args.update:
+            if known.get(variant) != keys:
+                known[variant] = keys
+                changed = True
+        elif variant not in known:
+            missing.append(variant)
+        else:
+            for crossing in hot:
+                if crossing.key() not in known[variant]:
+                    failures.append(crossing)
+        all_crossings += hot if args.hot_only else crossings
+
+    print_crossings(all_crossings, hot_keys)
+    print("")
+    print(str(len(all_crossings)) + " page crossings (* in a hot routine)")
+    if changed:
+        write_baseline(args.baseline, baseline)
+        print("Known crossings in hot routines written to " + args.baseline)
+    if failures or missing:
+        print("")
+        for variant in missing:
+            print("error: no known crossings for " + variant + " in " + args.baseline + " (run 'python3 tools/page_check.py --update " + variant + "' to record them)")
+        for crossing in failures:
+            print("error: new page crossing in hot routine (" + crossing.variant + "): " + crossing.key() + " at &" + format(crossing.item.address, "04X") + ", " + crossing.detail)
+        if failures:
+            print("Move the code or table, or run 'python3 tools/page_check.py --update' to accept it.")
+        sys.exit(1)
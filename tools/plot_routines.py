@@ -0,0 +1,724 @@
+import argparse
+import os
+import random
+import sys
+
+import enemy_arcs
+import mos6502
+import post_process
+
+# Writes the routines that plot enemy ships and explosions (plot_segment and the routines
+# it uses) from one description, as build/plot_chain.a, build/plot_tables.a and
+# build/plot_segment.a for starcommand_acme.asm to include:
+#
+#   plot_chain.a    the macros that plot a pixel and step in each of the eight directions,
+#                   and plus_angle0 onwards: one step for each point of the circle in
+#                   source/enemies.txt, going round one and a bit times
+#   plot_tables.a   plot_table_offset and plot_table_offset2, the address of each step
+#   plot_segment.a  plot_segment, which picks the unrolled code (plot_segment_unrolled,
+#                   for arcs of the circle), a loop (plot_segment_regular_loop, for other
+#                   segments) or a loop checking each pixel is near the centre
+#                   (plot_segment_with_boundary_checks), and the routines to move on a
+#                   character cell (leftfix, ...)
+#
+# A configuration is named like 'guard-12-inline':
+#
+#   guard       the boundary checks are only made when the centre is within --margin
+#               pixels of the edge of the screen (as the original game)
+#   always      every pixel is checked; there is no unrolled code or fast loop
+#   12          the unrolled code plots arcs of up to 12 pixels (the steps go round the
+#               circle 32 + 12 - 1 times). Longer arcs use the loop. 0 for no unrolled code.
+#   inline      the loop plots each pixel itself rather than calling eor_play_area_pixel
+#
+# The BBC and Electron can use different configurations (--bbc and --elk); the files then
+# hold both, under '!if elk'. The default is the original game's code.
+#
+# --table VARIANT assembles each configuration (with post_process.py's source reader and
+# the symbols of the VARIANT build) and runs it on the 6502 core (as benchmark.py does),
+# drawing the enemy arcs from source/enemies.txt and explosion segments at random places,
+# and checks each draws exactly what the game's own plot_segment draws. It lists the code
+# bytes against the cycles per pixel plotted, marking the configurations on the frontier:
+# those that no other configuration beats on both size and speed.
+
+default_config = "guard-" + str(enemy_arcs.max_arc_length)
+table_configs = ["always", "guard-0", "guard-0-inline", "guard-4", "guard-8", "guard-12", "guard-4-inline", "guard-8-inline", "guard-12-inline"]
+
+directions = {
+    (1, 0): "right", (1, 1): "downright", (0, 1): "down", (-1, 1): "downleft",
+    (-1, 0): "left", (-1, -1): "upleft", (0, -1): "up", (1, -1): "upright",
+}
+
+comment_column = 70
+separator = "; " + "-" * 82
+
+# the generated code is assembled here for --table, clear of the screen (and the ROM
+# the screen can be written to with rom_writes)
+test_address = 0xb000
+screen_start = 0x5800
+screen_end = 0xa000
+
+class Config:
+    def __init__(self, name):
+        parts = name.split("-")
+        self.boundary = parts[0]
+        if self.boundary not in ("guard", "always"):
+            raise ValueError("unknown boundary check '" + parts[0] + "' (guard or always)")
+        self.unroll = 0
+        self.inline = False
+        if self.boundary == "guard":
+            self.unroll = int(parts[1]) if len(parts) > 1 else enemy_arcs.max_arc_length
+            self.inline = "inline" in parts[2:]
+            if not 0 <= self.unroll <= enemy_arcs.max_arc_length:
+                raise ValueError("the unrolled code can plot 0 to " + str(enemy_arcs.max_arc_length) + " pixels")
+        self.name = name
+
+    def chain_length(self):
+        # the number of steps, each with a label plus_angleN (and one more label for the
+        # end of an arc starting at the last point)
+        return enemy_arcs.number_of_points + self.unroll - 2 if self.unroll else 0
+
+def code(text, comment=""):
+    return (("    " + text).ljust(comment_column) + "; " + comment).rstrip()
+
+# ----------------------------------------------------------------------------------
+# The steps
+macro_bodies = {
+    "left": [
+        code("dex"), code("bpl +"), code("jsr leftfix"), "+", code("eor xbit_table,X"),
+    ],
+    "right": [
+        code("inx"), code("cpx #8"), code("bne +"), code("jsr rightfix"), "+", code("eor xbit_table,X"),
+    ],
+    "up": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("dey"), code("bpl +"),
+        code("jsr upfix"), "+", code("lda xbit_table,X"),
+    ],
+    "down": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("iny"), code("cpy #8"),
+        code("bne +"), code("jsr downfix"), "+", code("lda xbit_table,X"),
+    ],
+    "downleft": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("iny"), code("dex"),
+        code("bmi .nope"), code("cpy #8"), code("bne .ok"), ".nope", code("jsr downleftfix"), ".ok", code("lda xbit_table,X"),
+    ],
+    "downright": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("inx"), code("iny"),
+        code("cpx #8"), code("beq .nope"), code("cpy #8"), code("bne .ok"), ".nope", code("jsr downrightfix"), ".ok", code("lda xbit_table,X"),
+    ],
+    "upleft": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("dex"), code("dey"),
+        code("bmi .nope"), code("cpx #$ff"), code("bne .ok"), ".nope", code("jsr upleftfix"), ".ok", code("lda xbit_table,X"),
+    ],
+    "upright": [
+        code("eor (screen_address_low),y"), code("sta (screen_address_low),y"), code("inx"), code("dey"),
+        code("bmi .nope"), code("cpx #8"), code("bne .ok"), ".nope", code("jsr uprightfix"), ".ok", code("lda xbit_table,X"),
+    ],
+}
+macro_order = ["left", "right", "up", "down", "downleft", "downright", "upleft", "upright"]
+
+def macros():
+    lines = [
+        "; macros for object drawing",
+        "; A holds the current screen modification byte",
+        "; X and Y are between 0 and 7",
+    ]
+    for name in macro_order:
+        lines.append("!macro " + name + " {")
+        lines += macro_bodies[name]
+        lines.append("}")
+    return lines
+
+def chain(config, circle):
+    lines = [separator]
+    for i in range(config.chain_length()):
+        lines.append("plus_angle" + str(i))
+        lines.append("    +" + directions[circle.step(i)])
+    lines.append("plus_angle" + str(config.chain_length()))
+    return lines
+
+def tables(config):
+    labels = ["plus_angle" + str(i) for i in range(config.chain_length() + 1)]
+    lines = ["plot_table_offset"]
+    lines += ["    !byte <" + label for label in labels]
+    lines.append("!align 255, 0")
+    lines.append("plot_table_offset2")
+    lines += ["    !byte >" + label for label in labels]
+    return lines
+
+# ----------------------------------------------------------------------------------
+# The routines
+def step_to_next_pixel(loop):
+    return [
+        "",
+        code("ldy segment_angle"),
+        code("txa"),
+        code("clc"),
+        code("adc segment_angle_to_x_deltas_table,y", "update x"),
+        code("tax"),
+        "",
+        code("lda segment_angle_to_y_deltas_table,y"),
+        code("clc"),
+        code("adc y_pixels", "update y"),
+        code("sta y_pixels"),
+        "",
+        code("tya"),
+        code("clc"),
+        code("adc segment_angle_change_per_pixel", "update angle"),
+        code("and #$1f"),
+        code("sta segment_angle"),
+        "",
+        code("dec segment_length"),
+        code("bne " + loop),
+        code("rts"),
+    ]
+
+def plot_pixel(config):
+    if not config.inline:
+        return [code("jsr eor_play_area_pixel")]
+    return [
+        code("ldy y_pixels", "plot the pixel (as eor_play_area_pixel)"),
+        code("lda play_area_row_table_high,y"),
+        code("sta screen_address_high"),
+        code("lda row_table_low,y"),
+        code("sta screen_address_low"),
+        code("ldy xandf8,x"),
+        code("lda xbit_table,x"),
+        code("eor (screen_address_low),y"),
+        code("sta (screen_address_low),y"),
+    ]
+
+def edge_check(register, margin):
+    return [
+        code("lda " + register),
+        code("cmp #" + str(margin)),
+        code("bcc plot_segment_with_boundary_checks"),
+        code("cmp #256 - " + str(margin)),
+        code("bcs plot_segment_with_boundary_checks"),
+    ]
+
+def routines(config, margin):
+    lines = []
+    if config.boundary == "always":
+        lines += ["plot_segment", "plot_segment_with_boundary_checks"]
+    else:
+        lines += [
+            "plot_segment",
+            "    ; check if we are close to the side of the screen.",
+            "    ; If not we can forego the boundary checks and run faster.",
+        ]
+        lines += edge_check("temp10", margin)
+        lines += ["!if rom_writes {", "    ; fast path now includes going off the top/bottom of the screen", "} else {"]
+        lines += edge_check("temp9", margin)
+        lines.append("}")
+        if config.unroll:
+            lines += [
+                code("lda segment_angle_change_per_pixel"),
+                code("cmp #1"),
+            ]
+            if config.unroll < enemy_arcs.max_arc_length:
+                lines += [
+                    code("bne +"),
+                    code("lda segment_length", "the unrolled code plots at most"),
+                    code("cmp #" + str(config.unroll) + " + 1", str(config.unroll) + " pixels"),
+                    code("bcc plot_segment_unrolled"),
+                    "+",
+                ]
+            else:
+                lines.append(code("beq plot_segment_unrolled"))
+        lines += [
+            "",
+            code("ldx x_pixels"),
+            "plot_segment_regular_loop",
+        ]
+        lines += plot_pixel(config)
+        lines += step_to_next_pixel("plot_segment_regular_loop")
+        lines += [
+            "",
+            separator,
+            "plot_segment_with_boundary_checks",
+        ]
+    lines += [
+        code("ldx x_pixels"),
+        "",
+        "plot_segment_loop",
+        code("jsr eor_pixel_with_boundary_check"),
+    ]
+    lines += step_to_next_pixel("plot_segment_loop")
+    if config.unroll:
+        lines += ["", separator] + unrolled_routines()
+    return lines
+
+def unrolled_routines():
+    return [
+        "plot_segment_unrolled",
+        code("ldx segment_angle", "based on start angle,"),
+        code("lda plot_table_offset,x", "look up in a table"),
+        code("sta jump_address", "the address we jump to (low byte)"),
+        code("lda plot_table_offset2,x", "look up in a table"),
+        code("sta jump_address+1", "the address we jump to (high byte)"),
+        code("txa"),
+        code("clc"),
+        code("adc segment_length", "add the segment length"),
+        code("tax"),
+        code("lda plot_table_offset-1,x"),
+        code("sta codeptr_low"),
+        code("lda plot_table_offset2-1,x"),
+        code("sta codeptr_high"),
+        code("ldy #0"),
+        code("lda (codeptr_low),Y"),
+        code("sta temp_x", "save the opcode"),
+        code("lda #$60", "opcode for RTS"),
+        code("sta (codeptr_low),Y"),
+        code("ldx x_pixels"),
+        code("ldy y_pixels"),
+        code("jsr init_object_play_area"),
+        "jump_address = * + 1",
+        code("jsr $0000"),
+        "finish_object",
+        code("eor (screen_address_low),y"),
+        code("sta (screen_address_low),y"),
+        code("lda temp_x", "recall opcode"),
+        code("ldy #0"),
+        code("sta (codeptr_low),Y"),
+        code("rts"),
+        "",
+        "init_object_play_area",
+        code("lda row_table_low,y"),
+        code("and #$f8"),
+        code("clc"),
+        code("adc xandf8,x"),
+        code("sta screen_address_low"),
+        code("lda play_area_row_table_high,y"),
+        code("adc #0"),
+        code("sta screen_address_high"),
+        code("txa"),
+        code("and #7"),
+        code("tax"),
+        code("tya"),
+        code("and #7"),
+        code("tay"),
+        code("lda xbit_table,X"),
+        code("rts"),
+        "",
+        "leftfix",
+        code("eor (screen_address_low),y"),
+        code("sta (screen_address_low),y"),
+        "leftfix2",
+        code("lda screen_address_low"),
+        code("sec"),
+        code("sbc #8"),
+        code("sta screen_address_low"),
+        code("bcs +"),
+        code("dec screen_address_high"),
+        "+",
+        code("ldx #7"),
+        code("lda #0"),
+        code("rts"),
+        "",
+        "rightfix",
+        code("eor (screen_address_low),y"),
+        code("sta (screen_address_low),y"),
+        "rightfix2",
+        code("lda screen_address_low"),
+        code("clc"),
+        code("adc #8"),
+        code("sta screen_address_low"),
+        code("bcc +"),
+        code("inc screen_address_high"),
+        "+",
+        code("ldx #0"),
+        code("lda #0"),
+        code("rts"),
+        "",
+        "downfix",
+        code("lda #$40"),
+        "downfix_with_offset",
+        code("clc"),
+        code("adc screen_address_low"),
+        code("sta screen_address_low"),
+        code("inc screen_address_high"),
+        code("bcc +"),
+        code("inc screen_address_high"),
+        "+",
+        "!if rom_writes {",
+        code("bmi offscreen_down"),
+        "}",
+        code("ldy #0"),
+        code("rts"),
+        "",
+        "downrightfix",
+        code("cpx #8", "if (x != 8) then right doesn't need fixing,"),
+        code("bne downfix", "so it must be down that does"),
+        "".ljust(comment_column) + "; (we know *something* does)",
+        "    ; right needs fixing. does down need fixing too?",
+        code("cpy #8"),
+        code("bne rightfix2", "if (y != 8) then only fix right"),
+        "",
+        "    ; fix both",
+        code("ldx #0", "fix right"),
+        code("lda #$48"),
+        code("bne downfix_with_offset", "fix down with offset (ALWAYS branch)"),
+        "",
+        "downleftfix",
+        code("cpx #$ff"),
+        code("bne downfix", "if (x != 255) then left doesn't need fixing (down does)"),
+        "",
+        "    ; left needs fixing. does down need fixing too?",
+        code("cpy #8"),
+        code("bne leftfix2", "if (y != 8) then down doesn't need fixing (left does)"),
+        "",
+        "    ; fix down and left",
+        code("ldx #7", "fix left"),
+        code("lda #$38"),
+        code("bne downfix_with_offset", "fix down with offset (ALWAYS branch)"),
+        "",
+        "upfix",
+        code("lda #$100-$40"),
+        "upfix_with_offset",
+        code("clc"),
+        code("adc screen_address_low"),
+        code("sta screen_address_low"),
+        code("lda screen_address_high"),
+        code("sbc #1"),
+        code("sta screen_address_high"),
+        "!if rom_writes {",
+        code("cmp #$58"),
+        "}",
+        code("ldy #7"),
+        "!if rom_writes {",
+        code("bcc offscreen_up"),
+        "}",
+        "-",
+        code("rts"),
+        "",
+        "!if rom_writes {",
+        "offscreen_down",
+        code("ldy #0"),
+        "    ; if screen address >$8000 then we're off the bottom",
+        "    ; we leave the address unchanged, writing to ROM (but that's OK)",
+        code("lda screen_address_high"),
+        code("cmp #$98"),
+        code("bcc -"),
+        "    ; we've just moved back onto the top of the screen",
+        "    ; subtract $4000 to reinstate the screen address",
+        "",
+        "offscreen_up",
+        "    ; if screen address <$5800 then we're off the top",
+        "    ; we add $4000 to make the address <$9800, which is also in ROM.",
+        code("eor #$c0"),
+        code("sta screen_address_high"),
+        code("rts"),
+        "}",
+        "",
+        "upleftfix",
+        code("cpx #$ff"),
+        code("bne upfix", "if (x != 255) then left doesn't need fixing (but up does)"),
+        "",
+        "    ; left needs fixing. does up need fixing too?",
+        code("cpy #$ff"),
+        code("bne leftfix2", "if (y != 255) then up doesn't need fixing (but left does)"),
+        "",
+        "    ; fix both",
+        code("ldx #7", "fix left"),
+        code("lda #$100-$40-$8"),
+        code("bne upfix_with_offset", "fix up with offset (ALWAYS branch)"),
+        "",
+        "uprightfix",
+        code("cpx #8"),
+        code("bne upfix", "if (x != 8) then right doesn't need fixing (but up does)"),
+        "",
+        "    ; fix right. does up need fixing too?",
+        code("ldx #0", "fix right"),
+        code("cpy #$ff"),
+        code("bne rightfix2", "if (y != 255) then fix right"),
+        "",
+        "    ; fix up.",
+        code("lda #$100-$40+$8"),
+        code("bne upfix_with_offset", "fix up with offset (ALWAYS branch)"),
+    ]
+
+def parts(config, circle, margin):
+    # the lines of each file for one configuration
+    return {
+        "plot_chain.a": (macros() + [""] + chain(config, circle)) if config.unroll else [],
+        "plot_tables.a": tables(config) if config.unroll else [],
+        "plot_segment.a": routines(config, margin),
+    }
+
+def write_files(directory, bbc, elk, circle, margin):
+    bbc_parts = parts(bbc, circle, margin)
+    elk_parts = parts(elk, circle, margin)
+    for filename in ("plot_chain.a", "plot_tables.a", "plot_segment.a"):
+        header = ["; Written by tools/plot_routines.py. Do not edit."]
+        if bbc.name == elk.name:
+            header.append("; " + bbc.name)
+            body = bbc_parts[filename]
+        else:
+            header.append("; " + bbc.name + " (BBC), " + elk.name + " (Electron)")
+            (first, second) = (bbc_parts[filename], elk_parts[filename])
+            body = []
+            if filename == "plot_chain.a" and first and second:
+                # the macros are the same for both
+                body = macros() + [""]
+                (first, second) = (chain(bbc, circle), chain(elk, circle))
+            body += ["!if elk=0 {"] + first + ["} else {"] + second + ["}"]
+        with open(os.path.join(directory, filename), "w") as f:
+            f.write("\n".join(header + [""] + body) + "\n")
+
+# ----------------------------------------------------------------------------------
+# Assembling generated code, for --table. The lines are read with post_process.py's
+# SourceWalker (for the '!if' blocks and macros) and assembled in two passes.
+class AssemblyError(Exception):
+    pass
+
+def defined_labels(lines):
+    names = set()
+    for line in lines:
+        name = line.split(None, 1)[0] if line.strip() else ""
+        if line and not line[0].isspace() and name[0] not in ".+-!;}" and "=" not in line:
+            names.add(name)
+        elif "=" in line and not line[0].isspace():
+            names.add(line.split("=")[0].strip())
+    return names
+
+def assemble(lines, origin, symbols):
+    # Returns (bytes, labels, padding)
+    own = defined_labels(lines)
+    external = dict((name, value) for (name, value) in symbols.items() if name not in own)
+    items = post_process.parse_source("generated", lines)
+    labels = {}
+    scopes = {}
+    anonymous = {"+": [], "-": []}
+    for final in (False, True):
+        walker = post_process.SourceWalker(symbols=dict(external, **(labels if final else {})))
+        evaluator = walker.evaluator
+        output = bytearray()
+        pc = origin
+        padding = 0
+        seen = {"+": 0, "-": 0}
+        for visit in walker.walk_items(items, True, None, None):
+            line = visit.line
+            if not visit.active or visit.macro is not None or line.block is not None or line.close:
+                continue
+            scope = id(visit.call) if visit.call is not None else None
+            evaluator.pc = pc
+            evaluator.locals = scopes.setdefault(scope, {}) if final else dict(scopes.get(scope, {}))
+            if line.label is not None:
+                if line.label in ("+", "-"):
+                    if not final:
+                        anonymous[line.label].append(pc)
+                    seen[line.label] += 1
+                elif line.label.startswith("."):
+                    scopes.setdefault(scope, {})[line.label] = pc
+                else:
+                    labels[line.label] = pc
+                    evaluator.symbols[line.label] = pc
+            if line.assignment is not None:
+                (name, expression) = line.assignment
+                value = evaluator.try_evaluate(expression)
+                if value is not None:
+                    labels[name] = value
+            elif line.directive == "!byte":
+                for argument in post_process.split_arguments(line.arguments):
+                    value = evaluator.try_evaluate(argument)
+                    if value is None and final:
+                        raise AssemblyError("can't evaluate '" + argument + "'")
+                    output.append((value or 0) & 0xff)
+                    pc += 1
+            elif line.directive == "!align":
+                (mask, value) = [evaluator.evaluate(argument) for argument in post_process.split_arguments(line.arguments)[0:2]]
+                while pc & mask != value:
+                    output.append(0)
+                    pc += 1
+                    padding += 1
+            elif line.mnemonic is not None:
+                operand = line.operand
+                mode = post_process.addressing_mode(line.mnemonic, operand, evaluator)
+                instruction = mos6502.lookup(line.mnemonic, mode)
+                if instruction is None:
+                    raise AssemblyError("no '" + line.mnemonic + "' in mode " + mode)
+                value = 0
+                if instruction.size > 1:
+                    expression = operand.lstrip("#").strip()
+                    if expression.startswith("(") and mode in (mos6502.INDX, mos6502.INDY, mos6502.IND):
+                        expression = expression[1:].split(")")[0].split(",")[0]
+                    elif mode not in (mos6502.IMM,) and "," in expression:
+                        expression = expression.rsplit(",", 1)[0]
+                    if expression == "+":
+                        targets = anonymous["+"]
+                        value = targets[seen["+"]] if seen["+"] < len(targets) else None
+                    elif expression == "-":
+                        value = anonymous["-"][seen["-"] - 1] if seen["-"] else None
+                    else:
+                        value = evaluator.try_evaluate(expression)
+                    if value is None:
+                        if final:
+                            raise AssemblyError("can't evaluate '" + expression + "'")
+                        value = pc
+                output.append(instruction.opcode)
+                if mode == mos6502.REL:
+                    offset = value - (pc + 2)
+                    if final and not -128 <= offset <= 127:
+                        raise AssemblyError("branch out of range to &" + format(value, "04X"))
+                    output.append(offset & 0xff)
+                elif instruction.size == 2:
+                    output.append(value & 0xff)
+                elif instruction.size == 3:
+                    output += bytes([value & 0xff, (value >> 8) & 0xff])
+                pc += instruction.size
+    return (bytes(output), labels, padding)
+
+# ----------------------------------------------------------------------------------
+# Measuring, for --table
+class Segment:
+    def __init__(self, centre, start, angle, length, change):
+        self.centre = centre            # (temp10, temp9)
+        self.start = start              # (x_pixels, y_pixels)
+        self.angle = angle
+        self.length = length
+        self.change = change
+
+def rotations(arcs):
+    # the arcs of an enemy's defined angles, turned by each quarter turn
+    result = []
+    for arc in arcs:
+        (x, y, start) = (arc.x, arc.y, arc.start)
+        for turn in range(4):
+            result.append((x, y, start % enemy_arcs.number_of_points, arc.length))
+            (x, y, start) = (-y, x, start + 8)
+    return result
+
+def workloads(enemies, calls, seed):
+    rng = random.Random(seed)
+    arcs = rotations([arc for enemy in enemies for angle in enemy.angles for arc in angle])
+    def arc_segment(centre):
+        (x, y, start, length) = rng.choice(arcs)
+        return Segment(centre, ((centre[0] + x) & 0xff, (centre[1] + y) & 0xff), start, length, 1)
+    def middle():
+        return (rng.randrange(32, 224), rng.randrange(32, 224))
+    def edge():
+        return (rng.choice([rng.randrange(0, 16), rng.randrange(240, 256)]), rng.randrange(32, 224))
+    def explosion():
+        (change, length) = rng.choice([(2, 7), (0xff, 6)])
+        centre = middle()
+        return Segment(centre, centre, rng.randrange(32), length, change)
+    return [
+        ("arcs", [arc_segment(middle()) for i in range(calls)]),
+        ("explosions", [explosion() for i in range(calls)]),
+        ("edge", [arc_segment(edge()) for i in range(calls)]),
+    ]
+
+def draw(machine, address, segment):
+    # Returns the cycles taken and the screen bytes changed
+    machine.reset()
+    memory = machine.cpu.memory
+    for (name, value) in (("temp10", segment.centre[0]), ("temp9", segment.centre[1]), ("x_pixels", segment.start[0]), ("y_pixels", segment.start[1]), ("segment_angle", segment.angle), ("segment_length", segment.length), ("segment_angle_change_per_pixel", segment.change)):
+        machine.set(name, value)
+    cycles = machine.cpu.call(address)
+    changed = tuple((i, memory[i]) for i in range(screen_start, screen_end) if memory[i] != machine.initial_memory[i])
+    return (cycles, changed)
+
+def measure(variant, build_dir, names, circle, margin, enemies, calls, seed):
+    import benchmark
+    machine = benchmark.Machine(variant, build_dir)
+    base_memory = machine.initial_memory
+    loads = workloads(enemies, calls, seed)
+    expected = dict((name, [draw(machine, machine.symbols["plot_segment"], segment)[1] for segment in segments]) for (name, segments) in loads)
+
+    results = []
+    for name in names:
+        config = Config(name)
+        files = parts(config, circle, margin)
+        lines = files["plot_chain.a"] + files["plot_tables.a"] + files["plot_segment.a"]
+        (image, labels, padding) = assemble(lines, test_address, machine.symbols)
+        sizes = {}
+        for filename in ("plot_chain.a", "plot_tables.a", "plot_segment.a"):
+            (data, found, padding) = assemble(files[filename], test_address, dict(machine.symbols, **labels))
+            sizes[filename] = len(data) - padding
+        memory = bytearray(base_memory)
+        memory[test_address:test_address + len(image)] = image
+        machine.initial_memory = bytes(memory)
+        cycles = {}
+        errors = []
+        for (load, segments) in loads:
+            total = 0
+            pixels = 0
+            for (segment, wanted) in zip(segments, expected[load]):
+                (taken, changed) = draw(machine, labels["plot_segment"], segment)
+                total += taken
+                pixels += segment.length
+                if changed != wanted and len(errors) < 3:
+                    errors.append(load + ": draws differently at angle " + str(segment.angle) + ", length " + str(segment.length))
+            cycles[load] = total / float(pixels)
+        machine.initial_memory = base_memory
+        results.append((config, sizes, cycles, errors))
+    return results
+
+def frontier(results):
+    # the results no other result beats on size and on every speed
+    def measures(result):
+        (config, sizes, cycles, errors) = result
+        return [sum(sizes.values())] + [cycles[load] for load in sorted(cycles)]
+    best = []
+    for result in results:
+        mine = measures(result)
+        beaten = False
+        for other in results:
+            theirs = measures(other)
+            if other is not result and all(a <= b for (a, b) in zip(theirs, mine)) and theirs != mine:
+                beaten = True
+        if not beaten:
+            best.append(result)
+    return best
+
+def print_table(variant, results):
+    on_frontier = frontier(results)
+    print("Configurations, run on the 6502 core with " + variant + "'s tables (cycles per pixel plotted)")
+    print("")
+    print("  configuration       chain  tables  routines  total bytes      arcs  explosions    edge")
+    for result in sorted(results, key=lambda result: sum(result[1].values())):
+        (config, sizes, cycles, errors) = result
+        mark = "*" if result in on_frontier else " "
+        print("%s %-18s  %6d  %6d  %8d  %11d  %8.1f  %10.1f  %6.1f" % (mark, config.name, sizes["plot_chain.a"], sizes["plot_tables.a"], sizes["plot_segment.a"], sum(sizes.values()), cycles["arcs"], cycles["explosions"], cycles["edge"]))
+        for error in errors:
+            print("      error: " + error)
+    print("")
+    print("* on the frontier: no other configuration is both smaller and faster")
+    print("(table sizes don't include the padding to align plot_table_offset2 to a page)")
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Write the enemy plotting routines for a given unrolling and boundary check strategy, or compare the strategies")
+all_args.add_argument("--output", metavar="DIR", help="write plot_chain.a, plot_tables.a and plot_segment.a to this directory (e.g. build)")
+all_args.add_argument("--bbc", default=default_config, help="configuration for the BBC builds (default: " + default_config + ")")
+all_args.add_argument("--elk", default=default_config, help="configuration for the Electron builds (default: " + default_config + ")")
+all_args.add_argument("--margin", type=int, default=16, help="with 'guard', use the fast code when the centre is this many pixels from the edges")
+all_args.add_argument("--enemies", default="source/enemies.txt", help="enemy descriptions, for the circle and the arcs drawn")
+all_args.add_argument("--table", metavar="VARIANT", help="assemble and time each configuration against this build (e.g. STAR)")
+all_args.add_argument("--configs", help="comma separated configurations for --table (default: " + ",".join(table_configs) + ")")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--calls", type=int, default=200, help="segments drawn for each kind of --table measurement")
+all_args.add_argument("--seed", type=int, default=1, help="random number seed for the segments drawn")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    (circle, enemies, header) = enemy_arcs.read_description(args.enemies)
+    try:
+        (bbc, elk) = (Config(args.bbc), Config(args.elk))
+        names = args.configs.split(",") if args.configs else table_configs
+        for name in names:
+            Config(name)
+    except ValueError as e:
+        all_args.error(str(e))
+    for i in range(enemy_arcs.number_of_points + enemy_arcs.max_arc_length):
+        if circle.step(i) not in directions:
+            print("error: step " + str(i) + " of the circle is " + str(circle.step(i)) + ", not one pixel in any direction")
+            sys.exit(1)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        write_files(args.output, bbc, elk, circle, args.margin)
+    if args.table:
+        results = measure(args.table, args.build, names, circle, args.margin, enemies, args.calls, args.seed)
+        print_table(args.table, results)
+        if any(result[3] for result in results):
+            sys.exit(1)
@@ -0,0 +1,133 @@
+import struct
+import zlib
+
+# Minimal PNG reading and writing for the tools, without needing any image library.
+#
+# Images are lists of rows. For palette images each pixel is a palette index, and the
+# palette a list of (r, g, b); otherwise each pixel is a (r, g, b) or (r, g, b, a) tuple.
+# Only 8 bit non-interlaced images are read, plus 1, 2 and 4 bit palette and greyscale.
+
+class PNGError(Exception):
+    pass
+
+signature = b"\x89PNG\r\n\x1a\n"
+
+def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+def write(filename, rows, palette=None):
+    height = len(rows)
+    width = len(rows[0]) if height else 0
+    raw = bytearray()
+    if palette is not None:
+        colour_type = 3
+        for row in rows:
+            raw.append(0)
+            raw += bytes(row)
+    else:
+        colour_type = 2
+        for row in rows:
+            raw.append(0)
+            for pixel in row:
+                raw += bytes(pixel[0:3])
+    data = signature
+    data += chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, colour_type, 0, 0, 0))
+    if palette is not None:
+        data += chunk(b"PLTE", b"".join(bytes(colour) for colour in palette))
+    data += chunk(b"IDAT", zlib.compress(bytes(raw), 9))
+    data += chunk(b"IEND", b"")
+    with open(filename, "wb") as f:
+        f.write(data)
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+def unfilter(data, width, height, bits_per_pixel):
+    stride = (width * bits_per_pixel + 7) // 8
+    step = max(1, bits_per_pixel // 8)
+    rows = []
+    previous = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        kind = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        for i in range(stride):
+            left = row[i - step] if i >= step else 0
+            up = previous[i]
+            up_left = previous[i - step] if i >= step else 0
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xff
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xff
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xff
+            elif kind == 4:
+                row[i] = (row[i] + paeth(left, up, up_left)) & 0xff
+            elif kind != 0:
+                raise PNGError("unknown filter type " + str(kind))
+        rows.append(row)
+        previous = row
+    return rows
+
+def read(filename):
+    # Returns (rows, palette). palette is None unless the image is a palette image.
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[0:8] != signature:
+        raise PNGError(filename + " is not a PNG file")
+    pos = 8
+    header = None
+    palette = None
+    compressed = bytearray()
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        kind = data[pos + 4:pos + 8]
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"PLTE":
+            palette = [tuple(body[i:i + 3]) for i in range(0, len(body), 3)]
+        elif kind == b"IDAT":
+            compressed += body
+        elif kind == b"IEND":
+            break
+    if header is None:
+        raise PNGError(filename + " has no header")
+    (width, height, depth, colour_type, compression, filter_method, interlace) = header
+    if interlace:
+        raise PNGError(filename + " is interlaced")
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[colour_type]
+    if depth != 8 and not (depth < 8 and channels == 1):
+        raise PNGError(filename + ": " + str(depth) + " bit images are not supported")
+    rows = unfilter(zlib.decompress(bytes(compressed)), width, height, depth * channels)
+
+    result = []
+    for row in rows:
+        if depth < 8:
+            per_byte = 8 // depth
+            mask = (1 << depth) - 1
+            values = [(row[x // per_byte] >> (8 - depth * (x % per_byte + 1))) & mask for x in range(width)]
+            if colour_type == 0:
+                values = [(v * 255 // mask,) * 3 for v in values]
+            result.append(values)
+        elif colour_type == 3:
+            result.append(list(row))
+        elif colour_type == 0:
+            result.append([(v, v, v) for v in row])
+        elif colour_type == 4:
+            result.append([(row[i], row[i], row[i], row[i + 1]) for i in range(0, len(row), 2)])
+        else:
+            result.append([tuple(row[i:i + channels]) for i in range(0, len(row), channels)])
+    if colour_type != 3:
+        palette = None
+    return (result, palette)
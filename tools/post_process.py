@@ -1,18 +1,620 @@
-import sys
+import argparse
+import os
 import re
+import sys
+
+import mos6502
 
 start_pattern = re.compile(r'^ *pydis_start *$')
 end_pattern = re.compile(r'^ *pydis_end *$')
 instruction_pattern = re.compile(r"^\s+(ADC|AND|ASL|BCC|BCS|BEQ|BIT|BMI|BNE|BPL|BRK|BVC|BVS|CLC|CLD|CLI|CLV|CMP|CPX|CPY|DEC|DEX|DEY|EOR|INC|INX|INY|JMP|JSR|LDA|LDX|LDY|LSR|NOP|ORA|PHA|PHP|PLA|PLP|ROL|ROR|RTI|RTS|SBC|SEC|SED|SEI|STA|STX|STY|TAX|TAY|TSX|TXA|TXS|TYA|!byte|!word|!32|!text)(\s.*)?$", re.I)
 
-for line in sys.stdin:
-    line = line.rstrip()
-    if (end_pattern.search(line) != None):
-        break
-    if (start_pattern.search(line) != None):
-        continue
-    match = instruction_pattern.search(line)
-    if (match != None):
-        line = line.rstrip().ljust(69, ' ') + " ; "
-
-    print(line)
+comment_column = 69
+
+def pad_disassembly(lines):
+    # Pad instruction lines of a disassembly out to the comment column
+    for line in lines:
+        line = line.rstrip()
+        if (end_pattern.search(line) != None):
+            break
+        if (start_pattern.search(line) != None):
+            continue
+        match = instruction_pattern.search(line)
+        if (match != None):
+            line = line.rstrip().ljust(comment_column, ' ') + " ; "
+
+        print(line)
+
+# ----------------------------------------------------------------------------------
+# Reading acme source
+#
+# Lines are split into label, instruction or directive, and comment. '!if', '!ifndef'
+# and '!macro' blocks are followed, so that the lines that would be assembled for a
+# given set of -D definitions can be walked in order, with macro calls expanded.
+# Constants ('name = value') are evaluated as they are met; addresses of labels are
+# only known if an acme symbol list is supplied.
+# ----------------------------------------------------------------------------------
+
+class Unknown(Exception):
+    pass
+
+token_pattern = re.compile(r"""\s*(?:
+    (?P<hex>\$[0-9a-fA-F]+|0x[0-9a-fA-F]+)|
+    (?P<binary>%[01.#]+)|
+    (?P<decimal>[0-9]+)|
+    (?P<char>'(?:\\.|[^'])')|
+    (?P<string>"(?:\\.|[^"])*")|
+    (?P<name>\.?[A-Za-z_][A-Za-z0-9_]*)|
+    (?P<operator><<|>>|<=|>=|!=|<>|==|[-+*/&|^()<>=!,~])
+)""", re.X)
+
+binary_operators = [
+    (["or"], 1), (["xor"], 2), (["and"], 3), (["|"], 4), (["^"], 5), (["&"], 6),
+    (["=", "==", "!=", "<>", "<", ">", "<=", ">="], 7), (["<<", ">>"], 8), (["+", "-"], 9), (["*", "/", "div", "mod"], 10),
+]
+precedence = dict((op, level) for (ops, level) in binary_operators for op in ops)
+
+def tokenise(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = token_pattern.match(text, pos)
+        if not match or match.end() == pos:
+            raise Unknown("can't read '" + text + "'")
+        pos = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    return tokens
+
+class Evaluator:
+    # Evaluates acme expressions. Names not yet known raise Unknown.
+    def __init__(self, symbols=None):
+        self.symbols = dict(symbols or {})
+        self.locals = {}
+        self.pc = None
+
+    def lookup(self, name):
+        table = self.locals if name.startswith(".") else self.symbols
+        if name in table:
+            return table[name]
+        raise Unknown(name)
+
+    def evaluate(self, text):
+        self.tokens = tokenise(text)
+        self.pos = 0
+        value = self.expression(1)
+        if self.pos != len(self.tokens):
+            raise Unknown("can't read '" + text + "'")
+        return value
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def expression(self, minimum):
+        value = self.unary()
+        while True:
+            (kind, text) = self.peek()
+            level = precedence.get(text, 0) if kind in ("operator", "name") else 0
+            if level == 0 or level < minimum:
+                return value
+            self.pos += 1
+            value = self.apply(text, value, self.expression(level + 1))
+
+    def apply(self, op, a, b):
+        if op == "+": return a + b
+        if op == "-": return a - b
+        if op == "*": return a * b
+        if op in ("/", "div"): return int(a / b) if b else 0
+        if op == "mod": return a % b if b else 0
+        if op == "<<": return a << b
+        if op == ">>": return a >> b
+        if op == "&": return a & b
+        if op == "|": return a | b
+        if op == "^": return a ^ b
+        if op in ("=", "=="): return int(a == b)
+        if op in ("!=", "<>"): return int(a != b)
+        if op == "<": return int(a < b)
+        if op == ">": return int(a > b)
+        if op == "<=": return int(a <= b)
+        if op == ">=": return int(a >= b)
+        if op == "and": return int(bool(a) and bool(b))
+        if op == "or": return int(bool(a) or bool(b))
+        return int(bool(a) != bool(b))
+
+    def unary(self):
+        (kind, text) = self.peek()
+        self.pos += 1
+        if kind == "operator":
+            if text == "-": return -self.unary()
+            if text == "+":
+                if self.peek()[0] in (None, "operator") and self.peek()[1] not in ("(", "<", ">", "-"):
+                    raise Unknown("anonymous label")
+                return self.unary()
+            if text == "<": return self.unary() & 0xff
+            if text == ">": return (self.unary() >> 8) & 0xff
+            if text in ("!", "~"): return ~self.unary()
+            if text == "(":
+                value = self.expression(1)
+                if self.peek()[1] != ")":
+                    raise Unknown("missing )")
+                self.pos += 1
+                return value
+            if text == "*":
+                if self.pc is None:
+                    raise Unknown("*")
+                return self.pc
+        if kind == "name" and text == "not":
+            return int(not self.unary())
+        if kind == "hex":
+            return int(text[2:] if text.startswith("0x") else text[1:], 16)
+        if kind == "binary":
+            return int(text[1:].replace(".", "0").replace("#", "1"), 2)
+        if kind == "decimal":
+            return int(text)
+        if kind == "char":
+            return ord(text[1:-1].replace("\\", "")[-1])
+        if kind == "name":
+            return self.lookup(text)
+        raise Unknown("unexpected '" + str(text) + "'")
+
+    def try_evaluate(self, text):
+        try:
+            return self.evaluate(text)
+        except Unknown:
+            return None
+
+def split_comment(line):
+    # Split a line into code and comment, ignoring ';' inside quotes
+    quote = None
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if quote:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            # a quote character is only a quote if it's closed on the same line
+            if line.find(c, i + 1) >= 0:
+                quote = c
+        elif c == ";":
+            return (line[:i], line[i + 1:])
+        i += 1
+    return (line, None)
+
+def split_arguments(text):
+    # Split on commas that are not inside brackets or quotes
+    result = []
+    depth = 0
+    quote = None
+    current = ""
+    for c in text:
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "," and depth == 0:
+            result.append(current.strip())
+            current = ""
+            continue
+        current += c
+    if current.strip():
+        result.append(current.strip())
+    return result
+
+label_pattern = re.compile(r'^(\.?[A-Za-z_][A-Za-z0-9_]*|[-+]+)(\s+(.*))?$')
+assignment_pattern = re.compile(r'^(\.?[A-Za-z_][A-Za-z0-9_]*|\*)\s*=\s*(.*)$')
+macro_call_pattern = re.compile(r'^\+([A-Za-z_][A-Za-z0-9_]*)\s*(.*)$')
+
+class SourceLine:
+    def __init__(self, filename, number, text):
+        self.filename = filename
+        self.number = number
+        self.text = text
+        (code, self.comment) = split_comment(text)
+        self.code = code.rstrip()
+        self.label = None           # label defined at the start of the line
+        self.assignment = None      # (name, expression) for 'name = expression'
+        self.mnemonic = None
+        self.operand = None
+        self.directive = None
+        self.arguments = None
+        self.macro_call = None      # name of macro called
+        self.block = None           # header of a block opened on this line
+        self.close = False          # line closes a block ('}' or '} else {')
+
+        code = self.code.strip()
+        if not code:
+            return
+        if code.startswith("}"):
+            self.close = True
+            code = code[1:].strip()
+            if code.endswith("{"):
+                self.block = code[:-1].strip()
+            return
+        if code.endswith("{"):
+            self.block = code[:-1].strip()
+            return
+
+        # labels start in the first column
+        if not self.code[0].isspace() and self.code[0] not in "*!":
+            match = label_pattern.match(code)
+            if match and not assignment_pattern.match(code) and not (match.group(1).lower() in mos6502.mnemonics):
+                self.label = match.group(1)
+                code = (match.group(3) or "").strip()
+        if not code:
+            return
+
+        match = assignment_pattern.match(code)
+        if match:
+            self.assignment = (match.group(1), match.group(2).strip())
+            return
+        if code.startswith("!"):
+            parts = code.split(None, 1)
+            self.directive = parts[0].lower()
+            self.arguments = parts[1] if len(parts) > 1 else ""
+            return
+        match = macro_call_pattern.match(code)
+        if match:
+            self.macro_call = match.group(1)
+            self.arguments = match.group(2)
+            return
+        if code in ("+", "++", "-", "--"):
+            self.label = code
+            return
+        parts = code.split(None, 1)
+        if parts[0].lower() in mos6502.mnemonics:
+            self.mnemonic = parts[0].lower()
+            self.operand = parts[1].strip() if len(parts) > 1 else ""
+
+    def is_global_label(self):
+        return self.label is not None and self.label[0] not in ".+-"
+
+class Block:
+    def __init__(self, line):
+        self.line = line
+        self.header = line.block
+        self.body = []
+        self.else_body = None
+
+def read_source(filename):
+    # Read a source file into a list of SourceLines and Blocks
+    with open(filename, encoding="latin-1") as f:
+        return parse_source(filename, f)
+
+def parse_source(filename, texts):
+    # Parse lines of source (from a file or generated) into SourceLines and Blocks
+    lines = [SourceLine(filename, number, text.rstrip("\n")) for (number, text) in enumerate(texts, 1)]
+    items = []
+    stack = [items]
+    blocks = []
+    for line in lines:
+        if line.close:
+            if not blocks:
+                raise SyntaxError(filename + ":" + str(line.number) + ": unmatched '}'")
+            stack.pop()
+            if line.block is not None and line.block.startswith("else"):
+                blocks[-1].else_body = []
+                stack.append(blocks[-1].else_body)
+            else:
+                blocks.pop()
+            continue
+        if line.block is not None:
+            block = Block(line)
+            stack[-1].append(block)
+            blocks.append(block)
+            stack.append(block.body)
+            continue
+        stack[-1].append(line)
+    if blocks:
+        raise SyntaxError(filename + ": unclosed block from line " + str(blocks[-1].line.number))
+    return items
+
+class Visit:
+    # A line met while walking the source
+    def __init__(self, line, active, macro=None, call=None):
+        self.line = line
+        self.active = active        # would this line be assembled?
+        self.macro = macro          # name of the macro definition the line is in
+        self.call = call            # for expanded macro lines, the line calling the macro
+
+class SourceWalker:
+    # Walks through source lines in assembly order for the given definitions
+    def __init__(self, defines=None, symbols=None, base_directory="."):
+        self.evaluator = Evaluator(symbols)
+        for (name, value) in (defines or {}).items():
+            self.evaluator.symbols[name] = value
+        self.macros = {}
+        self.base_directory = base_directory
+        self.missing_includes = []
+
+    def walk(self, filename):
+        return self.walk_items(read_source(filename), True, None, None)
+
+    def condition(self, header):
+        # Returns True, False or None (unknown) for a block header
+        if header.startswith("!ifndef") or header.startswith("!ifdef"):
+            name = header.split(None, 1)[1].strip()
+            defined = (name in self.evaluator.symbols) or (name in self.evaluator.locals)
+            return defined == header.startswith("!ifdef")
+        value = self.evaluator.try_evaluate(header[3:].strip())
+        if value is None:
+            return None
+        return value != 0
+
+    def walk_items(self, items, active, macro, call):
+        for item in items:
+            if isinstance(item, SourceLine):
+                for visit in self.walk_line(item, active, macro, call):
+                    yield visit
+                continue
+
+            header = item.header
+            yield Visit(item.line, active, macro, call)
+            if header.startswith("!macro"):
+                parts = header.split(None, 2)
+                parameters = [p.strip() for p in parts[2].split(",")] if len(parts) > 2 else []
+                if active:
+                    self.macros[parts[1]] = (parameters, item.body)
+                for visit in self.walk_items(item.body, False, parts[1], call):
+                    yield visit
+                continue
+
+            if header.startswith("!pseudopc"):
+                for visit in self.walk_items(item.body, active, macro, call):
+                    yield visit
+                continue
+
+            condition = self.condition(header) if (active and macro is None) else None
+            for visit in self.walk_items(item.body, active and condition == True, macro, call):
+                yield visit
+            if item.else_body is not None:
+                for visit in self.walk_items(item.else_body, active and condition == False, macro, call):
+                    yield visit
+
+    def walk_line(self, line, active, macro, call):
+        yield Visit(line, active, macro, call)
+        if not active:
+            return
+        if line.assignment is not None:
+            (name, expression) = line.assignment
+            value = self.evaluator.try_evaluate(expression)
+            if value is not None and name != "*":
+                if name.startswith("."):
+                    self.evaluator.locals[name] = value
+                else:
+                    self.evaluator.symbols[name] = value
+        elif line.directive in ("!src", "!source"):
+            filename = line.arguments.strip().strip('"')
+            path = os.path.join(self.base_directory, filename)
+            if os.path.exists(path):
+                for visit in self.walk_items(read_source(path), active, macro, call):
+                    yield visit
+            else:
+                self.missing_includes.append(filename)
+        elif line.macro_call is not None and line.macro_call in self.macros:
+            (parameters, body) = self.macros[line.macro_call]
+            values = [self.evaluator.try_evaluate(argument) for argument in split_arguments(line.arguments)]
+            saved = self.evaluator.locals
+            self.evaluator.locals = dict((name, value) for (name, value) in zip(parameters, values) if value is not None)
+            for visit in self.walk_items(body, True, None, call or line):
+                yield visit
+            self.evaluator.locals = saved
+
+def read_defines(definitions):
+    # Parse -D name=value arguments, as given to acme
+    defines = {}
+    for definition in definitions or []:
+        (name, value) = definition.split("=", 1)
+        defines[name] = Evaluator().evaluate(value)
+    return defines
+
+# ----------------------------------------------------------------------------------
+# Cycle counting
+# ----------------------------------------------------------------------------------
+
+def addressing_mode(mnemonic, operand, evaluator):
+    # Work out the addressing mode acme would choose for an instruction
+    operand = operand.strip()
+    if operand == "" or operand.lower() == "a":
+        if mos6502.lookup(mnemonic, mos6502.ACC):
+            return mos6502.ACC
+        return mos6502.IMP
+    if operand.startswith("#"):
+        return mos6502.IMM
+    if mnemonic in mos6502.branches:
+        return mos6502.REL
+    match = re.match(r'^\((.*)\)\s*,\s*[yY]$', operand)
+    if match:
+        return mos6502.INDY
+    match = re.match(r'^\((.*),\s*[xX]\s*\)$', operand)
+    if match:
+        return mos6502.INDX
+    if mnemonic == "jmp" and operand.startswith("("):
+        return mos6502.IND
+
+    index = ""
+    match = re.match(r'^(.*),\s*([xXyY])$', operand)
+    if match:
+        operand = match.group(1)
+        index = match.group(2).lower()
+    mode = "abs" + index
+    if mos6502.has_zero_page_form(mnemonic, mode):
+        value = evaluator.try_evaluate(operand)
+        if value is not None and 0 <= value < 0x100:
+            return "zp" + index
+    return mode
+
+def instruction_for(line, evaluator):
+    # Returns the mos6502.Instruction assembled for a SourceLine, or None
+    if line.mnemonic is None:
+        return None
+    return mos6502.lookup(line.mnemonic, addressing_mode(line.mnemonic, line.operand, evaluator))
+
+def data_size(line, evaluator):
+    # Number of bytes produced by a data directive, or None
+    if line.directive in ("!byte", "!by", "!08", "!text", "!tx", "!raw"):
+        size = 0
+        for argument in split_arguments(line.arguments):
+            if argument.startswith('"') and argument.endswith('"') and len(argument) >= 2:
+                size += len(argument[1:-1].replace('\\', ''))
+            else:
+                size += 1
+        return size
+    if line.directive in ("!word", "!wo", "!16"):
+        return 2 * len(split_arguments(line.arguments))
+    if line.directive in ("!32",):
+        return 4 * len(split_arguments(line.arguments))
+    return None
+
+class Cost:
+    # Size and straight line cycle counts of some code. 'extra' is the most cycles that
+    # page crossings and taken branches can add.
+    def __init__(self):
+        self.size = 0
+        self.instructions = 0
+        self.cycles = 0
+        self.extra = 0
+
+    def add_instruction(self, instruction):
+        self.size += instruction.size
+        self.instructions += 1
+        self.cycles += instruction.cycles
+        if instruction.mode == mos6502.REL:
+            self.extra += 2
+        elif instruction.page_penalty:
+            self.extra += 1
+
+    def add(self, other):
+        self.size += other.size
+        self.instructions += other.instructions
+        self.cycles += other.cycles
+        self.extra += other.extra
+
+    def cycle_text(self):
+        if self.extra:
+            return str(self.cycles) + "-" + str(self.cycles + self.extra)
+        return str(self.cycles)
+
+def cycle_annotation(instruction):
+    # e.g. "4+c 3b" for lda abs,X: four cycles plus one if a page is crossed, three bytes.
+    # Branches show the cycles not taken / taken.
+    if instruction.mode == mos6502.REL:
+        cycles = "2/3+"
+    else:
+        cycles = str(instruction.cycles) + ("+" if instruction.page_penalty else "")
+    return cycles + "c " + str(instruction.size) + "b"
+
+def annotate(filename, walker):
+    # Returns a dictionary from line number to annotation for the lines of 'filename',
+    # and a list of (labels, Cost) for each global label in assembly order. Labels with
+    # no code of their own share the Cost of the label that follows.
+    visits = list(walker.walk(filename))
+
+    # the cost of each macro call
+    call_costs = {}
+    for visit in visits:
+        if visit.call is not None and visit.active:
+            line = visit.line
+            cost = call_costs.setdefault(id(visit.call), Cost())
+            instruction = instruction_for(line, walker.evaluator)
+            if instruction:
+                cost.add_instruction(instruction)
+            else:
+                cost.size += data_size(line, walker.evaluator) or 0
+
+    annotations = {}
+    labels = []
+    current = None
+    for visit in visits:
+        line = visit.line
+        if visit.call is not None:
+            continue
+
+        annotation = None
+        cost = None
+        instruction = instruction_for(line, walker.evaluator)
+        if instruction:
+            annotation = cycle_annotation(instruction)
+            cost = Cost()
+            cost.add_instruction(instruction)
+        elif line.macro_call is not None and id(line) in call_costs:
+            cost = call_costs[id(line)]
+            annotation = cost.cycle_text() + "c " + str(cost.size) + "b"
+        else:
+            size = data_size(line, walker.evaluator)
+            if size is not None:
+                annotation = str(size) + "b"
+                cost = Cost()
+                cost.size = size
+        if annotation is not None and line.filename == filename:
+            annotations[line.number] = annotation
+
+        if not visit.active or visit.macro is not None:
+            continue
+        if line.is_global_label():
+            if current is not None and current.size == 0:
+                labels[-1][0].append(line.label)
+            else:
+                current = Cost()
+                labels.append(([line.label], current))
+        if current is not None and cost is not None:
+            current.add(cost)
+    return (annotations, labels)
+
+def print_annotated(filename, annotations):
+    print("; cycles and bytes from post_process.py --cycles: '+' is one more cycle when a page boundary is crossed, branches show not taken/taken")
+    with open(filename, encoding="latin-1") as f:
+        for (number, text) in enumerate(f, 1):
+            text = text.rstrip("\n")
+            if number not in annotations:
+                print(text)
+                continue
+            (code, comment) = split_comment(text)
+            comment = (comment or "").strip()
+            print((code.rstrip().ljust(comment_column, ' ') + " ; " + annotations[number].ljust(12) + comment).rstrip())
+
+def print_summary(labels, wanted=None):
+    print("label".ljust(48) + "bytes  instructions  cycles (straight line)")
+    for (names, cost) in labels:
+        if wanted and not wanted.intersection(names):
+            continue
+        for name in names[:-1]:
+            print(name)
+        print(names[-1].ljust(47) + " " + str(cost.size).rjust(5) + str(cost.instructions).rjust(14) + "  " + cost.cycle_text())
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Pad disassembly to the comment column (reads stdin), or annotate source with cycle counts")
+all_args.add_argument("input", nargs="?", help="source file for --cycles (default: stdin)")
+all_args.add_argument("--cycles", action="store_true", help="write cycle counts and sizes in the comment column, with totals per label")
+all_args.add_argument("--summary", action="store_true", help="with --cycles, print only the totals per label")
+all_args.add_argument("--labels", action="append", help="with --summary, only show these labels (comma separated)")
+all_args.add_argument("-D", dest="defines", action="append", metavar="NAME=VALUE", help="define a symbol as acme's -D does (e.g. -D elk=1)")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    if not args.cycles:
+        pad_disassembly(sys.stdin)
+    else:
+        filename = args.input
+        if filename is None:
+            filename = "/dev/stdin"
+        walker = SourceWalker(read_defines(args.defines))
+        (annotations, labels) = annotate(filename, walker)
+        for name in sorted(set(walker.missing_includes)):
+            print("warning: " + name + " not found (run go_acme first to generate it)", file=sys.stderr)
+        if args.summary:
+            wanted = None
+            if args.labels:
+                wanted = set(name.strip() for names in args.labels for name in names.split(","))
+            print_summary(labels, wanted)
+        else:
+            print_annotated(filename, annotations)
@@ -0,0 +1,305 @@
+import argparse
+import os
+import re
+import sys
+
+import mos6502
+import png
+
+# Converts the starship designs between PNG images and the MODE 4 bytes plotted by
+# plot_starship and plot_starship_heading (via copy_half).
+#
+# Each starship is 16 x 16 pixels, one bit per pixel with the leftmost pixel in bit 7.
+# The 32 bytes are in screen character cell order: the top half is the left cell (rows
+# 0-7) then the right cell (rows 0-7), and the bottom half is the same for rows 8-15.
+#
+# The designs are source/starships/starship_1.png, starship_2.png, ... in order. Any
+# light pixel is set. Images may be drawn at a larger scale, any whole multiple of 16
+# pixels square, in which case the top left pixel of each block is used. The output is
+# build/starships.a for starcommand_acme.asm to include, holding starship_addresses_low,
+# starship_addresses_high, num_starships and starship_sprite_1... The data is the same
+# for all four builds.
+#
+# --extract reads the designs back out of assembly source (starship_sprite_N followed by
+# '!byte %' lines, as written here) into PNGs, so an image can be made of each existing
+# ship, and --check compares an assembled binary against the images.
+#
+# --mirror and --shifts add extra versions of each ship to the output (left-right
+# mirrored, and pre-shifted right by 1-7 pixels, which takes three cells across), for
+# plotting code that wants them. --report lists the bytes each ship needs against the
+# cycles to plot it, for the current loop and for other layouts.
+
+width = 16
+height = 16
+cell_height = 8
+centre_column = 7           # the middle of the ship, as plotted in the middle of the screen
+
+# the palette for extracted images
+palette = [(0, 0, 0), (255, 255, 255)]
+
+class Sprite:
+    def __init__(self, name, rows, columns=width // 8):
+        self.name = name
+        self.rows = rows            # height lists of 0/1 pixels, 8 * columns pixels across
+        self.columns = columns      # character cells across
+
+    def to_bytes(self):
+        # character cells in order across each half, eight rows each
+        result = bytearray()
+        for top in range(0, height, cell_height):
+            for column in range(self.columns):
+                for row in self.rows[top:top + cell_height]:
+                    value = 0
+                    for bit in row[column * 8:column * 8 + 8]:
+                        value = (value << 1) | bit
+                    result.append(value)
+        return bytes(result)
+
+    def set_pixels(self):
+        return sum(sum(row) for row in self.rows)
+
+def from_bytes(name, data, columns=width // 8):
+    if len(data) != height * columns:
+        raise ValueError(name + ": expected " + str(height * columns) + " bytes, found " + str(len(data)))
+    rows = [[0] * (8 * columns) for y in range(height)]
+    index = 0
+    for top in range(0, height, cell_height):
+        for column in range(columns):
+            for y in range(top, top + cell_height):
+                for bit in range(8):
+                    rows[y][column * 8 + bit] = (data[index] >> (7 - bit)) & 1
+                index += 1
+    return Sprite(name, rows, columns)
+
+def mirrored(sprite):
+    # flip left to right about the centre column, which stays where it is
+    rows = []
+    for row in sprite.rows:
+        if any(row[2 * centre_column + 1:]):
+            raise ValueError(sprite.name + ": pixels right of column " + str(2 * centre_column) + " have no mirror image")
+        rows.append(list(reversed(row[0:2 * centre_column + 1])) + [0] * (len(row) - 2 * centre_column - 1))
+    return Sprite(sprite.name + "_mirrored", rows, sprite.columns)
+
+def shifted(sprite, shift):
+    # move right by 'shift' pixels into one more cell across
+    rows = [[0] * shift + row + [0] * (8 - shift) for row in sprite.rows]
+    return Sprite(sprite.name + "_shift_" + str(shift), rows, sprite.columns + 1)
+
+def is_light(pixel, image_palette):
+    if image_palette is not None:
+        pixel = image_palette[pixel]
+    if len(pixel) == 4 and pixel[3] < 128:
+        return 0
+    return 1 if pixel[0] + pixel[1] + pixel[2] >= 3 * 128 else 0
+
+def read_image(filename, name):
+    (rows, image_palette) = png.read(filename)
+    if not rows or len(rows) % height or len(rows[0]) != len(rows) or len(rows[0]) % width:
+        raise ValueError(filename + ": images must be 16 x 16 pixels, or a whole multiple of that")
+    scale = len(rows) // height
+    pixels = [[is_light(rows[y * scale][x * scale], image_palette) for x in range(width)] for y in range(height)]
+    return Sprite(name, pixels)
+
+def write_image(filename, sprite, scale):
+    rows = []
+    for row in sprite.rows:
+        big = [pixel for pixel in row for i in range(scale)]
+        rows += [big] * scale
+    png.write(filename, rows, palette)
+
+def image_filenames(directory):
+    # starship_1.png, starship_2.png ... in order, with no gaps
+    numbers = []
+    for filename in os.listdir(directory):
+        match = re.match(r'^starship_([0-9]+)\.png$', filename)
+        if match:
+            numbers.append(int(match.group(1)))
+    numbers.sort()
+    if numbers != list(range(1, len(numbers) + 1)):
+        raise ValueError(directory + ": expected starship_1.png to starship_" + str(len(numbers)) + ".png, found " + ", ".join(str(n) for n in numbers))
+    return [os.path.join(directory, "starship_" + str(n) + ".png") for n in numbers]
+
+def read_images(directory):
+    return [read_image(filename, "starship_sprite_" + str(number + 1)) for (number, filename) in enumerate(image_filenames(directory))]
+
+def read_assembly(filename):
+    # Returns the sprites defined as 'starship_sprite_N' followed by '!byte %...' lines
+    sprites = []
+    name = None
+    data = bytearray()
+    with open(filename) as f:
+        for line in f:
+            code = line.split(";")[0].strip()
+            match = re.match(r'^(starship_sprite_[0-9]+)$', code)
+            if match:
+                if name:
+                    sprites.append(from_bytes(name, data))
+                (name, data) = (match.group(1), bytearray())
+                continue
+            match = re.match(r'^!(?:byte|by|08)\s+%([.#01]{8})$', code)
+            if name and match:
+                data.append(int(match.group(1).replace(".", "0").replace("#", "1"), 2))
+            elif name and code:
+                sprites.append(from_bytes(name, data))
+                name = None
+    if name:
+        sprites.append(from_bytes(name, data))
+    return sprites
+
+def picture(row):
+    return "".join("#" if bit else "." for bit in row)
+
+def write_sprite(f, sprite):
+    data = sprite.to_bytes()
+    f.write(sprite.name + "\n")
+    for (index, value) in enumerate(data):
+        line = "    !byte %" + picture((value >> (7 - bit)) & 1 for bit in range(8))
+        if index < height:
+            line = line.ljust(70) + "; " + picture(sprite.rows[index])
+        f.write(line + "\n")
+    f.write("\n")
+
+def write_sprites(filename, sprites, extras):
+    with open(filename, 'w') as f:
+        f.write("; Written by tools/starship_sprites.py from source/starships/. Do not edit.\n\n")
+        f.write("starship_addresses_low\n")
+        for sprite in sprites:
+            f.write("    !byte <" + sprite.name + "\n")
+        f.write("starship_addresses_high\n")
+        for sprite in sprites:
+            f.write("    !byte >" + sprite.name + "\n")
+        f.write("num_starships = * - starship_addresses_high\n\n")
+        f.write("; ----------------------------------------------------------------------------------\n")
+        for sprite in sprites:
+            write_sprite(f, sprite)
+        if extras:
+            f.write("; ----------------------------------------------------------------------------------\n")
+            f.write("; Extra versions of each ship: " + str(extras[0].columns) + " cells across for '_shift_N'\n\n")
+            for sprite in extras:
+                write_sprite(f, sprite)
+
+# ----------------------------------------------------------------------------------
+# Costs. plot_starship EORs each byte onto the screen in a loop, one loop per half:
+#
+#   lda (starship_low),y / eor abs,y / sta abs,y / iny / cpy #n / bne
+#
+# An unrolled plot instead needs only 'lda #value / eor abs / sta abs' for each byte that
+# isn't zero, so is faster but takes more memory.
+def cycles(mnemonic, mode):
+    return mos6502.lookup(mnemonic, mode).cycles
+
+def size(mnemonic, mode):
+    return mos6502.lookup(mnemonic, mode).size
+
+loop_cycles_per_byte = cycles("lda", mos6502.INDY) + cycles("eor", mos6502.ABSY) + cycles("sta", mos6502.ABSY) + cycles("iny", mos6502.IMP) + cycles("cpy", mos6502.IMM) + cycles("bne", mos6502.REL) + 1
+loop_overhead = (2 * 6 + cycles("ldx", mos6502.ABS) + 2 * (cycles("lda", mos6502.ABSX) + cycles("sta", mos6502.ZP)) + cycles("rts", mos6502.IMP)     # jsr plot_starship, jsr get_starship_address
+                 + cycles("ldy", mos6502.IMM) - 2 + cycles("rts", mos6502.IMP))                                                                    # ldy #0, two loop exits, rts
+unrolled_cycles_per_byte = cycles("lda", mos6502.IMM) + cycles("eor", mos6502.ABS) + cycles("sta", mos6502.ABS)
+unrolled_bytes_per_byte = size("lda", mos6502.IMM) + size("eor", mos6502.ABS) + size("sta", mos6502.ABS)
+unrolled_overhead = 6 + cycles("rts", mos6502.IMP)                                                                                                # jsr, rts
+
+def crosses(base, index):
+    return (base >> 8) != ((base + index) >> 8)
+
+def page_crossings(number, address, size, symbols):
+    # extra cycles for the reads of the address tables and the data that cross a page
+    total = sum(1 for table in ("starship_addresses_low", "starship_addresses_high") if crosses(symbols[table], number))
+    return total + sum(1 for index in range(size) if crosses(address, index))
+
+def loop_cost(sprite, extra=0):
+    return loop_overhead + loop_cycles_per_byte * len(sprite.to_bytes()) + extra
+
+def unrolled_cost(sprite):
+    nonzero = sum(1 for value in sprite.to_bytes() if value)
+    return (unrolled_overhead + unrolled_cycles_per_byte * nonzero, unrolled_bytes_per_byte * nonzero + 1)
+
+def report(sprites, extras, extras_cycles, measured):
+    print("ship                            cells  pixels  data bytes  zero bytes  loop cycles  unrolled cycles  unrolled bytes" + ("  measured" if measured else ""))
+    for sprite in sprites + extras:
+        data = sprite.to_bytes()
+        (fast, code) = unrolled_cost(sprite)
+        line = "%-30s  %5d  %6d  %10d  %10d  %11d  %15d  %14d" % (sprite.name, sprite.columns, sprite.set_pixels(), len(data), data.count(0), loop_cost(sprite, extras_cycles.get(sprite.name, 0)), fast, code)
+        if sprite.name in measured:
+            line += "  %8d" % measured[sprite.name]
+        print(line)
+    print("")
+    print("loop: " + str(loop_cycles_per_byte) + " cycles per byte plus " + str(loop_overhead) + " (and one for each page crossed, with --check), sharing one copy of the code between all ships")
+    print("unrolled: " + str(unrolled_cycles_per_byte) + " cycles and " + str(unrolled_bytes_per_byte) + " bytes of code per non-zero byte, plus " + str(unrolled_overhead) + " cycles, with code for each ship")
+
+def read_binary(variant, build_dir):
+    # Returns the sprites in an assembled binary, the extra cycles each takes to plot from
+    # page crossings, and the cycles taken by plot_starship for each when run on the 6502
+    # core
+    import benchmark
+    machine = benchmark.Machine(variant, build_dir)
+    symbols = machine.symbols
+    memory = machine.cpu.memory
+    count = symbols["num_starships"]
+    sprites = []
+    extra = {}
+    measured = {}
+    for number in range(count):
+        name = "starship_sprite_" + str(number + 1)
+        address = memory[symbols["starship_addresses_low"] + number] | (memory[symbols["starship_addresses_high"] + number] << 8)
+        sprites.append(from_bytes(name, bytes(memory[address:address + height * width // 8])))
+        extra[name] = page_crossings(number, address, height * width // 8, symbols)
+        machine.reset()
+        machine.set("starship_type", number)
+        measured[name] = machine.call("plot_starship")
+    return (sprites, extra, measured)
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Convert the starship designs between PNG images and the bytes plotted by the game")
+all_args.add_argument("--input", default="source/starships", help="directory of starship_N.png images")
+all_args.add_argument("--output", help="assembly file to write (e.g. build/starships.a)")
+all_args.add_argument("--extract", metavar="FILE", help="write the starships defined in this assembly file to the --input directory as PNGs")
+all_args.add_argument("--scale", type=int, default=1, help="pixel size of extracted images")
+all_args.add_argument("--mirror", action="store_true", help="add a left-right mirrored copy of each ship to the output")
+all_args.add_argument("--shifts", type=int, default=0, help="add copies of each ship shifted right by 1 up to this many pixels (at most 7)")
+all_args.add_argument("--report", action="store_true", help="list the bytes and plot cycles of each ship")
+all_args.add_argument("--check", metavar="VARIANT", help="check an assembled binary (e.g. STAR) holds the images, and time plot_starship for each ship")
+all_args.add_argument("--build", default="build", help="build directory for --check")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    if not 0 <= args.shifts <= 7:
+        all_args.error("--shifts must be from 0 to 7")
+
+    try:
+        if args.extract:
+            sprites = read_assembly(args.extract)
+            if not sprites:
+                print("No starship_sprite_N data found in " + args.extract)
+                sys.exit(1)
+            os.makedirs(args.input, exist_ok=True)
+            for (number, sprite) in enumerate(sprites):
+                write_image(os.path.join(args.input, "starship_" + str(number + 1) + ".png"), sprite, args.scale)
+            print(str(len(sprites)) + " starships written to " + args.input)
+
+        sprites = read_images(args.input)
+        extras = []
+        if args.mirror:
+            extras += [mirrored(sprite) for sprite in sprites]
+        for shift in range(1, args.shifts + 1):
+            extras += [shifted(sprite, shift) for sprite in sprites]
+    except (ValueError, png.PNGError) as e:
+        print("error: " + str(e))
+        sys.exit(1)
+
+    if args.output:
+        write_sprites(args.output, sprites, extras)
+
+    extra = {}
+    measured = {}
+    if args.check:
+        (built, extra, measured) = read_binary(args.check, args.build)
+        different = [sprite.name for (sprite, other) in zip(sprites, built) if sprite.to_bytes() != other.to_bytes()]
+        if len(built) != len(sprites):
+            different.append(str(len(built)) + " ships in " + args.check + ", " + str(len(sprites)) + " images")
+        if different:
+            print("error: " + args.check + " does not match " + args.input + ": " + ", ".join(different))
+            sys.exit(1)
+        print(args.check + " matches " + args.input)
+
+    if args.report:
+        report(sprites, extras, extra, measured)
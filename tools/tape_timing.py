@@ -0,0 +1,252 @@
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import tempfile
+
+import acme_output
+import exo
+import uef
+
+# Models how long a tape build takes to load, from the UEF file written by maketape.pl.
+#
+# The tape holds a standard header block with the loader (source/tape.asm), then one
+# long stream of bytes: the decompression code (255 bytes, loaded backwards) followed by
+# the three Exomizer regions of the binary (see build_tape in go_acme):
+#
+#   region 1   loader_copy_start -> eof                   decompressed while waiting
+#   region 2   post_reloc -> loader_copy_start            decompressed under interrupt
+#   region 3   load_addr -> post_reloc                    decompressed under interrupt
+#
+# The globe starts spinning (the first screen) once region 2 has been decompressed, and
+# loading is complete when region 3 has been decompressed.
+#
+# Decompression happens as the bytes arrive, so usually it only adds a little time after
+# the last byte of each region. The cycle costs below are rough figures for exo.asm and
+# for taking each tape byte under interrupt in loader2.asm.
+
+decrunch_table_cycles = 4000            # reading the 52 entry table and building it
+decrunch_cycles_per_input_byte = 105    # bit reading, literals and sequence headers
+decrunch_cycles_per_output_byte = 25    # copy loop
+irq_cycles_per_input_byte = 130         # IRQ, get_crunched_byte_irq and stack switching
+
+decruncher_length = 255
+
+regions = [
+    ("1", "loader_copy_start", "eof"),
+    ("2", "post_reloc", "loader_copy_start"),
+    ("3", "load_addr", "post_reloc"),
+]
+
+uef_filenames = {
+    "STAR.tape":    "STAR2022.uef",
+    "STARELK.tape": "STARELK.uef",
+}
+
+def is_electron(variant):
+    return "ELK" in variant
+
+def default_clock(variant):
+    # The Electron's RAM is only accessed at 1MHz in the game's screen mode
+    if is_electron(variant):
+        return 1000000
+    return 2000000
+
+class Region:
+    def __init__(self, name, start, end, crunched_length):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.crunched_length = crunched_length
+
+    def length(self):
+        return self.end - self.start
+
+def region_bounds(symbols, split1=None, split2=None):
+    # Returns (name, start, end) for each region, using the symbols unless the split
+    # points (between regions 1 and 2, and between regions 2 and 3) are given.
+    if split1 is None:
+        split1 = symbols["loader_copy_start"]
+    if split2 is None:
+        split2 = symbols["post_reloc"]
+    return [("1", split1, symbols["eof"]), ("2", split2, split1), ("3", symbols["load_addr"], split2)]
+
+def find_payload(uef_filename, payload_length):
+    # Returns the loader block, the data chunk holding the decruncher and the Exomizer
+    # regions, and the list of all chunks
+    chunks = []
+    loader = None
+    payload = None
+    for chunk in uef.read_chunks(uef_filename):
+        chunks.append(chunk)
+        if chunk.chunk_id != 0x100:
+            continue
+        if loader is None and chunk.data[0:1] == b"*":
+            loader = uef.parse_acorn_block(chunk.data)
+        elif len(chunk.data) == payload_length:
+            payload = chunk
+    if payload is None:
+        raise uef.UEFError("no data chunk of " + str(payload_length) + " bytes in " + uef_filename + " (has the tape been rebuilt?)")
+    return (loader, payload, chunks)
+
+def model_load(payload_start, regions, clock, baud=uef.default_baud):
+    # Work out when each region has been received and decompressed, given the time at
+    # which the decruncher and regions start playing. Returns a list of
+    # (region, first byte time, last byte time, decompressed time).
+    def byte_time(index):
+        return payload_start + (index + 1) * 10.0 / baud
+
+    result = []
+    offset = decruncher_length
+    done = byte_time(offset - 1)
+    for region in regions:
+        first = byte_time(offset)
+        last = byte_time(offset + region.crunched_length - 1)
+        cycles = decrunch_table_cycles + region.crunched_length * decrunch_cycles_per_input_byte + region.length() * decrunch_cycles_per_output_byte
+        if region.name != "1":
+            cycles += region.crunched_length * irq_cycles_per_input_byte
+        work = float(cycles) / clock
+        start = max(first, done)
+        done = max(last + work / region.crunched_length, start + work)
+        result.append((region, first, last, done))
+        offset += region.crunched_length
+    return result
+
+def first_screen_and_total(timeline):
+    done = dict((region.name, finished) for (region, first, last, finished) in timeline)
+    return (done["2"], done["3"])
+
+def hex4(value):
+    return "&" + format(value, "04X")
+
+def print_report(uef_filename, variant, loader, payload, chunks, timeline, clock):
+    print(uef_filename + " (" + variant + ", " + str(clock / 1000000.0) + "MHz)")
+    print("")
+    print("    chunk   bytes    start      end")
+    for chunk in chunks:
+        print("    &" + format(chunk.chunk_id, "04x") + str(len(chunk.data)).rjust(8) + ("%9.2f%9.2f" % (chunk.start, chunk.end())))
+    print("")
+    if loader:
+        print("    loader block '" + loader.filename + "' load " + hex4(loader.load & 0xffff) + " exec " + hex4(loader.exec & 0xffff) + ", " + str(loader.length) + " bytes")
+    print("    decruncher                %5d bytes   %8.2f" % (decruncher_length, payload.start + decruncher_length * 10.0 / uef.default_baud))
+    print("")
+    print("    region          bytes  crunched    first     last  decrunched")
+    for (region, first, last, done) in timeline:
+        print("    %s %s-%s  %6d  %8d %8.2f %8.2f  %10.2f" % (region.name, hex4(region.start), hex4(region.end), region.length(), region.crunched_length, first, last, done))
+    (first_screen, total) = first_screen_and_total(timeline)
+    print("")
+    print("Time to first screen: %6.2f s" % first_screen)
+    print("Total load time:      %6.2f s" % total)
+
+def crunch_region(exomizer, binary, load_addr, start, end):
+    # Compress part of the binary with Exomizer (as exo_region in go_acme), or with exo.py
+    # if 'exomizer' is "python", and return the length of the result
+    if exomizer == "python":
+        return len(exo.crunch(binary[start - load_addr:end - load_addr], end))
+    with tempfile.TemporaryDirectory() as directory:
+        raw = os.path.join(directory, "region")
+        crunched = os.path.join(directory, "region.exo")
+        with open(raw, 'wb') as f:
+            f.write(binary[start - load_addr:end - load_addr])
+        subprocess.run([exomizer, "level", "-q", raw + "@0x" + format(start, "04x"), "-o", crunched], check=True)
+        return os.path.getsize(crunched)
+
+def candidates(symbols, low, high, points):
+    # Pick up to 'points' symbol addresses in [low, high], always including 'high'
+    addresses = sorted(set(value for value in symbols.values() if low <= value <= high))
+    if high not in addresses:
+        addresses.append(high)
+    if len(addresses) <= points:
+        return addresses
+    step = (len(addresses) - 1) / float(points - 1)
+    return sorted(set(addresses[int(round(i * step))] for i in range(points)))
+
+def search(args, symbols, payload, clock):
+    with open(os.path.join(args.build, "disk", args.variant), 'rb') as f:
+        binary = f.read()
+    load_addr = symbols["load_addr"]
+
+    # Split points can only move down from where the code needs them: everything from
+    # loader_copy_start must be in region 1, and everything from post_reloc must be
+    # loaded by the end of region 2.
+    split1s = candidates(symbols, symbols["loader_copy_start"] - args.window, symbols["loader_copy_start"], args.points)
+    split2s = candidates(symbols, max(load_addr + 1, symbols["post_reloc"] - args.window), symbols["post_reloc"], args.points)
+    splits = [(s1, s2) for s1 in split1s for s2 in split2s if s2 < s1]
+
+    # Each distinct region only needs compressing once
+    wanted = set()
+    for (s1, s2) in splits:
+        for (name, start, end) in region_bounds(symbols, s1, s2):
+            wanted.add((start, end))
+
+    print("Compressing " + str(len(wanted)) + " regions for " + str(len(splits)) + " split points...")
+    lengths = {}
+    # (exo.py crunches in this process, so it needs processes rather than threads)
+    executor = concurrent.futures.ProcessPoolExecutor if args.exomizer == "python" else concurrent.futures.ThreadPoolExecutor
+    with executor(max_workers=args.jobs) as pool:
+        futures = {}
+        for (start, end) in wanted:
+            futures[pool.submit(crunch_region, args.exomizer, binary, load_addr, start, end)] = (start, end)
+        for future in concurrent.futures.as_completed(futures):
+            lengths[futures[future]] = future.result()
+
+    results = []
+    for (s1, s2) in splits:
+        split_regions = [Region(name, start, end, lengths[(start, end)]) for (name, start, end) in region_bounds(symbols, s1, s2)]
+        (first_screen, total) = first_screen_and_total(model_load(payload.start, split_regions, clock))
+        results.append((first_screen, total, s1, s2))
+    results.sort()
+
+    default = (symbols["loader_copy_start"], symbols["post_reloc"])
+    print("")
+    print("    split 1/2   split 2/3   first screen   total")
+    best_total = None
+    for (first_screen, total, s1, s2) in results:
+        # results are sorted by first screen time, so a row is on the Pareto frontier if
+        # it has a better total time than every row above it
+        pareto = best_total is None or total < best_total
+        if pareto:
+            best_total = total
+        notes = []
+        if pareto:
+            notes.append("pareto")
+        if (s1, s2) == default:
+            notes.append("current")
+        print("    %s       %s       %8.2f   %8.2f   %s" % (hex4(s1), hex4(s2), first_screen, total, " ".join(notes)))
+
+    fastest_screen = results[0]
+    fastest_total = min(results, key=lambda result: (result[1], result[0]))
+    print("")
+    print("Fastest first screen: %.2f s with splits %s, %s" % (fastest_screen[0], hex4(fastest_screen[2]), hex4(fastest_screen[3])))
+    print("Fastest total load:   %.2f s with splits %s, %s" % (fastest_total[1], hex4(fastest_total[2]), hex4(fastest_total[3])))
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Model the loading time of a tape build, and search for better region split points")
+all_args.add_argument("--variant", default="STAR.tape", help="tape build to examine (STAR.tape or STARELK.tape)")
+all_args.add_argument("--uef", help="UEF file (default: the one go_acme writes for the variant)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--clock", type=int, help="CPU clock in Hz (default 2MHz for BBC, 1MHz for Electron)")
+all_args.add_argument("--search", action="store_true", help="search for alternative split points")
+all_args.add_argument("--window", type=int, default=1024, help="how far below each current split point to search (bytes)")
+all_args.add_argument("--points", type=int, default=8, help="number of candidate addresses for each split point")
+all_args.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of compressions to run at once")
+all_args.add_argument("--exomizer", default="exomizer302", help="Exomizer 3.0.2 executable, or 'python' to use exo.py")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    uef_filename = args.uef or uef_filenames.get(args.variant, args.variant + ".uef")
+    clock = args.clock or default_clock(args.variant)
+    symbols = acme_output.read_symbols(acme_output.symbols_filename(args.variant, args.build))
+
+    current = []
+    for (name, start, end) in region_bounds(symbols):
+        exo_filename = os.path.join(args.build, "tape", args.variant + "." + name + ".exo")
+        current.append(Region(name, start, end, os.path.getsize(exo_filename)))
+
+    (loader, payload, chunks) = find_payload(uef_filename, decruncher_length + sum(region.crunched_length for region in current))
+    timeline = model_load(payload.start, current, clock)
+    print_report(uef_filename, args.variant, loader, payload, chunks, timeline, clock)
+
+    if args.search:
+        print("")
+        search(args, symbols, payload, clock)
@@ -1,10 +1,54 @@
 import argparse
+import csv
+import heapq
+import json
+import os
 import re
+import time
+
+import cpu6502
+import exo
+import plot_routines
+import uef
+
+# Compresses the game's text (and optionally other corpora of text, such as the tape loader's)
+# into a 5 bit code: the 29 commonest characters in one code each, others (and tokens for the
+# shortcut phrases) in two.
+#
+# Each --input is written to the --output given in the same position. With more than one,
+# --table chooses whether they share the one table of common characters (written with the
+# first output as text_header_data) or each has its own table, its labels (text_header_data,
+# text_data) prefixed with the corpus name (the input's file name) after the first. Text
+# before the first label of an input is labelled with the corpus name.
+#
+# --report lists for each corpus its raw and compressed size, the size of each once crunched
+# by exo.py (as every tape region is), and the time each takes to load at 1200 baud.
+#
+# --stats FILE writes what the compression found, as JSON (or CSV, for a .csv file): for each
+# string its raw bytes, the bits it packs to and the padding to a whole byte, how many
+# characters took a common code or each escape (29: any other character, 30: a control code,
+# 31: a token for a shortcut phrase), the phrases it uses and how often it is used as one.
+# The JSON also has each corpus's table of common characters with their counts, the totals,
+# and the seconds spent parsing, compressing and writing the output, so the compression
+# ratio and the time taken can be tracked from commit to commit.
+
+# --coding huffman packs the text with a canonical Huffman code instead, no longer than
+# --max-length bits, for every character and token (so there are no escapes). The decode
+# tables are the number of codes of each length, the index of the first symbol of each length,
+# and the symbols in code order (text_huffman_counts, text_huffman_index, text_huffman_symbols),
+# for the decoder in huffman_decoder below, which reads a bit at a time. --compare assembles
+# that and the game's own decoder, prints every string with each on the 6502 core (checking
+# the text printed) and lists the bytes of each coding against the cycles per character.
+
+# the string printed for token 128 (print_compressed_string prints the strings from here on
+# for tokens 128 to 159)
+first_token_label = "award_you_the_order_of_the"
 
-compressed_data = {}
 encoding = {}
 conc = {}
 commonest_entries = {}
+coding = "fixed"
+huffman_codes = {}          # symbol -> (bits, code)
 
 class BitStream:
     bitarray = []
@@ -131,18 +175,23 @@ def parse_bytes(rawline, count):
     # skip any spaces and comma from the start of the string
     return (result, line)
 
-def compress(string_dict):
+def build_table(string_dicts):
     global conc
     global commonest_entries
+    global encoding
+
+    conc = {}
+    encoding = {}
 
     # get concordance of bytes
-    for entry in string_dict:
-        for b in string_dict[entry]:
-            if b < 128: # skip tokens
-                if not (b in conc):
-                    conc[b] = 1
-                else:
-                    conc[b] += 1
+    for string_dict in string_dicts:
+        for entry in string_dict:
+            for b in string_dict[entry]:
+                if b < 128: # skip tokens
+                    if not (b in conc):
+                        conc[b] = 1
+                    else:
+                        conc[b] += 1
 
     conc = dict(sorted(conc.items(), key= lambda x:-x[1]))
 
@@ -158,101 +207,647 @@ def compress(string_dict):
         if (counter % 32) == 0:
             depth += 1
 
+def huffman_lengths(counts, max_length):
+    # The code length for each symbol, by Huffman's algorithm, then limited to max_length
+    # bits by moving pairs of the longest codes up a level (as JPEG does).
+    if len(counts) == 1:
+        return dict((symbol, 1) for symbol in counts)
+
+    heap = [(counts[symbol], symbol, [symbol]) for symbol in counts]
+    heapq.heapify(heap)
+    lengths = dict((symbol, 0) for symbol in counts)
+    while len(heap) > 1:
+        (count1, key1, symbols1) = heapq.heappop(heap)
+        (count2, key2, symbols2) = heapq.heappop(heap)
+        for symbol in symbols1 + symbols2:
+            lengths[symbol] += 1
+        heapq.heappush(heap, (count1 + count2, min(key1, key2), symbols1 + symbols2))
+
+    longest = max(lengths.values())
+    bits = [0] * (longest + 1)
+    for symbol in lengths:
+        bits[lengths[symbol]] += 1
+    for i in range(longest, max_length, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+
+    # the commonest symbols take the shortest codes
+    order = sorted(counts, key=lambda symbol: (-counts[symbol], symbol))
+    result = {}
+    for length in range(1, len(bits)):
+        for i in range(bits[length]):
+            result[order.pop(0)] = length
+    return result
+
+def build_huffman(string_dicts, max_length):
+    global conc
+    global huffman_codes
+
+    # every character and token, with how often it appears
+    conc = {}
+    for string_dict in string_dicts:
+        for entry in string_dict:
+            for b in string_dict[entry]:
+                conc[b] = conc.get(b, 0) + 1
+
+    assert len(conc) < 128, "too many symbols for the decoder"
+    lengths = huffman_lengths(conc, max_length)
+
+    # canonical codes: in order of length, then symbol
+    huffman_codes = {}
+    code = 0
+    length = 1
+    for symbol in sorted(lengths, key=lambda symbol: (lengths[symbol], symbol)):
+        code <<= lengths[symbol] - length
+        length = lengths[symbol]
+        huffman_codes[symbol] = (length, code)
+        code += 1
+
+    # (up to seven ones of padding must not complete a code: see compress_string_huffman)
+    assert max(lengths.values()) > 7, "too few symbols for a code longer than 7 bits"
+
+def huffman_tables():
+    # (counts, index, symbols): the codes of each length 1 to the longest, the index of the
+    # first symbol of each length, and the symbols in code order
+    longest = max(bits for (bits, code) in huffman_codes.values())
+    symbols = sorted(huffman_codes, key=lambda symbol: huffman_codes[symbol])
+    counts = [0] * longest
+    for (bits, code) in huffman_codes.values():
+        counts[bits - 1] += 1
+    index = [sum(counts[0:i]) for i in range(longest)]
+    return (counts, index, symbols)
+
+def compress_string_huffman(string):
+    result = BitStream()
+    result.clear()
+    result.common = len(string)
+    result.escapes = {29: 0, 30: 0, 31: 0}
+    result.tokens = [entry for entry in string if entry >= 128]
+    for entry in string:
+        (bits, code) = huffman_codes[entry]
+        result.append(bits, code)
+
+    # pad with ones, the start of the last (longest) code, so the decoder runs out of
+    # bytes before it finds a symbol
+    result.unpadded_bits = len(result.bitarray)
+    result.pad_with(7, 127, 7, 127)
+    return result
+
+def compress(string_dict):
+    # compress each string with the current table
+    result = {}
     for entry in string_dict:
-        compressed_data[entry] = compress_string(string_dict[entry])
+        if coding == "huffman":
+            result[entry] = compress_string_huffman(string_dict[entry])
+        else:
+            result[entry] = compress_string(string_dict[entry])
+    return result
 
 def compress_string(string):
     global commonest_entries
 
     result = BitStream()
     result.clear()
+    result.common = 0
+    result.escapes = {29: 0, 30: 0, 31: 0}
+    result.tokens = []
     common_list = list(commonest_entries.keys())
     for entry in string:
         if entry in commonest_entries:
             assert (entry < 128)
             result.append(5, common_list.index(entry))
+            result.common += 1
         else:
             if entry >= 128:
                 assert (entry < 160)
                 result.append(5, 31)
                 result.append(5, entry & 31)
+                result.escapes[31] += 1
+                result.tokens.append(entry)
             elif entry < 32:
                 result.append(5, 30)
                 result.append(5, entry)
+                result.escapes[30] += 1
             else:
                 result.append(5, 29)
                 result.append(7, entry)
+                result.escapes[29] += 1
 
+    result.unpadded_bits = len(result.bitarray)
     result.pad_with(5,30, 7,0)
     return result
 
-# Construct an argument parser
-all_args = argparse.ArgumentParser()
-
-# Add arguments to the parser
-all_args.add_argument("--input",  required=True, help="acme-like input text")
-all_args.add_argument("--output", required=True, help="compressed text as acme asm file")
-args = vars(all_args.parse_args())
-
-lines = []
-label = ""
-string_bytes = []
-string_dict = {}
-compressed_data = {}
-encoding = {}
-conc = {}
-commonest_entries = {}
-
-with open(args["input"]) as f:
-    count = 0
-    for line in f:
-        count += 1
-        line = line.split(';')[0].rstrip()
-        if (len(line) == 0):
-            continue
-        if (line[0] == ' '):
-            line = line.strip()
+def read_strings(filename, name):
+    string_dict = {}
+    label = name
+    string_bytes = []
+    with open(filename) as f:
+        count = 0
+        for line in f:
+            count += 1
+            line = line.split(';')[0].rstrip()
             if (len(line) == 0):
                 continue
-            if (line.startswith("!text ") or line.startswith("!byte ")):
-                line = line[6:]
-                (my_bytes,_) = parse_bytes(line, count)
-                string_bytes.extend(my_bytes)
+            if (line[0] == ' '):
+                line = line.strip()
+                if (len(line) == 0):
+                    continue
+                if (line.startswith("!text ") or line.startswith("!byte ")):
+                    line = line[6:]
+                    (my_bytes,_) = parse_bytes(line, count)
+                    string_bytes.extend(my_bytes)
+                else:
+                    print("error, can't understand line " + str(count) + "'" + line + "'")
+
             else:
-                print("error, can't understand line " + str(count) + "'" + line + "'")
+                if string_bytes or label != name:
+                    string_dict[label] = string_bytes
+                label = line
+                string_bytes = []
+
+    if string_bytes or label != name:
+        string_dict[label] = string_bytes
+    return string_dict
+
+def corpus_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+def write_output(filename, compressed_data, prefix, with_table):
+    with open(filename, 'w') as f:
+        i = 0
+        for entry in compressed_data:
+            f.write(entry.ljust(40) + " = " + str(i) + "\n")
+            i += 1
+            f.write("")
+
+        if with_table and coding == "huffman":
+            (counts, index, symbols) = huffman_tables()
+            f.write("\n" + prefix + "text_huffman_counts\n")
+            for (length, count) in enumerate(counts):
+                f.write("    !byte " + str(count).ljust(20) + "; " + str(length + 1) + " bits\n")
+            f.write("\n" + prefix + "text_huffman_index\n")
+            for value in index:
+                f.write("    !byte " + str(value) + "\n")
+            f.write("\n" + prefix + "text_huffman_symbols\n")
+            for entry in symbols:
+                f.write("    !byte " + str(entry).ljust(20) + "; ")
+                if ((entry >= 32) and (entry < 127)):
+                    f.write("'" + chr(entry) + "'")
+                else:
+                    f.write(str(entry).rjust(3))
+                f.write(": " + str(conc[entry]).rjust(3) + ", " + format(huffman_codes[entry][1], "0" + str(huffman_codes[entry][0]) + "b") + "\n")
+        elif with_table:
+            f.write("\n" + prefix + "text_header_data\n")
+            for entry in encoding:
+                f.write("    !byte " + str(entry).ljust(20) + "; ")
+                if ((entry >= 32) and (entry < 127)):
+                    f.write("'" + chr(entry) + "'")
+                else:
+                    f.write(str(entry).rjust(3))
+                f.write(": " + str(conc[entry]).rjust(3) + ", " + str(encoding[entry]) + "\n")
 
+        f.write("\n" + prefix + "text_data\n")
+        for entry in compressed_data:
+            f.write(";" + entry + "\n")
+
+            data = compressed_data[entry].get_byte_list()
+            for b in data:
+                f.write("    !byte " + str(b) + "\n")
+
+def tape_seconds(length):
+    # start bit, eight data bits and a stop bit for each byte
+    return length * 10.0 / uef.default_baud
+
+def crunched_length(data):
+    return len(exo.crunch(bytes(data), len(data)))
+
+def corpus_sizes(string_dict, compressed, table):
+    # The bytes a corpus packs to: each string with its length byte, plus the table
+    # (a shared table is counted once, with the first corpus)
+    raw = []
+    for entry in string_dict:
+        raw.extend(string_dict[entry])
+    packed = []
+    for entry in compressed:
+        packed.extend(compressed[entry].get_byte_list())
+    return (raw, packed, len(packed) + table)
+
+def table_note(names, table):
+    # The packing of each corpus depends on the table, so on every corpus it was built from
+    if len(names) > 1 and table == "shared":
+        return "one table for " + ", ".join(names) + ", counted with " + names[0]
+    return "each corpus has its own"
+
+def print_report(names, corpora, results, table_bytes, table_mode):
+    print("corpus              strings    raw  compressed  ratio    crunched: raw  compressed   tape seconds saved")
+    for (name, string_dict, compressed, table) in zip(names, corpora, results, table_bytes):
+        (raw, packed, size) = corpus_sizes(string_dict, compressed, table)
+        crunched_raw = crunched_length(raw)
+        crunched_packed = crunched_length(packed) + table
+        print("%-18s  %7d  %5d  %10d  %4.0f%%  %15d  %10d  %13.2f" % (name, len(string_dict), len(raw), size, 100.0 * size / max(1, len(raw)), crunched_raw, crunched_packed, tape_seconds(crunched_raw - crunched_packed)))
+    print("compressed: the packed strings, each with its length byte, and the table (%s)" % table_note(names, table_mode))
+
+# The game's decoder (print_compressed_string in source/starcommand_acme.asm, with named
+# labels for its anonymous ones), and one for the Huffman code. Both find the string from the
+# length byte before each, and print the strings for tokens by calling themselves.
+fixed_decoder = """
+print_compressed_string
+    lda #<text_data
+    sta lookup_low
+    lda #>text_data
+    sta lookup_high
+    ldy #0
+find_string
+    lda (lookup_low),y
+    dex
+    bmi found_string
+    clc
+    adc lookup_low
+    sta lookup_low
+    bcc +
+    inc lookup_high
++
+    bne find_string
+found_string
+    sta bytes_left
+    sty lookup_byte
+print_compressed_loop
+    jsr get_5_bits
+    cmp #31
+    beq token
+    cmp #29
+    beq extended1
+    bcs extended2
+    tax
+    lda text_header_data,x
+output_character
+    jsr oswrch
+    jmp print_compressed_loop
+extended1
+    ldx #7
+    !byte $2c
+extended2
+    ldx #5
+    jsr get_x_bits
+    bcc output_character
+token
+    jsr get_5_bits
+    sec
+    sbc #$100 - award_you_the_order_of_the
+    tax
+    ldy #3
+-
+    lda lookup_low,y
+    pha
+    dey
+    bpl -
+    jsr print_compressed_string
+    ldy #0
+-
+    pla
+    sta lookup_low,y
+    iny
+    cpy #4
+    bne -
+    ldy #0
+    beq print_compressed_loop
+
+move_to_next_byte
+    inc lookup_low
+    bne +
+    inc lookup_high
++
+    dec bytes_left
+    bne get_byte
+    pla
+    pla
+    rts
+get_byte
+    lda (lookup_low),y
+    sec
+    ror
+    bne resume_getting_bits
+get_5_bits
+    ldx #5
+get_x_bits
+    lda #0
+    sta result
+    lda lookup_byte
+-
+    lsr
+    beq move_to_next_byte
+resume_getting_bits
+    rol result
+    dex
+    bne -
+    sta lookup_byte
+    lda result
+    rts
+"""
+
+# Each bit read takes the code so far (less the codes of the lengths before) to the next
+# length: when it is less than the number of codes of that length, it is the symbol's index
+# among them.
+huffman_decoder = """
+print_compressed_string
+    lda #<text_data
+    sta lookup_low
+    lda #>text_data
+    sta lookup_high
+    ldy #0
+find_string
+    lda (lookup_low),y
+    dex
+    bmi found_string
+    clc
+    adc lookup_low
+    sta lookup_low
+    bcc +
+    inc lookup_high
++
+    bne find_string
+found_string
+    sta bytes_left
+    sty lookup_byte
+print_compressed_loop
+    ldx #0
+    txa
+next_bit
+    lsr lookup_byte
+    beq next_byte
+got_bit
+    rol
+    cmp text_huffman_counts,x
+    bcc found_symbol
+    sbc text_huffman_counts,x
+    inx
+    bne next_bit
+found_symbol
+    adc text_huffman_index,x
+    tax
+    lda text_huffman_symbols,x
+    bmi token
+    jsr oswrch
+    jmp print_compressed_loop
+
+next_byte
+    sta result
+    inc lookup_low
+    bne +
+    inc lookup_high
++
+    dec bytes_left
+    beq done
+    lda (lookup_low),y
+    sec
+    ror
+    sta lookup_byte
+    lda result
+    jmp got_bit
+done
+    rts
+
+token
+    sec
+    sbc #$80 - award_you_the_order_of_the
+    tax
+    ldy #3
+-
+    lda lookup_low,y
+    pha
+    dey
+    bpl -
+    jsr print_compressed_string
+    ldy #0
+-
+    pla
+    sta lookup_low,y
+    iny
+    cpy #4
+    bne -
+    ldy #0
+    beq print_compressed_loop
+"""
+
+# where the decoder and its data go on the 6502 core (zero page as in the game)
+decoder_symbols = {
+    "oswrch": 0xffee,
+    "lookup_low": 0x0c,
+    "lookup_high": 0x0d,
+    "lookup_byte": 0x0e,
+    "bytes_left": 0x0f,
+    "result": 0x30,
+}
+decoder_address = 0x1000
+tables_address = 0x2000
+text_address = 0x3000
+
+def expand(string_dict, entry, phrases):
+    # the text a string prints, with the phrases for its tokens
+    result = bytearray()
+    for b in string_dict[entry]:
+        if b >= 128:
+            result += expand(string_dict, phrases[b], phrases)
         else:
-            if label:
-                string_dict[label] = string_bytes
-            label = line
-            string_bytes = []
-
-if label:
-    string_dict[label] = string_bytes
-
-compress(string_dict)
-
-with open(args["output"], 'w') as f:
-    i = 0
-    for entry in compressed_data:
-        f.write(entry.ljust(40) + " = " + str(i) + "\n")
-        i += 1
-        f.write("")
-
-    f.write("\ntext_header_data\n")
-    for entry in encoding:
-        f.write("    !byte " + str(entry).ljust(20) + "; ")
-        if ((entry >= 32) and (entry < 127)):
-            f.write("'" + chr(entry) + "'")
-        else:
-            f.write(str(entry).rjust(3))
-        f.write(": " + str(conc[entry]).rjust(3) + ", " + str(encoding[entry]) + "\n")
+            result.append(b)
+    return result
 
-    f.write("\ntext_data\n")
-    for entry in compressed_data:
-        f.write(";" + entry + "\n")
+def measure_decoder(string_dict, compressed):
+    # Assemble the decoder for the current coding and print every string with it on the
+    # 6502 core. Returns (decoder bytes, table bytes, cycles, characters printed).
+    phrases = token_labels(string_dict)
+    tables = bytearray()
+    symbols = dict(decoder_symbols)
+    symbols["award_you_the_order_of_the"] = list(string_dict).index(first_token_label) if first_token_label in string_dict else 0
+    if coding == "huffman":
+        (counts, index, order) = huffman_tables()
+        for (name, values) in (("text_huffman_counts", counts), ("text_huffman_index", index), ("text_huffman_symbols", order)):
+            symbols[name] = tables_address + len(tables)
+            tables += bytes(values)
+        source = huffman_decoder
+    else:
+        symbols["text_header_data"] = tables_address
+        tables += bytes(commonest_entries)
+        source = fixed_decoder
+    symbols["text_data"] = text_address
+
+    (code, labels, _) = plot_routines.assemble(source.strip("\n").split("\n"), decoder_address, symbols)
+    data = bytearray()
+    for entry in compressed:
+        data += bytes(compressed[entry].get_byte_list())
+
+    cpu = cpu6502.CPU()
+    cpu.load(decoder_address, code)
+    cpu.load(tables_address, tables)
+    cpu.load(text_address, data)
+    output = bytearray()
+    def oswrch(cpu):
+        output.append(cpu.a)
+        cpu.rts()
+    cpu.traps[decoder_symbols["oswrch"]] = oswrch
+
+    cycles = 0
+    for (index, entry) in enumerate(compressed):
+        del output[:]
+        cycles += cpu.call(labels["print_compressed_string"], x=index)
+        expected = expand(string_dict, entry, phrases)
+        if output != expected:
+            raise AssertionError(coding + " decoder printed the wrong text for " + entry)
+    characters = sum(len(expand(string_dict, entry, phrases)) for entry in compressed)
+    return (len(code), len(tables), cycles, characters)
+
+def print_comparison(names, corpora, max_length):
+    global coding
+
+    print("corpus              coding     text  tables  decoder  total    cycles  cycles/char")
+    for (name, string_dict) in zip(names, corpora):
+        for coding in ("fixed", "huffman"):
+            if coding == "huffman":
+                build_huffman([string_dict], max_length)
+            else:
+                build_table([string_dict])
+            compressed = compress(string_dict)
+            text = sum(len(compressed[entry].get_byte_list()) for entry in compressed)
+            (decoder, tables, cycles, characters) = measure_decoder(string_dict, compressed)
+            print("%-18s  %-8s  %5d  %6d  %7d  %5d  %8d  %11.1f" % (name, coding, text, tables, decoder, text + tables + decoder, cycles, float(cycles) / max(1, characters)))
+
+def token_labels(string_dict):
+    # the label of the string each token prints
+    labels = list(string_dict)
+    if first_token_label not in labels:
+        return {}
+    first = labels.index(first_token_label)
+    return dict((128 + i, labels[first + i]) for i in range(min(32, len(labels) - first)))
+
+def string_stats(name, string_dict, compressed):
+    phrases = token_labels(string_dict)
+    references = {}
+    for entry in compressed:
+        for token in compressed[entry].tokens:
+            label = phrases.get(token, str(token))
+            references[label] = references.get(label, 0) + 1
+
+    result = []
+    for entry in compressed:
+        stream = compressed[entry]
+        raw = len(string_dict[entry])
+        result.append({
+            "corpus": name,
+            "label": entry,
+            "raw_bytes": raw,
+            "compressed_bits": stream.unpadded_bits,
+            "padding_bits": len(stream.bitarray) - stream.unpadded_bits,
+            "compressed_bytes": len(stream.get_byte_list()),
+            "bits_per_byte": round(float(stream.unpadded_bits) / raw, 3) if raw else 0,
+            "common": stream.common,
+            "escape_char": stream.escapes[29],
+            "escape_control": stream.escapes[30],
+            "escape_token": stream.escapes[31],
+            "tokens": [phrases.get(token, str(token)) for token in stream.tokens],
+            "used_as_phrase": references.get(entry, 0),
+        })
+    return result
 
-        data = compressed_data[entry].get_byte_list()
-        for b in data:
-            f.write("    !byte " + str(b) + "\n")
+def write_stats(filename, stats):
+    if filename.lower().endswith(".csv"):
+        columns = ["corpus", "label", "raw_bytes", "compressed_bits", "padding_bits", "compressed_bytes", "bits_per_byte", "common", "escape_char", "escape_control", "escape_token", "tokens", "used_as_phrase"]
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in stats["strings"]:
+                writer.writerow([" ".join(row[column]) if column == "tokens" else row[column] for column in columns])
+    else:
+        with open(filename, "w") as f:
+            json.dump(stats, f, indent=4, sort_keys=True)
+            f.write("\n")
 
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Compress the game's text")
+
+# Add arguments to the parser
+all_args.add_argument("--input",  required=True, action="append", help="acme-like input text (give more than once for several corpora)")
+all_args.add_argument("--output", required=True, action="append", help="compressed text as acme asm file, one for each --input")
+all_args.add_argument("--table", choices=["shared", "separate"], default="shared", help="one table of common characters for all the corpora, or one for each")
+all_args.add_argument("--report", action="store_true", help="report the size of each corpus before and after compression")
+all_args.add_argument("--stats", metavar="FILE", help="write statistics for each string as JSON (or CSV if FILE ends .csv)")
+all_args.add_argument("--coding", choices=["fixed", "huffman"], default="fixed", help="the game's 5 bit code with escapes, or a canonical Huffman code")
+all_args.add_argument("--max-length", type=int, default=12, help="longest Huffman code in bits (8 or more)")
+all_args.add_argument("--compare", action="store_true", help="list the bytes and decoding cycles of each coding for each corpus")
+
+if __name__ == "__main__":
+    args = vars(all_args.parse_args())
+    if len(args["input"]) != len(args["output"]):
+        all_args.error("give an --output for each --input")
+    if args["max_length"] < 8:
+        all_args.error("--max-length must be 8 or more")
+    coding = args["coding"]
+
+    timings = {"parse": 0.0, "compress": 0.0, "emit": 0.0}
+
+    start = time.perf_counter()
+    names = [corpus_name(filename) for filename in args["input"]]
+    corpora = [read_strings(filename, name) for (filename, name) in zip(args["input"], names)]
+    timings["parse"] += time.perf_counter() - start
+
+    results = []
+    table_bytes = []
+    tables = {}
+    for (index, (name, string_dict)) in enumerate(zip(names, corpora)):
+        start = time.perf_counter()
+        if coding == "huffman":
+            if args["table"] == "separate" or index == 0:
+                build_huffman(corpora if args["table"] == "shared" else [string_dict], args["max_length"])
+        elif args["table"] == "shared":
+            if index == 0:
+                build_table(corpora)
+        else:
+            build_table([string_dict])
+
+        # only the first output has the shared table
+        with_table = (args["table"] == "separate" or index == 0)
+        prefix = "" if index == 0 else name + "_"
+        results.append(compress(string_dict))
+        if coding == "huffman":
+            (counts, index_table, symbols) = huffman_tables()
+            table_bytes.append(len(counts) + len(index_table) + len(symbols) if with_table else 0)
+            tables[name] = [{"char": entry, "count": conc[entry], "bits": huffman_codes[entry][0], "code": huffman_codes[entry][1]} for entry in symbols]
+        else:
+            table_bytes.append(len(encoding) if with_table else 0)
+            tables[name] = [{"char": entry, "count": conc[entry], "code": code} for (code, entry) in enumerate(commonest_entries)]
+        timings["compress"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_output(args["output"][index], results[-1], prefix, with_table)
+        timings["emit"] += time.perf_counter() - start
+
+    if args["stats"]:
+        strings = []
+        for (name, string_dict, compressed) in zip(names, corpora, results):
+            strings.extend(string_stats(name, string_dict, compressed))
+        totals = {}
+        for (name, string_dict, compressed, table) in zip(names, corpora, results, table_bytes):
+            rows = [row for row in strings if row["corpus"] == name]
+            (raw, packed, size) = corpus_sizes(string_dict, compressed, table)
+            totals[name] = {
+                "strings": len(rows),
+                "raw_bytes": len(raw),
+                "compressed_bytes": size,
+                "length_bytes": len(rows),
+                "table_bytes": table,
+                "padding_bits": sum(row["padding_bits"] for row in rows),
+                "escapes": dict((key, sum(row[key] for row in rows)) for key in ("escape_char", "escape_control", "escape_token")),
+            }
+        stats = {"coding": coding, "table": args["table"], "table_note": table_note(names, args["table"]), "corpora": totals, "tables": tables, "strings": strings, "timings": timings}
+        write_stats(args["stats"], stats)
+
+    if args["report"]:
+        print_report(names, corpora, results, table_bytes, args["table"])
+
+    if args["compare"]:
+        print_comparison(names, corpora, args["max_length"])
@@ -0,0 +1,276 @@
+import argparse
+import bisect
+import gzip
+import re
+import sys
+
+import acme_output
+import mos6502
+import page_check
+
+# Profiles the game from a program counter trace captured by an emulator, mapping each
+# address back to the labels in the assembled source.
+#
+# The trace is read one line at a time (so a trace of many gigabytes needs no more memory
+# than a short one) and may be gzipped. Each line gives the address of an instruction
+# about to run and, usually, a cycle count: --format picks how to read it.
+#
+#   cycles-pc   '<cycles> <pc>', the cycle counter in decimal then the address in hex
+#   pc-cycles   '<pc> <cycles>'
+#   pc          just the address, as the first four hex digits on the line (e.g. 'C000: lda #0');
+#               the cycles are estimated from the instruction (see below)
+#
+# or give --pattern, a regular expression with groups named 'pc' and (optionally)
+# 'cycles'. Lines that don't match are skipped. The cycle count is taken to be a running
+# total unless --cycles-per-line is given.
+#
+# The calls are followed from the instructions in the variant's binary: a JSR pushes the
+# routine called, and reaching the return address of the routine on top of the stack pops
+# it (whether by RTS, RTI or otherwise). An RTS to an address that no routine on the stack
+# returns to empties the stack, as it returns from code called before the trace started.
+# A jump to an address that doesn't follow from the previous instruction is taken to be an
+# interrupt. Where an instruction's cycles aren't in the trace, its base cycles are used
+# (without page crossings or taken branches) or 'unknown_cycles' for code outside the
+# binary, such as the OS.
+#
+# The output lists, for each routine called by JSR, the cycles spent in it (self) and in it
+# or anything it calls (total), with the average per frame (the number of frames is the
+# number of times --frame-label is reached). Then the cycles spent at each label. With
+# --folded FILE it writes the call stacks in the 'folded' format that flamegraph tools
+# read: one line per stack, the frames separated by ';' followed by the cycles.
+
+variants = ["STAR", "STAR.tape", "STARELK", "STARELK.tape"]
+
+formats = {
+    "cycles-pc": r'^\s*(?P<cycles>[0-9]+)\s+\$?&?(?P<pc>[0-9A-Fa-f]{4})\b',
+    "pc-cycles": r'^\s*\$?&?(?P<pc>[0-9A-Fa-f]{4})\b:?\s+(?P<cycles>[0-9]+)\b',
+    "pc": r'^\s*\$?&?(?P<pc>[0-9A-Fa-f]{4})\b',
+}
+
+unknown_cycles = 3
+max_depth = 64
+
+os_names = {
+    0xffee: "OSWRCH",
+    0xffe7: "OSNEWL",
+    0xffe3: "OSASCI",
+    0xfff1: "OSWORD",
+    0xfff4: "OSBYTE",
+    0xffcb: "NVWRCH",
+}
+
+class Program:
+    # The labels and instructions of a variant
+    def __init__(self, variant, build_dir):
+        report = acme_output.read_report(acme_output.report_filename(variant, build_dir))
+        (items, labels) = page_check.read_items(report)
+        self.labels = sorted((address, name) for (name, address) in labels.items() if name[0] not in ".+-")
+        self.addresses = [address for (address, name) in self.labels]
+        self.instructions = {}
+        for item in items:
+            if item.instruction is not None:
+                self.instructions[item.address] = item
+        self.start = items[0].address if items else 0
+        self.end = items[-1].address + items[-1].size if items else 0
+
+    def label(self, address):
+        if address in os_names:
+            return os_names[address]
+        if address >= 0xc000 or not self.start <= address < self.end:
+            return "&" + format(address & 0xff00, "04X")
+        index = bisect.bisect_right(self.addresses, address) - 1
+        if index < 0:
+            return "&" + format(address & 0xff00, "04X")
+        return self.labels[index][1]
+
+    def routine(self, address):
+        # a routine is named by its own label, if it has one
+        index = bisect.bisect_left(self.addresses, address)
+        if index < len(self.labels) and self.addresses[index] == address and address not in os_names:
+            return self.labels[index][1]
+        return self.label(address)
+
+    def successors(self, address):
+        # The addresses that can follow the instruction at 'address' without an interrupt,
+        # or None if anything can (or the instruction isn't known)
+        item = self.instructions.get(address)
+        if item is None:
+            return None
+        instruction = item.instruction
+        following = (address + instruction.size) & 0xffff
+        if instruction.mode == mos6502.REL:
+            return (following, item.branch_target())
+        if instruction.mnemonic in ("jmp", "rts", "rti", "brk"):
+            # (some jumps are self modifying code, so the target isn't known)
+            return None
+        if instruction.mnemonic == "jsr":
+            return (item.operand(),)
+        return (following,)
+
+    def cycles(self, address):
+        item = self.instructions.get(address)
+        return item.instruction.cycles if item is not None else unknown_cycles
+
+class Frame:
+    def __init__(self, name, returns):
+        self.name = name
+        self.returns = returns          # the addresses that return from it
+
+class Profile:
+    def __init__(self, program, frame_address):
+        self.program = program
+        self.frame_address = frame_address
+        self.stack = []
+        self.folded = {}
+        self.self_cycles = {}
+        self.total_cycles = {}
+        self.label_cycles = {}
+        self.frames = 0
+        self.cycles = 0
+        self.instructions = 0
+        self.interrupts = 0
+
+    def account(self, pc, cycles):
+        # add the cycles for the instruction at 'pc' to its stack
+        program = self.program
+        leaf = program.label(pc)
+        names = tuple(frame.name for frame in self.stack)
+        if not names or names[-1] != leaf:
+            stack = names + (leaf,)
+        else:
+            stack = names
+        self.folded[stack] = self.folded.get(stack, 0) + cycles
+        self.label_cycles[leaf] = self.label_cycles.get(leaf, 0) + cycles
+        top = names[-1] if names else "(top level)"
+        self.self_cycles[top] = self.self_cycles.get(top, 0) + cycles
+        for name in set(names) or ("(top level)",):
+            self.total_cycles[name] = self.total_cycles.get(name, 0) + cycles
+        self.cycles += cycles
+        self.instructions += 1
+
+    def follow(self, previous, pc):
+        # update the call stack on going from the instruction at 'previous' to 'pc'
+        program = self.program
+        if pc == self.frame_address:
+            self.frames += 1
+        if self.stack and pc in self.stack[-1].returns:
+            self.stack.pop()
+            return
+        item = program.instructions.get(previous)
+        if item is not None and item.instruction.mnemonic in ("rts", "rti"):
+            # returning past routines that dropped their return address from the stack
+            for depth in range(len(self.stack) - 2, -1, -1):
+                if pc in self.stack[depth].returns:
+                    del self.stack[depth:]
+                    return
+            # returning from something called before the trace started
+            del self.stack[:]
+            return
+
+        if previous is None:
+            return
+        if item is not None and item.instruction.mnemonic == "jsr":
+            if pc == (previous + 3) & 0xffff:
+                # the routine called isn't in the trace
+                return
+            self.push(Frame(program.routine(pc), ((previous + 3) & 0xffff,)))
+            return
+        successors = program.successors(previous)
+        if successors is not None and pc not in successors:
+            self.interrupts += 1
+            self.push(Frame("(interrupt)", successors))
+
+    def push(self, frame):
+        if len(self.stack) >= max_depth:
+            # something isn't returning the usual way; start again from this call
+            del self.stack[:]
+        self.stack.append(frame)
+
+def open_trace(filename):
+    if filename == "-":
+        return sys.stdin
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", errors="replace")
+    return open(filename, errors="replace")
+
+def profile_trace(filename, pattern, program, frame_address, cycles_per_line):
+    profile = Profile(program, frame_address)
+    previous = None
+    previous_cycles = None
+    with open_trace(filename) as f:
+        for line in f:
+            match = pattern.match(line)
+            if not match:
+                continue
+            pc = int(match.group("pc"), 16)
+            cycles = match.groupdict().get("cycles")
+            if previous is not None:
+                if cycles is None:
+                    profile.account(previous, program.cycles(previous))
+                elif cycles_per_line:
+                    profile.account(previous, previous_cycles)
+                else:
+                    profile.account(previous, max(0, int(cycles) - previous_cycles))
+            profile.follow(previous, pc)
+            previous = pc
+            previous_cycles = None if cycles is None else int(cycles)
+    if previous is not None:
+        profile.account(previous, previous_cycles if cycles_per_line and previous_cycles is not None else program.cycles(previous))
+    return profile
+
+def print_profile(profile, limit):
+    frames = profile.frames
+    print(str(profile.instructions) + " instructions, " + str(profile.cycles) + " cycles, " + str(frames) + " frames, " + str(profile.interrupts) + " interrupts")
+    print("")
+    heading = "routine                                             self    %    total    %"
+    if frames:
+        heading += "  self/frame  total/frame"
+    print(heading)
+    for (name, total) in sorted(profile.total_cycles.items(), key=lambda item: -item[1])[0:limit]:
+        own = profile.self_cycles.get(name, 0)
+        line = "%-45s  %10d %5.1f %8d %5.1f" % (name, own, 100.0 * own / max(1, profile.cycles), total, 100.0 * total / max(1, profile.cycles))
+        if frames:
+            line += "  %10.0f  %11.0f" % (own / float(frames), total / float(frames))
+        print(line)
+    print("")
+    print("label                                             cycles      %")
+    for (name, cycles) in sorted(profile.label_cycles.items(), key=lambda item: -item[1])[0:limit]:
+        print("%-45s  %10d  %5.1f" % (name, cycles, 100.0 * cycles / max(1, profile.cycles)))
+
+def write_folded(filename, profile):
+    with open(filename, "w") as f:
+        for (stack, cycles) in sorted(profile.folded.items()):
+            f.write(";".join(stack) + " " + str(cycles) + "\n")
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Profile the game from an emulator's program counter trace")
+all_args.add_argument("trace", help="trace file ('-' for standard input, '.gz' files are decompressed)")
+all_args.add_argument("--variant", default="STAR", choices=variants, help="the build that was traced")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--format", default="cycles-pc", choices=sorted(formats), help="how each line of the trace is laid out")
+all_args.add_argument("--pattern", help="regular expression for each line, with groups 'pc' and optionally 'cycles' (instead of --format)")
+all_args.add_argument("--cycles-per-line", action="store_true", help="the cycles on each line are for that instruction, not a running total")
+all_args.add_argument("--frame-label", default="every_vsync", help="label reached once per frame")
+all_args.add_argument("--top", type=int, default=40, help="number of routines and labels to list")
+all_args.add_argument("--folded", metavar="FILE", help="write folded call stacks (for flamegraph tools) to this file")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    program = Program(args.variant, args.build)
+    symbols = acme_output.read_symbols(acme_output.symbols_filename(args.variant, args.build))
+    frame_address = symbols.get(args.frame_label)
+    if frame_address is None:
+        print("warning: no label '" + args.frame_label + "' in " + args.variant + ", so no frames are counted")
+    pattern = re.compile(args.pattern if args.pattern else formats[args.format])
+    if "pc" not in pattern.groupindex:
+        all_args.error("the pattern needs a group named 'pc'")
+
+    profile = profile_trace(args.trace, pattern, program, frame_address, args.cycles_per_line)
+    if profile.instructions == 0:
+        print("No instructions found in " + args.trace)
+        sys.exit(1)
+    print_profile(profile, args.top)
+    if args.folded:
+        write_folded(args.folded, profile)
+        print("")
+        print("Folded stacks written to " + args.folded)
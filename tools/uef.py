@@ -0,0 +1,153 @@
+import gzip
+import struct
+
+# Reading UEF tape images, as written by tools/maketape.pl.
+#
+# Chunks are read one at a time so that large (or gzipped) files never need to be
+# held in memory, and each chunk is given the time at which it starts playing and how
+# long it lasts, using the usual Acorn tape timings (1200 baud data, 2400Hz carrier).
+
+uef_magic = b"UEF File!\0"
+
+default_baud = 1200
+default_base_frequency = 1200.0
+
+class UEFError(Exception):
+    pass
+
+class Chunk:
+    def __init__(self, chunk_id, offset, data, start, duration):
+        self.chunk_id = chunk_id
+        self.offset = offset        # file offset of the chunk data (after decompression)
+        self.data = data
+        self.start = start          # seconds from the start of the tape
+        self.duration = duration    # seconds
+
+    def end(self):
+        return self.start + self.duration
+
+    def byte_time(self, index, baud=default_baud):
+        # Time at which byte 'index' of a 0x100 data chunk has been completely received
+        return self.start + (index + 1) * 10.0 / baud
+
+def crc16(data, crc=0):
+    # The CRC used by the Acorn tape filing system (XMODEM: polynomial 0x1021, initial value 0)
+    for b in data:
+        crc ^= b << 8
+        for i in range(8):
+            crc <<= 1
+            if crc & 0x10000:
+                crc ^= 0x11021
+    return crc
+
+def open_uef(filename):
+    # UEF files are often gzipped, so check for the gzip signature first
+    with open(filename, 'rb') as f:
+        signature = f.read(2)
+    if signature == b"\x1f\x8b":
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+def read_float(data):
+    return struct.unpack("<f", data[0:4])[0]
+
+def read_chunks(filename):
+    # Generator returning each Chunk of a UEF file in turn
+    with open_uef(filename) as f:
+        header = f.read(12)
+        if header[0:10] != uef_magic:
+            raise UEFError(filename + " is not a UEF file")
+
+        offset = 12
+        time = 0.0
+        baud = default_baud
+        base_frequency = default_base_frequency
+        while True:
+            chunk_header = f.read(6)
+            if len(chunk_header) == 0:
+                break
+            if len(chunk_header) < 6:
+                raise UEFError("truncated chunk header at offset " + str(offset))
+            (chunk_id, length) = struct.unpack("<HI", chunk_header)
+            offset += 6
+            data = f.read(length)
+            if len(data) < length:
+                raise UEFError("truncated chunk &" + format(chunk_id, "04x") + " at offset " + str(offset))
+
+            if chunk_id == 0x113:
+                base_frequency = read_float(data)
+            elif chunk_id == 0x117:
+                baud = struct.unpack("<H", data[0:2])[0]
+
+            duration = chunk_duration(chunk_id, data, baud, base_frequency)
+            yield Chunk(chunk_id, offset, data, time, duration)
+            time += duration
+            offset += length
+
+def chunk_duration(chunk_id, data, baud=default_baud, base_frequency=default_base_frequency):
+    # How long a chunk takes to play, in seconds. Chunks that don't represent sound on
+    # the tape (origin information, instructions etc) take no time.
+    carrier_frequency = 2.0 * base_frequency
+    if chunk_id == 0x100:
+        # implicit start/stop bit data: 8N1, so ten bits per byte
+        return len(data) * 10.0 / baud
+    if chunk_id == 0x102:
+        # explicit bits: first byte holds the number of unused bits at the end
+        return ((len(data) - 1) * 8 - data[0]) / float(baud)
+    if chunk_id == 0x104:
+        # defined format data: bits per packet, parity and stop bits in the first three bytes
+        bits = 1 + data[0] + (0 if data[1:2] == b"N" else 1) + abs(struct.unpack("<b", data[2:3])[0])
+        return (len(data) - 3) * float(bits) / baud
+    if chunk_id == 0x110:
+        return struct.unpack("<H", data[0:2])[0] / carrier_frequency
+    if chunk_id == 0x111:
+        (before, after) = struct.unpack("<HH", data[0:4])
+        return (before + after) / carrier_frequency + 10.0 / baud
+    if chunk_id == 0x112:
+        return struct.unpack("<H", data[0:2])[0] / carrier_frequency
+    if chunk_id == 0x114:
+        cycles = data[0] | (data[1] << 8) | (data[2] << 16)
+        return cycles / carrier_frequency
+    if chunk_id == 0x116:
+        return read_float(data)
+    return 0.0
+
+class AcornBlock:
+    pass
+
+def parse_acorn_block(data, pos=0):
+    # Parse a standard tape filing system block ('*', name, header, CRC, data, CRC) from
+    # 'data' at 'pos'. Returns an AcornBlock, whose 'end' is the position just after it.
+    if data[pos:pos+1] != b"*":
+        raise UEFError("no block sync byte at " + str(pos))
+    name_end = data.find(b"\0", pos + 1)
+    if name_end < 0 or name_end - pos - 1 > 10:
+        raise UEFError("bad filename in block at " + str(pos))
+    header_start = pos + 1
+    header_end = name_end + 1 + 17
+    if header_end + 2 > len(data):
+        raise UEFError("truncated block header at " + str(pos))
+
+    block = AcornBlock()
+    block.filename = data[header_start:name_end].decode("latin-1")
+    (block.load, block.exec, block.number, block.length, block.flags, block.spare) = struct.unpack("<IIHHBI", data[name_end + 1:header_end])
+    block.header_crc = struct.unpack(">H", data[header_end:header_end + 2])[0]
+    block.header_crc_ok = (crc16(data[header_start:header_end]) == block.header_crc)
+
+    data_start = header_end + 2
+    block.data = data[data_start:data_start + block.length]
+    if len(block.data) < block.length:
+        raise UEFError("truncated block data in '" + block.filename + "'")
+    block.start = pos
+    block.data_start = data_start
+    block.end = data_start + block.length
+    if block.length > 0:
+        if block.end + 2 > len(data):
+            raise UEFError("missing data CRC in '" + block.filename + "'")
+        block.data_crc = struct.unpack(">H", data[block.end:block.end + 2])[0]
+        block.data_crc_ok = (crc16(block.data) == block.data_crc)
+        block.end += 2
+    else:
+        block.data_crc = None
+        block.data_crc_ok = True
+    return block
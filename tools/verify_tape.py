@@ -0,0 +1,167 @@
+import argparse
+import os
+import sys
+
+import acme_output
+import exo
+import tape_timing
+import uef
+
+# Checks that a UEF file written by maketape.pl loads back to exactly the binary acme
+# assembled, without needing an emulator.
+#
+# The UEF is read a chunk at a time. The header block's CRCs are checked, then the
+# memory the tape loader would fill is rebuilt: the loader block at &0500, the
+# decruncher (stored backwards) at &0401-&04FF, then each Exomizer region, decrunched
+# in turn. The result is compared with build/disk/<variant>.
+
+# exo.asm uses three bytes of the tape block header that the OS leaves at &03CB
+# (tabl_bit) as part of its decrunch table
+expected_spare = 0xe28ce1
+
+loader_address = 0x0500
+decruncher_address = 0x0401
+
+class Problems:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+
+    def report(self, message):
+        print(self.name + ": " + message)
+        self.count += 1
+
+def describe(address, symbols):
+    # Name an address by the nearest symbol at or below it
+    best = None
+    for (name, value) in symbols.items():
+        if value <= address and (best is None or value > best[1]):
+            best = (name, value)
+    if best is None:
+        return "&" + format(address, "04X")
+    return "&" + format(address, "04X") + " (" + best[0] + "+" + str(address - best[1]) + ")"
+
+def differences(expected, actual, start):
+    # Returns a list of (first address, last address) of the runs of differing bytes
+    runs = []
+    run_start = None
+    for i in range(len(expected)):
+        if expected[i] != actual[i]:
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            runs.append((start + run_start, start + i - 1))
+            run_start = None
+    if run_start is not None:
+        runs.append((start + run_start, start + len(expected) - 1))
+    return runs
+
+def verify(uef_filename, variant, build_dir, max_differences=10):
+    problems = Problems(uef_filename)
+    symbols = acme_output.read_symbols(acme_output.symbols_filename(variant, build_dir))
+    memory = bytearray(65536)
+    written = bytearray(65536)          # which bytes have been loaded
+    loader = None
+    streams = []
+
+    for chunk in uef.read_chunks(uef_filename):
+        if chunk.chunk_id != 0x100:
+            continue
+
+        if loader is None:
+            if chunk.data[0:1] != b"*":
+                # e.g. the single dummy byte before the header block
+                continue
+            loader = uef.parse_acorn_block(chunk.data)
+            if not loader.header_crc_ok:
+                problems.report("header CRC error in block '" + loader.filename + "'")
+            if not loader.data_crc_ok:
+                problems.report("data CRC error in block '" + loader.filename + "'")
+            if loader.spare != expected_spare:
+                problems.report("block header spare bytes are &" + format(loader.spare, "08X") + ", exo.asm needs &" + format(expected_spare, "08X") + " at tabl_bit")
+            if loader.end != len(chunk.data):
+                problems.report(str(len(chunk.data) - loader.end) + " unexpected bytes after the header block")
+            address = loader.load & 0xffff
+            if address != loader_address:
+                problems.report("loader block loads at &" + format(address, "04X"))
+            memory[address:address + loader.length] = loader.data
+            written[address:address + loader.length] = b"\1" * loader.length
+            continue
+
+        # The data after the header block: the decruncher backwards, then the regions
+        data = chunk.data
+        decruncher = bytes(reversed(data[0:tape_timing.decruncher_length]))
+        memory[decruncher_address:decruncher_address + len(decruncher)] = decruncher
+        pos = tape_timing.decruncher_length
+        while pos < len(data):
+            try:
+                result = exo.decrunch(data, pos)
+            except exo.ExoError as e:
+                problems.report("region " + str(len(streams) + 1) + " (at offset " + str(pos) + "): " + str(e))
+                break
+            for address in range(result.start, result.end):
+                if written[address]:
+                    problems.report("region " + str(len(streams) + 1) + " overwrites " + describe(address, symbols))
+                    break
+            memory[result.start:result.end] = result.data
+            written[result.start:result.end] = b"\1" * len(result.data)
+            streams.append(result)
+            pos = result.crunched_end
+
+    if loader is None:
+        problems.report("no header block found")
+        return problems
+    if len(streams) != len(tape_timing.regions):
+        problems.report(str(len(streams)) + " compressed regions found, expected " + str(len(tape_timing.regions)))
+
+    # the region boundaries should be where go_acme put them
+    for (stream, (name, start_symbol, end_symbol)) in zip(streams, tape_timing.regions):
+        if (stream.start, stream.end) != (symbols[start_symbol], symbols[end_symbol]):
+            problems.report("region " + name + " is &" + format(stream.start, "04X") + "-&" + format(stream.end, "04X") + ", expected " + start_symbol + "-" + end_symbol)
+
+    # the loader, as assembled
+    loader_filename = os.path.join(build_dir, "tape", "loader." + variant)
+    if os.path.exists(loader_filename):
+        with open(loader_filename, 'rb') as f:
+            expected = f.read()
+        actual = memory[decruncher_address:decruncher_address + len(expected)]
+        for (first, last) in differences(expected, actual, decruncher_address)[0:max_differences]:
+            problems.report("loader differs at &" + format(first, "04X") + "-&" + format(last, "04X"))
+
+    # the game binary, as assembled
+    with open(os.path.join(build_dir, "disk", variant), 'rb') as f:
+        expected = f.read()
+    load_addr = symbols["load_addr"]
+    actual = memory[load_addr:load_addr + len(expected)]
+    missing = written[load_addr:load_addr + len(expected)].count(0)
+    if missing:
+        problems.report(str(missing) + " bytes of the binary are never loaded")
+    runs = differences(expected, actual, load_addr)
+    for (first, last) in runs[0:max_differences]:
+        problems.report("binary differs at " + describe(first, symbols) + " - &" + format(last, "04X"))
+    if len(runs) > max_differences:
+        problems.report("... and " + str(len(runs) - max_differences) + " more differences")
+
+    if problems.count == 0:
+        sizes = ", ".join(str(stream.crunched_end - stream.crunched_start) + "->" + str(len(stream.data)) for stream in streams)
+        print(uef_filename + ": OK (" + variant + ", regions " + sizes + ")")
+    return problems
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Check that tape builds load back to the assembled binaries")
+all_args.add_argument("variants", nargs="*", default=sorted(tape_timing.uef_filenames), help="tape builds to check (default: all)")
+all_args.add_argument("--uef", help="UEF file to check (default: the one go_acme writes for the variant)")
+all_args.add_argument("--build", default="build", help="build directory")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    failures = 0
+    for variant in args.variants:
+        uef_filename = args.uef or tape_timing.uef_filenames.get(variant, variant + ".uef")
+        try:
+            failures += verify(uef_filename, variant, args.build).count
+        except (uef.UEFError, IOError) as e:
+            print(uef_filename + ": " + str(e))
+            failures += 1
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,377 @@
+import argparse
+import re
+import sys
+
+import memory_map
+import mos6502
+import page_check
+
+# Suggests which variables should live in zero page, from how often the code uses them.
+#
+# Every instruction that reads or writes a variable is found in the acme report of each
+# variant (see memory_map.py for how the variables and their sizes are found). Each use
+# is weighted by the loops around it, as in page_check.py: --loop-weight for each loop
+# (up to --max-depth loops).
+# A use of an absolute address that has a zero page form would save a byte and (usually)
+# a cycle in zero page; a use of a zero page address would cost them if the variable
+# moved out.
+#
+# Variables stay together where the source defines them together: the structure of
+# arrays 'enemy_ships_* = $38 + k * maximum_number_of_enemy_ships' is one block, as are
+# names defined from another (enemy_x = enemy_ships_flags_or_explosion_timer). These
+# groups come from the constant definitions in source/starcommand_acme.asm.
+#
+# Some variables can't move out: those used as pointers ((zp),Y and (zp,X)), those used
+# by an instruction with no absolute form (such as stx zp,Y), the --reserve addresses
+# (the OS uses &FC in its interrupt handler and &FF for Escape) and the temporaries below
+# zp_start. Variables in the binary that start with anything other than zero can't simply
+# move in either. Check that a variable moving in is set up before use: only zp_start to
+# zp_end is cleared at start.
+#
+# The game calls OSWRCH, OSBYTE and OSWORD, so the OS's workspace at the top of zero page
+# (os_workspace, for the BBC and the Electron) must be left alone. Variables are only
+# placed in the game's own range, zp_start to zp_end, and in the OS locations the source
+# already claims for its own variables (such as &E2-&E5), which have to be safe on both.
+#
+# The proposal picks the variables that save the most weighted cycles within those bytes
+# free in every variant (a knapsack), keeps the fixed ones where they are and packs the
+# rest around them. The savings are static estimates: each use counted once per
+# enclosing loop level, not measured.
+
+variants = ["STAR", "STAR.tape", "STARELK", "STARELK.tape"]
+
+definition_pattern = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([^;]*)')
+base_pattern = re.compile(r'^\s*(\$[0-9a-fA-F]+|[0-9]+|[A-Za-z_][A-Za-z0-9_]*)\s*[-+]')
+
+# The OS's zero page on each machine while the game runs. &90-&CF (Econet, NMI and filing
+# system workspace) are left out: they are in the game's own range, as nothing uses them
+# once the game has loaded.
+os_workspace = {
+    "BBC": [
+        (0xd0, 0xe1, "VDU workspace"),
+        (0xe2, 0xe3, "cassette filing system status and options"),
+        (0xe4, 0xe6, "GSINIT/GSREAD workspace"),
+        (0xe7, 0xee, "keyboard and MOS workspace"),
+        (0xef, 0xf1, "OSBYTE/OSWORD A, X and Y"),
+        (0xf2, 0xf3, "command line pointer"),
+        (0xf4, 0xf7, "paged ROM number and pointer"),
+        (0xf8, 0xfb, "MOS workspace"),
+        (0xfc, 0xfc, "IRQ copy of A"),
+        (0xfd, 0xfe, "BRK error pointer"),
+        (0xff, 0xff, "Escape flag"),
+    ],
+    "Electron": [
+        (0xd0, 0xe1, "VDU workspace"),
+        (0xe2, 0xe3, "cassette filing system status and options"),
+        (0xe4, 0xe6, "GSINIT/GSREAD workspace"),
+        (0xe7, 0xee, "keyboard and MOS workspace"),
+        (0xef, 0xf1, "OSBYTE/OSWORD A, X and Y"),
+        (0xf2, 0xf3, "command line pointer"),
+        (0xf4, 0xf7, "paged ROM number and pointer"),
+        (0xf8, 0xfb, "MOS workspace"),
+        (0xfc, 0xfc, "IRQ copy of A"),
+        (0xfd, 0xfe, "BRK error pointer"),
+        (0xff, 0xff, "Escape flag"),
+    ],
+}
+
+zero_page_forms = { mos6502.ABS: mos6502.ZP, mos6502.ABSX: mos6502.ZPX, mos6502.ABSY: mos6502.ZPY }
+absolute_forms = dict((zp, absolute) for (absolute, zp) in zero_page_forms.items())
+
+class Variable:
+    # A block of memory that moves as one
+    def __init__(self, key, kind, start, size, names):
+        self.key = key
+        self.kind = kind                # where it is now: zero page, workspace or data
+        self.start = start
+        self.size = size
+        self.names = names              # (name, offset)
+        self.uses = 0
+        self.cycles = 0                 # weighted cycles saved in zero page
+        self.bytes = 0                  # instruction bytes saved in zero page
+        self.fixed = None               # why it can't move out of zero page
+        self.initialised = False
+
+    def in_zero_page(self):
+        return self.kind == "zero page"
+
+    def density(self):
+        return self.cycles / float(self.size)
+
+def read_groups(filename):
+    # Returns name -> group for the constants defined from a common base
+    parent = {}
+    def find(name):
+        while parent.get(name, name) != name:
+            name = parent[name]
+        return name
+    with open(filename, encoding="latin-1") as f:
+        for line in f:
+            match = definition_pattern.match(line)
+            if not match:
+                continue
+            base = base_pattern.match(match.group(2))
+            if base:
+                base_name = base.group(1).lower() if base.group(1)[0] == "$" else base.group(1)
+                parent[find(match.group(1))] = find(base_name)
+    return dict((name, find(name)) for name in parent)
+
+def find_variables(layout, groups):
+    # Blocks of zero page, workspace and (uninitialised) data, merged into their groups
+    blocks = [(block, "zero page") for block in layout.zero_page()]
+    blocks += [(block, "workspace") for block in layout.workspace() if not 0x200 <= block.start < 0x400]
+    code = set()
+    for item in layout.items:
+        if item.instruction is not None:
+            code.update(range(item.address, item.address + item.size))
+    data = dict((item.address, item) for item in layout.items if item.instruction is None)
+    for block in layout.referenced_blocks(layout.load_addr, layout.resident_end, "data"):
+        blocks.append((block, "data"))
+    # (a block named 'table+3' is more of a table whose size isn't known)
+    blocks = [(block, kind) for (block, kind) in blocks if kind == "zero page" or (block.start not in code and "+" not in block.name() and not block.name().startswith("&"))]
+
+    variables = []
+    by_group = {}
+    for (block, kind) in blocks:
+        group = None
+        for name in block.names:
+            group = groups.get(name.split("+")[0], group)
+        if group is not None and group in by_group and by_group[group].kind == kind:
+            variable = by_group[group]
+            end = max(variable.start + variable.size, block.end)
+            variable.start = min(variable.start, block.start)
+            variable.size = end - variable.start
+            variable.names += [(name, block.start) for name in block.names]
+            continue
+        variable = Variable(block.name(), kind, block.start, block.size(), [(name, block.start) for name in block.names])
+        if kind == "data":
+            variable.initialised = any(any(data[address].line.data) for address in range(block.start, block.end) if address in data)
+        variables.append(variable)
+        if group is not None:
+            by_group[group] = variable
+    for variable in variables:
+        variable.names = [(name, address - variable.start) for (name, address) in variable.names if "+" not in name]
+        variable.key = " / ".join(name for (name, offset) in variable.names) or variable.key
+    return variables
+
+def weigh(layout, variables, loop_weight, max_depth, reserve):
+    # Adds up the weighted uses of each variable
+    starts = sorted((variable.start, variable.start + variable.size, variable) for variable in variables)
+    loops = page_check.find_loops(layout.items)
+    for item in layout.items:
+        instruction = item.instruction
+        if instruction is None or instruction.size < 2 or instruction.mode in (mos6502.IMM, mos6502.REL):
+            continue
+        address = item.operand()
+        for (start, end, variable) in starts:
+            if start <= address < end:
+                break
+        else:
+            continue
+        weight = loop_weight ** min(max_depth, sum(1 for (start, end) in loops if start <= item.address < end))
+        variable.uses += 1
+        if instruction.mode in (mos6502.INDX, mos6502.INDY):
+            variable.fixed = variable.fixed or "pointer"
+        elif variable.in_zero_page() and instruction.mode in absolute_forms:
+            absolute = mos6502.lookup(instruction.mnemonic, absolute_forms.get(instruction.mode))
+            if absolute is None:
+                variable.fixed = variable.fixed or "no absolute form of " + instruction.mnemonic + " " + instruction.mode
+            else:
+                variable.cycles += weight * (absolute.cycles - instruction.cycles)
+                variable.bytes += absolute.size - instruction.size
+        elif not variable.in_zero_page():
+            zero_page = mos6502.lookup(instruction.mnemonic, zero_page_forms.get(instruction.mode))
+            if zero_page is not None:
+                variable.cycles += weight * (instruction.cycles - zero_page.cycles)
+                variable.bytes += instruction.size - zero_page.size
+    for variable in variables:
+        if variable.in_zero_page() and any(variable.start <= address < variable.start + variable.size for address in reserve):
+            variable.fixed = "reserved"
+
+def os_use(machine, address):
+    for (first, last, what) in os_workspace[machine]:
+        if first <= address <= last:
+            return what
+    return None
+
+def available(layout, reserve):
+    # The zero page bytes the game may use: zp_start to zp_end, and the OS locations the
+    # source names for its own variables
+    own = set(range(layout.symbols["zp_start"], layout.symbols["zp_end"]))
+    claimed = set()
+    for (address, (names, indexed, pointer)) in layout.references.items():
+        if address < 0x100 and names and address not in own and address not in reserve:
+            if any(os_use(machine, address) for machine in os_workspace):
+                claimed.add(address)
+    return (own, claimed)
+
+def confine(variables, room, below):
+    # Fixes the zero page variables outside 'room', and trims the rest to it (a block can
+    # run on into the OS's bytes after the claimed address)
+    for variable in variables:
+        if not variable.in_zero_page() or variable.fixed:
+            continue
+        if variable.start < below:
+            variable.fixed = "below zp_start"
+        elif variable.start not in room:
+            variable.fixed = "OS workspace"
+        else:
+            size = 1
+            while size < variable.size and variable.start + size in room:
+                size += 1
+            variable.size = size
+            variable.names = [(name, offset) for (name, offset) in variable.names if offset < size]
+
+def combine(per_variant):
+    # One list of variables for all the variants, keyed by name: the uses add up, and a
+    # variable fixed or initialised in any variant is in all
+    combined = {}
+    for variables in per_variant:
+        for variable in variables:
+            existing = combined.get(variable.key)
+            if existing is None:
+                combined[variable.key] = variable
+                continue
+            existing.uses += variable.uses
+            existing.cycles += variable.cycles
+            existing.bytes += variable.bytes
+            existing.size = max(existing.size, variable.size)
+            existing.fixed = existing.fixed or variable.fixed
+            existing.initialised = existing.initialised or variable.initialised
+    return list(combined.values())
+
+def choose(candidates, capacity):
+    # 0/1 knapsack: the candidates saving the most weighted cycles in 'capacity' bytes
+    # (on a tie, the one leaving more variables where they are)
+    best = [(0, 0, 0, ())] * (capacity + 1)
+    for (index, variable) in enumerate(candidates):
+        for room in range(capacity, variable.size - 1, -1):
+            (cycles, saved, staying, chosen) = best[room - variable.size]
+            option = (cycles + variable.cycles, saved + variable.bytes, staying + variable.in_zero_page(), chosen + (index,))
+            if option[0:3] > best[room][0:3]:
+                best[room] = option
+    return [candidates[index] for index in best[capacity][3]]
+
+def place(fixed, chosen, room):
+    # Returns variable -> address: those already in zero page stay where they are, and
+    # the rest are packed into 'room' around them (largest first), or None for those
+    # that don't fit
+    used = set()
+    placed = {}
+    for variable in fixed + [variable for variable in chosen if variable.in_zero_page()]:
+        used.update(range(variable.start, variable.start + variable.size))
+        if variable in chosen:
+            placed[variable] = variable.start
+    for variable in sorted([variable for variable in chosen if not variable.in_zero_page()], key=lambda variable: (-variable.size, variable.start, variable.key)):
+        for address in sorted(room):
+            addresses = set(range(address, address + variable.size))
+            if addresses <= room and not used.intersection(addresses):
+                placed[variable] = address
+                used.update(range(address, address + variable.size))
+                break
+        else:
+            placed[variable] = None
+    return placed
+
+def propose(variables, room):
+    fixed = [variable for variable in variables if variable.in_zero_page() and variable.fixed]
+    movable = [variable for variable in variables if not variable.fixed and not variable.initialised and variable.size <= len(room)]
+    capacity = len(room - set(address for variable in fixed for address in range(variable.start, variable.start + variable.size)))
+    chosen = choose(movable, capacity)
+    while True:
+        placed = place(fixed, chosen, room)
+        left_out = [variable for (variable, address) in placed.items() if address is None]
+        if not left_out:
+            return placed
+        # fragmented: drop the least useful per byte and try again
+        chosen.remove(min(chosen, key=lambda variable: (variable.density(), variable.key)))
+
+def print_variables(variables, limit):
+    print("variable                                                size  uses  weighted cycles  bytes  where       note")
+    for variable in sorted(variables, key=lambda variable: (-variable.cycles, variable.key))[0:limit]:
+        note = variable.fixed or ("initialised" if variable.initialised else "")
+        print("%-54s  %4d  %4d  %15d  %5d  %-10s  %s" % (variable.key[0:54], variable.size, variable.uses, variable.cycles, variable.bytes, variable.kind if variable.kind != "zero page" else "&" + format(variable.start, "02X"), note))
+
+def ranges(addresses):
+    parts = []
+    for address in sorted(addresses):
+        if parts and parts[-1][1] == address - 1:
+            parts[-1][1] = address
+        else:
+            parts.append([address, address])
+    return ", ".join("&%02X" % first if first == last else "&%02X-&%02X" % (first, last) for (first, last) in parts)
+
+def print_room(own, claimed):
+    print("Zero page for variables: " + ranges(own) + " (zp_start to zp_end), and " + ranges(claimed) + " taken from the OS by the source:")
+    for address in sorted(claimed):
+        print("  &%02X  BBC: %-40s  Electron: %s" % (address, os_use("BBC", address), os_use("Electron", address)))
+    print("")
+
+def print_proposal(variables, placed):
+    moving_in = [variable for variable in placed if not variable.in_zero_page()]
+    moving_out = [variable for variable in variables if variable.in_zero_page() and not variable.fixed and variable not in placed]
+    gained = sum(variable.cycles for variable in moving_in) - sum(variable.cycles for variable in moving_out)
+    saved = sum(variable.bytes for variable in moving_in) - sum(variable.bytes for variable in moving_out)
+    used = sum(variable.size for variable in placed) + sum(variable.size for variable in variables if variable.in_zero_page() and variable.fixed)
+    print("Proposed zero page (" + str(used) + " bytes used):")
+    for variable in moving_in:
+        print("  in   %-54s  %4d bytes  %+6d weighted cycles  %+4d bytes of code" % (variable.key[0:54], variable.size, variable.cycles, variable.bytes))
+    for variable in moving_out:
+        print("  out  %-54s  %4d bytes  %+6d weighted cycles  %+4d bytes of code" % (variable.key[0:54], variable.size, -variable.cycles, -variable.bytes))
+    print("")
+    print("%+d weighted cycles, %+d bytes of code (summed over the variants)" % (gained, saved))
+    print("")
+    print("New definitions for the variables moving in:")
+    for variable in sorted(moving_in, key=lambda variable: placed[variable]):
+        address = placed[variable]
+        for (name, offset) in variable.names:
+            print("%-39s = $%02x" % (name, address + offset))
+
+def parse_reserve(text):
+    reserve = set()
+    for part in text.split(","):
+        if not part:
+            continue
+        (first, dash, last) = part.partition("-")
+        reserve.update(range(int(first, 16), int(last or first, 16) + 1))
+    return reserve
+
+# Construct an argument parser
+all_args = argparse.ArgumentParser(description="Weigh each variable's uses and propose which should be in zero page")
+all_args.add_argument("variants", nargs="*", default=variants, help="variants to weigh (default: all four)")
+all_args.add_argument("--build", default="build", help="build directory")
+all_args.add_argument("--source", default="source/starcommand_acme.asm", help="source defining the variables")
+all_args.add_argument("--budget", default=memory_map.default_budget, help="memory_map.py's budget file (for the screen start and end of resident code)")
+all_args.add_argument("--loop-weight", type=int, default=8, help="weight multiplier for each loop around a use")
+all_args.add_argument("--max-depth", type=int, default=3, help="most loops to count around a use (unrolled code has many short ones)")
+all_args.add_argument("--reserve", default="fc,ff", help="zero page addresses the game uses but the OS owns (hex, e.g. 'fc,e0-e3'), to leave alone")
+all_args.add_argument("--top", type=int, default=40, help="number of variables to list")
+
+if __name__ == "__main__":
+    args = all_args.parse_args()
+    config = memory_map.read_config(args.budget)
+    groups = read_groups(args.source)
+    reserve = parse_reserve(args.reserve)
+    per_variant = []
+    own = None
+    claimed = None
+    for variant in args.variants:
+        layout = memory_map.Layout(variant, args.build, config)
+        (variant_own, variant_claimed) = available(layout, reserve)
+        own = variant_own if own is None else own & variant_own
+        claimed = variant_claimed if claimed is None else claimed & variant_claimed
+        variables = find_variables(layout, groups)
+        weigh(layout, variables, args.loop_weight, args.max_depth, reserve)
+        per_variant.append(variables)
+    room = own | claimed
+    for variables in per_variant:
+        confine(variables, room, min(own))
+    variables = combine(per_variant)
+
+    print_variables(variables, args.top)
+    print("")
+    print_room(own, claimed)
+    placed = propose(variables, room)
+    print_proposal(variables, placed)
+    if any(address is None for address in placed.values()):
+        sys.exit(1)